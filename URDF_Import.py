@@ -1,12 +1,21 @@
 
+import contextlib
+import hashlib
+import json
 import logging
 import math
 import os
+import shutil
+import sys
+import time
 from typing import Annotated, Optional
-import pathlib
-import xacro2urdf
 import vtk
+from vtk.util import numpy_support
+import qt
 import numpy
+from URDF_ImportLib.profiling import JointInteractionProfiler
+from URDF_ImportLib.rotations import (axisAngleToQuaternion, fromVTKMatrices, matrixToAxisAngle, normalize, originMatrix,
+                                      quaternionToMatrix, toVTKMatrices)
 
 import slicer
 from slicer.i18n import tr as _
@@ -53,18 +62,66 @@ and Steve Pieper, Isomics, Inc. and was partially funded by NIH grant 3P41RR0132
 
         # Additional initialization step after application startup is complete
     #    slicer.app.connect("startupCompleted()", registerSampleData)
+        # Robots in loaded scenes are set up again even if the module has not been opened
+        slicer.app.connect("startupCompleted()", observeRobotSceneLoading)
+
+
+# Logic shared by the module widget and the scene loading observer (see moduleLogic) and the tag of that observer
+_moduleLogic = None
+_robotSceneLoadingObserver = None
+
+
+#Returns the logic used by the module widget, it is created on first use so that robots can be restored without the widget
+def moduleLogic():
+    global _moduleLogic
+    if _moduleLogic is None:
+        _moduleLogic = URDF_ImportLogic()
+    return _moduleLogic
+
+
+#Restores the robots saved in each loaded scene (see URDF_ImportLogic.restoreRobots) with moduleLogic, also when a scene
+#with robots is loaded before the module was opened. The observer is removed by stopObservingRobotSceneLoading.
+def observeRobotSceneLoading():
+    global _robotSceneLoadingObserver
+    if _robotSceneLoadingObserver is not None:
+        return
+    def onSceneEndImport(caller, event):
+        if any(node.GetAttribute(ROBOT_MODEL_ATTRIBUTE) is not None for node in slicer.util.getNodesByClass("vtkMRMLTransformNode")):
+            moduleLogic().restoreRobots()
+    _robotSceneLoadingObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndImportEvent, onSceneEndImport)
+    slicer.app.connect("aboutToQuit()", stopObservingRobotSceneLoading)
+
+
+def stopObservingRobotSceneLoading():
+    global _robotSceneLoadingObserver
+    if _robotSceneLoadingObserver is not None:
+        slicer.mrmlScene.RemoveObserver(_robotSceneLoadingObserver)
+        _robotSceneLoadingObserver = None
 
 
 
     
+#Adds a transform node whose matrix (vtkMatrix4x4) and parent transform are set before it is added to the scene,
+#so that scene observers see it only once, already in place
+
+def addTransformNode(name, matrix=None, parentTransformNodeID=None):
+    transformNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLTransformNode")
+    transformNode.UnRegister(None)
+    transformNode.SetName(name)
+    if matrix is not None:
+        transformNode.SetMatrixTransformToParent(matrix)
+    if parentTransformNodeID:
+        transformNode.SetAndObserveTransformNodeID(parentTransformNodeID)
+    return slicer.mrmlScene.AddNode(transformNode)
+
+
 #Connects given nodes 
 
 def connectNodes(nodes, scaleTrans):
-    robotToWorldTransformNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode", "Robot")
     robotToWorldTransform = vtk.vtkTransform()
     if scaleTrans:
         robotToWorldTransform.Scale(1000, 1000, 1000)  # convert from meters (URDF) to millimeters (Slicer)
-    robotToWorldTransformNode.SetMatrixTransformToParent(robotToWorldTransform.GetMatrix())
+    robotToWorldTransformNode = addTransformNode("Robot", robotToWorldTransform.GetMatrix())
     for nodeName in nodes:
         if nodes[nodeName]["type"] == "link":
             node = nodes[nodeName]["model"]
@@ -72,167 +129,118 @@ def connectNodes(nodes, scaleTrans):
             node = nodes[nodeName]["transform"]
         if not node.GetParentTransformNode():
             node.SetAndObserveTransformNodeID(robotToWorldTransformNode.GetID())
+    return robotToWorldTransformNode
 
 
 #Sets up positioning of model components from given xyz/rpy transformations in robot file
-
-def setUpMeshes(link, nodes, model):
-    if link.find("visual") != None:
-        if link.find("visual").find("origin") != None:
-            name = link.get("name")
-            usedNode = nodes[name]
-            transformModelNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode", f"{name} to world")
-            nodes[transformModelNode.GetName()] = { "type": "transform", "transform": transformModelNode}
-            transformModelNode.SetAndObserveTransformNodeID(usedNode["model"].GetTransformNodeID())
-            transformModel = vtk.vtkTransform()
-            xyz = [float(x) for x in link.find("visual").find("origin").get("xyz").split()]
-            transformModel.Translate(xyz)
-            if(link.find("visual").find("origin").get("rpy") != None): 
-                rpy = [vtk.vtkMath.DegreesFromRadians(float(x)) for x in link.find("visual").find("origin").get("rpy").split()]  
-                transformModel.RotateX(rpy[0])
-                transformModel.RotateY(rpy[1])
-                transformModel.RotateZ(rpy[2])
-            transformModelNode.SetMatrixTransformToParent(transformModel.GetMatrix())
-            nodes[name]["model"].SetAndObserveTransformNodeID(transformModelNode.GetID())
-            model.ApplyTransform(transformModel)
+#Returns the transform applied to the model mesh (None if the link has no visual origin)
+
+def setUpMeshes(name, visualOrigin, nodes, model):
+    if visualOrigin is not None:
+        usedNode = nodes[name]
+        transformModel = vtk.vtkTransform()
+        transformModel.SetMatrix(toVTKMatrices(visualOrigin))
+        transformModelNode = addTransformNode(f"{name} to world", transformModel.GetMatrix(), usedNode["model"].GetTransformNodeID())
+        nodes[transformModelNode.GetName()] = { "type": "transform", "transform": transformModelNode}
+        nodes[name]["model"].SetAndObserveTransformNodeID(transformModelNode.GetID())
+        model.ApplyTransform(transformModel)
+        return transformModel
+    return None
         # use this but with the xyz and rpy for the models themselves?
 
+
+#Applies a link visual origin (4x4 numpy array) to the model mesh instead of adding a transform node
+#Returns the applied transform (None if the origin is the identity)
+
+def bakeMeshOrigin(model, origin):
+    if numpy.allclose(origin, numpy.eye(4)):
+        return None
+    transformModel = vtk.vtkTransform()
+    transformModel.SetMatrix(slicer.util.vtkMatrixFromArray(origin))
+    model.ApplyTransform(transformModel)
+    return transformModel
+
     
     
 
 
 #makes hierarchy for nodes and transforms joints based on given translation 
 
-def makeNodeHierarchy(nodes, robot):
-    for joint in robot.findall("joint"):
-        name = joint.get("name")
-
-        parentName = joint.find("parent").get("link")
-        if parentName:
-            parent = nodes[parentName]
-            if parent["type"] != "link":
-                raise ValueError(f"Parent of joint {name} is not a link")
-            jointToParentTransformNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode", f"{name} to {parentName}")
-            nodes[jointToParentTransformNode.GetName()] = { "type": "transform", "transform": jointToParentTransformNode}
-            jointToParentTransformNode.SetAndObserveTransformNodeID(parent["model"].GetTransformNodeID())
-            # <origin rpy="-1.57079632679 0 0" xyz="0 0 0"/>
-            transformToParent = vtk.vtkTransform()
-            rpy = [vtk.vtkMath.DegreesFromRadians(float(x)) for x in joint.find("origin").get("rpy").split()]  
-            xyz = [float(x) for x in joint.find("origin").get("xyz").split()]
-            myXYZ = [xyz[0], xyz[1], xyz[2]]
-            transformToParent.Translate(myXYZ)
-            transformToParent.RotateX(rpy[0])
-            transformToParent.RotateY(rpy[1])
-            transformToParent.RotateZ(rpy[2])
-            jointToParentTransformNode.SetMatrixTransformToParent(transformToParent.GetMatrix())
-            nodes[name]["transform"].SetAndObserveTransformNodeID(jointToParentTransformNode.GetID())
-        
-        # iterate through all children
-        for child in joint.findall("child"):
-            childName = child.get("link")
-            child = nodes[childName]
-            if child["type"] != "link":
-                raise ValueError(f"Child of joint {name} is not a link")
-            childModelNode = child["model"]
-            childModelNode.SetAndObserveTransformNodeID(nodes[name]["transform"].GetID())
-
-
-#Sets lower limits on joint movement
-def setLowerLim(link, type):
-    l = link.find("limit").get("lower")
-    if l != None:
-            return float(l)
-    else:
-        return None
+def makeNodeHierarchy(nodes, urdf):
+    jointOrigins = urdf.jointOrigins()
+    for jointIndex, name in enumerate(urdf.jointNames):
+        parentName = urdf.linkNames[urdf.jointParents[jointIndex]]
+        parent = nodes[parentName]
+        if parent["type"] != "link":
+            raise ValueError(f"Parent of joint {name} is not a link")
+        # <origin rpy="-1.57079632679 0 0" xyz="0 0 0"/>
+        jointToParentTransformNode = addTransformNode(f"{name} to {parentName}", toVTKMatrices(jointOrigins[jointIndex]),
+                                                      parent["model"].GetTransformNodeID())
+        nodes[jointToParentTransformNode.GetName()] = { "type": "transform", "transform": jointToParentTransformNode}
+        nodes[name]["transform"].SetAndObserveTransformNodeID(jointToParentTransformNode.GetID())
+
+        child = nodes[urdf.linkNames[urdf.jointChildren[jointIndex]]]
+        if child["type"] != "link":
+            raise ValueError(f"Child of joint {name} is not a link")
+        child["model"].SetAndObserveTransformNodeID(nodes[name]["transform"].GetID())
 
-#Sets upper limits on joint movement
-def setUpperLim(link, type):
-    u = link.find("limit").get("upper")
-    if u != None:
-            return float(u)
-    else:
-        return None
-#this is in radians for rotation and meters for translation
-
-#Converts upper limits (radians) for rotation around an axis into axis angles
-def upperAxang(link):
-    if link.find("limit").get("upper") != None:
-        axang = numpy.zeros(1)
-        axang[0] = link.find("limit").get("upper")
-        #print(axang)
-        axang = numpy.append(axang, [float(x) for x in link.find("axis").get("xyz").split()])
-        """print("upper axang")
-        print(axang)
-        print()"""
-        return axang
-    else:
-        print("no upper")
-        return None
 
-#Converts lower limits (radians) for rotation around an axis into axis angles
-def lowerAxang(link):
-    if link.find("limit").get("lower") != None:
-        axang = numpy.zeros(1)
-        axang[0] = link.find("limit").get("lower")
-        axang = numpy.append(axang, [float(x) for x in link.find("axis").get("xyz").split()])
-        """print("lower axang")
-        print(axang)"""
-        return axang
-    else:
-        return None
-    
-def makeAxang(link, limit):
-    axang = [limit, [float(x) for x in link.find("axis").get("xyz").split()]]
-        
 #Creates transform node visibility for joints based on axis of translation/rotation and joint type
-def makeLinks(link, node):
-    if not link.get("type") == "floating":
-        if(link.find("axis") == None):
-            axis = [1, 0, 0]
-        else:
-            axis = [float(x) for x in link.find("axis").get("xyz").split()]
-    if link.get("type") == "revolute":
-        #<axis xyz="0 0 1"/>
-
-        if axis == [1, 0, 0] or axis == [-1, 0, 0]:
-            node.SetRotationHandleComponentVisibility3D(True, False, False, False)
-        elif axis == [0, 1, 0] or axis == [0, -1, 0]:
-            node.SetRotationHandleComponentVisibility3D(False, True, False, False)
-        elif axis == [0, 0, 1] or axis == [0, 0, -1]:
-            node.SetRotationHandleComponentVisibility3D(False, False, True, False)
-        else:
-            raise ValueError(f"Unsupported rotation axis {axis}")
-    elif link.get("type") == "continuous":
-                        
-        if axis == [1, 0, 0] or axis == [-1, 0, 0]:
-            node.SetRotationHandleComponentVisibility3D(True, False, False, False)
-        elif axis == [0, 1, 0] or axis == [0, -1, 0]:
-            node.SetRotationHandleComponentVisibility3D(False, True, False, False)
-        elif axis == [0, 0, 1] or axis == [0, 0, -1]:
-            node.SetRotationHandleComponentVisibility3D(False, False, True, False)
-        else:
-            raise ValueError(f"Unsupported continuous axis {axis}")
-    elif link.get("type") == "prismatic":
+#Handles are shown for the coordinate axes that the joint axis has a component along, motion along other
+#directions is removed by the joint observer
+def makeLinks(jointType, axis, node):
+    from URDF_ImportLib.kinematics import planeBasis
+    alongAxis = [bool(component != 0) for component in axis]
+    # coordinate axes that have a component in the plane of a planar joint
+    inPlane = [bool(component) for component in numpy.any(planeBasis(normalize(axis)) != 0, axis=0)]
+    if jointType == "revolute" or jointType == "continuous":
+        node.SetRotationHandleComponentVisibility3D(*alongAxis, False)
+    elif jointType == "prismatic":
         node.SetEditorTranslationEnabled(True)
         node.SetEditorRotationEnabled(False)
-        if axis == [1, 0, 0] or axis == [-1, 0, 0]:
-            node.SetTranslationHandleComponentVisibility3D(True, False, False, False)
-        elif axis == [0, 1, 0] or axis == [0, -1, 0]:
-            node.SetTranslationHandleComponentVisibility3D(False, True, False, False)
-        elif axis == [0, 0, 1] or axis == [0, 0, -1]:
-            node.SetTranslationHandleComponentVisibility3D(False, False, True, False)
-        else:
-            raise ValueError(f"Unsupported prismatic axis {axis}")
-    elif link.get("type") == "floating":
-        # TODO: implement floating joint
+        node.SetTranslationHandleComponentVisibility3D(*alongAxis, False)
+    elif jointType == "planar":
         node.SetEditorTranslationEnabled(True)
-        node.SetRotationHandleComponentVisibility3D(True, True, True, False) 
-        node.SetTranslationHandleComponentVisibility3D(True, True, True, False) 
-    #elif link.get("type") == "planar":
-        # TODO: implement planar joint
+        node.SetRotationHandleComponentVisibility3D(*alongAxis, False)
+        node.SetTranslationHandleComponentVisibility3D(*inPlane, False)
+    elif jointType == "floating":
+        node.SetEditorTranslationEnabled(True)
+        node.SetRotationHandleComponentVisibility3D(True, True, True, False)
+        node.SetTranslationHandleComponentVisibility3D(True, True, True, False)
     else:
-        # TODO: implement translation and other joint types
-        raise ValueError(f"Unsupported joint type {link.get('type')}")
+        raise ValueError(f"Unsupported joint type {jointType}")
+
+
+#Sets up the interactive editor of a joint transform display node for the joint type and axis, mimic joints are moved by their driver
+def setUpJointEditor(node, jointType, axis, mimic):
+    node.SetEditorVisibility(not mimic)
+    node.SetEditorTranslationEnabled(False)
+    node.SetEditorRotationEnabled(True)
+    makeLinks(jointType, axis, node)
+
+# Joint motions that differ from the constrained motion by less than this (radians or meters) are left unchanged,
+# so that setting a joint to its constrained motion does not constrain it again
+JOINT_LIMIT_TOLERANCE = 1e-6
+
+# Seconds of scene building per timer event of an import started with startImport, the application stays responsive in between
+IMPORT_TIME_SLICE = 0.05
+
+# Milliseconds without further changes of the watched robot files before the robot is reloaded
+ROBOT_RELOAD_DELAY_MS = 200
+
+# Robot transform node attribute that holds the encoded kinematic model of a robot saved with the scene (see saveRobotState),
+# and the role of the node references from the robot transform node to the other nodes of the robot
+ROBOT_MODEL_ATTRIBUTE = "URDF_Import.RobotModel"
+ROBOT_NODE_REFERENCE_ROLE = "URDF_Import.RobotNode"
+
+#Text of a frame of a joint value sequence: the joint values (dofCount,) separated by spaces
+def jointValuesText(q):
+    return " ".join(f"{value:.10g}" for value in q)
+
+
+def jointValuesFromText(text):
+    return numpy.array([float(value) for value in text.split()])
+
 
 #
 # URDF_ImportParameterNode
@@ -292,8 +300,10 @@ class URDF_ImportWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         uiWidget.setMRMLScene(slicer.mrmlScene)
 
         # Create logic class. Logic implements all computations that should be possible to run
-        # in batch mode, without a graphical user interface.
-        self.logic = URDF_ImportLogic()
+        # in batch mode, without a graphical user interface. It is shared with the scene loading observer.
+        self.logic = moduleLogic()
+        # also after the module is reloaded, which removes the observer of the previous module
+        observeRobotSceneLoading()
 
         # Connections
 
@@ -302,19 +312,44 @@ class URDF_ImportWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.addObserver(slicer.mrmlScene, slicer.mrmlScene.EndCloseEvent, self.onSceneEndClose)
 
         # Observer for transforms to keep in specified limits
-        #(node name).addObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onRotateNode)
+        #(node name).addObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onJointNode)
 
         # Buttons
         self.ui.applyButton.connect("clicked(bool)", self.onLoadButton)
+        self.ui.cancelImportButton.connect("clicked(bool)", self.onCancelImportButton)
         self.ui.clearButton.connect("clicked(bool)", self.onClearButton)
-        
+        self.ui.exportBundleButton.connect("clicked(bool)", self.onExportBundleButton)
+        self.ui.refreshStatisticsButton.connect("clicked(bool)", self.updateStatisticsTable)
+        self.ui.resetStatisticsButton.connect("clicked(bool)", self.onResetStatisticsButton)
+        self.ui.exportStatisticsButton.connect("clicked(bool)", self.onExportStatisticsButton)
+        self.ui.clearanceMonitorButton.connect("toggled(bool)", self.onClearanceMonitorButton)
+        self.ui.watchRobotFileCheck.connect("toggled(bool)", self.onWatchRobotFileCheck)
+        self.logic.meshLoadingProgressCallback = self.onMeshLoadingProgress
+        self.logic.importProgressCallback = self.onImportProgress
+        self.logic.importFinishedCallback = self.onImportFinished
+        self.logic.clearanceCallback = self.onClearanceUpdated
+        self.logic.robotReloadedCallback = self.onRobotReloaded
+
+        # Time 3D view rendering so that it can be compared with the joint observer latencies
+        self._renderStartTime = None
+        layoutManager = slicer.app.layoutManager()
+        if layoutManager and layoutManager.threeDViewCount > 0:
+            renderWindow = layoutManager.threeDWidget(0).threeDView().renderWindow()
+            self.addObserver(renderWindow, vtk.vtkCommand.StartEvent, self.onRenderStart)
+            self.addObserver(renderWindow, vtk.vtkCommand.EndEvent, self.onRenderEnd)
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
+        # Robots of a scene that was loaded before the module was opened
+        self.logic.restoreRobots()
 
     def cleanup(self) -> None:
         """Called when the application closes and the module widget is destroyed."""
+        self.logic.cancelImport()
+        self.logic.stopJointPath()
+        self.logic.stopWatchingRobotFile()
         self.removeObservers()
+        stopObservingRobotSceneLoading()
 
     def enter(self) -> None:
         """Called each time the user opens this module."""
@@ -330,6 +365,10 @@ class URDF_ImportWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
     def onSceneStartClose(self, caller, event) -> None:
         """Called just before the scene is closed."""
+        # The nodes of a robot that is being imported or moved along a path are about to be removed
+        self.logic.cancelImport()
+        self.logic.stopJointPath()
+        self.logic.stopWatchingRobotFile()
         # Parameter node will be reset, do not use it anymore
         self.setParameterNode(None)
 
@@ -372,8 +411,112 @@ class URDF_ImportWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         slicer.mrmlScene.Clear()
 
     def onLoadButton(self) -> None:
-        self.logic.process(self.ui.robotFilePath.currentPath, self.ui.meshesDirectoryButton.directory,
-                self.ui.scaleRobotFileM.checked, self.ui.collisionMeshCheck.checked)
+        self.ui.applyButton.enabled = False
+        self.ui.importProgressBar.visible = True
+        self.ui.cancelImportButton.visible = True
+        self.logic.startImport(self.ui.robotFilePath.currentPath, self.ui.meshesDirectoryButton.directory,
+                self.ui.scaleRobotFileM.checked, self.ui.collisionMeshCheck.checked,
+                lazyMeshes=self.ui.lazyMeshLoadingCheck.checked, flatHierarchy=self.ui.flatHierarchyCheck.checked,
+                mergeFixedLinks=self.ui.mergeFixedLinksCheck.checked, instanceMeshes=self.ui.instanceMeshesCheck.checked)
+
+    def onCancelImportButton(self) -> None:
+        self.logic.cancelImport()
+
+    def onImportProgress(self, stage, stepsDone, stepCount) -> None:
+        stageNames = {"parse": _("Reading robot file"), "meshes": _("Reading meshes"), "scene": _("Adding links and joints")}
+        self.ui.importProgressBar.format = f"{stageNames[stage]}: %p%"
+        self.ui.importProgressBar.maximum = stepCount
+        self.ui.importProgressBar.value = stepsDone
+
+    def onImportFinished(self, error, cancelled) -> None:
+        self.ui.applyButton.enabled = True
+        self.ui.importProgressBar.visible = False
+        self.ui.cancelImportButton.visible = False
+        if error is not None:
+            slicer.util.errorDisplay(_("Failed to load the robot."), detailedText=str(error))
+        elif not cancelled:
+            self.onWatchRobotFileCheck(self.ui.watchRobotFileCheck.checked)
+
+    def onWatchRobotFileCheck(self, checked) -> None:
+        from URDF_ImportLib.bundle import BUNDLE_EXTENSION
+        if not checked or self.logic.robotImport is None or os.path.splitext(self.logic.robotImport["description"]["robotPath"])[1] == BUNDLE_EXTENSION:
+            self.logic.stopWatchingRobotFile()
+            return
+        self.logic.watchRobotFile()
+
+    def onRobotReloaded(self, diff, error) -> None:
+        if error is not None:
+            slicer.util.showStatusMessage(_("Failed to reload the robot: {error}").format(error=error), 5000)
+        else:
+            slicer.util.showStatusMessage(_("Robot reloaded: {diff}").format(diff=diff), 3000)
+
+    def onExportBundleButton(self) -> None:
+        from URDF_ImportLib.bundle import BUNDLE_EXTENSION
+        bundlePath = qt.QFileDialog.getSaveFileName(None, _("Export robot bundle"), "", f"Robot bundle (*{BUNDLE_EXTENSION})")
+        if not bundlePath:
+            return
+        self.logic.exportRobotBundle(self.ui.robotFilePath.currentPath, self.ui.meshesDirectoryButton.directory,
+                bundlePath, self.ui.collisionMeshCheck.checked)
+
+    def onMeshLoadingProgress(self, loaded, total) -> None:
+        self.ui.meshLoadingProgressBar.visible = loaded < total
+        self.ui.meshLoadingProgressBar.maximum = total
+        self.ui.meshLoadingProgressBar.value = loaded
+
+    def onClearanceMonitorButton(self, checked) -> None:
+        if not checked:
+            self.logic.stopClearanceMonitoring()
+            self.ui.clearanceLabel.text = _("Not monitored")
+            self.ui.clearanceLabel.styleSheet = ""
+            return
+        anatomyNode = self.ui.anatomySelector.currentNode()
+        if anatomyNode is None:
+            self.ui.clearanceMonitorButton.checked = False
+            return
+        with slicer.util.tryWithErrorDisplay(_("Failed to start clearance monitoring."), waitCursor=True):
+            self.logic.startClearanceMonitoring(anatomyNode, self.ui.clearanceThresholdSpinBox.value, self.ui.distanceFieldSpacingSpinBox.value)
+
+    def onClearanceUpdated(self, closestName, clearance, tooClose) -> None:
+        if closestName is None:
+            self.ui.clearanceLabel.text = _("No robot models")
+            return
+        self.ui.clearanceLabel.text = f"{closestName}: {clearance:.1f} mm"
+        self.ui.clearanceLabel.styleSheet = "color: red" if tooClose else ""
+
+    def onRenderStart(self, caller, event) -> None:
+        self._renderStartTime = time.perf_counter()
+
+    def onRenderEnd(self, caller, event) -> None:
+        if self._renderStartTime is not None:
+            self.logic.profiler.recordRender(time.perf_counter() - self._renderStartTime)
+            self._renderStartTime = None
+
+    def updateStatisticsTable(self) -> None:
+        """Show the latest joint interaction statistics in the module panel."""
+        columns = self.logic.profiler.columns
+        rows = self.logic.profiler.summary()
+        table = self.ui.statisticsTable
+        table.clear()
+        table.setColumnCount(len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setRowCount(len(rows))
+        for rowIndex, row in enumerate(rows):
+            for columnIndex, column in enumerate(columns):
+                value = row[column]
+                text = f"{value:.3f}" if isinstance(value, float) else str(value)
+                table.setItem(rowIndex, columnIndex, qt.QTableWidgetItem(text))
+        table.resizeColumnsToContents()
+
+    def onResetStatisticsButton(self) -> None:
+        self.logic.profiler.reset()
+        self.updateStatisticsTable()
+
+    def onExportStatisticsButton(self) -> None:
+        path = qt.QFileDialog.getSaveFileName(None, _("Export joint interaction statistics"), "", "CSV files (*.csv)")
+        if not path:
+            return
+        self.logic.profiler.writeCSV(path)
+        self.updateStatisticsTable()
     
         
             
@@ -392,240 +535,255 @@ class URDF_ImportLogic(ScriptedLoadableModuleLogic):
     Uses ScriptedLoadableModuleLogic base class, available at:
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
-    joints = {}
     
     def __init__(self) -> None:
         """Called when the logic class is instantiated. Can be used for initializing member variables."""
         ScriptedLoadableModuleLogic.__init__(self)
+        # Editable joints of the loaded robots: joint transform node ID -> {"model", "jointIndex"}, and the joint
+        # transform node IDs of each kinematic model: model -> {joint index: node ID}
+        self.joints = {}
+        self._modelJointNodeIDs = {}
+        # Latency and clamp statistics of the joint limit observers
+        self.profiler = JointInteractionProfiler()
+        # Lazy mesh loading: meshes waiting to be read (model node ID -> (mesh path, mesh transform)),
+        # meshes being read and the display node observers of their placeholders
+        self.meshLoader = None
+        self.meshLoadingProgressCallback = None
+        self._pendingMeshes = {}
+        self._loadingMeshes = {}
+        self._placeholderObservers = {}
+        self._meshesTotal = 0
+        self._meshesLoaded = 0
+        self._meshLoadingTimer = None
+        # Flattened transform hierarchies: joint transform node ID -> (hierarchy, joint index)
+        self._flatHierarchyJoints = {}
+        # Models and editable joint transforms of the loaded robots
+        self.robotModelNodeIDs = []
+        self.jointTransformNodeIDs = []
+        # Clearance monitoring: monitor, joint observers, models closer to the anatomy than the threshold and
+        # a function called with (closest model name, its clearance, names of models that are too close) after each check
+        self.clearanceMonitor = None
+        self.clearanceCallback = None
+        self._clearanceObservers = []
+        self._tooCloseModels = set()
+        # Instanced mesh actors added to the 3D views and the observers that update them:
+        # model node ID -> (MeshInstances, [(render window, actor)], [(observed node, observer tag)])
+        self._instancedActors = {}
+        self._instancedActorsCleanupObserver = None
+        self._instancedModelsSaveObserver = None
+        # Kinematic model and robot transform node of the last loaded robot, used for swept volumes
+        self.robotModel = None
+        self.robotToWorldTransformNodeID = None
+        # Set while setJointMotions modifies joint transforms, the joint observers do nothing then
+        self._settingJointMotions = False
+        # Import started by startImport: its state, the timer that advances it, a function called with
+        # (stage, steps done, step count) as it progresses and one called with (error or None, cancelled) when it is over
+        self._importJob = None
+        self._importTimer = None
+        self.importProgressCallback = None
+        self.importFinishedCallback = None
+        # Events invoked during the scene batches of the last import, and how deeply sceneBatch blocks are nested
+        self.suppressedEventCount = 0
+        self._sceneBatchDepth = 0
+        # Motion planning: the collision checker and roadmaps of the last planning environment with its key (robot, environment
+        # and planning parameters), and the path being played back on the joint transforms with the timer that advances it
+        self._planningEnvironment = None
+        self._jointPathPlayback = None
+        self._jointPathTimer = None
+        # Surface registration: link surface samples and their indices by robot, link models and sample spacing
+        self._surfaceRegistrations = {}
+        # Import of the last loaded robot (description, import options, its nodes by name, flattened hierarchy and mesh file stamps)
+        # used to reload it, the watcher of its files, the timer that reloads it after they changed and a function called with
+        # (RobotDiff or None, error or None) after each reload
+        self.robotImport = None
+        self._robotFileWatcher = None
+        self._robotReloadTimer = None
+        self.robotReloadedCallback = None
+        # Scene observer that forgets the robots of a closed scene (see restoreRobots)
+        self._robotSceneCloseObserver = None
+        # Joint value sequence browsed by the robot (sequence, browser and proxy node IDs, proxy observer and joint value names),
+        # the joint observers that write the proxy while recording and whether the proxy is being written or applied
+        self._jointSequence = None
+        self._jointRecordingObservers = []
+        self._updatingJointSequenceProxy = False
 
     def getParameterNode(self):
         return URDF_ImportParameterNode(super().getParameterNode())
 
     # create a flag to prevent looping in adjust
     
-    # Calculates axis angle representation from rotation matrix 
+    # Calculates axis angle representation [angle, x, y, z] from rotation matrix (vtkMatrix4x4), angle is in [0, pi]
     def matrixToAngle(self, m):
-        epsilon = 0.01 # margin to allow for rounding errors
-        epsilon2 = 0.1 # margin to distinguish between 0 and 180 degrees
-        # optional check that input is pure rotation, 'isRotationMatrix' is defined at:
-        # https://www.euclideanspace.com/maths/algebra/matrix/orthogonal/rotation/
-        #assert isRotationMatrix(m) : "not valid rotation matrix" // for debugging
-        if abs(m.GetElement(0,1)-m.GetElement(1,0)) < epsilon and abs(m.GetElement(0,2)-m.GetElement(2,0)) < epsilon and abs(m.GetElement(1,2)-m.GetElement(2,1))< epsilon:
-            # singularity found
-            # first check for identity matrix which must have +1 for all terms
-            #  in leading diagonaland zero in other terms
-            if abs(m.GetElement(0,1)+m.GetElement(1,0)) < epsilon2 and abs(m.GetElement(0,2)+m.GetElement(2,0)) < epsilon2 and abs(m.GetElement(1,2)+m.GetElement(2,1)) < epsilon2 and abs(m.GetElement(0,0)+m.GetElement(1,1)+m.GetElement(2,2)-3) < epsilon2:
-
-                # this singularity is identity matrix so angle = 0
-                axisAngle = [0,1,0,0] # zero angle, arbitrary axis
-                
-            else:
-            # otherwise this singularity is angle = 180
-                angle = math.pi
-                xx = (m.GetElement(0,0)+1)/2
-                yy = (m.GetElement(1,1)+1)/2
-                zz = (m.GetElement(2,2)+1)/2
-                xy = (m.GetElement(0,1)+m.GetElement(1,0))/4
-                xz = (m.GetElement(0,2)+m.GetElement(2,0))/4
-                yz = (m.GetElement(1,2)+m.GetElement(2,1))/4
-                if xx > yy and xx > zz: # m[0][0] is the largest diagonal term
-                    if xx < epsilon:
-                        x = 0
-                        y = 0.7071
-                        z = 0.7071
-                    else:
-                        x = math.sqrt(xx)
-                        y = xy/x
-                        z = xz/x
-                elif yy > zz: # m[1][1] is the largest diagonal term
-                    if yy< epsilon:
-                        x = 0.7071
-                        y = 0
-                        z = 0.7071
-                    else:
-                        y = math.sqrt(yy)
-                        x = xy/y
-                        z = yz/y
-                else: # m[2][2] is the largest diagonal term so base result on this
-                    if zz< epsilon:
-                        x = 0.7071
-                        y = 0.7071
-                        z = 0
-                    else:
-                        z = math.sqrt(zz)
-                        x = xz/z
-                        y = yz/z
-
-                axisAngle = [angle,x,y,z] # return 180 deg rotation
-        else:        
-        # as we have reached here there are no singularities so we can handle normally
-            s = math.sqrt((m.GetElement(2,1) - m.GetElement(1,2))*(m.GetElement(2,1) - m.GetElement(1,2))
-                +(m.GetElement(0,2) - m.GetElement(2,0))*(m.GetElement(0,2)- m.GetElement(2,0))
-                +(m.GetElement(1,0) - m.GetElement(0,1))*(m.GetElement(1,0) - m.GetElement(0,1))) # used to normalise
-            if abs(s) < 0.001:
-                s=1 
-                # prevent divide by zero, should not happen if matrix is orthogonal and should be
-                # caught by singularity test above, but I've left it in just in case
-            angle = math.acos(( m.GetElement(0,0) + m.GetElement(1,1) + m.GetElement(2,2) - 1)/2)
-            x = (m.GetElement(2,1) - m.GetElement(1,2))/s
-            y = (m.GetElement(0,2) - m.GetElement(2,0))/s
-            z = (m.GetElement(1,0) - m.GetElement(0,1))/s
-            axisAngle = [angle,x,y,z]
-
-        return(axisAngle)
-    
+        axis, angle = matrixToAxisAngle(fromVTKMatrices(m)[:3, :3])
+        return [float(angle)] + axis.tolist()
 
-    # converts quaternion to transform matrix representation
-    #code from https://github.com/li-xl/rotationconverter/tree/master, modified to create 4 by 4 transform matrix
+    # converts quaternion (w, x, y, z) to transform matrix representation
     def quaternion2matrix(self, quaternion):
         if quaternion is None:
             return None
-        a = quaternion[0]
-        b = quaternion[1]
-        c = quaternion[2]
-        d = quaternion[3]
-
-        m = numpy.array([[1-2*(c*c+d*d),2*b*c-2*a*d,2*a*c+2*b*d,0.00],
-                [2*b*c+2*a*d,1-2*(b*b+d*d),2*c*d-2*a*b,0.00],
-                [2*b*d-2*a*c,2*a*b+2*c*d,1-2*(b*b+c*c),0.00],[0.00, 0.00, 0.00, 1.00]],dtype=numpy.float32)
+        m = numpy.eye(4)
+        m[:3, :3] = quaternionToMatrix(quaternion)
         return m
 
-    # converts axis angle to quarternion representation
-    # code from https://github.com/li-xl/rotationconverter/tree/master
+    # converts axis angle [angle, x, y, z] (or rotation vector if with_magnitude) to quaternion representation
     def axis2quaternion(self, axis_angle,with_magnitude=False):
         if axis_angle is None:
-            print("no axis angle")
             return None
+        axis_angle = numpy.asarray(axis_angle, dtype=numpy.float64)
         if with_magnitude:
-            angle = numpy.linalg.norm(axis_angle)
-            axis_angle = axis_angle/angle
-        else:
-            angle = axis_angle[0]
-            axis_angle = axis_angle[-3:]
-            axis_angle /=numpy.linalg.norm(axis_angle)
-        a = numpy.cos(angle/2)
-        s = numpy.sin(angle/2)
-        b,c,d = axis_angle*s
-        quaternion = numpy.array([a,b,c,d],numpy.float32)
-        return quaternion
+            return axisAngleToQuaternion(axis_angle, numpy.linalg.norm(axis_angle))
+        return axisAngleToQuaternion(axis_angle[-3:], axis_angle[0])
 
     # converts axis angle to matrix representation
-    # code from https://github.com/li-xl/rotationconverter/tree/master
     def axis2matrix(self,axis_angle,with_magnitude=False):
-        axis_angle
-        if axis_angle is None:
-            return None
-        
-        quaternion = self.axis2quaternion(axis_angle,with_magnitude=with_magnitude)
-        m = self.quaternion2matrix(quaternion)
-        
-        return m
-
-    #Makes identity matrix modified for translation along axis
-    def matrixFromTranslate(self, translate, link):
-        axis = [float(x) for x in link.find("axis").get("xyz").split()]
-        matrix = vtk.vtkMatrix4x4()
-        if(axis[0] == 1.0):
-            matrix.SetElement(0, 3, translate)
-        elif(axis[1] == 1.0):
-            matrix.SetElement(1, 3, translate)
-        else:
-            matrix.SetElement(2, 3, translate)
-        return matrix
-
-    #Method for transform observer with rotational nodes; sets and uses limits from URDF
-    def onRotateNode(self, caller, event):
+        return self.quaternion2matrix(self.axis2quaternion(axis_angle,with_magnitude=with_magnitude))
+
+    #Method for transform observer of joint nodes; removes motion that the joint cannot perform (e.g., rotation about
+    #other axes than the joint axis) and clamps the joint values to the limits from URDF
+    #Mimic joints follow their driving joint: their own motion is replaced and moving the driver moves them all in one batch.
+    def onJointNode(self, caller, event):
+        if self._settingJointMotions:
+            return
+        startTime = time.perf_counter()
         transformNode = caller
-        nodeName = transformNode.GetName()
-        upperLimit = self.joints[nodeName]["upper"]
-        lowerLimit = self.joints[nodeName]["lower"]
-        newMatrix = vtk.vtkMatrix4x4()
-        transformNode.GetMatrixTransformFromParent(newMatrix)             
-        angleRep = self.matrixToAngle(newMatrix)
-        angleRep[0] = round(angleRep[0], 3)
-        if(angleRep[1] == 1 or angleRep[2] == 1 or angleRep[3] == 1):
-            newAngle = -angleRep[0]
-            newAngle = round(newAngle, 3)
-            if(newAngle < lowerLimit):
-                #print("At lower rotation limit")
-                transformNode.SetMatrixTransformToParent(self.joints[nodeName]["lowerMatrix"])
+        joint = self.joints[transformNode.GetID()]
+        model = joint["model"]
+        jointIndex = joint["jointIndex"]
+        motion = fromVTKMatrices(transformNode.GetMatrixTransformToParent())
+        driverIndex = model.mimicDrivers[jointIndex]
+        if driverIndex >= 0:
+            driverMotion = fromVTKMatrices(self.jointNode(model, driverIndex).GetMatrixTransformToParent())
+            q = model.applyMimicJoints(model.jointValuesFromMotions(driverMotion[None], [driverIndex]))
+            constrainedMotion, clamped = model.jointMotions(q, [jointIndex])[0], False
         else:
-            if(angleRep[0] > upperLimit):
-               # print("At upper rotation limit")
-                transformNode.SetMatrixTransformToParent(self.joints[nodeName]["upperMatrix"])
-            if(angleRep[0] < lowerLimit):
-                    
-                #print("At lower rotation limit")
-                transformNode.SetMatrixTransformToParent(self.joints[nodeName]["lowerMatrix"])
-
-    #Method for transform observer with translation; sets and uses limits from URDF  
-    #Note: currently only for meter scaling
-    def onTranslateNode(self, caller, event):
-        transformNode = caller
-        nodeName = transformNode.GetName()
-        upperLimit = self.joints[nodeName]["upper"]
-        lowerLimit = self.joints[nodeName]["lower"]
-        originX = self.joints[nodeName]["originX"]
-        originY = self.joints[nodeName]["originY"]
-        originZ = self.joints[nodeName]["originZ"]
-        axis = self.joints[nodeName]["axis"]
-        newMatrix = vtk.vtkMatrix4x4()
-        transformNode.GetMatrixTransformFromParent(newMatrix)
-        translatedAmount = 0
-        if(axis == [1, 0, 0]):
-            translatedAmount = -newMatrix.GetElement(0,3)
-            if(newMatrix.GetElement(0,3) != originX):
-                #translatedAmount /= 1000
-                pass
-        elif(axis == [0, 1, 0]):
-            translatedAmount = -newMatrix.GetElement(1,3)
-            if(newMatrix.GetElement(1,3) != originY):
-                #translatedAmount /= 1000
-                pass
-        elif(axis == [0, 0, 1]):
-            translatedAmount = -newMatrix.GetElement(2,3)
-            if(newMatrix.GetElement(2,3) != originZ):
-               # translatedAmount /= 1000
-                pass
-        elif(axis == [-1, 0, 0]):
-            translatedAmount = newMatrix.GetElement(0,3)
-            if(newMatrix.GetElement(0,3) != originX):
-                #translatedAmount /= 1000
-                pass
-        elif(axis == [0, -1, 0]):
-            translatedAmount = newMatrix.GetElement(1,3)
-            if(newMatrix.GetElement(1,3) != originY):
-               # translatedAmount /= 1000
-                pass
-        elif(axis == [0, 0, -1]):
-            translatedAmount = newMatrix.GetElement(2,3)
-            if(newMatrix.GetElement(2,3) != originZ):
-                #translatedAmount /= 1000
-                pass
-        translatedAmount = round(translatedAmount, 3)
-        if(translatedAmount > upperLimit):
-            #print("At upper translation limit")
-            transformNode.SetMatrixTransformToParent(self.joints[nodeName]["upperMatrix"])
-        if(translatedAmount < lowerLimit):
-           # print("At lower translation limit")
-            transformNode.SetMatrixTransformToParent(self.joints[nodeName]["lowerMatrix"])
-
-    #Converts arrays from 3 by 3 transform matrices to 4x4 vtk matrices   
+            constrainedMotion, clamped = model.constrainJointMotion(jointIndex, motion)
+        # the constrained motion is set only if it differs, so that setting it does not trigger another update
+        changed = numpy.abs(constrainedMotion - motion).max() > JOINT_LIMIT_TOLERANCE
+        if changed:
+            # the observer is called again for the constrained motion and moves the mimic joints then
+            transformNode.SetMatrixTransformToParent(toVTKMatrices(constrainedMotion))
+        followers = model.mimicFollowers(jointIndex)
+        if len(followers) and driverIndex < 0 and not changed:
+            q = model.applyMimicJoints(model.jointValuesFromMotions(constrainedMotion[None], [jointIndex]))
+            # flattened hierarchies and clearance are updated by the observers of this joint, which run after this one
+            self.setJointMotions(model, followers, model.jointMotions(q, followers), updateObservers=False)
+        self.profiler.record(model.jointNames[jointIndex], time.perf_counter() - startTime, clamped and changed)
+
+    #Transform node of a joint of a loaded robot, None if the joint has no node (fixed joints) or it was deleted
+    def jointNode(self, model, jointIndex):
+        nodeID = self._modelJointNodeIDs.get(model, {}).get(jointIndex)
+        return slicer.mrmlScene.GetNodeByID(nodeID) if nodeID else None
+
+    #Makes the joint transform node of a joint of model follow the model: its motion is constrained by onJointNode and jointNode finds it
+    def _addJoint(self, model, jointIndex, jointTransformNode):
+        self.joints[jointTransformNode.GetID()] = {"model": model, "jointIndex": jointIndex}
+        self._modelJointNodeIDs.setdefault(model, {})[jointIndex] = jointTransformNode.GetID()
+
+    #Rebuilds the joint transform node IDs of each kinematic model from self.joints
+    def _indexJointNodes(self):
+        self._modelJointNodeIDs = {}
+        for nodeID, joint in self.joints.items():
+            self._modelJointNodeIDs.setdefault(joint["model"], {})[joint["jointIndex"]] = nodeID
+
+    #Sets the motions (N, 4, 4) of joints (N joint indices of model) in one batch: the joint observers are not called
+    #for each joint, instead flattened hierarchies and the clearance are updated once at the end (unless updateObservers
+    #is False because the caller takes care of it)
+    def setJointMotions(self, model, joints, motions, updateObservers=True):
+        hierarchies = {}
+        self._settingJointMotions = True
+        try:
+            for jointIndex, motion in zip(joints, motions):
+                jointTransformNode = self.jointNode(model, jointIndex)
+                if jointTransformNode is None:
+                    continue
+                jointTransformNode.SetMatrixTransformToParent(toVTKMatrices(motion))
+                if jointTransformNode.GetID() in self._flatHierarchyJoints:
+                    hierarchy, hierarchyJointIndex = self._flatHierarchyJoints[jointTransformNode.GetID()]
+                    hierarchy["motions"][hierarchyJointIndex] = motion
+                    hierarchies[id(hierarchy)] = hierarchy
+        finally:
+            self._settingJointMotions = False
+        if not updateObservers:
+            return
+        for hierarchy in hierarchies.values():
+            self.updateFlatHierarchy(hierarchy)
+        if self.clearanceMonitor:
+            self.updateClearance()
+        if self._jointRecordingObservers and not self._updatingJointSequenceProxy:
+            self.updateJointSequenceProxy()
+
+    #Moves the joints of the last loaded robot to joint values q (dofCount,) of robotModel in one batch. Values are
+    #clamped to the joint limits and mimic joints follow their drivers.
+    def setJointValues(self, q):
+        from URDF_ImportLib.kinematics import FIXED
+        model = self.robotModel
+        q = model.applyMimicJoints(model.clampJointValues(q)[0])
+        joints = numpy.nonzero(model.jointTypes != FIXED)[0]
+        self.setJointMotions(model, joints, model.jointMotions(q, joints))
+
+    #Converts 3x3 or 4x4 arrays to 4x4 vtk matrices (a list of them for arrays of matrices)
     def arrayToVTKMatrix(self, array):
-        matrix = vtk.vtkMatrix4x4()
-        for i in range (4):
-            for j in range (4):
-                matrix.SetElement(i, j, array[i][j])
-        return matrix
+        return toVTKMatrices(array)
 
     #Importer process on "load" button
-    def process(self, robotPath, meshFolder, scaleIsM, useCollisionMesh) -> None:
-        
-        import SampleData
-        import xml.etree.ElementTree as ET
+    def process(self, robotPath, meshFolder, scaleIsM, useCollisionMesh, lazyMeshes=False, flatHierarchy=False, mergeFixedLinks=False,
+                instanceMeshes=False) -> None:
+        description = self.readRobotDescription(robotPath, meshFolder)
+        self.suppressedEventCount = 0
+        with self.sceneBatch():
+            for stepsDone, stepCount in self.importSteps(description, meshFolder, scaleIsM, useCollisionMesh, lazyMeshes, flatHierarchy,
+                                                         mergeFixedLinks, instanceMeshes):
+                pass
+        logging.info(f"Robot imported, {self.suppressedEventCount} scene events were batched")
+
+    #Runs the scene changes made in the with block as one batch process: views and other scene observers update once at the
+    #end instead of after every change. The events invoked meanwhile by the scene and by the nodes added in the block are
+    #counted in suppressedEventCount. Nested blocks are part of the outermost batch. The IDs of the nodes added in the
+    #outermost block are appended to addedNodeIDs if it is given.
+    @contextlib.contextmanager
+    def sceneBatch(self, addedNodeIDs=None):
+        if self._sceneBatchDepth:
+            self._sceneBatchDepth += 1
+            try:
+                yield
+            finally:
+                self._sceneBatchDepth -= 1
+            return
+        nodeObservers = []
+
+        def onEvent(caller, event):
+            self.suppressedEventCount += 1
+
+        @vtk.calldata_type(vtk.VTK_OBJECT)
+        def onNodeAdded(caller, event, node):
+            nodeObservers.append((node, node.AddObserver(vtk.vtkCommand.AnyEvent, onEvent)))
+            if addedNodeIDs is not None:
+                addedNodeIDs.append(node.GetID())
+
+        slicer.mrmlScene.StartState(slicer.vtkMRMLScene.BatchProcessState)
+        self._sceneBatchDepth = 1
+        sceneObservers = [slicer.mrmlScene.AddObserver(vtk.vtkCommand.AnyEvent, onEvent),
+                          slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.NodeAddedEvent, onNodeAdded)]
+        try:
+            yield
+        finally:
+            for observer in sceneObservers:
+                slicer.mrmlScene.RemoveObserver(observer)
+            for node, observer in nodeObservers:
+                node.RemoveObserver(observer)
+            self._sceneBatchDepth = 0
+            slicer.mrmlScene.EndState(slicer.vtkMRMLScene.BatchProcessState)
+
+    #Parses a robot file (or bundle) and builds its kinematic model. The scene is not modified, so this can run on a worker thread.
+    #Returns a dict with the robot path and text, the URDFDescription, the bundle (None for robot files), the kinematic model and the package index.
+    def readRobotDescription(self, robotPath, meshFolder):
+        from URDF_ImportLib.bundle import BUNDLE_EXTENSION, RobotBundle
+        from URDF_ImportLib.kinematics import RobotModel
+        from URDF_ImportLib.urdfparser import parseURDFString
+        from URDF_ImportLib.packagepaths import PackageIndex
         # Gets paths for the robot and the directory of mesh files from user input
         
-        pathExt = pathlib.Path(robotPath).suffix #find suffix to tell if file is URDF or xacro
+        pathExt = os.path.splitext(robotPath)[1] #find suffix to tell if file is URDF or xacro
         # TODO: xacro to urdf conversions
         """ if(pathExt == ".xacro"):
             robotPath = xacroToUrdf(robotPath)
@@ -637,84 +795,1597 @@ class URDF_ImportLogic(ScriptedLoadableModuleLogic):
             tree = ET.parse(robotPath)"""
         
         # Parse robot description file   
-        # Parse XML data from a file
-        tree = ET.parse(robotPath)
-        robot = tree.getroot()
-        if robot.tag != "robot":
-            raise ValueError("Invalid URDF file")
+        bundle = None
+        if pathExt == BUNDLE_EXTENSION:
+            # Robot bundle: the URDF and all meshes are read from one memory-mapped file
+            bundle = RobotBundle(robotPath)
+            urdfText = bundle.urdfText
+        else:
+            with open(robotPath, "rb") as robotFile:
+                urdfText = robotFile.read()
+        # The text is parsed in one pass, all attributes the import needs are extracted into arrays
+        urdf = parseURDFString(urdfText)
+        for reference in urdf.danglingReferences:
+            logging.warning(f"{os.path.basename(robotPath)}: {reference}")
+        return {
+            "robotPath": robotPath,
+            "urdfText": urdfText,
+            "urdf": urdf,
+            "bundle": bundle,
+            # Kinematic model used for joint limits and to compute the link poses when the transform hierarchy is flattened
+            "model": bundle.robotModel if bundle is not None else RobotModel.fromDescription(urdf),
+            # package:// mesh URIs are resolved from the packages found next to the meshes and the robot file
+            "packageIndex": PackageIndex([meshFolder, os.path.dirname(robotPath)]),
+        }
+
+    #Adds the nodes of a robot read by readRobotDescription to the scene. This is a generator that yields (steps done, step count)
+    #before each link and joint, so that an import can be spread over several timer events (see startImport); process runs
+    #it to the end at once. meshCache holds mesh files that were read in advance (see readCachedMeshFile).
+    def importSteps(self, description, meshFolder, scaleIsM, useCollisionMesh, lazyMeshes=False, flatHierarchy=False, mergeFixedLinks=False,
+                    instanceMeshes=False, meshCache=None):
+        from URDF_ImportLib.meshloading import mergeMeshes
+        from URDF_ImportLib.robotdiff import meshStamps
+        urdf = description["urdf"]
+        bundle = description["bundle"]
+        model = description["model"]
+        packageIndex = description["packageIndex"]
+        if mergeFixedLinks or instanceMeshes:
+            # merged and instanced links have no model node to attach a chain of transforms to, their poses come from the kinematic model
+            flatHierarchy = True
+        # Links of each rigid body (links connected by fixed joints) that are merged into the model of its first link
+        mergedLinks = {}
+        if mergeFixedLinks:
+            bodyLinks, linkToBody = model.rigidBodies()
+            for linkIndex, bodyLinkIndex in enumerate(bodyLinks):
+                if bodyLinkIndex != linkIndex:
+                    mergedLinks.setdefault(bodyLinkIndex, []).append(linkIndex)
+        # Links that share a mesh file are drawn as instances of one mesh
+        instancedLinks = set()
+        instanceGroups = []
+        if instanceMeshes:
+            rigidBodyLinks = set(mergedLinks) | {linkIndex for linkIndices in mergedLinks.values() for linkIndex in linkIndices}
+            instanceGroups = self.readInstancedMeshes(urdf, rigidBodyLinks, meshFolder, useCollisionMesh, packageIndex, bundle, meshCache)
+            for instances, linkIndices in instanceGroups:
+                instancedLinks.update(linkIndices)
         
         nodes = {}
         
         
 
-        for link in robot:
-            name = link.get("name")
-            if link.tag == "link":
-                try: 
-                    if useCollisionMesh:
-                        stlFilePath = meshFolder + '/' + link.find('collision').find('geometry').find('mesh').attrib["filename"]
-                    else:
-                        stlFilePath = meshFolder + '/' + link.find('visual').find('geometry').find('mesh').attrib["filename"]
-                    # Use RAS coordinate system to avoid model conversion from LPS to RAS (we can transform the entire robot as a whole later if needed)
-                    modelNode = slicer.modules.models.logic().AddModel(stlFilePath, slicer.vtkMRMLStorageNode.CoordinateSystemRAS)
-                except:
-                    # No mesh found, add a sphere
-                    print("sphere in use")
-                    sphere = vtk.vtkSphereSource()
-                    sphere.SetRadius(0.01)
-                    modelNode = slicer.modules.models.logic().AddModel(sphere.GetOutputPort())
-                modelNode.SetName(name)
-                nodes[name] = { "type": "link", "model": modelNode}
-                setUpMeshes(link, nodes, modelNode)
-            elif link.tag == "joint":
-                jointTransformNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode", name)
-                nodes[name] = { "type": "joint", "transform": jointTransformNode}
-                if link.get("type") == "fixed":
-                    # do not create a display node, the transform does not have to be editable
-                    pass
+        # merging, hierarchy and connecting the nodes are the last step
+        stepCount = len(urdf.elementOrder) + 1
+        for stepIndex, (elementType, elementIndex) in enumerate(urdf.elementOrder):
+            yield stepIndex, stepCount
+            if elementType == "link":
+                name = urdf.linkNames[elementIndex]
+                if mergeFixedLinks and bodyLinks[model.linkIndex[name]] != model.linkIndex[name]:
+                    # added to the model of its rigid body below
+                    continue
+                if instanceMeshes and model.linkIndex[name] in instancedLinks:
+                    # drawn by the model of its mesh instances below
+                    continue
+                # meshes that other links are merged into are read right away
+                self.addLinkModel(description, elementIndex, nodes, meshFolder, useCollisionMesh,
+                                  lazyMeshes and model.linkIndex[name] not in mergedLinks, flatHierarchy, meshCache)
+            else:
+                name = urdf.jointNames[elementIndex]
+                if flatHierarchy and urdf.jointTypeNames[elementIndex] == "fixed":
+                    # fixed joint origins are part of the link poses computed by makeFlatHierarchy
+                    continue
+                self.addJointTransform(description, elementIndex, nodes)
+
+        yield len(urdf.elementOrder), stepCount
+        for bodyLinkIndex, linkIndices in mergedLinks.items():
+            modelNode = nodes[model.linkNames[bodyLinkIndex]]["model"]
+            meshes = [modelNode.GetPolyData()]
+            for linkIndex in linkIndices:
+                linkMesh = self.readMergedLinkMesh(urdf, linkIndex, linkToBody[linkIndex] @ model.visualOrigins[linkIndex],
+                                                   meshFolder, useCollisionMesh, packageIndex, bundle, meshCache)
+                if linkMesh is not None:
+                    meshes.append(linkMesh)
+            modelNode.SetAndObservePolyData(mergeMeshes(meshes))
+            # the LinkIndex cell array refers to this list of link names
+            modelNode.SetAttribute("URDF_Import.MergedLinks", " ".join(model.linkNames[linkIndex] for linkIndex in [bodyLinkIndex] + linkIndices))
+        instanceModelNodes = []
+        for instances, linkIndices in instanceGroups:
+            modelNode = slicer.modules.models.logic().AddModel(instances.mergedPolyData)
+            modelNode.SetName(f"{model.linkNames[linkIndices[0]]} instances")
+            # the LinkIndex cell array refers to this list of link names
+            modelNode.SetAttribute("URDF_Import.MergedLinks", " ".join(model.linkNames[linkIndex] for linkIndex in linkIndices))
+            nodes[modelNode.GetName()] = { "type": "link", "model": modelNode}
+            instanceModelNodes.append(modelNode)
+        hierarchy = None
+        if flatHierarchy:
+            hierarchy = self.makeFlatHierarchy(nodes, model, instanceGroups)
+        else:
+            makeNodeHierarchy(nodes, urdf)
+        robotToWorldTransformNode = connectNodes(nodes, scaleIsM)
+        for (instances, linkIndices), modelNode in zip(instanceGroups, instanceModelNodes):
+            self.addInstancedActors(instances, modelNode, robotToWorldTransformNode)
+        self.robotModelNodeIDs += [node["model"].GetID() for node in nodes.values() if node["type"] == "link"]
+        self.robotModel = model
+        self.robotToWorldTransformNodeID = robotToWorldTransformNode.GetID()
+        self.robotImport = {
+            "description": description,
+            "options": {"meshFolder": meshFolder, "scaleIsM": scaleIsM, "useCollisionMesh": useCollisionMesh, "lazyMeshes": lazyMeshes,
+                        "flatHierarchy": flatHierarchy, "mergeFixedLinks": mergeFixedLinks, "instanceMeshes": instanceMeshes},
+            "nodeIDs": {name: (node["model"] if node["type"] == "link" else node["transform"]).GetID() for name, node in nodes.items()},
+            "hierarchy": hierarchy,
+            "meshStamps": meshStamps(urdf, meshFolder, useCollisionMesh, packageIndex) if bundle is None else {},
+            "instanceNodeNames": [modelNode.GetName() for modelNode in instanceModelNodes],
+        }
+        self.saveRobotState()
+        if lazyMeshes:
+            self.startMeshLoading()
+
+    #Adds the model node of a link (index in the URDFDescription) of a robot read by readRobotDescription to nodes, see importSteps
+    def addLinkModel(self, description, linkIndex, nodes, meshFolder, useCollisionMesh, lazyMeshes=False, flatHierarchy=False, meshCache=None):
+        from URDF_ImportLib.meshloading import meshFileBounds, placeholderPolyData, readCachedMeshFile
+        from URDF_ImportLib.packagepaths import resolveMeshPath
+        urdf = description["urdf"]
+        bundle = description["bundle"]
+        model = description["model"]
+        name = urdf.linkNames[linkIndex]
+        deferredMeshPath = None
+        meshScaling = None
+        try: 
+            if bundle is not None:
+                # Mesh buffers are used directly from the bundle (already scaled), no need to load them lazily
+                modelNode = slicer.modules.models.logic().AddModel(bundle.linkPolyData(name))
+            else:
+                meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+                if meshFilename is None:
+                    raise ValueError(f"Link {name} has no mesh")
+                meshFilePath = resolveMeshPath(meshFilename, meshFolder, description["packageIndex"])
+                meshScaling = urdf.meshScale(linkIndex, useCollisionMesh)
+                if lazyMeshes:
+                    # Show the bounding box of the mesh now, the mesh itself is read in the background
+                    modelNode = slicer.modules.models.logic().AddModel(placeholderPolyData(meshFileBounds(meshFilePath), scale=meshScaling))
+                    deferredMeshPath = meshFilePath
                 else:
-                    # make the transform interactively editable in 3D views
-                    
-                    jointTransformNode.CreateDefaultDisplayNodes()
-                    displayNode = jointTransformNode.GetDisplayNode()
-                    displayNode.SetEditorVisibility(True)
-                    displayNode.SetEditorSliceIntersectionVisibility(False)
-                    displayNode.SetEditorTranslationEnabled(False)
-                    makeLinks(link, displayNode)
-
-                    #sets translate limits for prismatic joints
-                    if link.get("type") == "prismatic":
-                        lowerLimit = setLowerLim(link, "translate")
-                        upperLimit = setUpperLim(link, "translate")
-
-                        originX = float(link.find("origin").get("xyz").split()[0])
-                        originY = float(link.find("origin").get("xyz").split()[1])
-                        originZ = float(link.find("origin").get("xyz").split()[2])
-                        jointAxis = link.find("axis").get("xyz").split()
-                        jointAxis[0] = float(jointAxis[0])
-                        jointAxis[1] = float(jointAxis[1])
-                        jointAxis[2] = float(jointAxis[2])
-                        lowerMatrix = self.matrixFromTranslate(lowerLimit, link)
-                        upperMatrix = self.matrixFromTranslate(upperLimit, link)
-                        self.joints[name] = {"upper": upperLimit, "lower" : lowerLimit, "originX" : originX,
-                                             "originY" : originY, "originZ": originZ, "lowerMatrix": lowerMatrix,
-                                             "upperMatrix": upperMatrix, "axis": jointAxis}
-                        jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onTranslateNode)
-                        
-                    #sets rotation limits for rotational joints
-                    elif link.get("type") == "revolute" or link.get("type") == "continuous":
-                        
-                        lowerLimit = setLowerLim(link, "rotate")
-                        upperLimit = setUpperLim(link, "rotate")
-
-                        lowerMatrix = self.arrayToVTKMatrix(self.axis2matrix(lowerAxang(link)))
-                        upperMatrix = self.arrayToVTKMatrix(self.axis2matrix(upperAxang(link)))
-                        self.joints[name] = {"upper": upperLimit, "lower" : lowerLimit, 
-                                             "upperMatrix": upperMatrix, "lowerMatrix": lowerMatrix}
-                        jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onRotateNode)
-                    
-        makeNodeHierarchy(nodes, robot)
-        connectNodes(nodes, scaleIsM)
+                    # Meshes are read in RAS coordinate system to avoid model conversion from LPS to RAS (we can transform the entire robot as a whole later if needed)
+                    modelNode = slicer.modules.models.logic().AddModel(readCachedMeshFile(meshCache, meshFilePath, scale=meshScaling))
+        except (KeyError, OSError, ValueError) as error:
+            # No mesh found, add a sphere
+            logging.warning(f"Mesh of {name} is not loaded, a sphere is shown instead: {error}")
+            sphere = vtk.vtkSphereSource()
+            sphere.SetRadius(0.01)
+            modelNode = slicer.modules.models.logic().AddModel(sphere.GetOutputPort())
+        modelNode.SetName(name)
+        nodes[name] = { "type": "link", "model": modelNode}
+        if flatHierarchy:
+            meshTransform = bakeMeshOrigin(modelNode, model.visualOrigins[model.linkIndex[name]])
+        else:
+            visualOrigin = model.visualOrigins[model.linkIndex[name]] if urdf.hasVisualOrigin[linkIndex] else None
+            meshTransform = setUpMeshes(name, visualOrigin, nodes, modelNode)
+        if deferredMeshPath:
+            self.deferMeshLoading(modelNode, deferredMeshPath, meshTransform, meshScaling)
+        return modelNode
+
+    #Adds the transform node of a joint (index in the URDFDescription) of a robot read by readRobotDescription to nodes, see importSteps
+    def addJointTransform(self, description, jointIndex, nodes):
+        urdf = description["urdf"]
+        model = description["model"]
+        name = urdf.jointNames[jointIndex]
+        jointType = urdf.jointTypeNames[jointIndex]
+        jointTransformNode = addTransformNode(name)
+        nodes[name] = { "type": "joint", "transform": jointTransformNode}
+        if jointType == "fixed":
+            # do not create a display node, the transform does not have to be editable
+            return jointTransformNode
+        # make the transform interactively editable in 3D views
+        jointTransformNode.CreateDefaultDisplayNodes()
+        self.jointTransformNodeIDs.append(jointTransformNode.GetID())
+        displayNode = jointTransformNode.GetDisplayNode()
+        displayNode.SetEditorSliceIntersectionVisibility(False)
+        setUpJointEditor(displayNode, jointType, urdf.jointAxes[jointIndex], model.mimicDrivers[model.jointIndex[name]] >= 0)
+
+        # joint motion is constrained to the joint axis (or plane) and limits by the kinematic model
+        self._addJoint(model, model.jointIndex[name], jointTransformNode)
+        # the constraint runs before the other observers of the joint (flat hierarchy, clearance) so they see its result
+        jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onJointNode, 1.0)
+        return jointTransformNode
+
+    #Places nodes in a transform hierarchy of constant depth: each link model is under one "link to robot" transform
+    #and each joint transform is under one "joint frame" transform. The matrices of these transforms are computed
+    #with forward kinematics from all joint transforms whenever one of the joint transforms is modified.
+    #Links drawn as mesh instances are placed by updating instanceGroups, a list of (MeshInstances, link indices).
+    #Returns the hierarchy (model, joint motions, link transforms, link and joint frame nodes, instance groups).
+    def makeFlatHierarchy(self, nodes, model, instanceGroups=()):
+        hierarchy = {
+            "model": model,
+            "motions": numpy.tile(numpy.eye(4), (len(model.jointNames), 1, 1)),
+            "linkTransforms": None,
+            "linkNodes": [],
+            "frameNodes": {},
+            "instanceGroups": [(instances, numpy.array(linkIndices)) for instances, linkIndices in instanceGroups],
+        }
+        movingJoints = [jointIndex for jointIndex, jointName in enumerate(model.jointNames) if jointName in nodes]
+        for jointIndex in movingJoints:
+            hierarchy["motions"][jointIndex] = slicer.util.arrayFromTransformMatrix(nodes[model.jointNames[jointIndex]]["transform"])
+        # the transforms are added with their final matrices
+        linkTransforms = hierarchy["linkTransforms"] = model.linkTransforms(motions=hierarchy["motions"])
+        for linkIndex, linkName in enumerate(model.linkNames):
+            if linkName not in nodes:
+                # merged into the model of another link
+                hierarchy["linkNodes"].append(None)
+                continue
+            linkToRobotTransformNode = addTransformNode(f"{linkName} to robot", toVTKMatrices(linkTransforms[linkIndex]))
+            nodes[linkToRobotTransformNode.GetName()] = { "type": "transform", "transform": linkToRobotTransformNode}
+            nodes[linkName]["model"].SetAndObserveTransformNodeID(linkToRobotTransformNode.GetID())
+            hierarchy["linkNodes"].append(linkToRobotTransformNode)
+        for jointIndex in movingJoints:
+            jointName = model.jointNames[jointIndex]
+            jointFrameTransformNode = addTransformNode(f"{jointName} frame",
+                                                       toVTKMatrices(linkTransforms[model.jointParents[jointIndex]] @ model.jointOrigins[jointIndex]))
+            nodes[jointFrameTransformNode.GetName()] = { "type": "transform", "transform": jointFrameTransformNode}
+            jointTransformNode = nodes[jointName]["transform"]
+            jointTransformNode.SetAndObserveTransformNodeID(jointFrameTransformNode.GetID())
+            hierarchy["frameNodes"][jointIndex] = jointFrameTransformNode
+            self._flatHierarchyJoints[jointTransformNode.GetID()] = (hierarchy, jointIndex)
+            jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onFlatHierarchyJointModified)
+        for instances, linkIndices in hierarchy["instanceGroups"]:
+            instances.setMatrices(linkTransforms[linkIndices] @ model.visualOrigins[linkIndices])
+        return hierarchy
+
+    #Recomputes link and joint frame poses of a flattened hierarchy, only transforms that moved are modified
+    def updateFlatHierarchy(self, hierarchy):
+        model = hierarchy["model"]
+        linkTransforms = model.linkTransforms(motions=hierarchy["motions"])
+        if hierarchy["linkTransforms"] is None:
+            movedLinks = numpy.ones(len(model.linkNames), dtype=bool)
+        else:
+            movedLinks = numpy.any(numpy.abs(linkTransforms - hierarchy["linkTransforms"]) > 1e-12, axis=(1, 2))
+        hierarchy["linkTransforms"] = linkTransforms
+        for linkIndex in numpy.nonzero(movedLinks)[0]:
+            if hierarchy["linkNodes"][linkIndex] is None:
+                continue
+            slicer.util.updateTransformMatrixFromArray(hierarchy["linkNodes"][linkIndex], linkTransforms[linkIndex])
+        for jointIndex, jointFrameTransformNode in hierarchy["frameNodes"].items():
+            parentIndex = model.jointParents[jointIndex]
+            if movedLinks[parentIndex]:
+                slicer.util.updateTransformMatrixFromArray(jointFrameTransformNode, linkTransforms[parentIndex] @ model.jointOrigins[jointIndex])
+        for instances, linkIndices in hierarchy["instanceGroups"]:
+            if numpy.any(movedLinks[linkIndices]):
+                instances.setMatrices(linkTransforms[linkIndices] @ model.visualOrigins[linkIndices])
+
+    #Reads the mesh of a link of a URDFDescription that is merged into the model of its rigid body, meshToBody is a 4x4 numpy array
+    #Returns None if the link has no mesh
+    def readMergedLinkMesh(self, urdf, linkIndex, meshToBody, meshFolder, useCollisionMesh, packageIndex, bundle=None, meshCache=None):
+        from URDF_ImportLib.meshloading import readCachedMeshFile
+        from URDF_ImportLib.packagepaths import resolveMeshPath
+        meshToBodyTransform = vtk.vtkTransform()
+        meshToBodyTransform.SetMatrix(slicer.util.vtkMatrixFromArray(meshToBody))
+        try:
+            if bundle is not None:
+                transformFilter = vtk.vtkTransformPolyDataFilter()
+                transformFilter.SetInputData(bundle.linkPolyData(urdf.linkNames[linkIndex]))
+                transformFilter.SetTransform(meshToBodyTransform)
+                transformFilter.Update()
+                return transformFilter.GetOutput()
+            meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+            if meshFilename is None:
+                return None
+            meshFilePath = resolveMeshPath(meshFilename, meshFolder, packageIndex)
+            return readCachedMeshFile(meshCache, meshFilePath, meshToBodyTransform, urdf.meshScale(linkIndex, useCollisionMesh))
+        except (KeyError, OSError, ValueError) as error:
+            logging.warning(f"Mesh of {urdf.linkNames[linkIndex]} is not merged: {error}")
+            return None
+
+    #Reads the meshes that are shared by several links of a URDFDescription, returns a list of (MeshInstances, link indices)
+    #Links in excludedLinks are not instanced. Meshes that cannot be read are left to the regular mesh
+    #loading, which shows a sphere instead.
+    def readInstancedMeshes(self, urdf, excludedLinks, meshFolder, useCollisionMesh, packageIndex, bundle=None, meshCache=None):
+        from URDF_ImportLib.meshloading import meshCacheKey, readCachedMeshFile
+        from URDF_ImportLib.instancing import MeshInstances
+        from URDF_ImportLib.packagepaths import resolveMeshPath
+        linksByMesh = {}
+        for linkIndex in range(urdf.linkCount):
+            filename = urdf.meshFilename(linkIndex, useCollisionMesh)
+            if linkIndex in excludedLinks or filename is None:
+                continue
+            linksByMesh.setdefault(meshCacheKey(filename, urdf.meshScale(linkIndex, useCollisionMesh)), []).append(linkIndex)
+        instanceGroups = []
+        for (filename, scale), linkIndices in linksByMesh.items():
+            if len(linkIndices) < 2:
+                continue
+            try:
+                if bundle is not None:
+                    mesh = bundle.linkPolyData(urdf.linkNames[linkIndices[0]])
+                else:
+                    mesh = readCachedMeshFile(meshCache, resolveMeshPath(filename, meshFolder, packageIndex), scale=scale)
+            except (KeyError, OSError, ValueError) as error:
+                logging.warning(f"Mesh {filename} is not instanced: {error}")
+                continue
+            instanceGroups.append((MeshInstances(mesh, len(linkIndices)), linkIndices))
+        return instanceGroups
+
+    #Draws the instances with one vtkGlyph3DMapper actor per 3D view if the views render with a hardware OpenGL
+    #renderer. Otherwise (and in slice views) the instances are drawn by modelNode, which shows the transformed
+    #copies of the mesh. These copies are then only moved with the joints while the model is visible in slice views,
+    #see updateInstanceModels.
+    def addInstancedActors(self, instances, modelNode, robotToWorldTransformNode):
+        from URDF_ImportLib.instancing import instancedRenderingSupported
+        layoutManager = slicer.app.layoutManager()
+        if not layoutManager or layoutManager.threeDViewCount == 0:
+            return
+        renderWindows = [layoutManager.threeDWidget(viewIndex).threeDView().renderWindow() for viewIndex in range(layoutManager.threeDViewCount)]
+        if not all(instancedRenderingSupported(renderWindow) for renderWindow in renderWindows):
+            return
+        displayNode = modelNode.GetDisplayNode()
+
+        # the robot transform may have parents, like the transforms of the model nodes
+        def robotToWorldMatrix():
+            matrix = vtk.vtkMatrix4x4()
+            robotToWorldTransformNode.GetMatrixTransformToWorld(matrix)
+            return matrix
+        actors = []
+        for renderWindow in renderWindows:
+            actor = vtk.vtkActor()
+            actor.SetMapper(instances.glyphMapper())
+            actor.GetProperty().SetColor(displayNode.GetColor())
+            actor.SetUserMatrix(robotToWorldMatrix())
+            renderWindow.GetRenderers().GetFirstRenderer().AddActor(actor)
+            actors.append((renderWindow, actor))
+        # the model node stays in the scene for slice views, picking and saving, the actors draw it in 3D views
+        displayNode.SetVisibility3D(False)
+        instances.lazyMergedPolyData = not displayNode.GetVisibility2D()
+
+        def onRobotTransformModified(caller, event):
+            for renderWindow, actor in actors:
+                actor.SetUserMatrix(robotToWorldMatrix())
+        def onDisplayModified(caller, event):
+            for renderWindow, actor in actors:
+                actor.SetVisibility(caller.GetVisibility())
+                actor.GetProperty().SetColor(caller.GetColor())
+                actor.GetProperty().SetOpacity(caller.GetOpacity())
+            instances.lazyMergedPolyData = not caller.GetVisibility2D()
+            if not instances.lazyMergedPolyData:
+                instances.updateMergedPolyData()
+        observers = [(robotToWorldTransformNode, robotToWorldTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, onRobotTransformModified)),
+                     (displayNode, displayNode.AddObserver(vtk.vtkCommand.ModifiedEvent, onDisplayModified))]
+        self._instancedActors[modelNode.GetID()] = (instances, actors, observers)
+        if not self._instancedActorsCleanupObserver:
+            self._instancedActorsCleanupObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.StartCloseEvent, self.onSceneStartCloseRemoveActors)
+            self._instancedModelsSaveObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.StartSaveEvent, self.onSceneStartSaveUpdateInstanceModels)
+
+    #Removes the instanced mesh actors of a model node from the 3D views and stops updating them, the model node
+    #follows the instances again
+    def removeInstancedActors(self, modelNodeID):
+        instances, actors, observers = self._instancedActors.pop(modelNodeID)
+        for renderWindow, actor in actors:
+            renderWindow.GetRenderers().GetFirstRenderer().RemoveActor(actor)
+        for node, tag in observers:
+            node.RemoveObserver(tag)
+        instances.lazyMergedPolyData = False
+        instances.updateMergedPolyData()
+
+    #Moves the copies of the meshes in the models of instances drawn by instanced actors to the current link poses,
+    #needed before the model points are read (e.g., for picking), it is done automatically when the scene is saved
+    def updateInstanceModels(self):
+        for instances, actors, observers in self._instancedActors.values():
+            instances.updateMergedPolyData()
+
+    def onSceneStartSaveUpdateInstanceModels(self, caller, event):
+        self.updateInstanceModels()
+
+    def onSceneStartCloseRemoveActors(self, caller, event):
+        for modelNodeID in list(self._instancedActors):
+            self.removeInstancedActors(modelNodeID)
+
+    #Surface of a model or segmentation node (all segments) in world coordinates
+    def anatomySurface(self, anatomyNode):
+        if anatomyNode.IsA("vtkMRMLSegmentationNode"):
+            anatomyNode.CreateClosedSurfaceRepresentation()
+            segmentation = anatomyNode.GetSegmentation()
+            appendFilter = vtk.vtkAppendPolyData()
+            for segmentIndex in range(segmentation.GetNumberOfSegments()):
+                segmentSurface = vtk.vtkPolyData()
+                anatomyNode.GetClosedSurfaceRepresentation(segmentation.GetNthSegmentID(segmentIndex), segmentSurface)
+                appendFilter.AddInputData(segmentSurface)
+            appendFilter.Update()
+            surface = appendFilter.GetOutput()
+        else:
+            surface = anatomyNode.GetPolyData()
+        anatomyToWorld = vtk.vtkGeneralTransform()
+        slicer.vtkMRMLTransformNode.GetTransformBetweenNodes(anatomyNode.GetParentTransformNode(), None, anatomyToWorld)
+        transformFilter = vtk.vtkTransformPolyDataFilter()
+        transformFilter.SetInputData(surface)
+        transformFilter.SetTransform(anatomyToWorld)
+        transformFilter.Update()
+        return transformFilter.GetOutput()
+
+    #Starts checking the clearance between the robot models and the anatomy (model or segmentation node) after every
+    #joint motion. The signed distance field of the anatomy is computed on a grid with the given spacing, or loaded
+    #from distanceFieldPath (.npy, memory-mapped) if that file exists; a computed field is saved to distanceFieldPath.
+    #Distances are in world (scene) units.
+    def startClearanceMonitoring(self, anatomyNode, threshold=5.0, spacing=1.0, distanceFieldPath=None, samplesPerLink=200):
+        from URDF_ImportLib.distancefield import ClearanceMonitor, DistanceField
+        self.stopClearanceMonitoring()
+        if distanceFieldPath and os.path.isfile(distanceFieldPath):
+            distanceField = DistanceField.load(distanceFieldPath)
+        else:
+            distanceField = DistanceField.fromPolyData(self.anatomySurface(anatomyNode), spacing, margin=max(2 * threshold, 10 * spacing))
+            if distanceFieldPath:
+                distanceField.save(distanceFieldPath)
+        self.clearanceMonitor = ClearanceMonitor(distanceField, threshold, samplesPerLink)
+        self._clearanceObservers = self.observeJointNodes(self.onClearanceJointModified)
+        self.updateClearance()
+        return self.clearanceMonitor
+
+    #Adds an observer of the modifications of all editable joint transforms, returns the (node, observer tag) pairs
+    def observeJointNodes(self, callback):
+        observers = []
+        for jointTransformNodeID in self.jointTransformNodeIDs:
+            jointTransformNode = slicer.mrmlScene.GetNodeByID(jointTransformNodeID)
+            if jointTransformNode is None:
+                continue
+            observers.append((jointTransformNode, jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, callback)))
+        return observers
+
+    def stopClearanceMonitoring(self):
+        for jointTransformNode, observerTag in self._clearanceObservers:
+            jointTransformNode.RemoveObserver(observerTag)
+        self._clearanceObservers = []
+        self._tooCloseModels = set()
+        self.clearanceMonitor = None
+
+    #Checks the clearance of all robot models, returns the names of the models that are closer to the anatomy than the threshold
+    def updateClearance(self):
+        startTime = time.perf_counter()
+        meshes = {}
+        for modelNodeID in self.robotModelNodeIDs:
+            modelNode = slicer.mrmlScene.GetNodeByID(modelNodeID)
+            if modelNode is None or modelNode.GetPolyData() is None or modelNode.GetPolyData().GetNumberOfPoints() == 0:
+                continue
+            modelToWorld = vtk.vtkMatrix4x4()
+            if modelNode.GetParentTransformNode():
+                modelNode.GetParentTransformNode().GetMatrixTransformToWorld(modelToWorld)
+            meshes[modelNode.GetName()] = (modelNode.GetPolyData(), slicer.util.arrayFromVTKMatrix(modelToWorld))
+        tooClose = self.clearanceMonitor.update(meshes)
+        newlyTooClose = set(tooClose) - self._tooCloseModels
+        self._tooCloseModels = set(tooClose)
+        self.profiler.record("(clearance check)", time.perf_counter() - startTime, bool(tooClose))
+        closestName, clearance = self.clearanceMonitor.closest()
+        if newlyTooClose:
+            logging.warning(f"Clearance below {self.clearanceMonitor.threshold}: {', '.join(sorted(newlyTooClose))} (closest: {closestName} at {clearance:.2f})")
+        if self.clearanceCallback:
+            self.clearanceCallback(closestName, clearance, tooClose)
+        return tooClose
+
+    def onClearanceJointModified(self, caller, event):
+        if self.clearanceMonitor and not self._settingJointMotions:
+            self.updateClearance()
+
+    #Triangle meshes of the link models of the last loaded robot in link coordinates: link index -> (points (n, 3), triangles (m, 3)),
+    #optionally only of the links named in linkNames. Models of merged links are returned for the first link of their rigid body.
+    def linkMeshArrays(self, linkNames=None):
+        from URDF_ImportLib.bundle import triangleArrays
+        model = self.robotModel
+        linkMeshes = {}
+        for modelNodeID in self.robotModelNodeIDs:
+            modelNode = slicer.mrmlScene.GetNodeByID(modelNodeID)
+            if modelNode is None or modelNode.GetPolyData() is None:
+                continue
+            # models of merged links are in the frame of the first link of their rigid body
+            mergedLinks = modelNode.GetAttribute("URDF_Import.MergedLinks")
+            bodyLinkNames = mergedLinks.split() if mergedLinks else [modelNode.GetName()]
+            if bodyLinkNames[0] not in model.linkIndex:
+                continue
+            if linkNames is not None and not set(bodyLinkNames) & set(linkNames):
+                continue
+            if modelNode.GetName().endswith(" instances"):
+                raise ValueError(f"Link meshes of mesh instances ({modelNode.GetName()}) are not supported, load the robot without instancing")
+            points, offsets, connectivity = triangleArrays(modelNode.GetPolyData())
+            # link meshes have the visual origin applied, so they are in link coordinates
+            linkMeshes[model.linkIndex[bodyLinkNames[0]]] = (points, connectivity.reshape(-1, 3))
+        return linkMeshes
+
+    #Robot to world transform (4, 4) of the last loaded robot
+    def robotToWorldArray(self):
+        robotToWorld = vtk.vtkMatrix4x4()
+        robotToWorldTransformNode = slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID)
+        if robotToWorldTransformNode is not None:
+            robotToWorldTransformNode.GetMatrixTransformToWorld(robotToWorld)
+        return slicer.util.arrayFromVTKMatrix(robotToWorld)
+
+    #Computes the volume swept by the link models of the last loaded robot along a trajectory of joint values
+    #(T, dofCount) of robotModel, optionally only for the links named in linkNames. spacing is the voxel size in
+    #world units: halving it makes the result more accurate but multiplies memory and time by 8.
+    #Configurations are inserted so that no joint moves more than maxJointStep between samples, and chunks of the
+    #trajectory are processed by workers processes (all CPUs by default).
+    #Returns a new labelmap volume node, or a model node of its surface if outputType is "model".
+    def computeSweptVolume(self, trajectory, linkNames=None, spacing=2.0, maxJointStep=None, workers=None, outputType="labelmap"):
+        from URDF_ImportLib.sweptvolume import occupancySurface, sweptVolume
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        if outputType not in ("labelmap", "model"):
+            raise ValueError(f"Unknown swept volume output type {outputType}")
+        model = self.robotModel
+        linkMeshes = self.linkMeshArrays(linkNames)
+        if not linkMeshes:
+            raise ValueError("No link meshes to sweep")
+        robotToWorld = self.robotToWorldArray()
+        occupancy, origin, spacing = self._runWithWorkers(
+            lambda workers: sweptVolume(model, linkMeshes, trajectory, spacing, robotToWorld, maxJointStep, workers=workers),
+            workers, "Swept volume is computed")
+
+        name = slicer.mrmlScene.GenerateUniqueName("Swept volume")
+        if outputType == "model":
+            outputNode = slicer.modules.models.logic().AddModel(occupancySurface(occupancy, origin, spacing))
+            outputNode.SetName(name)
+            return outputNode
+        outputNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode", name)
+        outputNode.SetOrigin(origin)
+        outputNode.SetSpacing(spacing, spacing, spacing)
+        slicer.util.updateVolumeFromArray(outputNode, occupancy)
+        return outputNode
+
+    #Returns function(workers) run with spawned worker processes (all CPUs if workers is None). If the worker
+    #processes cannot be started or die, a warning starting with description is logged and function(1) is run instead.
+    def _runWithWorkers(self, function, workers, description):
+        import multiprocessing
+        from concurrent.futures.process import BrokenProcessPool
+        # worker processes are started with the Python launcher of Slicer, not with the application itself
+        multiprocessing.get_context("spawn").set_executable(shutil.which("PythonSlicer") or sys.executable)
+        try:
+            return function(workers)
+        except (BrokenProcessPool, OSError) as error:
+            logging.warning(f"{description} without worker processes: {error}")
+            return function(1)
+
+    #Current joint values (dofCount,) of the last loaded robot, read from its joint transforms
+    def jointValues(self):
+        from URDF_ImportLib.kinematics import FIXED
+        model = self.robotModel
+        joints = [jointIndex for jointIndex in numpy.nonzero(model.jointTypes != FIXED)[0] if self.jointNode(model, jointIndex) is not None]
+        motions = fromVTKMatrices([self.jointNode(model, jointIndex).GetMatrixTransformToParent() for jointIndex in joints])
+        return model.applyMimicJoints(model.jointValuesFromMotions(motions.reshape(-1, 4, 4), joints))
+
+    #Plans a collision-free path of the last loaded robot from joint values start to goal (dofCount,) of robotModel
+    #within the URDF joint limits. Links may not touch each other or come closer than margin (world units) to the anatomy
+    #(model or segmentation node), if given. Links are approximated by spheres of about sphereSize (world units, a quarter
+    #of the largest link by default) and the anatomy by a distance field with the given spacing.
+    #planner is "rrtconnect", or "prm" to build a roadmap of roadmapNodes configurations that is kept for later queries
+    #with the same robot, anatomy and parameters. Edges are checked every checkStep (largest joint change) and the
+    #collision checks are spread over workers processes (all CPUs by default).
+    #Returns the path as joint values (K, dofCount), None if no path is found.
+    def planMotion(self, start, goal, anatomyNode=None, planner="rrtconnect", margin=2.0, sphereSize=None, spacing=1.0, checkStep=0.02,
+                   workers=None, roadmapNodes=500, seed=None):
+        from URDF_ImportLib.planning import CheckerPool
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        if planner not in ("rrtconnect", "prm"):
+            raise ValueError(f"Unknown motion planner {planner}")
+        model = self.robotModel
+        start = model.applyMimicJoints(model.clampJointValues(start)[0])
+        goal = model.applyMimicJoints(model.clampJointValues(goal)[0])
+        environment = self.planningEnvironment(anatomyNode, margin, sphereSize, spacing)
+
+        # with one worker the checks run in this process
+        def planPath(workers):
+            with CheckerPool(environment["checker"], workers) as checkerPool:
+                return self._planPath(checkerPool, environment, start, goal, planner, checkStep, roadmapNodes, seed)
+        path = self._runWithWorkers(planPath, workers, "Motion is planned")
+        if path is None:
+            logging.warning("No collision-free path found")
+        return path
+
+    def _planPath(self, checker, environment, start, goal, planner, checkStep, roadmapNodes, seed):
+        from URDF_ImportLib.planning import Roadmap, rrtConnect, samplingBounds, shortcutPath
+        rng = numpy.random.default_rng(seed)
+        bounds = samplingBounds(self.robotModel)
+        if planner == "prm":
+            roadmap = environment["roadmaps"].get((roadmapNodes, checkStep))
+            if roadmap is None:
+                roadmap = Roadmap.build(checker, bounds, roadmapNodes, checkStep=checkStep, rng=rng)
+                environment["roadmaps"][(roadmapNodes, checkStep)] = roadmap
+            path = roadmap.query(checker, start, goal)
+        else:
+            path = rrtConnect(checker, start, goal, bounds, checkStep=checkStep, rng=rng)
+        return None if path is None else shortcutPath(checker, path, checkStep, rng=rng)
+
+    #Collision checker and roadmaps for the last loaded robot in its current pose among the anatomy, reused while the
+    #robot, the anatomy surface (in world coordinates) and the planning parameters stay the same. Only the last environment
+    #is kept, it holds a distance field of the anatomy.
+    def planningEnvironment(self, anatomyNode=None, margin=2.0, sphereSize=None, spacing=1.0):
+        from URDF_ImportLib.bundle import triangleArrays
+        from URDF_ImportLib.distancefield import DistanceField
+        from URDF_ImportLib.planning import CollisionChecker, sphereApproximation
+        model = self.robotModel
+        robotToWorld = self.robotToWorldArray()
+        surface = self.anatomySurface(anatomyNode) if anatomyNode is not None else None
+        surfaceHash = hashlib.sha1()
+        if surface is not None:
+            points, offsets, connectivity = triangleArrays(surface)
+            for array in (points, offsets, connectivity):
+                surfaceHash.update(numpy.ascontiguousarray(array).tobytes())
+        key = (model, robotToWorld.tobytes(), surfaceHash.hexdigest(), margin, sphereSize, spacing)
+        if self._planningEnvironment is not None and self._planningEnvironment[0] == key:
+            return self._planningEnvironment[1]
+        # the distance field and roadmaps of the previous environment are released before the new ones are built
+        self._planningEnvironment = None
+
+        linkMeshes = self.linkMeshArrays()
+        if not linkMeshes:
+            raise ValueError("No link meshes to check for collisions")
+        if sphereSize is None:
+            cellSize = max(numpy.ptp(points, axis=0).max() for points, triangles in linkMeshes.values()) / 4
+        else:
+            cellSize = sphereSize / float(numpy.cbrt(abs(numpy.linalg.det(robotToWorld[:3, :3]))))
+        linkSpheres = {linkIndex: sphereApproximation(points.astype(numpy.float64), triangles, cellSize)
+                       for linkIndex, (points, triangles) in linkMeshes.items()}
+        distanceField = None
+        if surface is not None:
+            distanceField = DistanceField.fromPolyData(surface, spacing, margin=max(2 * margin, 10 * spacing))
+        environment = {"checker": CollisionChecker(model, linkSpheres, distanceField, robotToWorld, margin), "roadmaps": {}}
+        self._planningEnvironment = (key, environment)
+        return environment
+
+    #Moves the joints of the last loaded robot along a path of joint values (K, dofCount) in duration seconds. Frames
+    #are interpolated so that no joint moves more than maxJointStep between them and skipped if rendering falls behind.
+    def playJointPath(self, path, duration=2.0, maxJointStep=0.02):
+        from URDF_ImportLib.sweptvolume import interpolateTrajectory
+        self.stopJointPath()
+        frames = interpolateTrajectory(path, maxJointStep)
+        self._jointPathPlayback = {"frames": frames, "duration": duration, "startTime": time.perf_counter()}
+        if self._jointPathTimer is None:
+            self._jointPathTimer = qt.QTimer()
+            self._jointPathTimer.setInterval(20)
+            self._jointPathTimer.connect("timeout()", self.advanceJointPath)
+        self.setJointValues(frames[0])
+        self._jointPathTimer.start()
+
+    @property
+    def playingJointPath(self):
+        return self._jointPathPlayback is not None
+
+    #Shows the frame of the played path for the elapsed time, called periodically by a timer
+    def advanceJointPath(self):
+        playback = self._jointPathPlayback
+        if playback is None:
+            return
+        frames = playback["frames"]
+        elapsed = time.perf_counter() - playback["startTime"]
+        frameIndex = len(frames) - 1 if playback["duration"] <= 0 else min(int(elapsed / playback["duration"] * (len(frames) - 1)), len(frames) - 1)
+        self.setJointValues(frames[frameIndex])
+        if frameIndex == len(frames) - 1:
+            self.stopJointPath()
+
+    def stopJointPath(self):
+        if self._jointPathTimer is not None:
+            self._jointPathTimer.stop()
+        self._jointPathPlayback = None
+
+    #Records the joint values of the last loaded robot into a new sequence node whenever its joints move (interaction,
+    #setJointValues, playJointPath): a frame holds only the joint values as text, link poses are regenerated from them
+    #when the sequence is browsed. Frames are recorded by browserNode (a new sequence browser by default) at the time
+    #they are set, so they can be synchronized with the other sequences of the browser (e.g. ultrasound images).
+    #Returns the sequence browser node.
+    def startJointRecording(self, browserNode=None):
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        sequenceNode = self.newJointSequenceNode()
+        browserNode = self.browseJointSequence(sequenceNode, browserNode)
+        self.updateJointSequenceProxy()
+        self._jointRecordingObservers = self.observeJointNodes(self.onRecordedJointModified)
+        browserNode.SetRecording(sequenceNode, True)
+        browserNode.SetRecordingActive(True)
+        if not sequenceNode.GetNumberOfDataNodes():
+            # the starting pose is the first frame
+            browserNode.SaveProxyNodesState()
+        return browserNode
+
+    #Stops recording joint values, the recorded sequence can still be browsed
+    def stopJointRecording(self):
+        for jointTransformNode, observerTag in self._jointRecordingObservers:
+            jointTransformNode.RemoveObserver(observerTag)
+        self._jointRecordingObservers = []
+        browserNode = slicer.mrmlScene.GetNodeByID(self._jointSequence["browserNodeID"]) if self._jointSequence else None
+        if browserNode is not None:
+            browserNode.SetRecordingActive(False)
+
+    @property
+    def recordingJoints(self):
+        return bool(self._jointRecordingObservers)
+
+    #Writes a trajectory of joint values (T, dofCount) of robotModel into a new sequence node, one frame per timeStep
+    #seconds, and browses it with browserNode (a new sequence browser by default). Returns the sequence browser node.
+    def exportJointSequence(self, trajectory, timeStep=0.04, browserNode=None):
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        model = self.robotModel
+        trajectory = model.applyMimicJoints(numpy.atleast_2d(numpy.asarray(trajectory, dtype=numpy.float64)))
+        sequenceNode = self.newJointSequenceNode()
+        frameNode = slicer.vtkMRMLTextNode()
+        for frameIndex, q in enumerate(trajectory):
+            frameNode.SetText(jointValuesText(q))
+            sequenceNode.SetDataNodeAtValue(frameNode, f"{frameIndex * timeStep:.6g}")
+        return self.browseJointSequence(sequenceNode, browserNode)
+
+    #Moves the joints of the last loaded robot to the frame shown by the browser of a joint value sequence, from now on
+    #whenever the browser moves. Sequences are matched to the robot by joint names. Returns the sequence browser node.
+    def browseJointSequence(self, sequenceNode, browserNode=None):
+        model = self.robotModel
+        self.stopJointRecording()
+        names = json.loads(sequenceNode.GetAttribute("URDF_Import.JointValueNames") or "null") or model.dofNames()
+        if browserNode is None:
+            browserNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSequenceBrowserNode", slicer.mrmlScene.GenerateUniqueName(f"{model.name} motion"))
+            # every joint change is a frame, browsers given by the caller keep their own sampling
+            browserNode.SetRecordingSamplingMode(slicer.vtkMRMLSequenceBrowserNode.SamplingAll)
+        if self._jointSequence:
+            proxyNode, observerTag = self._jointSequence["proxyObserver"]
+            proxyNode.RemoveObserver(observerTag)
+        if not browserNode.IsSynchronizedSequenceNodeID(sequenceNode.GetID()):
+            browserNode.AddSynchronizedSequenceNode(sequenceNode)
+        proxyNode = browserNode.GetProxyNode(sequenceNode)
+        if not isinstance(proxyNode, slicer.vtkMRMLTextNode):
+            proxyNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTextNode", f"{sequenceNode.GetName()} proxy")
+            browserNode.AddProxyNode(proxyNode, sequenceNode, False)
+        observerTag = proxyNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onJointSequenceProxyModified)
+        self._jointSequence = {"sequenceNodeID": sequenceNode.GetID(), "browserNodeID": browserNode.GetID(),
+                               "proxyNodeID": proxyNode.GetID(), "proxyObserver": (proxyNode, observerTag), "names": names}
+        if sequenceNode.GetNumberOfDataNodes():
+            browserNode.SetSelectedItemNumber(0)
+            slicer.modules.sequences.logic().UpdateProxyNodesFromSequences(browserNode)
+        return browserNode
+
+    #Empty sequence node for the joint values of robotModel, indexed by time in seconds
+    def newJointSequenceNode(self):
+        model = self.robotModel
+        sequenceNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSequenceNode", slicer.mrmlScene.GenerateUniqueName(f"{model.name} joint values"))
+        sequenceNode.SetIndexName("time")
+        sequenceNode.SetIndexUnit("s")
+        # the joint names of the values, so that sequences are replayed correctly on robots with other joints
+        sequenceNode.SetAttribute("URDF_Import.JointValueNames", json.dumps(model.dofNames()))
+        return sequenceNode
+
+    #Joint values (T, dofCount) of robotModel and times (T,) of the frames of a joint value sequence; values of joints that are
+    #not in the sequence are those of the current configuration
+    def jointSequenceArrays(self, sequenceNode):
+        model = self.robotModel
+        names = json.loads(sequenceNode.GetAttribute("URDF_Import.JointValueNames") or "[]")
+        times = numpy.array([float(sequenceNode.GetNthIndexValue(frameIndex)) for frameIndex in range(sequenceNode.GetNumberOfDataNodes())])
+        trajectory = numpy.tile(self.jointValues(), (len(times), 1))
+        values = numpy.array([jointValuesFromText(sequenceNode.GetNthDataNode(frameIndex).GetText()) for frameIndex in range(len(times))])
+        dofNames = model.dofNames()
+        for position, name in enumerate(names):
+            if name in dofNames and len(values):
+                trajectory[:, dofNames.index(name)] = values[:, position]
+        return trajectory, times
+
+    #Writes the current joint values into the proxy node of the joint value sequence, the browser records them
+    def updateJointSequenceProxy(self):
+        proxyNode = slicer.mrmlScene.GetNodeByID(self._jointSequence["proxyNodeID"]) if self._jointSequence else None
+        if proxyNode is None:
+            return
+        text = jointValuesText(self.jointValues())
+        if text == proxyNode.GetText():
+            return
+        self._updatingJointSequenceProxy = True
+        try:
+            proxyNode.SetText(text)
+        finally:
+            self._updatingJointSequenceProxy = False
+
+    def onRecordedJointModified(self, caller, event):
+        if not self._settingJointMotions:
+            self.updateJointSequenceProxy()
+
+    def onJointSequenceProxyModified(self, caller, event):
+        if self._updatingJointSequenceProxy or not caller.GetText():
+            return
+        values = jointValuesFromText(caller.GetText())
+        names = self._jointSequence["names"]
+        if len(values) != len(names):
+            logging.warning(f"Joint value frame of {caller.GetName()} has {len(values)} values, expected {len(names)}")
+            return
+        q = self.jointValues()
+        dofNames = self.robotModel.dofNames()
+        for name, value in zip(names, values):
+            if name in dofNames:
+                q[dofNames.index(name)] = value
+        self._updatingJointSequenceProxy = True
+        try:
+            self.setJointValues(q)
+        finally:
+            self._updatingJointSequenceProxy = False
+
+    #Joint torques (..., dofCount) that hold the last loaded robot still at joint values q (..., dofCount, the current joint
+    #values by default) against gravity, which is given in robot coordinates (m/s^2, URDF units, STANDARD_GRAVITY by default)
+    def computeGravityTorques(self, q=None, gravity=None):
+        from URDF_ImportLib.dynamics import STANDARD_GRAVITY, gravityTorques
+        gravity = STANDARD_GRAVITY if gravity is None else gravity
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        return gravityTorques(self.robotModel, self.jointValues() if q is None else q, gravity)
+
+    #Joint torques (..., dofCount) of the last loaded robot for joint values, velocities and accelerations (..., dofCount)
+    def computeInverseDynamics(self, q, qd, qdd, gravity=None):
+        from URDF_ImportLib.dynamics import STANDARD_GRAVITY, inverseDynamics
+        gravity = STANDARD_GRAVITY if gravity is None else gravity
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        return inverseDynamics(self.robotModel, q, qd, qdd, gravity)
+
+    #Center of mass (..., 3) of the last loaded robot in world coordinates at joint values q (..., dofCount, the current
+    #joint values by default), and the mass of the robot
+    def computeCenterOfMass(self, q=None):
+        from URDF_ImportLib.dynamics import centerOfMass
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        center, mass = centerOfMass(self.robotModel, self.jointValues() if q is None else q)
+        robotToWorld = self.robotToWorldArray()
+        return center @ robotToWorld[:3, :3].T + robotToWorld[:3, 3], mass
+
+    #Mass and center of mass (3,) in link coordinates of a payload attached to a link of the last loaded robot, estimated from
+    #joint torques (N, dofCount) measured while the robot holds still at joint values q (N, dofCount)
+    def estimatePayload(self, linkName, q, torques, gravity=None):
+        from URDF_ImportLib.dynamics import STANDARD_GRAVITY, estimatePayload
+        gravity = STANDARD_GRAVITY if gravity is None else gravity
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        return estimatePayload(self.robotModel, q, torques, self.robotModel.linkIndex[linkName], gravity)
+
+    #Plots the joint torques of the last loaded robot along a trajectory of joint values (T, dofCount) sampled every timeStep
+    #seconds. Velocities and accelerations are computed from the trajectory by finite differences.
+    #Returns the plot chart node, its table node holds the torques with a time column and a column per joint value.
+    def plotJointTorques(self, trajectory, timeStep=0.01, gravity=None):
+        from URDF_ImportLib.dynamics import STANDARD_GRAVITY, inverseDynamics
+        gravity = STANDARD_GRAVITY if gravity is None else gravity
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        model = self.robotModel
+        trajectory = numpy.asarray(trajectory, dtype=numpy.float64).reshape(-1, model.dofCount)
+        if len(trajectory) < 3:
+            raise ValueError("A trajectory needs at least 3 samples to plot joint torques")
+        qd = numpy.gradient(trajectory, timeStep, axis=0)
+        qdd = numpy.gradient(qd, timeStep, axis=0)
+        torques = inverseDynamics(model, trajectory, qd, qdd, gravity)
+        # mimic joints are driven by their drivers and not plotted
+        independent = numpy.ones(model.dofCount, dtype=bool)
+        independent[model.dofIndex[model.mimicDrivers >= 0]] = False
+        dofs = numpy.nonzero(independent)[0]
+        dofNames = model.dofNames()
+        columns = numpy.column_stack([numpy.arange(len(trajectory)) * timeStep, torques[:, dofs]])
+        return slicer.util.plot(columns, xColumnIndex=0, columnNames=["Time"] + [dofNames[dof] for dof in dofs],
+                                title=f"{model.name} joint torques")
+
+    #Registers the last loaded robot to a surface scan: a model node (a mesh or a point cloud) or a segmentation node.
+    #The robot to world transform is moved so that the link models fit the scan points best, starting from the current
+    #pose and from poses that align the principal axes of the robot and the scan. The joint values are fitted too if
+    #estimateJoints is set. Link surfaces are sampled every sampleSpacing (world units, a 25th of the largest link by
+    #default) and at most maxPoints scan points are used, see RobotSurfaceRegistration.register for the other parameters.
+    #Returns the RegistrationResult, with the robot to world transform and distances in world coordinates.
+    def registerRobotToSurface(self, surfaceNode, estimateJoints=False, sampleSpacing=None, maxPoints=3000, inlierFraction=0.9,
+                               multiStart=True, workers=None, seed=None):
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        surface = self.anatomySurface(surfaceNode)
+        if surface.GetNumberOfPoints() < 3:
+            raise ValueError(f"{surfaceNode.GetName()} has too few points to register to")
+        scanPoints = numpy_support.vtk_to_numpy(surface.GetPoints().GetData())
+        registration = self.surfaceRegistration(sampleSpacing)
+        robotToWorld = self.robotToWorldArray()
+        result = registration.register(scanPoints, robotToWorld, self.jointValues(), estimateJoints=estimateJoints, maxPoints=maxPoints,
+                                       inlierFraction=inlierFraction, multiStart=multiStart, workers=workers, rng=seed)
+        robotToWorldTransformNode = slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID)
+        parentToWorld = vtk.vtkMatrix4x4()
+        if robotToWorldTransformNode.GetParentTransformNode():
+            robotToWorldTransformNode.GetParentTransformNode().GetMatrixTransformToWorld(parentToWorld)
+        slicer.util.updateTransformMatrixFromArray(robotToWorldTransformNode,
+                                                   numpy.linalg.inv(slicer.util.arrayFromVTKMatrix(parentToWorld)) @ result.robotToWorld)
+        if estimateJoints:
+            self.setJointValues(result.q)
+        return result
+
+    #Link surface samples and nearest neighbor indices of the last loaded robot, reused while the link models stay the same
+    def surfaceRegistration(self, sampleSpacing=None):
+        from URDF_ImportLib.registration import RobotSurfaceRegistration
+        model = self.robotModel
+        modelNodes = [slicer.mrmlScene.GetNodeByID(modelNodeID) for modelNodeID in self.robotModelNodeIDs]
+        meshTimes = tuple(modelNode.GetPolyData().GetMTime() for modelNode in modelNodes if modelNode is not None and modelNode.GetPolyData() is not None)
+        key = (id(model), meshTimes, sampleSpacing)
+        registration = self._surfaceRegistrations.get(key)
+        if registration is not None:
+            return registration
+        linkMeshes = self.linkMeshArrays()
+        if not linkMeshes:
+            raise ValueError("No link meshes to register")
+        # samples are taken in link coordinates, which are scaled relative to world coordinates if the robot is
+        linkSpacing = max(numpy.ptp(points, axis=0).max() for points, triangles in linkMeshes.values()) / 25
+        if sampleSpacing is not None:
+            linkSpacing = sampleSpacing / float(numpy.cbrt(abs(numpy.linalg.det(self.robotToWorldArray()[:3, :3]))))
+        linkMeshes = {linkIndex: (points.astype(numpy.float64), triangles) for linkIndex, (points, triangles) in linkMeshes.items()}
+        # the registration holds the robot model, so its id is not reused while the registration is cached
+        registration = RobotSurfaceRegistration(model, linkMeshes, linkSpacing)
+        self._surfaceRegistrations = {key: registration}
+        return registration
+
+    #Calibrates the joint origins of a URDF file from end effector poses (N, 4, 4) or positions (N, 3) of the link named
+    #endLinkName measured at commanded joint values q (N, dofCount), in robot coordinates and URDF units. The origins of the
+    #joints named in jointNames (all joints from the root to the end link by default) are corrected and, if outputPath is
+    #given, written to a copy of the URDF file. Returns the CalibrationResult.
+    def calibrateJointOrigins(self, robotPath, q, measuredPoses, endLinkName, outputPath=None, jointNames=None, rotationWeight=None):
+        from URDF_ImportLib.calibration import calibrateJointOrigins, correctedURDFText
+        from URDF_ImportLib.kinematics import RobotModel
+        from URDF_ImportLib.urdfparser import parseURDFString
+        with open(robotPath) as robotFile:
+            urdfText = robotFile.read()
+        model = RobotModel.fromDescription(parseURDFString(urdfText))
+        if endLinkName not in model.linkIndex:
+            raise ValueError(f"Unknown link {endLinkName}")
+        jointIndices = None if jointNames is None else [model.jointIndex[jointName] for jointName in jointNames]
+        result = calibrateJointOrigins(model, q, measuredPoses, model.linkIndex[endLinkName], jointIndices, rotationWeight)
+        logging.info(f"Calibrated {len(result.jointIndices)} joint origins in {result.iterations} iterations: position error "
+                     f"{result.initialPositionRms:.6g} -> {result.positionRms:.6g}, rotation error {result.initialRotationRms:.6g} -> {result.rotationRms:.6g}")
+        if outputPath:
+            with open(outputPath, "w") as outputFile:
+                outputFile.write(correctedURDFText(urdfText, [model.jointNames[jointIndex] for jointIndex in result.jointIndices], result.xyz, result.rpy))
+        return result
+
+    #Renders images of the last loaded robot at joint values q (N, dofCount) of robotModel seen from camera poses (N, 4, 4) into
+    #outputFolder, for training pose estimation. Camera poses are camera to world transforms (world units) with the camera
+    #looking along its z axis, x right and y down in the image, and viewAngle is the vertical field of view in degrees.
+    #Each sample is written as RGB (PNG, link model colors), depth (float32 .npy, world units along the camera axis, 0 for
+    #the background) and labels (uint16 PNG, link index + 1, 0 for the background), see sampleFileNames. dataset.json lists
+    #the camera intrinsics, label values and file names, poses.npz the joint values and camera poses.
+    #The scene is not changed: links are rendered offscreen by workers processes (all CPUs by default).
+    #Returns the path of dataset.json.
+    def renderPoseDataset(self, q, cameraPoses, outputFolder, width=640, height=480, viewAngle=30.0, workers=None, progressCallback=None):
+        from URDF_ImportLib.rendering import cameraIntrinsics, renderDataset, sampleFileNames
+        if self.robotModel is None:
+            raise ValueError("No robot is loaded")
+        model = self.robotModel
+        q = model.applyMimicJoints(numpy.atleast_2d(numpy.asarray(q, dtype=numpy.float64)))
+        cameraPoses = numpy.asarray(cameraPoses, dtype=numpy.float64).reshape(-1, 4, 4)
+        linkMeshes = self.linkMeshArrays()
+        linkColors = {}
+        for modelNodeID in self.robotModelNodeIDs:
+            modelNode = slicer.mrmlScene.GetNodeByID(modelNodeID)
+            if modelNode is None or modelNode.GetDisplayNode() is None:
+                continue
+            mergedLinks = modelNode.GetAttribute("URDF_Import.MergedLinks")
+            linkName = mergedLinks.split()[0] if mergedLinks else modelNode.GetName()
+            if linkName in model.linkIndex:
+                linkColors[model.linkIndex[linkName]] = modelNode.GetDisplayNode().GetColor()
+
+        arguments = (model, linkMeshes, q, cameraPoses, outputFolder, width, height, viewAngle, self.robotToWorldArray(), linkColors)
+        startTime = time.perf_counter()
+        self._runWithWorkers(lambda workers: renderDataset(*arguments, workers=workers, progressCallback=progressCallback),
+                             workers, "Pose dataset is rendered")
+        logging.info(f"Rendered {len(q)} robot poses in {time.perf_counter() - startTime:.1f}s")
+
+        numpy.savez(os.path.join(outputFolder, "poses.npz"), q=q, cameraPoses=cameraPoses)
+        dataset = {
+            "robot": model.name,
+            "width": width,
+            "height": height,
+            "intrinsics": cameraIntrinsics(width, height, viewAngle).tolist(),
+            "labels": {str(linkIndex + 1): model.linkNames[linkIndex] for linkIndex in sorted(linkMeshes)},
+            "samples": [dict(zip(("rgb", "depth", "label"), sampleFileNames(index))) for index in range(len(q))],
+        }
+        datasetPath = os.path.join(outputFolder, "dataset.json")
+        with open(datasetPath, "w") as datasetFile:
+            json.dump(dataset, datasetFile, indent=1)
+        return datasetPath
+
+    #Name of the link that a cell of a link model comes from, also for models of merged links
+    def linkNameFromCell(self, modelNode, cellId):
+        from URDF_ImportLib.meshloading import LINK_INDEX_ARRAY_NAME
+        mergedLinks = modelNode.GetAttribute("URDF_Import.MergedLinks")
+        if not mergedLinks:
+            return modelNode.GetName()
+        linkIndices = modelNode.GetPolyData().GetCellData().GetArray(LINK_INDEX_ARRAY_NAME)
+        return mergedLinks.split()[int(linkIndices.GetValue(cellId))]
+
+    def onFlatHierarchyJointModified(self, caller, event):
+        if self._settingJointMotions or caller.GetID() not in self._flatHierarchyJoints:
+            return
+        hierarchy, jointIndex = self._flatHierarchyJoints[caller.GetID()]
+        hierarchy["motions"][jointIndex] = slicer.util.arrayFromTransformMatrix(caller)
+        self.updateFlatHierarchy(hierarchy)
+
+    #Writes the robot and its link meshes into a single-file robot bundle that can be loaded by process
+    def exportRobotBundle(self, robotPath, meshFolder, bundlePath, useCollisionMesh=False) -> None:
+        from URDF_ImportLib.meshloading import readMeshFile
+        from URDF_ImportLib.bundle import writeRobotBundle
+        from URDF_ImportLib.kinematics import RobotModel
+        from URDF_ImportLib.urdfparser import parseURDFString
+        from URDF_ImportLib.packagepaths import PackageIndex, resolveMeshPath
+        with open(robotPath) as robotFile:
+            urdfText = robotFile.read()
+        urdf = parseURDFString(urdfText)
+        model = RobotModel.fromDescription(urdf)
+        packageIndex = PackageIndex([meshFolder, os.path.dirname(robotPath)])
+        linkMeshes = {}
+        for linkIndex in range(urdf.linkCount):
+            meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+            if meshFilename is None:
+                continue
+            try:
+                meshFilePath = resolveMeshPath(meshFilename, meshFolder, packageIndex)
+                linkMeshes[linkIndex] = readMeshFile(meshFilePath, scale=urdf.meshScale(linkIndex, useCollisionMesh))
+            except (OSError, ValueError) as error:
+                logging.warning(f"Mesh of {model.linkNames[linkIndex]} is not included in the bundle: {error}")
+        writeRobotBundle(bundlePath, urdfText, model, linkMeshes)
+
+    #Queues the mesh of a link to be read in the background and swapped in for the placeholder shown by modelNode
+    def deferMeshLoading(self, modelNode, meshPath, meshTransform=None, meshScaling=None):
+        displayNode = modelNode.GetDisplayNode()
+        displayNode.SetOpacity(0.3)
+        self._pendingMeshes[modelNode.GetID()] = (meshPath, meshTransform, meshScaling)
+        # Loading of hidden links is deferred until they are shown
+        observerTag = displayNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onPlaceholderDisplayModified)
+        self._placeholderObservers[modelNode.GetID()] = (displayNode, observerTag)
+        self._meshesTotal += 1
+
+    def startMeshLoading(self):
+        from URDF_ImportLib.meshloading import BackgroundMeshLoader
+        if self.meshLoader is None:
+            self.meshLoader = BackgroundMeshLoader()
+        if self._meshLoadingTimer is None:
+            self._meshLoadingTimer = qt.QTimer()
+            self._meshLoadingTimer.setInterval(50)
+            self._meshLoadingTimer.connect("timeout()", self.processLoadedMeshes)
+        self._meshLoadingTimer.start()
+        self.processLoadedMeshes()
+
+    #Swaps finished meshes into the scene and submits more meshes to the loader, called periodically by a timer
+    def processLoadedMeshes(self, includeHidden=False):
+        for modelNodeID, polyData, error in self.meshLoader.takeCompleted():
+            self._loadingMeshes.pop(modelNodeID, None)
+            self._finishMeshLoading(modelNodeID, polyData, error)
+
+        for modelNodeID, (meshPath, meshTransform, meshScaling) in list(self._pendingMeshes.items()):
+            if self.meshLoader.inFlight >= 2 * self.meshLoader.maxWorkers:
+                break
+            modelNode = slicer.mrmlScene.GetNodeByID(modelNodeID)
+            if modelNode is None:
+                # node was deleted before its mesh was loaded
+                del self._pendingMeshes[modelNodeID]
+                self._finishMeshLoading(modelNodeID, None, None)
+                continue
+            displayNode = modelNode.GetDisplayNode()
+            if not includeHidden and displayNode and not displayNode.GetVisibility():
+                continue
+            del self._pendingMeshes[modelNodeID]
+            self._loadingMeshes[modelNodeID] = meshPath
+            self.meshLoader.submit(modelNodeID, meshPath, meshTransform, meshScaling)
+
+        if self.meshLoadingProgressCallback:
+            self.meshLoadingProgressCallback(self._meshesLoaded, self._meshesTotal)
+        if self.meshLoader.inFlight == 0 and self._meshLoadingTimer:
+            # Only hidden links are left (if any), showing them restarts the timer
+            self._meshLoadingTimer.stop()
+
+    def _finishMeshLoading(self, modelNodeID, polyData, error):
+        displayNode, observerTag = self._placeholderObservers.pop(modelNodeID, (None, None))
+        if displayNode:
+            displayNode.RemoveObserver(observerTag)
+        self._meshesLoaded += 1
+        modelNode = slicer.mrmlScene.GetNodeByID(modelNodeID)
+        if modelNode is None:
+            return
+        if error:
+            logging.warning(f"Failed to load mesh of {modelNode.GetName()}: {error}")
+        else:
+            modelNode.SetAndObservePolyData(polyData)
+        if modelNode.GetDisplayNode():
+            modelNode.GetDisplayNode().SetOpacity(1.0)
+
+    def onPlaceholderDisplayModified(self, caller, event):
+        if caller.GetVisibility() and self._meshLoadingTimer and not self._meshLoadingTimer.isActive():
+            self._meshLoadingTimer.start()
+
+    #Blocks until all deferred meshes (including those of hidden links) are loaded
+    def waitForMeshes(self):
+        if self.meshLoader is None:
+            return
+        while self._pendingMeshes or self.meshLoader.inFlight:
+            self.processLoadedMeshes(includeHidden=True)
+            self.meshLoader.wait()
+        self.processLoadedMeshes()
+
+    #Starts importing a robot without blocking the application, takes the same arguments as process.
+    #The robot file is parsed on a worker thread, then the meshes are read by a BackgroundMeshLoader and the scene is built
+    #in slices of IMPORT_TIME_SLICE by a timer. importProgressCallback is called with (stage, steps done, step count) where stage
+    #is "parse", "meshes" or "scene" and importFinishedCallback with (error or None, cancelled) once the import is over.
+    def startImport(self, robotPath, meshFolder, scaleIsM, useCollisionMesh, lazyMeshes=False, flatHierarchy=False, mergeFixedLinks=False,
+                    instanceMeshes=False):
+        import concurrent.futures
+        if self._importJob is not None:
+            raise RuntimeError("A robot is already being imported")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="URDFImport")
+        self.suppressedEventCount = 0
+        self._importJob = {
+            "stage": "parse",
+            "executor": executor,
+            "description": executor.submit(self.readRobotDescription, robotPath, meshFolder),
+            "arguments": (meshFolder, scaleIsM, useCollisionMesh, lazyMeshes, flatHierarchy, mergeFixedLinks, instanceMeshes),
+            "meshLoader": None,
+            "meshCache": {},
+            "meshCount": 0,
+            "steps": None,
+            # nodes added by the import are removed if it is cancelled or fails, nodes added meanwhile by others are kept
+            "addedNodeIDs": [],
+        }
+        if self._importTimer is None:
+            self._importTimer = qt.QTimer()
+            self._importTimer.setInterval(10)
+            self._importTimer.connect("timeout()", self.processImport)
+        self._importTimer.start()
+
+    @property
+    def importing(self):
+        return self._importJob is not None
+
+    #Advances the import started by startImport, called periodically by a timer
+    def processImport(self):
+        from URDF_ImportLib.meshloading import BackgroundMeshLoader, meshCacheKey
+        from URDF_ImportLib.packagepaths import resolveMeshPath
+        job = self._importJob
+        if job is None:
+            return
+        try:
+            if job["stage"] == "parse":
+                if not job["description"].done():
+                    self._reportImportProgress("parse", 0, 1)
+                    return
+                description = job["description"].result()
+                job["executor"].shutdown(wait=False)
+                job["description"] = description
+                job["stage"] = "meshes"
+                meshFolder, scaleIsM, useCollisionMesh, lazyMeshes = job["arguments"][:4]
+                if description["bundle"] is None and not lazyMeshes:
+                    job["meshLoader"] = BackgroundMeshLoader()
+                    urdf = description["urdf"]
+                    for linkIndex in range(urdf.linkCount):
+                        meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+                        if meshFilename is None:
+                            continue
+                        try:
+                            meshFilePath = resolveMeshPath(meshFilename, meshFolder, description["packageIndex"])
+                        except (OSError, ValueError):
+                            # reported when the link is added
+                            continue
+                        key = meshCacheKey(meshFilePath, urdf.meshScale(linkIndex, useCollisionMesh))
+                        if key not in job["meshCache"]:
+                            job["meshCache"][key] = None
+                            job["meshLoader"].submit(key, meshFilePath, scale=key[1])
+                    job["meshCount"] = len(job["meshCache"])
+            if job["stage"] == "meshes":
+                if job["meshLoader"] is not None:
+                    for key, polyData, error in job["meshLoader"].takeCompleted():
+                        job["meshCache"][key] = polyData if error is None else error
+                    self._reportImportProgress("meshes", job["meshCount"] - job["meshLoader"].inFlight, job["meshCount"])
+                    if self._importJob is not job or job["meshLoader"].inFlight:
+                        # cancelled by the progress callback or still reading
+                        return
+                    job["meshLoader"].shutdown()
+                job["steps"] = self.importSteps(job["description"], *job["arguments"], meshCache=job["meshCache"])
+                job["stage"] = "scene"
+            endTime = time.perf_counter() + IMPORT_TIME_SLICE
+            # each slice is one batch, so the views are updated between slices but not within them
+            with self.sceneBatch(job["addedNodeIDs"]):
+                for stepsDone, stepCount in job["steps"]:
+                    self._reportImportProgress("scene", stepsDone, stepCount)
+                    if self._importJob is not job or time.perf_counter() > endTime:
+                        return
+        except Exception as error:
+            logging.error(f"Robot import failed: {error}")
+            self._finishImport(error, False)
+            return
+        logging.info(f"Robot imported, {self.suppressedEventCount} scene events were batched")
+        self._finishImport(None, False)
+
+    #Stops the import started by startImport and removes the nodes it has added
+    def cancelImport(self):
+        if self._importJob is not None:
+            self._finishImport(None, True)
+
+    #Blocks until the import started by startImport is finished
+    def waitForImport(self):
+        while self._importJob is not None:
+            self.processImport()
+            if self._importJob is not None and self._importJob["stage"] != "scene":
+                time.sleep(0.01)
+
+    def _reportImportProgress(self, stage, stepsDone, stepCount):
+        if self.importProgressCallback:
+            self.importProgressCallback(stage, stepsDone, stepCount)
+
+    def _finishImport(self, error, cancelled):
+        job = self._importJob
+        self._importJob = None
+        self._importTimer.stop()
+        if job["stage"] == "parse":
+            # a running parse cannot be interrupted, its result is dropped
+            job["description"].cancel()
+            job["executor"].shutdown(wait=False)
+        if job["meshLoader"] is not None:
+            job["meshLoader"].shutdown()
+        if job["steps"] is not None:
+            job["steps"].close()
+        if error is not None or cancelled:
+            self._removeImportedNodes(job["addedNodeIDs"])
+        if self.importFinishedCallback:
+            self.importFinishedCallback(error, cancelled)
+
+    #Removes the nodes with IDs in addedNodeIDs (in reverse order of addition) and forgets the joints and models of the removed nodes
+    def _removeImportedNodes(self, addedNodeIDs):
+        with self.sceneBatch():
+            for nodeID in reversed(addedNodeIDs):
+                node = slicer.mrmlScene.GetNodeByID(nodeID)
+                if node is not None:
+                    slicer.mrmlScene.RemoveNode(node)
+        self._forgetRemovedNodes()
+
+    #Forgets the joints, models, flattened hierarchy joints and instanced actors of nodes that are no longer in the scene, and
+    #the planning environment, which may hold removed link models or a replaced robot model
+    def _forgetRemovedNodes(self):
+        self._planningEnvironment = None
+        self.joints = {nodeID: joint for nodeID, joint in self.joints.items() if slicer.mrmlScene.GetNodeByID(nodeID)}
+        self._indexJointNodes()
+        self.jointTransformNodeIDs = [nodeID for nodeID in self.jointTransformNodeIDs if slicer.mrmlScene.GetNodeByID(nodeID)]
+        self.robotModelNodeIDs = [nodeID for nodeID in self.robotModelNodeIDs if slicer.mrmlScene.GetNodeByID(nodeID)]
+        for nodeID in list(self._flatHierarchyJoints):
+            if not slicer.mrmlScene.GetNodeByID(nodeID):
+                del self._flatHierarchyJoints[nodeID]
+        for modelNodeID in [nodeID for nodeID in self._instancedActors if not slicer.mrmlScene.GetNodeByID(nodeID)]:
+            self.removeInstancedActors(modelNodeID)
+
+    #Reloads the last loaded robot after its robot file or mesh files were edited and changes only what differs: moved joints
+    #get new origin matrices, only changed meshes are read again and only the nodes of added or removed links and joints are
+    #added or removed. Joint values are kept (clamped to the new limits) and other scene content is not touched.
+    #Robots imported with a flat hierarchy are rebuilt if links or joints were added, removed or reordered, and merged or
+    #instanced links if their meshes or fixed joints changed; only the nodes of the robot are replaced then.
+    #Returns the RobotDiff from the previous description.
+    def reloadRobot(self):
+        from URDF_ImportLib.bundle import BUNDLE_EXTENSION
+        from URDF_ImportLib.urdfparser import parseURDFString
+        from URDF_ImportLib.robotdiff import diffRobotDescriptions, meshStamps
+        robotImport = self.robotImport
+        if robotImport is None or slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID) is None:
+            raise ValueError("No robot is loaded")
+        if os.path.splitext(robotImport["description"]["robotPath"])[1] == BUNDLE_EXTENSION:
+            raise ValueError("Robot bundles cannot be reloaded, import the robot again")
+        startTime = time.perf_counter()
+        options = robotImport["options"]
+        if robotImport["description"]["urdf"] is None:
+            # restored from a saved scene, the stored robot text is parsed when it is first needed
+            robotImport["description"]["urdf"] = parseURDFString(robotImport["description"]["urdfText"])
+        description = self.readRobotDescription(robotImport["description"]["robotPath"], options["meshFolder"])
+        urdf = description["urdf"]
+        stamps = meshStamps(urdf, options["meshFolder"], options["useCollisionMesh"], description["packageIndex"])
+        diff = diffRobotDescriptions(robotImport["description"]["urdf"], urdf, robotImport["meshStamps"], stamps, options["useCollisionMesh"])
+        # joint values are matched by name
+        oldValues = dict(zip(self.robotModel.dofNames(), self.jointValues()))
+        q = numpy.array([oldValues.get(name, 0.0) for name in description["model"].dofNames()])
+        movedFixedJoints = [name for name in diff.movedJoints if urdf.jointTypeNames[urdf.jointIndex[name]] == "fixed"]
+        if ((options["flatHierarchy"] and (diff.structureChanged or not diff.sameOrder))
+                or ((options["mergeFixedLinks"] or options["instanceMeshes"]) and (diff.changedMeshes or movedFixedJoints))):
+            self._reimportRobot(description)
+        else:
+            with self.sceneBatch():
+                self._applyRobotDiff(description, diff)
+            robotImport["description"] = description
+            robotImport["meshStamps"] = stamps
+            self.saveRobotState()
+        if diff.structureChanged:
+            self._refreshJointObservers()
+        self.setJointValues(q)
+        logging.info(f"Robot reloaded in {time.perf_counter() - startTime:.3f}s: {diff}")
+        return diff
+
+    #Updates the nodes of the last loaded robot to a new description, see reloadRobot
+    def _applyRobotDiff(self, description, diff):
+        from URDF_ImportLib.kinematics import FIXED
+        robotImport = self.robotImport
+        options = robotImport["options"]
+        oldUrdf = robotImport["description"]["urdf"]
+        urdf = description["urdf"]
+        model = description["model"]
+        nodeIDs = robotImport["nodeIDs"]
+
+        def robotNode(name):
+            return slicer.mrmlScene.GetNodeByID(nodeIDs[name]) if name in nodeIDs else None
+
+        # links and joints that are removed or attached differently lose their nodes
+        removedNames = []
+        for name in diff.removedLinks:
+            removedNames += [name, f"{name} to world"]
+        for name in diff.removedJoints + diff.reattachedJoints:
+            removedNames += [name, f"{name} to {oldUrdf.linkNames[oldUrdf.jointParents[oldUrdf.jointIndex[name]]]}"]
+        for name in removedNames:
+            node = robotNode(name)
+            nodeIDs.pop(name, None)
+            if node is not None:
+                slicer.mrmlScene.RemoveNode(node)
+        self._forgetRemovedNodes()
+        nodes = {}
+        for name in diff.addedLinks:
+            self.addLinkModel(description, urdf.linkIndex[name], nodes, options["meshFolder"], options["useCollisionMesh"],
+                              flatHierarchy=options["flatHierarchy"])
+        for name in diff.addedJoints + diff.reattachedJoints:
+            self.addJointTransform(description, urdf.jointIndex[name], nodes)
+        self.robotModelNodeIDs += [node["model"].GetID() for node in nodes.values() if node["type"] == "link"]
+        for name, node in nodes.items():
+            nodeIDs[name] = (node["model"] if node["type"] == "link" else node["transform"]).GetID()
+            if node["type"] == "transform":
+                node["transform"].SetAndObserveTransformNodeID(self.robotToWorldTransformNodeID)
+
+        for name in diff.changedMeshes:
+            linkIndex = urdf.linkIndex[name]
+            self.reloadLinkMesh(description, linkIndex, robotNode(name), options["meshFolder"], options["useCollisionMesh"])
+            if robotNode(f"{name} to world") is not None:
+                slicer.util.updateTransformMatrixFromArray(robotNode(f"{name} to world"), model.visualOrigins[model.linkIndex[name]])
+        # the kinematic model of the joint observers is replaced, it holds the new limits, axes and mimic coefficients
+        for name in model.jointNames:
+            jointIndex = model.jointIndex[name]
+            jointTransformNode = robotNode(name)
+            if jointTransformNode is None or model.jointTypes[jointIndex] == FIXED:
+                continue
+            self._addJoint(model, jointIndex, jointTransformNode)
+            if name in diff.changedJoints:
+                setUpJointEditor(jointTransformNode.GetDisplayNode(), urdf.jointTypeNames[urdf.jointIndex[name]],
+                                 urdf.jointAxes[urdf.jointIndex[name]], model.mimicDrivers[jointIndex] >= 0)
+        # forget the joint nodes of the old model
+        self._indexJointNodes()
+        if options["flatHierarchy"]:
+            hierarchy = robotImport["hierarchy"]
+            hierarchy["model"] = model
+            # all link poses are recomputed from the new model
+            hierarchy["linkTransforms"] = None
+            self.updateFlatHierarchy(hierarchy)
+        else:
+            jointOrigins = urdf.jointOrigins()
+            linkParentJoints = {urdf.jointChildren[jointIndex]: jointIndex for jointIndex in range(urdf.jointCount)}
+            for jointIndex, name in enumerate(urdf.jointNames):
+                parentLinkIndex = urdf.jointParents[jointIndex]
+                jointToParentName = f"{name} to {urdf.linkNames[parentLinkIndex]}"
+                jointToParentTransformNode = robotNode(jointToParentName)
+                if jointToParentTransformNode is None:
+                    jointToParentTransformNode = addTransformNode(jointToParentName, toVTKMatrices(jointOrigins[jointIndex]))
+                    nodeIDs[jointToParentName] = jointToParentTransformNode.GetID()
+                elif name in diff.movedJoints:
+                    slicer.util.updateTransformMatrixFromArray(jointToParentTransformNode, jointOrigins[jointIndex])
+                parentJointIndex = linkParentJoints.get(parentLinkIndex)
+                jointToParentTransformNode.SetAndObserveTransformNodeID(
+                    self.robotToWorldTransformNodeID if parentJointIndex is None else nodeIDs[urdf.jointNames[parentJointIndex]])
+                robotNode(name).SetAndObserveTransformNodeID(jointToParentTransformNode.GetID())
+                robotNode(urdf.linkNames[urdf.jointChildren[jointIndex]]).SetAndObserveTransformNodeID(nodeIDs[name])
+            for linkIndex, name in enumerate(urdf.linkNames):
+                if linkIndex not in linkParentJoints:
+                    robotNode(name).SetAndObserveTransformNodeID(self.robotToWorldTransformNodeID)
+        self.robotModel = model
+
+    #Replaces all nodes of the last loaded robot by the nodes of a new description, the robot transform is kept
+    def _reimportRobot(self, description):
+        robotImport = self.robotImport
+        robotToWorldTransformNode = slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID)
+        robotToParent = vtk.vtkMatrix4x4()
+        robotToWorldTransformNode.GetMatrixTransformToParent(robotToParent)
+        robotParentTransformNodeID = robotToWorldTransformNode.GetTransformNodeID()
+        with self.sceneBatch():
+            for nodeID in list(robotImport["nodeIDs"].values()) + [self.robotToWorldTransformNodeID]:
+                node = slicer.mrmlScene.GetNodeByID(nodeID)
+                if node is not None:
+                    slicer.mrmlScene.RemoveNode(node)
+            self._forgetRemovedNodes()
+            for stepsDone, stepCount in self.importSteps(description, **robotImport["options"]):
+                pass
+            robotToWorldTransformNode = slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID)
+            robotToWorldTransformNode.SetMatrixTransformToParent(robotToParent)
+            robotToWorldTransformNode.SetAndObserveTransformNodeID(robotParentTransformNodeID)
+
+    #Reads the mesh of a link (index in the URDFDescription) again into its model node, e.g. after its mesh file or visual origin
+    #changed. The model is kept if the mesh cannot be read, e.g. while it is being written.
+    def reloadLinkMesh(self, description, linkIndex, modelNode, meshFolder, useCollisionMesh):
+        from URDF_ImportLib.meshloading import readMeshFile
+        from URDF_ImportLib.packagepaths import resolveMeshPath
+        urdf = description["urdf"]
+        model = description["model"]
+        name = urdf.linkNames[linkIndex]
+        try:
+            meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+            if meshFilename is None:
+                raise ValueError(f"Link {name} has no mesh")
+            polyData = readMeshFile(resolveMeshPath(meshFilename, meshFolder, description["packageIndex"]),
+                                    scale=urdf.meshScale(linkIndex, useCollisionMesh))
+        except Exception as error:
+            logging.warning(f"Mesh of {name} is not reloaded: {error}")
+            return
+        modelNode.SetAndObservePolyData(polyData)
+        bakeMeshOrigin(modelNode, model.visualOrigins[model.linkIndex[name]])
+
+    #Observes the joint transforms of the robot again for clearance monitoring and joint recording, after joints were added or removed
+    def _refreshJointObservers(self):
+        for observers, callback in ((self._clearanceObservers, self.onClearanceJointModified),
+                                    (self._jointRecordingObservers, self.onRecordedJointModified)):
+            if not observers:
+                continue
+            for jointTransformNode, observerTag in observers:
+                jointTransformNode.RemoveObserver(observerTag)
+            observers[:] = self.observeJointNodes(callback)
+
+    #Reloads the last loaded robot (see reloadRobot) whenever its robot file or one of its mesh files changes
+    def watchRobotFile(self):
+        if self.robotImport is None:
+            raise ValueError("No robot is loaded")
+        self.stopWatchingRobotFile()
+        self._robotFileWatcher = qt.QFileSystemWatcher()
+        self._robotFileWatcher.connect("fileChanged(QString)", self.onWatchedRobotFileChanged)
+        if self._robotReloadTimer is None:
+            # editors write files in several steps (or replace them), the robot is reloaded once they are done
+            self._robotReloadTimer = qt.QTimer()
+            self._robotReloadTimer.setSingleShot(True)
+            self._robotReloadTimer.setInterval(ROBOT_RELOAD_DELAY_MS)
+            self._robotReloadTimer.connect("timeout()", self.reloadWatchedRobot)
+        self._updateWatchedRobotFiles()
+
+    def stopWatchingRobotFile(self):
+        if self._robotReloadTimer is not None:
+            self._robotReloadTimer.stop()
+        self._robotFileWatcher = None
+
+    @property
+    def watchingRobotFile(self):
+        return self._robotFileWatcher is not None
+
+    def onWatchedRobotFileChanged(self, path):
+        self._robotReloadTimer.start()
+
+    #Reloads the watched robot, a robot file that cannot be read (e.g. invalid XML while it is edited) leaves the robot as it is
+    def reloadWatchedRobot(self):
+        if self._robotFileWatcher is None:
+            return
+        diff, error = None, None
+        try:
+            diff = self.reloadRobot()
+        except Exception as exception:
+            error = exception
+            logging.error(f"Robot reload failed: {error}")
+        self._updateWatchedRobotFiles()
+        if self.robotReloadedCallback:
+            self.robotReloadedCallback(diff, error)
+
+    def _updateWatchedRobotFiles(self):
+        paths = {self.robotImport["description"]["robotPath"]}
+        paths.update(stamp[0] for stamp in self.robotImport["meshStamps"].values() if stamp is not None)
+        watchedPaths = set(self._robotFileWatcher.files())
+        if watchedPaths - paths:
+            self._robotFileWatcher.removePaths(list(watchedPaths - paths))
+        # files that were replaced by an editor are no longer watched, they are added again
+        if paths - watchedPaths:
+            self._robotFileWatcher.addPaths(list(paths - watchedPaths))
+
+    #Stores the last loaded robot in its robot transform node: the kinematic model (joint tree, limits, axes and mimic joints),
+    #the compressed robot text, the import options, the mesh file stamps and node references to its other nodes, which are
+    #saved with the scene. restoreRobots sets the robot up again from these when the scene is loaded.
+    def saveRobotState(self):
+        from URDF_ImportLib.scenestate import compressText, encodeRobotModel
+        robotImport = self.robotImport
+        description = robotImport["description"]
+        robotToWorldTransformNode = slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID)
+        robotToWorldTransformNode.SetAttribute(ROBOT_MODEL_ATTRIBUTE, encodeRobotModel(description["model"]))
+        robotToWorldTransformNode.SetAttribute("URDF_Import.RobotText", compressText(description["urdfText"]))
+        robotToWorldTransformNode.SetAttribute("URDF_Import.Import", json.dumps({
+            "robotPath": description["robotPath"],
+            "options": robotImport["options"],
+            "meshStamps": robotImport["meshStamps"],
+            "instanceNodeNames": robotImport["instanceNodeNames"],
+        }))
+        robotToWorldTransformNode.RemoveNodeReferenceIDs(ROBOT_NODE_REFERENCE_ROLE)
+        for name, nodeID in robotImport["nodeIDs"].items():
+            # node names may be changed by the user, the name in the robot is kept in an attribute
+            slicer.mrmlScene.GetNodeByID(nodeID).SetAttribute("URDF_Import.RobotNodeName", name)
+            robotToWorldTransformNode.AddNodeReferenceID(ROBOT_NODE_REFERENCE_ROLE, nodeID)
+        if not self._robotSceneCloseObserver:
+            self._robotSceneCloseObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onSceneEndCloseForgetRobot)
+
+    #Sets up the robots stored by saveRobotState in the scene (e.g., after a saved scene was loaded) that are not set up yet:
+    #joint limits are enforced again and flattened hierarchies and mesh instances follow the joints, in one pass over the
+    #stored metadata without the robot files or mesh files. The last one becomes the last loaded robot.
+    #Returns the robot transform nodes of the restored robots.
+    def restoreRobots(self):
+        restored = []
+        for robotToWorldTransformNode in slicer.util.getNodesByClass("vtkMRMLTransformNode"):
+            if robotToWorldTransformNode.GetAttribute(ROBOT_MODEL_ATTRIBUTE) is None:
+                continue
+            nodes = {}
+            for referenceIndex in range(robotToWorldTransformNode.GetNumberOfNodeReferences(ROBOT_NODE_REFERENCE_ROLE)):
+                node = robotToWorldTransformNode.GetNthNodeReference(ROBOT_NODE_REFERENCE_ROLE, referenceIndex)
+                if node is not None:
+                    nodes[node.GetAttribute("URDF_Import.RobotNodeName") or node.GetName()] = node
+            if (robotToWorldTransformNode.GetID() == self.robotToWorldTransformNodeID
+                    or any(node.GetID() in self.robotModelNodeIDs or node.GetID() in self.jointTransformNodeIDs for node in nodes.values())):
+                # imported or restored already
+                continue
+            self.restoreRobot(robotToWorldTransformNode, nodes)
+            restored.append(robotToWorldTransformNode)
+        return restored
+
+    #Sets up a robot stored by saveRobotState, nodes maps the names of its nodes in the robot to the nodes
+    def restoreRobot(self, robotToWorldTransformNode, nodes):
+        from URDF_ImportLib.kinematics import FIXED
+        from URDF_ImportLib.scenestate import decodeRobotModel, decompressText
+        startTime = time.perf_counter()
+        model = decodeRobotModel(robotToWorldTransformNode.GetAttribute(ROBOT_MODEL_ATTRIBUTE))
+        state = json.loads(robotToWorldTransformNode.GetAttribute("URDF_Import.Import"))
+        options = state["options"]
+        for jointIndex, name in enumerate(model.jointNames):
+            jointTransformNode = nodes.get(name)
+            if jointTransformNode is None or model.jointTypes[jointIndex] == FIXED:
+                continue
+            self.jointTransformNodeIDs.append(jointTransformNode.GetID())
+            self._addJoint(model, jointIndex, jointTransformNode)
+            jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onJointNode, 1.0)
+        self.robotModelNodeIDs += [node.GetID() for node in nodes.values() if node.IsA("vtkMRMLModelNode")]
+        hierarchy = None
+        if options["flatHierarchy"]:
+            hierarchy = self._restoreFlatHierarchy(nodes, model, state["instanceNodeNames"])
+            for (instances, linkIndices), name in zip(hierarchy["instanceGroups"], state["instanceNodeNames"]):
+                self.addInstancedActors(instances, nodes[name], robotToWorldTransformNode)
+                if nodes[name].GetID() not in self._instancedActors:
+                    # the instances were drawn by actors when the scene was saved
+                    nodes[name].GetDisplayNode().SetVisibility3D(True)
+        self.robotModel = model
+        self.robotToWorldTransformNodeID = robotToWorldTransformNode.GetID()
+        self.robotImport = {
+            # the robot text is parsed when the robot is reloaded
+            "description": {"robotPath": state["robotPath"], "urdfText": decompressText(robotToWorldTransformNode.GetAttribute("URDF_Import.RobotText")),
+                            "urdf": None, "bundle": None, "model": model, "packageIndex": None},
+            "options": options,
+            "nodeIDs": {name: node.GetID() for name, node in nodes.items()},
+            "hierarchy": hierarchy,
+            "meshStamps": {name: tuple(stamp) if stamp else None for name, stamp in state["meshStamps"].items()},
+            "instanceNodeNames": state["instanceNodeNames"],
+        }
+        if not self._robotSceneCloseObserver:
+            self._robotSceneCloseObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onSceneEndCloseForgetRobot)
+        logging.info(f"Robot {model.name} restored in {time.perf_counter() - startTime:.3f}s")
+
+    #Rebuilds the flattened hierarchy of a restored robot from its "link to robot" and "joint frame" transforms (see makeFlatHierarchy),
+    #the mesh instances are rebuilt from the saved models named instanceNodeNames
+    def _restoreFlatHierarchy(self, nodes, model, instanceNodeNames):
+        from URDF_ImportLib.instancing import MeshInstances
+        hierarchy = {
+            "model": model,
+            "motions": numpy.tile(numpy.eye(4), (len(model.jointNames), 1, 1)),
+            "linkTransforms": None,
+            "linkNodes": [nodes.get(f"{linkName} to robot") for linkName in model.linkNames],
+            "frameNodes": {},
+            "instanceGroups": [],
+        }
+        for jointIndex, jointName in enumerate(model.jointNames):
+            jointTransformNode = nodes.get(jointName)
+            jointFrameTransformNode = nodes.get(f"{jointName} frame")
+            if jointTransformNode is None or jointFrameTransformNode is None:
+                continue
+            hierarchy["motions"][jointIndex] = slicer.util.arrayFromTransformMatrix(jointTransformNode)
+            hierarchy["frameNodes"][jointIndex] = jointFrameTransformNode
+            self._flatHierarchyJoints[jointTransformNode.GetID()] = (hierarchy, jointIndex)
+            jointTransformNode.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onFlatHierarchyJointModified)
+        linkTransforms = model.linkTransforms(motions=hierarchy["motions"])
+        for name in instanceNodeNames:
+            modelNode = nodes[name]
+            # the LinkIndex cell array refers to this list of link names
+            linkIndices = numpy.array([model.linkIndex[linkName] for linkName in modelNode.GetAttribute("URDF_Import.MergedLinks").split()])
+            instances = MeshInstances.fromMergedPolyData(modelNode.GetPolyData(), linkTransforms[linkIndices] @ model.visualOrigins[linkIndices])
+            modelNode.SetAndObservePolyData(instances.mergedPolyData)
+            hierarchy["instanceGroups"].append((instances, linkIndices))
+        self.updateFlatHierarchy(hierarchy)
+        return hierarchy
+
+    #Forgets the nodes of the closed scene, so that the robots of the next loaded scene are restored even if their nodes get the same IDs
+    def onSceneEndCloseForgetRobot(self, caller, event):
+        self.stopWatchingRobotFile()
+        self._forgetRemovedNodes()
+        if not slicer.mrmlScene.GetNodeByID(self.robotToWorldTransformNodeID or ""):
+            self.robotModel = None
+            self.robotToWorldTransformNodeID = None
+            self.robotImport = None
 
     
 	
@@ -736,10 +2407,84 @@ class URDF_ImportTest(ScriptedLoadableModuleTest):
         """Do whatever is needed to reset the state - typically a scene clear will be enough."""
         slicer.mrmlScene.Clear()
 
+    #Directory for the files of a test, removed when the tests are done
+    def temporaryDirectory(self):
+        import tempfile
+        tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempDir, ignore_errors=True)
+        return tempDir
+
+    #Writes a synthetic robot (see synthetic.writeSyntheticRobot) into a temporary directory, returns the robot file path and the directory
+    def writeSyntheticRobot(self, linkCount, topology="chain", meshes="shared"):
+        from URDF_ImportLib import synthetic
+        tempDir = self.temporaryDirectory()
+        return synthetic.writeSyntheticRobot(tempDir, linkCount, topology=topology, meshes=meshes), tempDir
+
+    #Writes a synthetic robot and imports it (scaled to millimeters) with the import options of process into the scene
+    #Returns a new logic with the robot, the robot file path and the directory of the robot and its meshes
+    def importSyntheticRobot(self, linkCount, topology="chain", meshes="shared", **importOptions):
+        robotPath, tempDir = self.writeSyntheticRobot(linkCount, topology, meshes)
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False, **importOptions)
+        return logic, robotPath, tempDir
+
     def runTest(self):
         """Run as few or as many tests as needed here."""
+        try:
+            self.runTests()
+        finally:
+            # the self test of the module widget calls runTest directly, without the unittest runner that runs cleanups
+            self.doCleanups()
+
+    def runTests(self):
         self.setUp()
         self.test_URDF_Import1()
+        self.setUp()
+        self.test_JointInteractionProfiler()
+        self.setUp()
+        self.test_LazyMeshLoading()
+        self.setUp()
+        self.test_RobotBundle()
+        self.setUp()
+        self.test_MeshResolution()
+        self.setUp()
+        self.test_FlatHierarchy()
+        self.setUp()
+        self.test_MergeFixedLinks()
+        self.setUp()
+        self.test_InstancedMeshes()
+        self.setUp()
+        self.test_ClearanceMonitoring()
+        self.setUp()
+        self.test_SweptVolume()
+        self.setUp()
+        self.test_Rotations()
+        self.setUp()
+        self.test_GeneralJoints()
+        self.setUp()
+        self.test_MimicJoints()
+        self.setUp()
+        self.test_AsyncImport()
+        self.setUp()
+        self.test_BatchedImport()
+        self.setUp()
+        self.test_URDFParser()
+        self.setUp()
+        self.test_MotionPlanning()
+        self.setUp()
+        self.test_Dynamics()
+        self.setUp()
+        self.test_SurfaceRegistration()
+        self.setUp()
+        self.test_KinematicCalibration()
+        self.setUp()
+        self.test_PoseDatasetRendering()
+        self.setUp()
+        self.test_JointSequences()
+        self.setUp()
+        self.test_RobotHotReload()
+        self.setUp()
+        self.test_RobotSceneRestore()
 
     def test_URDF_Import1(self):
         """Ideally you should have several levels of tests.  At the lowest level
@@ -757,33 +2502,934 @@ class URDF_ImportTest(ScriptedLoadableModuleTest):
 
         # Get/create input data
 
-        import SampleData
+        robotPath, tempDir = self.writeSyntheticRobot(5, topology="chain", meshes="shared")
+        self.delayDisplay("Created synthetic robot")
+
+        # Test the module logic
 
-        registerSampleData()
-        inputVolume = SampleData.downloadSample("URDF_Import1")
-        self.delayDisplay("Loaded test data set")
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False)
+
+        for linkIndex in range(5):
+            modelNode = slicer.util.getNode(f"link_{linkIndex}")
+            self.assertGreater(modelNode.GetPolyData().GetNumberOfPoints(), 0)
+        robotNode = slicer.util.getNode("Robot")
+        self.assertAlmostEqual(robotNode.GetMatrixTransformToParent().GetElement(0, 0), 1000.0)
+
+        # Editable joints get a display node, fixed joints do not
+        self.assertIsNotNone(slicer.util.getNode("joint_0").GetDisplayNode())
+        self.assertIsNone(slicer.util.getNode("joint_3").GetDisplayNode())
+
+        # Rotating a revolute joint beyond its upper limit (1.5 rad) snaps it back to the limit
+        jointNode = slicer.util.getNode("joint_0")
+        rotation = vtk.vtkTransform()
+        rotation.RotateZ(vtk.vtkMath.DegreesFromRadians(2.5))
+        jointNode.SetMatrixTransformToParent(rotation.GetMatrix())
+        matrix = jointNode.GetMatrixTransformToParent()
+        self.assertAlmostEqual(math.atan2(matrix.GetElement(1, 0), matrix.GetElement(0, 0)), 1.5, places=3)
+        jointStatistics = {row["name"]: row for row in logic.profiler.summary()}
+        self.assertEqual(jointStatistics["joint_0"]["clamps"], 1)
+
+        self.delayDisplay("Test passed")
+
+    def test_JointInteractionProfiler(self):
+        """Latency percentiles and clamp counts are collected per joint and exported as CSV."""
+        import csv
+        import tempfile
+
+        profiler = JointInteractionProfiler(capacity=4)
+        for elapsed in [0.001, 0.002, 0.003, 0.004, 0.005]:
+            profiler.record("joint1", elapsed, clamped=elapsed > 0.004)
+        profiler.recordRender(0.010)
+
+        rows = profiler.summary()
+        self.assertEqual([row["name"] for row in rows], ["joint1", "(3D view render)"])
+        self.assertEqual(rows[0]["calls"], 5)
+        self.assertEqual(rows[0]["clamps"], 1)
+        # only the 4 most recent samples are kept in the ring buffer
+        self.assertAlmostEqual(rows[0]["max_ms"], 5.0)
+        self.assertAlmostEqual(rows[0]["p50_ms"], 3.5)
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            csvPath = os.path.join(tempDir, "statistics.csv")
+            profiler.writeCSV(csvPath)
+            with open(csvPath) as csvFile:
+                self.assertEqual(len(list(csv.DictReader(csvFile))), 2)
+
+        self.delayDisplay("Test passed")
+
+    def test_LazyMeshLoading(self):
+        """Links show placeholders right after import and get their meshes once background loading completes."""
+        # more links than meshes loaded at once (at most 16), so that the last link is not submitted when loading starts
+        linkCount = 20
+        robotPath, tempDir = self.writeSyntheticRobot(linkCount, topology="tree", meshes="unique")
 
-        inputScalarRange = inputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(inputScalarRange[0], 0)
-        self.assertEqual(inputScalarRange[1], 695)
+        logic = URDF_ImportLogic()
+        progress = []
+        logic.meshLoadingProgressCallback = lambda loaded, total: progress.append((loaded, total))
+        logic.process(robotPath, tempDir, True, False, lazyMeshes=True)
+        self.assertEqual(slicer.util.getNode("link_5").GetDisplayNode().GetOpacity(), 0.3)
+
+        # Hidden links are only loaded when explicitly waited for
+        hiddenNode = slicer.util.getNode(f"link_{linkCount - 1}")
+        hiddenNode.GetDisplayNode().SetVisibility(False)
+        while logic.meshLoader.inFlight:
+            logic.meshLoader.wait()
+            logic.processLoadedMeshes()
+        self.assertEqual(progress[-1], (linkCount - 1, linkCount))
+        self.assertEqual(hiddenNode.GetDisplayNode().GetOpacity(), 0.3)
+        self.assertEqual(hiddenNode.GetPolyData().GetNumberOfCells(), 6)
+        logic.waitForMeshes()
+        self.assertEqual(progress[-1], (linkCount, linkCount))
+        for linkIndex in range(linkCount):
+            modelNode = slicer.util.getNode(f"link_{linkIndex}")
+            self.assertEqual(modelNode.GetDisplayNode().GetOpacity(), 1.0)
+            self.assertEqual(modelNode.GetPolyData().GetNumberOfCells(), 12)
+
+        self.delayDisplay("Test passed")
+
+    def test_RobotBundle(self):
+        """A robot exported as a bundle loads without the URDF and mesh files."""
+        from URDF_ImportLib.bundle import BUNDLE_EXTENSION
+        import shutil
+        from URDF_ImportLib import synthetic
+
+        tempDir = self.temporaryDirectory()
+        robotDir = os.path.join(tempDir, "robot")
+        robotPath = synthetic.writeSyntheticRobot(robotDir, 8, topology="tree", meshes="unique")
+        bundlePath = os.path.join(tempDir, "robot" + BUNDLE_EXTENSION)
 
-        outputVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
-        threshold = 100
+        logic = URDF_ImportLogic()
+        logic.exportRobotBundle(robotPath, robotDir, bundlePath)
+        shutil.rmtree(robotDir)
+
+        logic.process(bundlePath, "", True, False)
+        for linkIndex in range(8):
+            modelNode = slicer.util.getNode(f"link_{linkIndex}")
+            self.assertEqual(modelNode.GetPolyData().GetNumberOfCells(), 12)
+        self.assertIsNotNone(slicer.util.getNode("joint_4").GetDisplayNode())
+
+        self.delayDisplay("Test passed")
+
+    def test_MeshResolution(self):
+        """package:// mesh URIs, mesh scale and non-STL mesh formats."""
+        from URDF_ImportLib import synthetic
+
+        tempDir = self.temporaryDirectory()
+        packageDir = os.path.join(tempDir, "src", "robot_description")
+        os.makedirs(os.path.join(packageDir, "meshes"))
+        with open(os.path.join(packageDir, "package.xml"), "w") as packageFile:
+            packageFile.write("<package><name>robot_description</name></package>")
+        synthetic.writeBoxSTL(os.path.join(packageDir, "meshes", "link_0.stl"))
+        with open(os.path.join(packageDir, "meshes", "link_1.obj"), "w") as objFile:
+            objFile.write("v 0 0 0\nv 0.01 0 0\nv 0.01 0.01 0\nv 0 0.01 0\nf 1 2 3 4\n")
+
+        robotText = synthetic.syntheticURDF(2, meshes="unique")
+        robotText = robotText.replace('filename="link_0.stl"', 'filename="package://robot_description/meshes/link_0.stl" scale="2 2 2"')
+        robotText = robotText.replace('filename="link_1.stl"', 'filename="package://robot_description/meshes/link_1.obj"')
+        robotPath = os.path.join(tempDir, "robot.urdf")
+        with open(robotPath, "w") as robotFile:
+            robotFile.write(robotText)
 
-        # Test the module logic
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False)
+        bounds = [0.0] * 6
+        slicer.util.getNode("link_0").GetPolyData().GetBounds(bounds)
+        self.assertAlmostEqual(bounds[1] - bounds[0], 0.04, places=5)
+        self.assertEqual(slicer.util.getNode("link_1").GetPolyData().GetNumberOfCells(), 2)
+
+        self.delayDisplay("Test passed")
+
+    def test_FlatHierarchy(self):
+        """Link poses of a flattened transform hierarchy follow the joint transforms."""
+        from URDF_ImportLib.kinematics import RobotModel
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(10, topology="chain", meshes="shared", flatHierarchy=True)
+        # fixed joints have no transform node, every model is two transforms away from the world
+        self.assertIsNone(slicer.mrmlScene.GetFirstNodeByName("joint_3"))
+        linkToRobotTransformNode = slicer.util.getNode("link_9").GetParentTransformNode()
+        self.assertEqual(linkToRobotTransformNode.GetName(), "link_9 to robot")
+        self.assertEqual(linkToRobotTransformNode.GetParentTransformNode().GetName(), "Robot")
+        self.assertIsNone(linkToRobotTransformNode.GetParentTransformNode().GetParentTransformNode())
+
+        model = RobotModel.fromFile(robotPath)
+        q = model.zeroConfiguration()
+        q[model.dofIndex[model.jointIndex["joint_4"]]] = 0.02
+        q[model.dofIndex[model.jointIndex["joint_0"]]] = 0.7
+        motions = model.jointMotions(q)
+        for jointName in ("joint_4", "joint_0"):
+            slicer.util.updateTransformMatrixFromArray(slicer.util.getNode(jointName), motions[model.jointIndex[jointName]])
+        expected = numpy.diag([1000.0, 1000.0, 1000.0, 1.0]) @ model.linkTransforms(q)[model.linkIndex["link_9"]]
+        numpy.testing.assert_allclose(slicer.util.arrayFromTransformMatrix(linkToRobotTransformNode, toWorld=True), expected, atol=1e-6)
+
+        self.delayDisplay("Test passed")
+
+    def test_MergeFixedLinks(self):
+        """Links connected by fixed joints are shown by one model, cells still map to their links."""
+        # joint_3 and joint_7 are fixed
+        logic, robotPath, tempDir = self.importSyntheticRobot(10, topology="chain", meshes="unique", mergeFixedLinks=True)
+        self.assertIsNone(slicer.mrmlScene.GetFirstNodeByName("link_4"))
+        self.assertIsNone(slicer.mrmlScene.GetFirstNodeByName("link_8"))
+        modelNode = slicer.util.getNode("link_3")
+        self.assertEqual(modelNode.GetPolyData().GetNumberOfCells(), 24)
+        self.assertEqual(logic.linkNameFromCell(modelNode, 0), "link_3")
+        self.assertEqual(logic.linkNameFromCell(modelNode, 20), "link_4")
+        self.assertEqual(logic.linkNameFromCell(slicer.util.getNode("link_5"), 0), "link_5")
+
+        self.delayDisplay("Test passed")
+
+    def test_InstancedMeshes(self):
+        """Links that share a mesh are drawn by one model and follow the joints."""
+        from URDF_ImportLib.kinematics import RobotModel
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(6, topology="chain", meshes="shared", instanceMeshes=True)
+        self.assertIsNone(slicer.mrmlScene.GetFirstNodeByName("link_5"))
+        modelNode = slicer.util.getNode("link_0 instances")
+        self.assertEqual(modelNode.GetPolyData().GetNumberOfCells(), 6 * 12)
+        self.assertEqual(logic.linkNameFromCell(modelNode, 5 * 12), "link_5")
+
+        model = RobotModel.fromFile(robotPath)
+        q = model.zeroConfiguration()
+        q[model.dofIndex[model.jointIndex["joint_0"]]] = 0.5
+        slicer.util.updateTransformMatrixFromArray(slicer.util.getNode("joint_0"), model.jointMotions(q)[model.jointIndex["joint_0"]])
+        meshToRobot = model.linkTransforms(q)[model.linkIndex["link_5"]] @ model.visualOrigins[model.linkIndex["link_5"]]
+        meshPoints = slicer.util.arrayFromModelPoints(modelNode)
+        center = meshPoints[5 * len(meshPoints) // 6:].mean(axis=0)
+        numpy.testing.assert_allclose(center, meshToRobot[:3, 3], atol=1e-5)
+
+        self.delayDisplay("Test passed")
+
+    def test_ClearanceMonitoring(self):
+        """Clearance of the robot models to an anatomy model is checked after joint motion."""
+        robotPath, tempDir = self.writeSyntheticRobot(4, topology="chain", meshes="unique")
+        # link_0 is a 20 x 20 x 50 mm box above the origin, the anatomy a 10 mm radius sphere 30 mm away from its side
+        sphere = vtk.vtkSphereSource()
+        sphere.SetCenter(0, 50, 25)
+        sphere.SetRadius(10)
+        sphere.SetThetaResolution(32)
+        sphere.SetPhiResolution(32)
+        sphere.Update()
+        anatomyNode = slicer.modules.models.logic().AddModel(sphere.GetOutput())
+
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False)
+        distanceFieldPath = os.path.join(tempDir, "anatomy.npy")
+        monitor = logic.startClearanceMonitoring(anatomyNode, threshold=40.0, spacing=1.0, distanceFieldPath=distanceFieldPath)
+        self.assertTrue(os.path.isfile(distanceFieldPath))
+        self.assertAlmostEqual(monitor.clearances["link_0"], 30.0, delta=1.5)
+        self.assertIn("link_0", logic.updateClearance())
+
+        # rotating joint_2 (continuous, about y) tilts link_3 but does not move link_0
+        clearanceOfLink3 = monitor.clearances["link_3"]
+        rotation = vtk.vtkTransform()
+        rotation.RotateY(math.degrees(1.0))
+        slicer.util.getNode("joint_2").SetMatrixTransformToParent(rotation.GetMatrix())
+        self.assertGreater(abs(monitor.clearances["link_3"] - clearanceOfLink3), 1.0)
+        self.assertAlmostEqual(monitor.clearances["link_0"], 30.0, delta=1.5)
+
+        logic.stopClearanceMonitoring()
+        self.delayDisplay("Test passed")
+
+    def test_SweptVolume(self):
+        """The volume swept by a link along a trajectory is computed as a labelmap and as a model."""
+        logic, robotPath, tempDir = self.importSyntheticRobot(4, topology="chain", meshes="unique", flatHierarchy=True)
+        model = logic.robotModel
+
+        # link_0 does not move: the swept volume is the 20 x 20 x 50 mm box
+        trajectory = numpy.zeros((2, model.dofCount))
+        staticNode = logic.computeSweptVolume(trajectory, linkNames=["link_0"], spacing=2.0, workers=1)
+        voxelVolume = numpy.count_nonzero(slicer.util.arrayFromVolume(staticNode)) * 8.0
+        self.assertAlmostEqual(voxelVolume, 20 * 20 * 50, delta=0.5 * 20 * 20 * 50)
+
+        # link_1 rotates about the z axis of joint_0, sweeping a larger volume than at rest
+        restNode = logic.computeSweptVolume(trajectory, linkNames=["link_1"], spacing=2.0, workers=1)
+        trajectory[1, model.dofIndex[model.jointIndex["joint_0"]]] = 1.5
+        sweptNode = logic.computeSweptVolume(trajectory, linkNames=["link_1"], spacing=2.0, maxJointStep=0.05, workers=2)
+        self.assertGreater(numpy.count_nonzero(slicer.util.arrayFromVolume(sweptNode)),
+                           numpy.count_nonzero(slicer.util.arrayFromVolume(restNode)))
+
+        surfaceNode = logic.computeSweptVolume(trajectory, linkNames=["link_1"], spacing=2.0, maxJointStep=0.05, workers=1, outputType="model")
+        self.assertGreater(surfaceNode.GetPolyData().GetNumberOfCells(), 0)
+        self.delayDisplay("Test passed")
+
+    def test_Rotations(self):
+        """Conversions between rotation representations round-trip on random and singular rotations."""
+        from URDF_ImportLib import rotations
+
+        rng = numpy.random.default_rng(0)
+        count = 10000
+        axes = rotations.normalize(rng.normal(size=(count, 3)))
+        angles = rng.uniform(0, math.pi, count)
+        # exact and nearly 0 and 180 degree rotations, also about coordinate axes
+        angles[:100] = 0
+        angles[100:200] = math.pi
+        angles[200:300] = rng.uniform(0, 1e-12, 100)
+        angles[300:400] = math.pi - rng.uniform(0, 1e-12, 100)
+        axes[100:150] = numpy.eye(3)[rng.integers(0, 3, 50)] * rng.choice([-1, 1], (50, 1))
+        matrices = rotations.axisAngleToMatrix(axes, angles)
+
+        roundTripAxes, roundTripAngles = rotations.matrixToAxisAngle(matrices)
+        numpy.testing.assert_allclose(roundTripAngles, angles, atol=1e-12)
+        numpy.testing.assert_allclose(rotations.axisAngleToMatrix(roundTripAxes, roundTripAngles), matrices, atol=1e-12)
+        numpy.testing.assert_allclose(rotations.quaternionToMatrix(rotations.axisAngleToQuaternion(axes, angles)), matrices, atol=1e-12)
+        numpy.testing.assert_allclose(rotations.quaternionToMatrix(rotations.matrixToQuaternion(matrices)), matrices, atol=1e-12)
+        numpy.testing.assert_allclose(rotations.rpyToMatrix(rotations.matrixToRpy(matrices)), matrices, atol=1e-12)
+
+        # roll, pitch, yaw angles are recovered away from gimbal lock (pitch = +-90 degrees)
+        rpy = rng.uniform(-math.pi, math.pi, (count, 3))
+        rpy[:, 1] = rng.uniform(-1.5, 1.5, count)
+        numpy.testing.assert_allclose(rotations.matrixToRpy(rotations.rpyToMatrix(rpy)), rpy, atol=1e-12)
+        rpy[:, 1] = rng.choice([-math.pi / 2, math.pi / 2], count)
+        numpy.testing.assert_allclose(rotations.rpyToMatrix(rotations.matrixToRpy(rotations.rpyToMatrix(rpy))), rotations.rpyToMatrix(rpy), atol=1e-12)
+
+        # bulk conversion to and from vtkMatrix4x4 is exact
+        transforms = rotations.originMatrix(rng.normal(size=(100, 3)), rpy[:100])
+        numpy.testing.assert_array_equal(rotations.fromVTKMatrices(rotations.toVTKMatrices(transforms)), transforms)
+
+        # URDF rpy are fixed-axis rotations: R = Rz(yaw) Ry(pitch) Rx(roll)
+        transform = vtk.vtkTransform()
+        transform.Translate(1, 2, 3)
+        transform.RotateZ(math.degrees(0.1))
+        transform.RotateY(math.degrees(0.2))
+        transform.RotateX(math.degrees(0.3))
+        numpy.testing.assert_allclose(rotations.originMatrix([1, 2, 3], [0.3, 0.2, 0.1]), slicer.util.arrayFromVTKMatrix(transform.GetMatrix()), atol=1e-12)
+
+        # axis-angle helpers of the logic
+        logic = URDF_ImportLogic()
+        matrix = logic.arrayToVTKMatrix(logic.axis2matrix([math.pi, 0, 0, 1]))
+        angle, x, y, z = logic.matrixToAngle(matrix)
+        self.assertAlmostEqual(angle, math.pi)
+        self.assertAlmostEqual(abs(z), 1.0)
+        self.delayDisplay("Test passed")
+
+    def test_GeneralJoints(self):
+        """Joints with oblique axes, planar and floating joints are imported and constrained to their motion."""
+        from URDF_ImportLib import rotations
+
+        tempDir = self.temporaryDirectory()
+        robotPath = os.path.join(tempDir, "joints.urdf")
+        with open(robotPath, "w") as robotFile:
+            robotFile.write("""<robot name="joints">
+  <link name="base"/><link name="arm"/><link name="slider"/><link name="puck"/><link name="drone"/>
+  <joint name="tilted" type="revolute"><parent link="base"/><child link="arm"/>
+    <origin xyz="0 0 0.1" rpy="0 0 0"/><axis xyz="1 1 0"/><limit lower="-1" upper="1"/></joint>
+  <joint name="slide" type="prismatic"><parent link="arm"/><child link="slider"/>
+    <origin xyz="0 0 0.1" rpy="0.3 0.2 0.1"/><axis xyz="0 0.6 0.8"/><limit lower="0" upper="0.5"/></joint>
+  <joint name="plane" type="planar"><parent link="slider"/><child link="puck"/>
+    <origin xyz="0 0 0.1" rpy="0 0 0"/><axis xyz="0 0 1"/></joint>
+  <joint name="free" type="floating"><parent link="puck"/><child link="drone"/>
+    <origin xyz="0 0 0.1" rpy="0 0 0"/></joint>
+</robot>""")
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False)
+
+        def setMotion(jointName, motion):
+            jointNode = slicer.util.getNode(jointName)
+            jointNode.SetMatrixTransformToParent(rotations.toVTKMatrices(motion))
+            return rotations.fromVTKMatrices(jointNode.GetMatrixTransformToParent())
+
+        # rotation about the tilted axis is kept within the limits, rotation about other axes is removed
+        tiltedAxis = rotations.normalize([1, 1, 0])
+        motion = numpy.eye(4)
+        motion[:3, :3] = rotations.axisAngleToMatrix(tiltedAxis, 0.5)
+        numpy.testing.assert_allclose(setMotion("tilted", motion), motion, atol=1e-9)
+        motion[:3, :3] = rotations.axisAngleToMatrix(tiltedAxis, 2.0)
+        axis, angle = rotations.matrixToAxisAngle(setMotion("tilted", motion)[:3, :3])
+        numpy.testing.assert_allclose(axis * angle, tiltedAxis, atol=1e-9)
+        motion[:3, :3] = rotations.axisAngleToMatrix([0, 0, 1], 0.3)
+        axis, angle = rotations.matrixToAxisAngle(setMotion("tilted", motion)[:3, :3])
+        self.assertAlmostEqual(abs(numpy.dot(axis, tiltedAxis)), 1.0)
+
+        # translation along the oblique prismatic axis is clamped to 0.5
+        motion = numpy.eye(4)
+        motion[:3, 3] = [0.2, 0.6, 0.8]
+        numpy.testing.assert_allclose(setMotion("slide", motion)[:3, 3], [0, 0.3, 0.4], atol=1e-9)
+
+        # planar joints move in the XY plane and rotate about Z, floating joints move freely
+        motion[:3, :3] = rotations.axisAngleToMatrix([0, 0, 1], 0.4)
+        motion[:3, 3] = [0.1, 0.2, 0.3]
+        expected = motion.copy()
+        expected[2, 3] = 0
+        numpy.testing.assert_allclose(setMotion("plane", motion), expected, atol=1e-9)
+        motion[:3, :3] = rotations.rpyToMatrix([0.1, 0.2, 0.3])
+        numpy.testing.assert_allclose(setMotion("free", motion), motion, atol=1e-9)
+
+        # the flat hierarchy places links with the same kinematics
+        slicer.mrmlScene.Clear()
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False, flatHierarchy=True)
+        model = logic.robotModel
+        q = model.zeroConfiguration()
+        q[model.jointDofs(model.jointIndex["plane"])] = [0.1, 0.2, 0.4]
+        q[model.jointDofs(model.jointIndex["free"])] = [0.1, 0.2, 0.3, 0.3, -0.2, 0.1]
+        motions = model.jointMotions(q)
+        for jointName in ("plane", "free"):
+            setMotion(jointName, motions[model.jointIndex[jointName]])
+        linkToRobot = slicer.util.arrayFromTransformMatrix(slicer.util.getNode("drone to robot"))
+        numpy.testing.assert_allclose(linkToRobot, model.linkTransforms(q)[model.linkIndex["drone"]], atol=1e-9)
+        self.delayDisplay("Test passed")
+
+    def test_MimicJoints(self):
+        """Mimic joints follow their driver, both when it is dragged and when joint values are set."""
+        from URDF_ImportLib import rotations
+
+        tempDir = self.temporaryDirectory()
+        robotPath = os.path.join(tempDir, "gripper.urdf")
+        with open(robotPath, "w") as robotFile:
+            robotFile.write("""<robot name="gripper">
+  <link name="palm"/><link name="left"/><link name="right"/><link name="tip"/>
+  <joint name="drive" type="revolute"><parent link="palm"/><child link="left"/>
+    <origin xyz="0.02 0 0.05" rpy="0 0 0"/><axis xyz="0 1 0"/><limit lower="-1" upper="1"/></joint>
+  <joint name="mirror" type="revolute"><parent link="palm"/><child link="right"/>
+    <origin xyz="-0.02 0 0.05" rpy="0 0 0"/><axis xyz="0 1 0"/><limit lower="-1" upper="1"/>
+    <mimic joint="drive" multiplier="-1"/></joint>
+  <joint name="slide" type="prismatic"><parent link="right"/><child link="tip"/>
+    <origin xyz="0 0 0.03" rpy="0 0 0"/><axis xyz="0 0 1"/><limit lower="-0.1" upper="0.1"/>
+    <mimic joint="mirror" multiplier="0.01" offset="0.005"/></joint>
+</robot>""")
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False, flatHierarchy=True)
+        model = logic.robotModel
+        q = model.applyMimicJoints([0.4, 0, 0])
+        numpy.testing.assert_allclose(q, [0.4, -0.4, 0.001])
+        self.assertEqual(list(model.mimicFollowers(model.jointIndex["drive"])), [model.jointIndex["mirror"], model.jointIndex["slide"]])
+
+        # dragging the driver moves the mimic joints, the flattened hierarchy is updated once per driver update
+        updates = []
+        updateFlatHierarchy = logic.updateFlatHierarchy
+        logic.updateFlatHierarchy = lambda hierarchy: (updates.append(hierarchy), updateFlatHierarchy(hierarchy))
+        slicer.util.getNode("drive").SetMatrixTransformToParent(rotations.toVTKMatrices(rotations.axisAngleToMatrix([0, 1, 0], 0.4)))
+        self.assertEqual(len(updates), 1)
+        tipToRobot = slicer.util.arrayFromTransformMatrix(slicer.util.getNode("tip to robot"))
+        numpy.testing.assert_allclose(tipToRobot, model.linkTransforms(q)[model.linkIndex["tip"]], atol=1e-9)
+
+        # mimic joints cannot be moved on their own
+        slicer.util.getNode("mirror").SetMatrixTransformToParent(rotations.toVTKMatrices(numpy.eye(3)))
+        mirrorMotion = slicer.util.arrayFromTransformMatrix(slicer.util.getNode("mirror"))
+        numpy.testing.assert_allclose(mirrorMotion, model.jointMotions(q)[model.jointIndex["mirror"]], atol=1e-9)
+
+        # setting a joint vector updates all joints in one batch
+        updates.clear()
+        logic.setJointValues([-0.3, 0, 0])
+        self.assertEqual(len(updates), 1)
+        q = model.applyMimicJoints([-0.3, 0, 0])
+        tipToRobot = slicer.util.arrayFromTransformMatrix(slicer.util.getNode("tip to robot"))
+        numpy.testing.assert_allclose(tipToRobot, model.linkTransforms(q)[model.linkIndex["tip"]], atol=1e-9)
+        self.delayDisplay("Test passed")
+
+    def test_AsyncImport(self):
+        """An import started in the background reports its stages and can be cancelled without leaving nodes behind."""
+        robotPath, tempDir = self.writeSyntheticRobot(20, topology="tree", meshes="unique")
 
         logic = URDF_ImportLogic()
+        stages = []
+        finished = []
+        logic.importProgressCallback = lambda stage, stepsDone, stepCount: stages.append(stage)
+        logic.importFinishedCallback = lambda error, cancelled: finished.append((error, cancelled))
+        logic.startImport(robotPath, tempDir, True, False)
+        self.assertTrue(logic.importing)
+        logic.waitForImport()
+        self.assertEqual(finished, [(None, False)])
+        self.assertIn("meshes", stages)
+        self.assertEqual(stages[-1], "scene")
+        for linkIndex in range(20):
+            self.assertEqual(slicer.util.getNode(f"link_{linkIndex}").GetPolyData().GetNumberOfCells(), 12)
+
+        # cancelling while the scene is built removes the nodes added so far, but not the nodes added by others between
+        # the time slices of the import
+        slicer.mrmlScene.Clear()
+        nodeCount = slicer.mrmlScene.GetNumberOfNodes()
+        finished.clear()
+        def pauseThenCancel(stage, stepsDone, stepCount):
+            if stage == "scene" and stepsDone == 2:
+                # ends the current time slice
+                time.sleep(2 * IMPORT_TIME_SLICE)
+            elif stage == "scene" and stepsDone > 5:
+                logic.cancelImport()
+        logic.importProgressCallback = pauseThenCancel
+        logic.startImport(robotPath, tempDir, True, False, flatHierarchy=True)
+        while logic.importing and slicer.mrmlScene.GetNumberOfNodes() == nodeCount:
+            logic.processImport()
+            time.sleep(0.01)
+        self.assertTrue(logic.importing)
+        otherNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTextNode", "added during import")
+        logic.waitForImport()
+        self.assertEqual(finished, [(None, True)])
+        self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), nodeCount + 1)
+        self.assertTrue(slicer.mrmlScene.IsNodePresent(otherNode))
+        self.assertEqual(logic.joints, {})
+
+        # errors are reported to the callback instead of being raised
+        finished.clear()
+        logic.importProgressCallback = None
+        logic.startImport(os.path.join(tempDir, "missing.urdf"), tempDir, True, False)
+        logic.waitForImport()
+        self.assertIsNotNone(finished[0][0])
+        self.delayDisplay("Test passed")
+
+    def test_BatchedImport(self):
+        """The import runs as one batch process with the transforms in place when their nodes are added."""
+        robotPath, tempDir = self.writeSyntheticRobot(30, topology="tree", meshes="unique")
 
-        # Test algorithm with non-inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, True)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], threshold)
+        logic = URDF_ImportLogic()
+        batchStates = []
+        observer = slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.NodeAddedEvent, lambda caller, event: batchStates.append(caller.IsBatchProcessing()))
+        try:
+            logic.process(robotPath, tempDir, True, False, flatHierarchy=True)
+        finally:
+            slicer.mrmlScene.RemoveObserver(observer)
+        self.assertTrue(batchStates and all(batchStates))
+        self.assertFalse(slicer.mrmlScene.IsBatchProcessing())
+        self.assertGreater(logic.suppressedEventCount, len(batchStates))
+
+        model = logic.robotModel
+        linkTransforms = model.linkTransforms(numpy.zeros(model.dofCount))
+        for linkIndex in range(30):
+            linkToRobot = slicer.util.arrayFromTransformMatrix(slicer.util.getNode(f"link_{linkIndex} to robot"))
+            numpy.testing.assert_allclose(linkToRobot, linkTransforms[linkIndex], atol=1e-9)
+        self.delayDisplay("Test passed")
+
+    def test_URDFParser(self):
+        """The single-pass parser indexes names, extracts attributes into arrays and reports dangling references."""
+        from URDF_ImportLib.kinematics import RobotModel
+        import xml.etree.ElementTree as ET
+        from URDF_ImportLib.urdfparser import describeElement, parseURDFString
+
+        urdf = parseURDFString("""<robot name="gripper">
+  <material name="blue"><color rgba="0 0 1 1"/></material>
+  <link name="base">
+    <visual><origin xyz="1 2 3"/><geometry><mesh filename="package://gripper/base.stl" scale="0.001"/></geometry><material name="blue"/></visual>
+    <collision><geometry><mesh filename="base_collision.stl"/></geometry></collision>
+  </link>
+  <link name="finger"><visual><geometry><box size="1 1 1"/></geometry><material name="red"/></visual></link>
+  <joint name="drive" type="revolute"><parent link="base"/><child link="finger"/><axis xyz="0 1 0"/><limit lower="-1" upper="1" effort="5"/></joint>
+  <joint name="slide" type="prismatic"><parent link="finger"/><child link="tip"/><mimic joint="drive" multiplier="0.5"/></joint>
+</robot>""")
+        self.assertEqual(urdf.linkIndex, {"base": 0, "finger": 1})
+        self.assertEqual(urdf.jointIndex, {"drive": 0, "slide": 1})
+        self.assertEqual(urdf.elementOrder, [("link", 0), ("link", 1), ("joint", 0), ("joint", 1)])
+        numpy.testing.assert_array_equal(urdf.visualXyz[0], [1, 2, 3])
+        self.assertEqual(urdf.meshScale(0), [0.001] * 3)
+        self.assertIsNone(urdf.meshScale(0, collision=True))
+        self.assertEqual(urdf.meshFilename(0, collision=True), "base_collision.stl")
+        self.assertIsNone(urdf.meshFilename(1))
+        numpy.testing.assert_array_equal(urdf.materialColors[urdf.linkMaterials[0]], [0, 0, 1, 1])
+        numpy.testing.assert_array_equal(urdf.jointParents, [0, 1])
+        numpy.testing.assert_array_equal(urdf.jointChildren, [1, -1])
+        numpy.testing.assert_array_equal(urdf.mimicJoints, [-1, 0])
+        self.assertEqual(urdf.lowerLimits[0], -1)
+        self.assertTrue(numpy.isnan(urdf.lowerLimits[1]))
+        self.assertEqual(urdf.efforts[0], 5)
+        self.assertEqual(sorted(urdf.danglingReferences), ["Joint slide refers to unknown link tip", "Link finger refers to unknown material red"])
+        with self.assertRaises(ValueError):
+            RobotModel.fromDescription(urdf)
+
+        # parsing a file with iterparse gives the same model as parsing an element tree
+        robotPath, tempDir = self.writeSyntheticRobot(50, topology="tree", meshes="shared")
+        fromFile = RobotModel.fromFile(robotPath)
+        fromElement = RobotModel.fromDescription(describeElement(ET.parse(robotPath).getroot()))
+        for name in RobotModel.arrayNames:
+            numpy.testing.assert_array_equal(getattr(fromFile, name), getattr(fromElement, name))
+        self.assertEqual(fromFile.visualMeshes, fromElement.visualMeshes)
+        self.delayDisplay("Test passed")
+
+    def test_MotionPlanning(self):
+        """Paths around an anatomy model are planned with RRT-Connect and a cached roadmap and played back on the joints."""
+        from URDF_ImportLib.planning import edgesInCollision
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(8, topology="chain")
+        model = logic.robotModel
+        numpy.testing.assert_allclose(logic.jointValues(), model.zeroConfiguration(), atol=1e-9)
+
+        # in the zero configuration the chain points up to 400 mm, a 25 mm radius sphere sits at its tip
+        sphere = vtk.vtkSphereSource()
+        sphere.SetCenter(0, 0, 400)
+        sphere.SetRadius(25)
+        sphere.SetThetaResolution(24)
+        sphere.SetPhiResolution(24)
+        sphere.Update()
+        anatomyNode = slicer.modules.models.logic().AddModel(sphere.GetOutput())
+
+        # tilting joint_2 (continuous, about y) from one side to the other would sweep the chain through the sphere
+        start = model.zeroConfiguration()
+        start[model.dofIndex[model.jointIndex["joint_2"]]] = -0.8
+        goal = -start
+        planningParameters = {"anatomyNode": anatomyNode, "margin": 2.0, "sphereSize": 20.0, "spacing": 3.0}
+        checker = logic.planningEnvironment(**planningParameters)["checker"]
+        self.assertFalse(checker.inCollision(numpy.vstack([start, goal])).any())
+        self.assertTrue(edgesInCollision(checker, start, goal, 0.02)[0])
+
+        for planner, workers in (("rrtconnect", 2), ("prm", 1)):
+            path = logic.planMotion(start, goal, planner=planner, workers=workers, roadmapNodes=200, seed=0, **planningParameters)
+            self.assertIsNotNone(path, planner)
+            numpy.testing.assert_allclose(path[0], start)
+            numpy.testing.assert_allclose(path[-1], goal)
+            self.assertFalse(edgesInCollision(checker, path[:-1], path[1:], 0.02).any(), planner)
+
+        # the roadmap is built once for the robot and anatomy and grows with the queries
+        roadmaps = logic.planningEnvironment(**planningParameters)["roadmaps"]
+        self.assertEqual(len(roadmaps), 1)
+        roadmap = next(iter(roadmaps.values()))
+        nodeCount = len(roadmap.nodes)
+        self.assertIsNotNone(logic.planMotion(goal, start, planner="prm", workers=1, roadmapNodes=200, seed=1, **planningParameters))
+        self.assertIs(next(iter(logic.planningEnvironment(**planningParameters)["roadmaps"].values())), roadmap)
+        self.assertEqual(len(roadmap.nodes), nodeCount + 2)
+
+        logic.playJointPath(path, duration=0.2)
+        self.assertTrue(logic.playingJointPath)
+        while logic.playingJointPath:
+            slicer.app.processEvents()
+        numpy.testing.assert_allclose(logic.jointValues(), goal, atol=1e-6)
+        self.delayDisplay("Test passed")
+
+    def test_Dynamics(self):
+        """Link inertials are read and gravity torques, inverse dynamics, center of mass and payloads are computed in batches."""
+        # a 2 kg pendulum with its center of mass 0.5 m from a y axis joint, on a massless vertical slider
+        urdfText = """<robot name="pendulum">
+          <link name="base"/>
+          <link name="carriage"/>
+          <link name="arm">
+            <inertial>
+              <origin xyz="0.5 0 0" rpy="0 0 0"/>
+              <mass value="2"/>
+              <inertia ixx="0.01" ixy="0" ixz="0" iyy="0.1" iyz="0" izz="0.1"/>
+            </inertial>
+          </link>
+          <joint name="lift" type="prismatic">
+            <parent link="base"/>
+            <child link="carriage"/>
+            <axis xyz="0 0 1"/>
+            <limit lower="-1" upper="1" effort="100" velocity="1"/>
+          </joint>
+          <joint name="swing" type="revolute">
+            <parent link="carriage"/>
+            <child link="arm"/>
+            <axis xyz="0 1 0"/>
+            <limit lower="-3" upper="3" effort="50" velocity="1"/>
+          </joint>
+        </robot>"""
+        tempDir = self.temporaryDirectory()
+        robotPath = os.path.join(tempDir, "pendulum.urdf")
+        with open(robotPath, "w") as robotFile:
+            robotFile.write(urdfText)
+        logic = URDF_ImportLogic()
+        logic.process(robotPath, tempDir, True, False)
+        model = logic.robotModel
+        numpy.testing.assert_allclose(model.linkMasses, [0, 0, 2])
+        numpy.testing.assert_allclose(model.linkCentersOfMass[2], [0.5, 0, 0])
+        self.assertAlmostEqual(model.linkInertias[2, 1, 1], 0.1)
+        self.assertEqual(model.dofNames(), ["lift", "swing"])
+
+        # rotating by q about y moves the center of mass down by 0.5 sin(q), gravity pulls it with 2 * 9.81 * 0.5 cos(q) Nm,
+        # the slider holds the weight of 2 * 9.81 N
+        angles = numpy.linspace(-1.5, 1.5, 1000)
+        q = numpy.column_stack([numpy.zeros(1000), angles])
+        torques = logic.computeGravityTorques(q)
+        numpy.testing.assert_allclose(torques[:, 0], 2 * 9.81, atol=1e-9)
+        numpy.testing.assert_allclose(torques[:, 1], -9.81 * numpy.cos(angles), atol=1e-9)
+        # accelerating also needs the inertia about the joint: 0.1 + 2 * 0.5^2
+        qd = numpy.tile([0.0, 1.0], (1000, 1))
+        qdd = numpy.tile([0.0, 2.0], (1000, 1))
+        torques = logic.computeInverseDynamics(q, qd, qdd)
+        numpy.testing.assert_allclose(torques[:, 1], 0.6 * 2.0 - 9.81 * numpy.cos(angles), atol=1e-9)
+
+        # the robot is scaled from meters to millimeters in the scene
+        center, mass = logic.computeCenterOfMass()
+        numpy.testing.assert_allclose(center, [500, 0, 0], atol=1e-6)
+        self.assertEqual(mass, 2)
+
+        # a 1 kg payload 0.8 m along the arm adds 9.81 N to the slider and 9.81 * 0.8 cos(q) Nm to the pendulum
+        measured = logic.computeGravityTorques(q) + numpy.column_stack([numpy.full(1000, 9.81), -9.81 * 0.8 * numpy.cos(angles)])
+        payloadMass, payloadCenter = logic.estimatePayload("arm", q, measured)
+        self.assertAlmostEqual(payloadMass, 1.0, places=6)
+        numpy.testing.assert_allclose(payloadCenter, [0.8, 0, 0], atol=1e-6)
+
+        chartNode = logic.plotJointTorques(q, timeStep=0.01)
+        self.assertEqual(chartNode.GetNumberOfPlotSeriesNodes(), 2)
+        self.assertEqual(chartNode.GetNthPlotSeriesNode(0).GetTableNode().GetNumberOfRows(), 1000)
+        self.delayDisplay("Test passed")
+
+    def test_SurfaceRegistration(self):
+        """The robot transform and joint values are registered to a noisy point cloud of the robot surface."""
+        from URDF_ImportLib.kinematics import PRISMATIC
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(8, topology="chain")
+        model = logic.robotModel
+        robotNode = slicer.mrmlScene.GetNodeByID(logic.robotToWorldTransformNodeID)
+        scale = logic.robotToWorldArray()
+        prismatic = numpy.concatenate([[model.jointTypes[jointIndex] == PRISMATIC] * len(model.jointDofs(jointIndex))
+                                       for jointIndex in range(len(model.jointNames))])
+
+        # a point cloud of the robot surface at a known pose, with 0.1 mm noise
+        trueRobotToWorld = originMatrix([30.0, -20.0, 15.0], [0.3, -0.2, 0.4]) @ scale
+        trueQ = numpy.where(prismatic, 0.01, 0.3 * (-1) ** numpy.arange(model.dofCount))
+        registration = logic.surfaceRegistration()
+        scanPoints = registration.robotPoints(trueRobotToWorld, trueQ, maxPoints=20000, rng=0)
+        scanPoints += numpy.random.default_rng(0).normal(0, 0.1, scanPoints.shape)
+        points = vtk.vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(scanPoints, deep=True))
+        scan = vtk.vtkPolyData()
+        scan.SetPoints(points)
+        scanNode = slicer.modules.models.logic().AddModel(scan)
+
+        def poseErrors():
+            robotToWorld = logic.robotToWorldArray()
+            rotationError = numpy.abs((robotToWorld[:3, :3] - trueRobotToWorld[:3, :3]) / scale[0, 0]).max()
+            return numpy.linalg.norm(robotToWorld[:3, 3] - trueRobotToWorld[:3, 3]), rotationError
+
+        # the robot transform alone, from a pose that is 9 mm and 0.2 radians off
+        slicer.util.updateTransformMatrixFromArray(robotNode, originMatrix([25.0, -15.0, 10.0], [0.2, -0.1, 0.2]) @ scale)
+        logic.setJointValues(trueQ)
+        result = logic.registerRobotToSurface(scanNode, seed=0)
+        translationError, rotationError = poseErrors()
+        self.assertLess(translationError, 0.5)
+        self.assertLess(rotationError, 0.01)
+        self.assertLess(result.rms, 1.0)
+
+        # with the joint values, from joints that are 0.1 radians or 4 mm off
+        logic.setJointValues(trueQ + numpy.where(prismatic, 0.004, 0.1))
+        result = logic.registerRobotToSurface(scanNode, estimateJoints=True, seed=0)
+        translationError, rotationError = poseErrors()
+        self.assertLess(translationError, 0.5)
+        self.assertLess(rotationError, 0.01)
+        numpy.testing.assert_allclose(logic.jointValues(), trueQ, atol=0.01)
+        numpy.testing.assert_allclose(result.q, logic.jointValues(), atol=1e-6)
+
+        # link samples and their indices are reused while the link models stay the same
+        self.assertIs(logic.surfaceRegistration(), registration)
+        self.delayDisplay("Test passed")
+
+    def test_KinematicCalibration(self):
+        """Joint origins are calibrated from measured end effector poses and written to a URDF file that loads."""
+        from URDF_ImportLib.kinematics import RobotModel
+        from URDF_ImportLib.urdfparser import parseURDFString
+        from URDF_ImportLib.calibration import chainJoints, correctedURDFText
+        from URDF_ImportLib.rotations import matrixToRpy
+
+        robotPath, tempDir = self.writeSyntheticRobot(8, topology="chain")
+        with open(robotPath) as robotFile:
+            urdfText = robotFile.read()
+        nominal = RobotModel.fromFile(robotPath)
+        endLinkIndex = len(nominal.linkNames) - 1
+        chain = chainJoints(nominal, endLinkIndex)
+        self.assertEqual(len(chain), 7)
+
+        # the real robot has origins that are off by about 2 mm and 0.01 radians
+        rng = numpy.random.default_rng(0)
+        xyz = nominal.jointOrigins[chain, :3, 3] + rng.normal(0, 0.002, (len(chain), 3))
+        rpy = matrixToRpy(nominal.jointOrigins[chain, :3, :3]) + rng.normal(0, 0.01, (len(chain), 3))
+        real = RobotModel.fromDescription(parseURDFString(correctedURDFText(urdfText, [nominal.jointNames[jointIndex] for jointIndex in chain], xyz, rpy)))
+        q = rng.uniform(numpy.maximum(nominal.lowerLimits, -1.5), numpy.minimum(nominal.upperLimits, 1.5), (300, nominal.dofCount))
+        measuredPoses = real.linkTransforms(q)[:, endLinkIndex]
 
-        # Test algorithm with inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, False)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], inputScalarRange[1])
+        logic = URDF_ImportLogic()
+        calibratedPath = os.path.join(tempDir, "calibrated.urdf")
+        result = logic.calibrateJointOrigins(robotPath, q, measuredPoses, nominal.linkNames[endLinkIndex], calibratedPath)
+        self.assertGreater(result.initialPositionRms, 1e-3)
+        self.assertLess(result.positionRms, 1e-9)
+        self.assertLess(result.rotationRms, 1e-9)
+        calibrated = RobotModel.fromFile(calibratedPath)
+        numpy.testing.assert_allclose(calibrated.linkTransforms(q)[:, endLinkIndex], measuredPoses, atol=1e-9)
+        # the poses of other configurations are predicted as well
+        q = rng.uniform(numpy.maximum(nominal.lowerLimits, -1.5), numpy.minimum(nominal.upperLimits, 1.5), (300, nominal.dofCount))
+        numpy.testing.assert_allclose(calibrated.linkTransforms(q)[:, endLinkIndex], real.linkTransforms(q)[:, endLinkIndex], atol=1e-9)
+
+        # the corrected file keeps everything else and loads like the original
+        numpy.testing.assert_allclose(calibrated.visualOrigins, nominal.visualOrigins)
+        logic.process(calibratedPath, tempDir, True, False)
+        self.assertEqual(len(logic.robotModelNodeIDs), len(nominal.linkNames))
+        self.delayDisplay("Test passed")
+
+    def test_PoseDatasetRendering(self):
+        """RGB, depth and link label images of robot poses are rendered offscreen by worker processes."""
+        import json
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(4, topology="chain", meshes="unique", flatHierarchy=True)
+        model = logic.robotModel
+
+        # cameras 400 mm in front of the 200 mm high chain, looking at its middle with the z axis up in the image
+        cameraPose = numpy.eye(4)
+        cameraPose[:3, :3] = [[1, 0, 0], [0, 0, 1], [0, -1, 0]]
+        cameraPose[:3, 3] = [0, -400, 100]
+        cameraPoses = numpy.array([cameraPose] * 4)
+        q = numpy.zeros((4, model.dofCount))
+        q[2:, model.dofIndex[model.jointIndex["joint_0"]]] = 0.5
+        outputFolder = os.path.join(tempDir, "dataset")
+        datasetPath = logic.renderPoseDataset(q, cameraPoses, outputFolder, width=160, height=120, viewAngle=40.0, workers=2)
+
+        with open(datasetPath) as datasetFile:
+            dataset = json.load(datasetFile)
+        self.assertEqual(len(dataset["samples"]), 4)
+        self.assertEqual(dataset["labels"]["1"], "link_0")
+        reader = vtk.vtkPNGReader()
+        reader.SetFileName(os.path.join(outputFolder, dataset["samples"][0]["label"]))
+        reader.Update()
+        labels = numpy_support.vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars()).reshape(120, 160)[::-1]
+        depth = numpy.load(os.path.join(outputFolder, dataset["samples"][0]["depth"]))
+        # all links are seen, link_0 at the bottom of the image, and depth is set exactly where links are
+        self.assertEqual(set(numpy.unique(labels)), {0, 1, 2, 3, 4})
+        self.assertGreater(numpy.nonzero(labels == 1)[0].mean(), numpy.nonzero(labels == 4)[0].mean())
+        numpy.testing.assert_array_equal(depth > 0, labels > 0)
+        self.assertTrue(numpy.all((depth[labels > 0] > 350) & (depth[labels > 0] < 450)))
+        # identical poses give identical images, another joint value a different one
+        numpy.testing.assert_array_equal(depth, numpy.load(os.path.join(outputFolder, dataset["samples"][1]["depth"])))
+        self.assertFalse(numpy.array_equal(depth, numpy.load(os.path.join(outputFolder, dataset["samples"][2]["depth"]))))
+        self.delayDisplay("Test passed")
+
+    def test_JointSequences(self):
+        """Joint motion is recorded into and exported to sequences of joint values that move the robot when browsed."""
+        logic, robotPath, tempDir = self.importSyntheticRobot(4, topology="chain", meshes="unique")
+        model = logic.robotModel
+        rng = numpy.random.default_rng(0)
+        configurations = model.applyMimicJoints(model.clampJointValues(rng.uniform(-0.5, 0.5, (3, model.dofCount)))[0])
+
+        # the starting pose, each batch of joint values and each interactive joint change is one frame
+        browserNode = logic.startJointRecording()
+        self.assertTrue(logic.recordingJoints)
+        for q in configurations:
+            time.sleep(0.01)
+            logic.setJointValues(q)
+        time.sleep(0.01)
+        jointIndex = model.jointIndex["joint_0"]
+        logic.jointNode(model, jointIndex).SetMatrixTransformToParent(toVTKMatrices(model.jointMotions(numpy.zeros(model.dofCount), [jointIndex])[0]))
+        logic.stopJointRecording()
+        self.assertFalse(logic.recordingJoints)
+        sequenceNode = browserNode.GetMasterSequenceNode()
+        self.assertEqual(sequenceNode.GetDataNodeClassName(), "vtkMRMLTextNode")
+        trajectory, times = logic.jointSequenceArrays(sequenceNode)
+        self.assertEqual(len(trajectory), 5)
+        self.assertTrue(numpy.all(numpy.diff(times) > 0))
+        numpy.testing.assert_allclose(trajectory[1:4], configurations, atol=1e-8)
+        self.assertAlmostEqual(trajectory[4, model.dofIndex[jointIndex]], 0.0)
+
+        # browsing a frame regenerates the link poses from its joint values
+        browserNode.SetSelectedItemNumber(2)
+        slicer.modules.sequences.logic().UpdateProxyNodesFromSequences(browserNode)
+        numpy.testing.assert_allclose(logic.jointValues(), configurations[1], atol=1e-8)
+
+        exportedBrowserNode = logic.exportJointSequence(configurations, timeStep=0.5)
+        exportedTrajectory, exportedTimes = logic.jointSequenceArrays(exportedBrowserNode.GetMasterSequenceNode())
+        numpy.testing.assert_allclose(exportedTrajectory, configurations, atol=1e-8)
+        numpy.testing.assert_allclose(exportedTimes, [0.0, 0.5, 1.0])
+        numpy.testing.assert_allclose(logic.jointValues(), configurations[0], atol=1e-8)
+        self.delayDisplay("Test passed")
+
+    def test_RobotHotReload(self):
+        """Reloading an edited robot file updates only the nodes of the links and joints that changed."""
+        import re
+
+        logic, robotPath, tempDir = self.importSyntheticRobot(4, topology="chain", meshes="unique")
+        model = logic.robotModel
+        q = numpy.array([1.2, 0.01, 0.5])
+        logic.setJointValues(q)
+        nodeIDs = dict(logic.robotImport["nodeIDs"])
+
+        def editRobotFile(pattern, replacement):
+            with open(robotPath) as file:
+                text = file.read()
+            with open(robotPath, "w") as file:
+                file.write(re.sub(pattern, replacement, text, count=1, flags=re.DOTALL))
+
+        # move a joint, narrow the limits of another one and replace a mesh
+        editRobotFile(r'(<joint name="joint_1".*?<origin xyz=)"0 0 0.05"', r'\1"0 0 0.06"')
+        editRobotFile(r'(<joint name="joint_0".*?upper=)"1.5"', r'\1"1.0"')
+        sphere = vtk.vtkSphereSource()
+        sphere.SetRadius(0.01)
+        writer = vtk.vtkSTLWriter()
+        writer.SetInputConnection(sphere.GetOutputPort())
+        writer.SetFileName(os.path.join(tempDir, "link_2.stl"))
+        writer.Write()
+        diff = logic.reloadRobot()
+        self.assertFalse(diff.structureChanged)
+        self.assertEqual(diff.movedJoints, ["joint_1"])
+        self.assertEqual(diff.changedJoints, ["joint_0"])
+        self.assertEqual(diff.changedMeshes, ["link_2"])
+        self.assertEqual(logic.robotImport["nodeIDs"], nodeIDs)
+        jointToParent = slicer.util.arrayFromTransformMatrix(slicer.mrmlScene.GetNodeByID(nodeIDs["joint_1 to link_1"]))
+        self.assertAlmostEqual(jointToParent[2, 3], 0.06)
+        self.assertEqual(slicer.mrmlScene.GetNodeByID(nodeIDs["link_2"]).GetPolyData().GetNumberOfPoints(), sphere.GetOutput().GetNumberOfPoints())
+        # joint values are kept within the new limits
+        numpy.testing.assert_allclose(logic.jointValues(), [1.0, 0.01, 0.5], atol=1e-8)
+        self.assertIsNot(logic.robotModel, model)
+
+        # remove the last link and attach a tool to link_1
+        editRobotFile(r'\s*<link name="link_3">.*?</link>', "")
+        editRobotFile(r'\s*<joint name="joint_2".*?</joint>', "")
+        editRobotFile(r'</robot>', '  <link name="tool"/>\n  <joint name="tool_joint" type="fixed">\n    <parent link="link_1"/>\n'
+                      '    <child link="tool"/>\n    <origin xyz="0.02 0 0" rpy="0 0 0"/>\n  </joint>\n</robot>')
+        diff = logic.reloadRobot()
+        self.assertEqual((diff.removedLinks, diff.removedJoints), (["link_3"], ["joint_2"]))
+        self.assertEqual((diff.addedLinks, diff.addedJoints), (["tool"], ["tool_joint"]))
+        for name in ("link_3", "link_3 to world", "joint_2", "joint_2 to link_2"):
+            self.assertIsNone(slicer.mrmlScene.GetNodeByID(nodeIDs[name]))
+        for name in ("link_0", "link_1", "link_2", "joint_0", "joint_1", "joint_1 to link_1"):
+            self.assertEqual(logic.robotImport["nodeIDs"][name], nodeIDs[name])
+        toolNode = slicer.mrmlScene.GetNodeByID(logic.robotImport["nodeIDs"]["tool"])
+        toolJointNode = toolNode.GetParentTransformNode()
+        self.assertEqual(toolJointNode.GetName(), "tool_joint")
+        self.assertEqual(toolJointNode.GetParentTransformNode().GetName(), "tool_joint to link_1")
+        self.assertEqual(toolJointNode.GetParentTransformNode().GetTransformNodeID(), nodeIDs["joint_0"])
+        numpy.testing.assert_allclose(logic.jointValues(), [1.0, 0.01], atol=1e-8)
+
+        # saving the robot file reloads a watched robot
+        reloads = []
+        logic.robotReloadedCallback = lambda diff, error: reloads.append((diff, error))
+        logic.watchRobotFile()
+        self.assertTrue(logic.watchingRobotFile)
+        editRobotFile(r'(<joint name="joint_0".*?<origin xyz=)"0 0 0.05"', r'\1"0 0 0.07"')
+        startTime = time.perf_counter()
+        while not reloads and time.perf_counter() - startTime < 5.0:
+            slicer.app.processEvents()
+            time.sleep(0.01)
+        logic.stopWatchingRobotFile()
+        self.assertEqual(len(reloads), 1)
+        self.assertIsNone(reloads[0][1])
+        self.assertEqual(reloads[0][0].movedJoints, ["joint_0"])
+        self.delayDisplay("Test passed")
+
+    def test_RobotSceneRestore(self):
+        """Robots in a saved scene get their joint limits, flattened hierarchy and mesh instances back without the robot files."""
+        from URDF_ImportLib import synthetic
+
+        robotPath, robotDir = self.writeSyntheticRobot(6, topology="chain", meshes="shared")
+        # a second robot with the same joint names
+        otherRobotPath = synthetic.writeSyntheticRobot(os.path.join(robotDir, "other"), 3, topology="chain", meshes="shared")
+        logic = URDF_ImportLogic()
+        logic.process(otherRobotPath, os.path.join(robotDir, "other"), True, False)
+        logic.process(robotPath, robotDir, True, False, flatHierarchy=True, instanceMeshes=True)
+        model = logic.robotModel
+        q = model.applyMimicJoints(model.clampJointValues(numpy.linspace(-0.5, 0.5, model.dofCount))[0])
+        logic.setJointValues(q)
+        logic.jointNode(model, model.jointIndex["joint_0"]).SetName("renamed joint")
+        scenePath = os.path.join(self.temporaryDirectory(), "robot.mrb")
+        self.assertTrue(slicer.util.saveScene(scenePath))
+        slicer.mrmlScene.Clear()
+        shutil.rmtree(robotDir)
 
-        self.delayDisplay("Test passed")
\ No newline at end of file
+        slicer.util.loadScene(scenePath)
+        logic = URDF_ImportLogic()
+        self.assertEqual(len(logic.restoreRobots()), 2)
+        # robots are restored once
+        self.assertEqual(logic.restoreRobots(), [])
+        model = logic.robotModel
+        self.assertEqual(logic.jointNode(model, model.jointIndex["joint_0"]).GetName(), "renamed joint")
+        otherJointMatrix = slicer.util.arrayFromTransformMatrix(slicer.util.getNode("joint_0"))
+        numpy.testing.assert_allclose(logic.jointValues(), q, atol=1e-6)
+        numpy.testing.assert_allclose(logic.robotImport["hierarchy"]["linkTransforms"], model.linkTransforms(q), atol=1e-6)
+
+        # joint limits are enforced and the flattened hierarchy follows the joints
+        jointIndex = model.jointIndex["joint_0"]
+        q[model.dofIndex[jointIndex]] = 2.0
+        logic.jointNode(model, jointIndex).SetMatrixTransformToParent(toVTKMatrices(model.jointMotions(q, [jointIndex])[0]))
+        q[model.dofIndex[jointIndex]] = model.upperLimits[model.dofIndex[jointIndex]]
+        numpy.testing.assert_allclose(logic.jointValues(), q, atol=1e-6)
+        numpy.testing.assert_allclose(logic.robotImport["hierarchy"]["linkTransforms"], model.linkTransforms(q), atol=1e-6)
+        instances, linkIndices = logic.robotImport["hierarchy"]["instanceGroups"][0]
+        logic.updateInstanceModels()
+        instancePoints = slicer.util.arrayFromModelPoints(slicer.mrmlScene.GetNodeByID(logic.robotImport["nodeIDs"][logic.robotImport["instanceNodeNames"][0]]))
+        meshPoints = numpy_support.vtk_to_numpy(instances.mesh.GetPoints().GetData())
+        lastLinkToRobot = model.linkTransforms(q)[linkIndices[-1]] @ model.visualOrigins[linkIndices[-1]]
+        numpy.testing.assert_allclose(instancePoints[-len(meshPoints):], meshPoints @ lastLinkToRobot[:3, :3].T + lastLinkToRobot[:3, 3], atol=1e-4)
+        # the joint of the other robot with the same name did not move
+        numpy.testing.assert_allclose(slicer.util.arrayFromTransformMatrix(slicer.util.getNode("joint_0")), otherJointMatrix)
+        self.delayDisplay("Test passed")
@@ -0,0 +1 @@
+"""Slicer-independent helpers used by the URDF_Import module."""
@@ -0,0 +1,219 @@
+"""Benchmarks of the URDF_Import pipeline on synthetic robots.
+
+The Slicer-independent stages (xacro expansion, URDF parsing, kinematic model building, forward
+kinematics, limit enforcement and mesh loading from files or from a robot bundle) run on plain CPython
+with numpy and VTK:
+
+    python -m URDF_ImportLib.benchmark --output current.json --compare URDF_Import/Testing/Benchmarks/baseline.json
+
+When run from the Slicer Python console, the scene building stage (URDF_ImportLogic.process) is timed as well.
+The "startup" case times the module-level imports of URDF_Import.py, which Slicer runs when it starts.
+"""
+
+import argparse
+import ast
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from URDF_ImportLib import synthetic
+from URDF_ImportLib.bundle import BUNDLE_EXTENSION, RobotBundle, writeRobotBundle
+from URDF_ImportLib.kinematics import RobotModel
+from URDF_ImportLib.meshloading import readMeshFile
+from URDF_ImportLib.urdfparser import parseURDF
+
+
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_TOPOLOGIES = ("chain", "tree")
+DEFAULT_MESHES = ("shared", "unique")
+# Number of configurations used by the batched kinematics stages
+BATCH_SIZE = 256
+
+
+#Runs function repeat times and returns timing statistics in milliseconds
+def timeFunction(function, repeat=5):
+    durations = []
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - startTime) * 1000.0)
+    return {"median_ms": statistics.median(durations), "min_ms": min(durations), "repeat": repeat}
+
+
+def _expandXacro(text):
+    from xml.dom.minidom import parseString
+    import xacro2urdf
+    document = parseString(text)
+    xacro2urdf.eval_self_contained(document)
+    return xacro2urdf.toprettyxml(document, indent="", newl="")
+
+
+#Top-level import statements of URDF_Import.py, except those of Slicer and its Qt and CTK bindings
+def startupImports():
+    modulePath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "URDF_Import.py")
+    with open(modulePath) as moduleFile:
+        tree = ast.parse(moduleFile.read())
+    statements = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            statements += [f"import {alias.name}" for alias in node.names if alias.name.split(".")[0] not in ("slicer", "qt", "ctk")]
+        elif isinstance(node, ast.ImportFrom) and node.module.split(".")[0] not in ("slicer", "qt", "ctk"):
+            statements.append(ast.unparse(node))
+    return statements
+
+
+#Times the startup imports of URDF_Import.py in fresh Python processes. numpy and VTK are imported before the timing
+#starts because Slicer has loaded them already when it loads the module.
+def timeStartupImports(repeat=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "\n".join(["import time, numpy, vtk", "startTime = time.perf_counter()"] + startupImports()
+                     + ["print((time.perf_counter() - startTime) * 1000.0)"])
+    durations = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root, check=True).stdout)
+                 for _ in range(repeat)]
+    return {"median_ms": statistics.median(durations), "min_ms": min(durations), "repeat": repeat}
+
+
+def _slicerAvailable():
+    try:
+        import slicer
+        return hasattr(slicer, "mrmlScene")
+    except ImportError:
+        return False
+
+
+#Times all stages for one synthetic robot, returns {stage: timing}
+def benchmarkCase(directory, linkCount, topology, meshes, repeat=5):
+    robotPath = synthetic.writeSyntheticRobot(directory, linkCount, topology, meshes)
+    xacroText = synthetic.syntheticXacro(linkCount, topology, meshes)
+    results = {}
+
+    results["xacro"] = timeFunction(lambda: _expandXacro(xacroText), repeat)
+    results["parse"] = timeFunction(lambda: parseURDF(robotPath), repeat)
+    urdf = parseURDF(robotPath)
+    results["build"] = timeFunction(lambda: RobotModel.fromDescription(urdf), repeat)
+
+    model = RobotModel.fromDescription(urdf)
+    rng = numpy.random.default_rng(0)
+    q = rng.uniform(-2.0, 2.0, model.dofCount)
+    qBatch = rng.uniform(-2.0, 2.0, (BATCH_SIZE, model.dofCount))
+    results["fk"] = timeFunction(lambda: model.linkTransforms(q), repeat)
+    results["fk_batch"] = timeFunction(lambda: model.linkTransforms(qBatch), repeat)
+
+    # Limit enforcement as done by the joint observers: matrix -> joint value -> clamp -> matrix
+    motions = model.jointMotions(qBatch)
+    def enforceLimits():
+        clamped, _ = model.clampJointValues(model.jointValuesFromMotions(motions))
+        model.jointMotions(clamped)
+    results["limits_batch"] = timeFunction(enforceLimits, repeat)
+
+    # Mesh loading from the individual mesh files and from a memory-mapped robot bundle
+    linkMeshPaths = {linkIndex: os.path.join(directory, filename) for linkIndex, filename in enumerate(model.visualMeshes) if filename}
+    results["meshes"] = timeFunction(lambda: [readMeshFile(path) for path in linkMeshPaths.values()], repeat)
+    bundlePath = os.path.join(directory, "robot" + BUNDLE_EXTENSION)
+    with open(robotPath) as robotFile:
+        writeRobotBundle(bundlePath, robotFile.read(), model, {linkIndex: readMeshFile(path) for linkIndex, path in linkMeshPaths.items()})
+    def loadBundle():
+        bundle = RobotBundle(bundlePath)
+        bundle.robotModel
+        return [bundle.linkPolyData(bundle.robotModel.linkNames[linkIndex]) for linkIndex in linkMeshPaths]
+    results["bundle"] = timeFunction(loadBundle, repeat)
+
+    if _slicerAvailable():
+        import slicer
+        from URDF_Import import URDF_ImportLogic
+        logic = URDF_ImportLogic()
+        def buildScene():
+            slicer.mrmlScene.Clear()
+            logic.process(robotPath, directory, True, False)
+        results["scene"] = timeFunction(buildScene, max(1, repeat // 2))
+        slicer.mrmlScene.Clear()
+    return results
+
+
+def _gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(sizes=DEFAULT_SIZES, topologies=DEFAULT_TOPOLOGIES, meshes=DEFAULT_MESHES, repeat=5, log=print):
+    results = {"startup": {"import": timeStartupImports(repeat)}}
+    if log:
+        log(f"startup  import={results['startup']['import']['median_ms']:.2f}ms")
+    with tempfile.TemporaryDirectory() as tempDir:
+        for topology in topologies:
+            for linkCount in sizes:
+                for meshMode in meshes:
+                    caseName = f"{topology}-{linkCount}-{meshMode}"
+                    results[caseName] = benchmarkCase(os.path.join(tempDir, caseName), linkCount, topology, meshMode, repeat)
+                    if log:
+                        log(caseName + "  " + "  ".join(f"{stage}={timing['median_ms']:.2f}ms" for stage, timing in results[caseName].items()))
+    return {
+        "metadata": {
+            "commit": _gitCommit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+            "slicer": _slicerAvailable(),
+        },
+        "results": results,
+    }
+
+
+#Compares median timings of two benchmark result dictionaries, returns rows (case, stage, baseline, current, ratio)
+def compareResults(baseline, current):
+    rows = []
+    for caseName, stages in current["results"].items():
+        baselineStages = baseline["results"].get(caseName, {})
+        for stage, timing in stages.items():
+            if stage not in baselineStages:
+                continue
+            baselineTime = baselineStages[stage]["median_ms"]
+            ratio = timing["median_ms"] / baselineTime if baselineTime > 0 else float("inf")
+            rows.append((caseName, stage, baselineTime, timing["median_ms"], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark URDF_Import on synthetic robots.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="number of links")
+    parser.add_argument("--topologies", nargs="+", default=list(DEFAULT_TOPOLOGIES), choices=["chain", "tree"])
+    parser.add_argument("--meshes", nargs="+", default=list(DEFAULT_MESHES), choices=["shared", "unique"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    current = runBenchmarks(args.sizes, args.topologies, args.meshes, args.repeat)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(current, outputFile, indent=2)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        print(f"\nComparison with {args.compare} (commit {baseline['metadata'].get('commit')})")
+        for caseName, stage, baselineTime, currentTime, ratio in compareResults(baseline, current):
+            flag = ""
+            if ratio > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{caseName:24s} {stage:14s} {baselineTime:10.2f}ms -> {currentTime:10.2f}ms  x{ratio:.2f}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
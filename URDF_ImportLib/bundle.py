@@ -0,0 +1,147 @@
+"""Single-file binary robot bundle (.urdfb).
+
+Layout (little-endian, all sections aligned to 64 bytes):
+
+    header     magic "URDFBNDL", format version, section count, directory offset
+    directory  one entry per section: name, numpy dtype, byte offset, element count
+    sections   flat arrays; the URDF text, the RobotModel arrays and (JSON encoded) string lists, and the
+               concatenated float32 points, int32 cell offsets and int32 triangle connectivity of all link meshes
+
+A bundle is memory-mapped copy-on-write, every section is a numpy view into the mapping, and link
+meshes are wrapped into vtkPolyData without copying the point and index buffers.
+"""
+
+import json
+import struct
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from URDF_ImportLib.kinematics import RobotModel
+
+
+BUNDLE_MAGIC = b"URDFBNDL"
+BUNDLE_VERSION = 1
+BUNDLE_EXTENSION = ".urdfb"
+_HEADER = struct.Struct("<8sIIQ")
+_DIRECTORY_ENTRY = struct.Struct("<32s8sQQ")
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _encodeStrings(values):
+    return numpy.frombuffer(json.dumps(values).encode("utf-8"), dtype=numpy.uint8)
+
+
+def _decodeStrings(section):
+    return json.loads(section.tobytes().decode("utf-8"))
+
+
+#Returns points (n, 3) float32, cell offsets (m+1,) int32 and connectivity (3m,) int32 of the triangles of polyData
+def triangleArrays(polyData):
+    triangleFilter = vtk.vtkTriangleFilter()
+    triangleFilter.SetInputData(polyData)
+    triangleFilter.PassVertsOff()
+    triangleFilter.PassLinesOff()
+    triangleFilter.Update()
+    triangles = triangleFilter.GetOutput()
+    points = numpy_support.vtk_to_numpy(triangles.GetPoints().GetData()).astype(numpy.float32)
+    polys = triangles.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(numpy.int32)
+    connectivity = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(numpy.int32)
+    return points, offsets, connectivity
+
+
+#Writes a bundle from the URDF text, its RobotModel and a dictionary of link index -> vtkPolyData
+def writeRobotBundle(path, urdfText, model, linkMeshes):
+    sections = {"urdf": numpy.frombuffer(urdfText.encode("utf-8"), dtype=numpy.uint8)}
+    arrays, strings = model.toArrays()
+    for name, array in arrays.items():
+        sections["arr:" + name] = numpy.ascontiguousarray(array).reshape(-1)
+    for name, values in strings.items():
+        sections["str:" + name] = _encodeStrings(values)
+
+    meshLinks = sorted(linkMeshes)
+    meshArrays = [triangleArrays(linkMeshes[linkIndex]) for linkIndex in meshLinks]
+    sections["mesh_links"] = numpy.array(meshLinks, dtype=numpy.int32)
+    for index, name in enumerate(("points", "offsets", "connectivity")):
+        parts = [mesh[index].reshape(-1) for mesh in meshArrays]
+        sections["mesh_" + name + "_starts"] = numpy.cumsum([0] + [len(part) for part in parts], dtype=numpy.int64)
+        dtype = numpy.float32 if name == "points" else numpy.int32
+        sections[name] = numpy.concatenate(parts).astype(dtype) if parts else numpy.zeros(0, dtype=dtype)
+
+    directoryOffset = _HEADER.size
+    offset = _align(directoryOffset + _DIRECTORY_ENTRY.size * len(sections))
+    entries = []
+    for name, array in sections.items():
+        entries.append((name, array, offset))
+        offset = _align(offset + array.nbytes)
+
+    with open(path, "wb") as bundleFile:
+        bundleFile.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(sections), directoryOffset))
+        for name, array, sectionOffset in entries:
+            bundleFile.write(_DIRECTORY_ENTRY.pack(name.encode("ascii"), array.dtype.str.encode("ascii"), sectionOffset, array.size))
+        for name, array, sectionOffset in entries:
+            bundleFile.seek(sectionOffset)
+            bundleFile.write(array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes())
+        bundleFile.truncate(offset)
+
+
+class RobotBundle:
+    """Memory-mapped robot bundle."""
+
+    def __init__(self, path):
+        self.path = path
+        # Copy-on-write, so that VTK filters modifying a mesh in place never write to the file
+        self._buffer = numpy.memmap(path, dtype=numpy.uint8, mode="c")
+        magic, version, sectionCount, directoryOffset = _HEADER.unpack_from(self._buffer, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a robot bundle")
+        if version > BUNDLE_VERSION:
+            raise ValueError(f"Robot bundle version {version} is not supported")
+        self.sections = {}
+        for entryIndex in range(sectionCount):
+            name, dtype, offset, count = _DIRECTORY_ENTRY.unpack_from(self._buffer, directoryOffset + entryIndex * _DIRECTORY_ENTRY.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            dtype = numpy.dtype(dtype.rstrip(b"\0").decode("ascii"))
+            self.sections[name] = numpy.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset)
+        meshLinks = self.sections["mesh_links"]
+        self._meshIndex = {int(linkIndex): meshIndex for meshIndex, linkIndex in enumerate(meshLinks)}
+        self._model = None
+
+    @property
+    def urdfText(self):
+        return self.sections["urdf"].tobytes().decode("utf-8")
+
+    @property
+    def robotModel(self):
+        if self._model is None:
+            # bundles written by older versions lack some arrays, RobotModel.fromArrays fills in defaults
+            arrays = {name: self.sections["arr:" + name] for name in RobotModel.arrayNames if "arr:" + name in self.sections}
+            strings = {name: _decodeStrings(self.sections["str:" + name]) for name in RobotModel.stringListNames + ("name",)}
+            self._model = RobotModel.fromArrays(arrays, strings)
+        return self._model
+
+    def hasLinkMesh(self, linkName):
+        return self.robotModel.linkIndex.get(linkName) in self._meshIndex
+
+    def _meshSection(self, name, meshIndex):
+        starts = self.sections["mesh_" + name + "_starts"]
+        return self.sections[name][starts[meshIndex]:starts[meshIndex + 1]]
+
+    #Mesh of a link as vtkPolyData that references the mapped buffers (raises KeyError if the link has no mesh)
+    def linkPolyData(self, linkName):
+        meshIndex = self._meshIndex[self.robotModel.linkIndex[linkName]]
+        points = vtk.vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(self._meshSection("points", meshIndex).reshape(-1, 3), deep=False))
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_support.numpy_to_vtk(self._meshSection("offsets", meshIndex), deep=False),
+                      numpy_support.numpy_to_vtk(self._meshSection("connectivity", meshIndex), deep=False))
+        polyData = vtk.vtkPolyData()
+        polyData.SetPoints(points)
+        polyData.SetPolys(polys)
+        return polyData
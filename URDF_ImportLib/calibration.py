@@ -0,0 +1,173 @@
+"""Kinematic calibration of joint origins from measured end effector poses.
+
+The joint origins (URDF <origin xyz rpy>) of the joints between the root link and an end link are
+corrected so that forward kinematics at the commanded joint values reproduces measured poses (or
+positions) of the end link. The corrections are fitted by Levenberg-Marquardt: each origin is
+multiplied by a small rotation and translation in its own frame, whose effect on the end link is
+known in closed form, so the residuals and Jacobians of all poses and joints are computed with a
+few batched array operations and no finite differences.
+
+Joint origins are redundant (e.g. a translation along a revolute joint axis can be moved into the
+next origin), the damping of the solve keeps redundant corrections at zero.
+"""
+
+import xml.etree.ElementTree as ET
+
+import numpy
+
+from URDF_ImportLib.rotations import axisAngleToMatrix, matrixToAxisAngle, matrixToRpy
+
+
+class CalibrationResult:
+    """Calibrated joint origins (jointCount, 4, 4) of all joints, the indices of the calibrated joints and their origin
+    xyz and rpy values (calibrated joint count, 3), with the root mean square position (URDF units) and rotation (radians)
+    errors of the end link before and after calibration."""
+
+    def __init__(self, jointOrigins, jointIndices, initialPositionRms, initialRotationRms, positionRms, rotationRms, iterations):
+        self.jointOrigins = jointOrigins
+        self.jointIndices = jointIndices
+        self.xyz = jointOrigins[jointIndices, :3, 3]
+        self.rpy = matrixToRpy(jointOrigins[jointIndices, :3, :3])
+        self.initialPositionRms = initialPositionRms
+        self.initialRotationRms = initialRotationRms
+        self.positionRms = positionRms
+        self.rotationRms = rotationRms
+        self.iterations = iterations
+
+
+#Indices of the joints from the root link to a link, in that order
+def chainJoints(model, linkIndex):
+    joints = []
+    while model.linkParentJoints[linkIndex] >= 0:
+        joints.append(int(model.linkParentJoints[linkIndex]))
+        linkIndex = model.jointParents[joints[-1]]
+    return joints[::-1]
+
+
+#End link to robot transforms (N, 4, 4) for joint origins (jointCount, 4, 4) and joint motions (N, jointCount, 4, 4) of the
+#joints of a chain, and the frames (N, len(calibrated), 4, 4) of the calibrated joints (their origins in robot coordinates)
+def _chainTransforms(origins, motions, chain, calibrated):
+    transforms = numpy.empty((len(motions), 4, 4))
+    transforms[...] = numpy.eye(4)
+    frames = numpy.empty((len(motions), len(calibrated), 4, 4))
+    for jointIndex in chain:
+        transforms = transforms @ origins[jointIndex]
+        if jointIndex in calibrated:
+            frames[:, calibrated[jointIndex]] = transforms
+        transforms = transforms @ motions[:, jointIndex]
+    return transforms, frames
+
+
+#Position (N, 3) and weighted rotation (N, 3) residuals of predicted end link poses (N, 4, 4) from measured ones
+def _residuals(predicted, measuredPoses, rotationWeight):
+    if measuredPoses.shape[1:] == (3,):
+        return measuredPoses - predicted[:, :3, 3], None
+    # rotation vectors of the rotations from the predicted to the measured orientations, in robot coordinates
+    axes, angles = matrixToAxisAngle(measuredPoses[:, :3, :3] @ numpy.swapaxes(predicted[:, :3, :3], 1, 2))
+    return measuredPoses[:, :3, 3] - predicted[:, :3, 3], rotationWeight * axes * angles[:, None]
+
+
+#Jacobian (N, rows, 6 * len(calibrated)) of the end link position (and weighted rotation) by small rotations and translations
+#(rotation, translation for each calibrated joint) applied in the frames of the calibrated joint origins
+def _jacobian(predicted, frames, withRotation, rotationWeight):
+    count, jointCount = frames.shape[:2]
+    rotations = frames[..., :3, :3]
+    # a rotation w about the origin frame moves the end point by (R w) x (end - origin), a translation v by R v
+    offsets = predicted[:, None, :3, 3] - frames[..., :3, 3]
+    positionByRotation = numpy.swapaxes(numpy.cross(numpy.swapaxes(rotations, -1, -2), offsets[:, :, None, :]), -1, -2)
+    jacobian = numpy.zeros((count, 6 if withRotation else 3, jointCount, 6))
+    jacobian[:, :3, :, :3] = numpy.moveaxis(positionByRotation, 2, 1)
+    jacobian[:, :3, :, 3:] = numpy.moveaxis(rotations, 2, 1)
+    if withRotation:
+        # the end orientation turns by R w in robot coordinates
+        jacobian[:, 3:, :, :3] = rotationWeight * numpy.moveaxis(rotations, 2, 1)
+    return jacobian.reshape(count * jacobian.shape[1], jointCount * 6)
+
+
+#Fits corrections of the origins of the joints (joint indices, all joints from the root to the end link by default) so that
+#the end link reaches the measured poses (N, 4, 4) or positions (N, 3), in robot coordinates and URDF units, at commanded
+#joint values q (N, dofCount). Rotation errors are multiplied by rotationWeight (length units per radian, the mean distance
+#of the measured positions from the robot origin by default) to weigh them against position errors.
+#Returns a CalibrationResult.
+def calibrateJointOrigins(model, q, measuredPoses, endLinkIndex, jointIndices=None, rotationWeight=None, iterations=100, tolerance=1e-12):
+    q = model.applyMimicJoints(numpy.atleast_2d(numpy.asarray(q, dtype=numpy.float64)))
+    measuredPoses = numpy.asarray(measuredPoses, dtype=numpy.float64)
+    if measuredPoses.shape not in ((len(q), 4, 4), (len(q), 3)):
+        raise ValueError(f"Expected {len(q)} measured poses (4x4) or positions (3), got an array of shape {measuredPoses.shape}")
+    chain = chainJoints(model, endLinkIndex)
+    calibrated = [jointIndex for jointIndex in chain if jointIndices is None or jointIndex in set(jointIndices)]
+    if not calibrated:
+        raise ValueError(f"No joints to calibrate between the root link and {model.linkNames[endLinkIndex]}")
+    calibratedPositions = {jointIndex: position for position, jointIndex in enumerate(calibrated)}
+    withRotation = measuredPoses.ndim == 3
+    if rotationWeight is None:
+        positions = measuredPoses[:, :3, 3] if withRotation else measuredPoses
+        rotationWeight = float(numpy.linalg.norm(positions, axis=1).mean()) or 1.0
+    motions = model.jointMotions(q)
+
+    def evaluate(origins):
+        predicted, frames = _chainTransforms(origins, motions, chain, calibratedPositions)
+        positionResiduals, rotationResiduals = _residuals(predicted, measuredPoses, rotationWeight)
+        residuals = positionResiduals if rotationResiduals is None else numpy.hstack([positionResiduals, rotationResiduals])
+        return predicted, frames, positionResiduals, rotationResiduals, residuals.reshape(-1)
+
+    def rms(values):
+        return 0.0 if values is None else float(numpy.sqrt(numpy.mean(numpy.sum(values ** 2, axis=1))))
+
+    origins = model.jointOrigins.copy()
+    predicted, frames, positionResiduals, rotationResiduals, residuals = evaluate(origins)
+    initialPositionRms, initialRotationRms = rms(positionResiduals), rms(rotationResiduals) / rotationWeight
+    cost = residuals @ residuals
+    damping = 1e-3
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        jacobian = _jacobian(predicted, frames, withRotation, rotationWeight)
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ residuals
+        diagonal = numpy.diag(normal) + 1e-12 * numpy.trace(normal)
+        improved = False
+        while damping < 1e12:
+            step = numpy.linalg.solve(normal + damping * numpy.diag(diagonal), gradient).reshape(-1, 6)
+            corrections = numpy.zeros((len(calibrated), 4, 4))
+            corrections[:, :3, :3] = axisAngleToMatrix(step[:, :3], numpy.linalg.norm(step[:, :3], axis=1))
+            corrections[:, :3, 3] = step[:, 3:]
+            corrections[:, 3, 3] = 1.0
+            candidateOrigins = origins.copy()
+            candidateOrigins[calibrated] = origins[calibrated] @ corrections
+            candidate = evaluate(candidateOrigins)
+            candidateCost = candidate[-1] @ candidate[-1]
+            if candidateCost < cost:
+                improved = True
+                break
+            damping *= 10
+        if not improved:
+            break
+        decrease = cost - candidateCost
+        origins = candidateOrigins
+        predicted, frames, positionResiduals, rotationResiduals, residuals = candidate
+        cost = candidateCost
+        damping = max(damping / 10, 1e-9)
+        if decrease <= tolerance * max(cost, 1e-300) or cost == 0:
+            break
+    return CalibrationResult(origins, numpy.array(calibrated, dtype=numpy.int64), initialPositionRms, initialRotationRms,
+                             rms(positionResiduals), rms(rotationResiduals) / rotationWeight, iteration)
+
+
+#URDF text with the origins of the named joints (direct children of <robot>) replaced by xyz and rpy values (jointCount, 3),
+#everything else (including comments) is kept
+def correctedURDFText(urdfText, jointNames, xyz, rpy):
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    robot = ET.fromstring(urdfText, parser=parser)
+    origins = {name: (jointXyz, jointRpy) for name, jointXyz, jointRpy in zip(jointNames, xyz, rpy)}
+    for joint in robot.findall("joint"):
+        if joint.get("name") not in origins:
+            continue
+        origin = joint.find("origin")
+        if origin is None:
+            # <origin> comes right after the joint name in the URDF examples, but its position does not matter
+            origin = ET.Element("origin")
+            joint.insert(0, origin)
+        for attribute, values in zip(("xyz", "rpy"), origins[joint.get("name")]):
+            origin.set(attribute, " ".join(f"{value:.12g}" for value in values))
+    declaration = '<?xml version="1.0"?>\n' if urdfText.lstrip().startswith("<?xml") else ""
+    return declaration + ET.tostring(robot, encoding="unicode") + "\n"
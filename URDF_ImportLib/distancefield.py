@@ -0,0 +1,169 @@
+"""Signed distance fields and clearance checks against them.
+
+A DistanceField is a regular grid of signed distances (negative inside) to a closed surface. It is
+computed once, optionally saved as a .npy file that is memory-mapped when loaded again, and sampled
+with vectorized trilinear interpolation. ClearanceMonitor keeps a fixed set of surface sample points
+per mesh and finds the smallest distance of each mesh to the surface in one lookup.
+"""
+
+import json
+import math
+import os
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from URDF_ImportLib.bundle import triangleArrays
+
+
+class DistanceField:
+    """Signed distances sampled on a grid, values are indexed as [k, j, i] (z, y, x)."""
+
+    def __init__(self, values, origin, spacing):
+        self.values = values
+        self.origin = numpy.asarray(origin, dtype=numpy.float64)
+        self.spacing = numpy.asarray(spacing, dtype=numpy.float64)
+        self.dimensions = numpy.array(values.shape[::-1])
+
+    #Computes the distance field of a closed surface on a grid covering its bounds plus margin
+    @classmethod
+    def fromPolyData(cls, polyData, spacing=1.0, margin=10.0):
+        bounds = numpy.array(polyData.GetBounds()).reshape(3, 2)
+        lower = bounds[:, 0] - margin
+        dimensions = [int(math.ceil((upper - low) / spacing)) + 1 for low, upper in zip(lower, bounds[:, 1] + margin)]
+        upper = lower + (numpy.array(dimensions) - 1) * spacing
+        distance = vtk.vtkImplicitPolyDataDistance()
+        distance.SetInput(polyData)
+        sampler = vtk.vtkSampleFunction()
+        sampler.SetImplicitFunction(distance)
+        sampler.SetModelBounds(lower[0], upper[0], lower[1], upper[1], lower[2], upper[2])
+        sampler.SetSampleDimensions(dimensions)
+        sampler.SetOutputScalarTypeToFloat()
+        sampler.ComputeNormalsOff()
+        sampler.Update()
+        values = numpy_support.vtk_to_numpy(sampler.GetOutput().GetPointData().GetScalars())
+        return cls(values.reshape(dimensions[::-1]).copy(), lower, [spacing] * 3)
+
+    #Saves the values as a .npy file and the grid geometry next to it as a .json file
+    def save(self, path):
+        numpy.save(path, numpy.ascontiguousarray(self.values, dtype=numpy.float32))
+        with open(os.path.splitext(path)[0] + ".json", "w") as geometryFile:
+            json.dump({"origin": self.origin.tolist(), "spacing": self.spacing.tolist()}, geometryFile)
+
+    @classmethod
+    def load(cls, path, memoryMap=True):
+        values = numpy.load(path, mmap_mode="r" if memoryMap else None)
+        with open(os.path.splitext(path)[0] + ".json") as geometryFile:
+            geometry = json.load(geometryFile)
+        return cls(values, geometry["origin"], geometry["spacing"])
+
+    #Wraps the values into a vtkImageData without copying
+    def toImageData(self):
+        imageData = vtk.vtkImageData()
+        imageData.SetOrigin(self.origin)
+        imageData.SetSpacing(self.spacing)
+        imageData.SetDimensions(self.dimensions.tolist())
+        scalars = numpy_support.numpy_to_vtk(numpy.ascontiguousarray(self.values).reshape(-1), deep=False)
+        scalars.SetName("Distance")
+        imageData.GetPointData().SetScalars(scalars)
+        # keep the buffer alive as long as the image
+        imageData._distanceValues = self.values
+        return imageData
+
+    #Signed distances (N,) at points (N, 3) by trilinear interpolation
+    #Points outside of the grid get the distance at the closest grid point plus their distance from the grid.
+    def distances(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64)
+        coordinates = (points - self.origin) / self.spacing
+        clipped = numpy.clip(coordinates, 0, self.dimensions - 1)
+        offGrid = (coordinates - clipped) * self.spacing
+        outside = numpy.sqrt(numpy.einsum("ij,ij->i", offGrid, offGrid))
+        # clipped coordinates are not negative, so truncation is floor
+        base = numpy.minimum(clipped.astype(numpy.int64), numpy.maximum(self.dimensions - 2, 0))
+        fx, fy, fz = numpy.ascontiguousarray((clipped - base).T)
+        # grid points are gathered from the flattened values, which is much faster than 3D fancy indexing
+        strideY = self.dimensions[0]
+        strideZ = self.dimensions[0] * self.dimensions[1]
+        index = base @ numpy.array([1, strideY, strideZ])
+        values = self.values.reshape(-1)
+        c00 = values.take(index) * (1 - fx) + values.take(index + 1) * fx
+        c10 = values.take(index + strideY) * (1 - fx) + values.take(index + strideY + 1) * fx
+        c01 = values.take(index + strideZ) * (1 - fx) + values.take(index + strideZ + 1) * fx
+        c11 = values.take(index + strideY + strideZ) * (1 - fx) + values.take(index + strideY + strideZ + 1) * fx
+        c0 = c00 * (1 - fy) + c10 * fy
+        c1 = c01 * (1 - fy) + c11 * fy
+        return c0 * (1 - fz) + c1 * fz + outside
+
+
+class ClearanceMonitor:
+    """Smallest distance of meshes to the surface of a distance field.
+
+    Each mesh is represented by sample points spread uniformly over its surface. The points are stored
+    as triangle vertex indices and barycentric weights, so they follow the mesh when its points are
+    modified in place.
+    """
+
+    def __init__(self, distanceField, threshold, samplesPerMesh=200):
+        self.distanceField = distanceField
+        self.threshold = threshold
+        self.samplesPerMesh = samplesPerMesh
+        self._samples = {}
+        # Smallest distance of each mesh at the last update
+        self.clearances = {}
+
+    #Chooses sample points of a mesh (vtkPolyData)
+    def _sample(self, polyData):
+        points, offsets, connectivity = triangleArrays(polyData)
+        triangles = connectivity.reshape(-1, 3)
+        if len(triangles) == 0:
+            return None
+        corners = points[triangles].astype(numpy.float64)
+        areas = 0.5 * numpy.linalg.norm(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+        rng = numpy.random.default_rng(0)
+        probabilities = areas / areas.sum() if areas.sum() > 0 else None
+        chosen = rng.choice(len(triangles), size=self.samplesPerMesh, p=probabilities)
+        weights = rng.random((self.samplesPerMesh, 2))
+        # fold samples that fall outside of the triangle back into it
+        flipped = weights.sum(axis=1) > 1
+        weights[flipped] = 1 - weights[flipped]
+        weights = numpy.column_stack([1 - weights.sum(axis=1), weights])
+        # the mesh vertices are samples too, so that small features are never missed
+        vertexIds = numpy.unique(triangles)
+        vertexWeights = numpy.zeros((len(vertexIds), 3))
+        vertexWeights[:, 0] = 1
+        return (polyData, numpy.concatenate([triangles[chosen], numpy.repeat(vertexIds[:, None], 3, axis=1)]),
+                numpy.concatenate([weights, vertexWeights]))
+
+    #Updates the clearances of meshes given as {name: (polyData, mesh to distance field transform (4, 4))}
+    #Returns the names of the meshes that are closer to the surface than the threshold.
+    def update(self, meshes):
+        names = []
+        worldPoints = []
+        for name, (polyData, meshToWorld) in meshes.items():
+            samples = self._samples.get(name)
+            if samples is None or samples[0] is not polyData:
+                # new mesh or mesh replaced (e.g., loaded in the background)
+                samples = self._samples[name] = self._sample(polyData)
+            if samples is None:
+                continue
+            _, vertexIds, weights = samples
+            points = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+            localPoints = numpy.einsum("pk,pkj->pj", weights, points[vertexIds])
+            worldPoints.append(localPoints @ meshToWorld[:3, :3].T + meshToWorld[:3, 3])
+            names.append(name)
+        self.clearances = {}
+        if not names:
+            return []
+        starts = numpy.cumsum([0] + [len(points) for points in worldPoints[:-1]])
+        distances = self.distanceField.distances(numpy.concatenate(worldPoints))
+        for name, clearance in zip(names, numpy.minimum.reduceat(distances, starts)):
+            self.clearances[name] = float(clearance)
+        return [name for name in names if self.clearances[name] < self.threshold]
+
+    #Name and clearance of the mesh closest to the surface at the last update, (None, inf) if there are no meshes
+    def closest(self):
+        if not self.clearances:
+            return None, math.inf
+        name = min(self.clearances, key=self.clearances.get)
+        return name, self.clearances[name]
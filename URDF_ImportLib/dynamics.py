@@ -0,0 +1,202 @@
+"""Rigid-body dynamics of a RobotModel, vectorized over batches of configurations.
+
+Link masses, centers of mass and inertias come from the URDF <inertial> elements (see
+RobotModel.linkMasses). Inverse dynamics uses the recursive Newton-Euler algorithm with spatial
+vectors (angular, linear) in link coordinates: one pass over the joints from the root computes link
+velocities and accelerations for all N configurations at once, a pass back from the leaves
+accumulates link forces into joint torques. Gravity is given in robot (root link) coordinates.
+
+Joint velocities and accelerations are derivatives of the joint values, except for floating
+joints, whose six values are the linear and angular velocity (and acceleration) of the child link
+in the joint frame. Torques of prismatic joints are forces.
+"""
+
+import numpy
+
+from URDF_ImportLib.kinematics import CONTINUOUS, FLOATING, PLANAR, PRISMATIC, REVOLUTE, planeBasis
+
+
+STANDARD_GRAVITY = (0.0, 0.0, -9.81)
+
+
+#Motion subspaces (jointCount, 6, 6) of the joints in joint coordinates: column k is the spatial velocity (angular, linear)
+#of the child link for a unit velocity of joint value k, unused columns are zero
+def _jointSubspaces(model):
+    subspaces = numpy.zeros((len(model.jointNames), 6, 6))
+    for jointIndex, (jointType, axis) in enumerate(zip(model.jointTypes, model.jointAxes)):
+        if jointType in (REVOLUTE, CONTINUOUS):
+            subspaces[jointIndex, :3, 0] = axis
+        elif jointType == PRISMATIC:
+            subspaces[jointIndex, 3:, 0] = axis
+        elif jointType == PLANAR:
+            subspaces[jointIndex, 3:, :2] = planeBasis(axis).T
+            subspaces[jointIndex, :3, 2] = axis
+        elif jointType == FLOATING:
+            subspaces[jointIndex, 3:, :3] = numpy.eye(3)
+            subspaces[jointIndex, :3, 3:] = numpy.eye(3)
+    return subspaces
+
+
+#Joint velocities or accelerations (..., dofCount) with the values of mimic joints set from their drivers (multiplier * driver value)
+def _applyMimicRates(model, rates):
+    rates = numpy.array(rates, dtype=numpy.float64)
+    for level in model.mimicLevels:
+        rates[..., model.dofIndex[level]] = model.mimicMultipliers[level] * rates[..., model.dofIndex[model.mimicDrivers[level]]]
+    return rates
+
+
+#Spatial force (..., 6) needed to give a rigid body with the given inertia the spatial motion (..., 6), for bodies with
+#masses (...,), centers of mass (..., 3) and inertias about the center of mass (..., 3, 3) in body coordinates
+def _inertiaTimes(masses, centers, inertias, motion):
+    angular = motion[..., :3]
+    linear = masses[..., None] * (motion[..., 3:] + numpy.cross(angular, centers))
+    torque = numpy.einsum("...ij,...j->...i", inertias, angular) + numpy.cross(centers, linear)
+    return numpy.concatenate([torque, linear], axis=-1)
+
+
+#Spatial cross product of motions (..., 6) with motions (..., 6)
+def _motionCross(velocity, motion):
+    angular, linear = velocity[..., :3], velocity[..., 3:]
+    return numpy.concatenate([numpy.cross(angular, motion[..., :3]),
+                              numpy.cross(angular, motion[..., 3:]) + numpy.cross(linear, motion[..., :3])], axis=-1)
+
+
+#Spatial cross product of motions (..., 6) with forces (..., 6)
+def _forceCross(velocity, force):
+    angular, linear = velocity[..., :3], velocity[..., 3:]
+    return numpy.concatenate([numpy.cross(angular, force[..., :3]) + numpy.cross(linear, force[..., 3:]),
+                              numpy.cross(angular, force[..., 3:])], axis=-1)
+
+
+#Joint torques (N, dofCount) for joint values q, velocities qd and accelerations qdd (N, dofCount) of a model whose links
+#have the given masses (linkCount,), centers of mass (linkCount, 3) and inertias (linkCount, 3, 3)
+def _newtonEuler(model, q, qd, qdd, gravity, masses, centers, inertias):
+    q = model.applyMimicJoints(q)
+    qd = _applyMimicRates(model, qd)
+    qdd = _applyMimicRates(model, qdd)
+    count = len(q)
+    linkCount = len(model.linkNames)
+    motions = model.jointMotions(q)
+    jointToChild = model.jointOrigins @ motions
+    subspaces = _jointSubspaces(model)
+
+    # root links do not move, gravity is an upward acceleration of the root instead
+    velocities = numpy.zeros((count, linkCount, 6))
+    accelerations = numpy.zeros((count, linkCount, 6))
+    accelerations[:, :, 3:] = -numpy.asarray(gravity, dtype=numpy.float64)
+    # per joint: parent to child rotations (N, 3, 3), child origins in parent coordinates (N, 3) and motion subspaces (N, 6, dofs)
+    childRotations = [None] * len(model.jointNames)
+    childOrigins = [None] * len(model.jointNames)
+    jointSubspaces = [None] * len(model.jointNames)
+    for jointIndex in model.jointOrder:
+        parentIndex = model.jointParents[jointIndex]
+        childIndex = model.jointChildren[jointIndex]
+        rotation = numpy.swapaxes(jointToChild[:, jointIndex, :3, :3], 1, 2)
+        origin = jointToChild[:, jointIndex, :3, 3]
+        velocity = _transformMotion(rotation, origin, velocities[:, parentIndex])
+        acceleration = _transformMotion(rotation, origin, accelerations[:, parentIndex])
+        dofs = model.jointDofs(jointIndex)
+        if len(dofs):
+            # the joint moves the child in joint coordinates, which are rotated by the joint motion relative to child coordinates
+            motionRotation = numpy.swapaxes(motions[:, jointIndex, :3, :3], 1, 2)
+            subspace = numpy.concatenate([motionRotation @ subspaces[jointIndex, :3, :len(dofs)],
+                                          motionRotation @ subspaces[jointIndex, 3:, :len(dofs)]], axis=1)
+            jointVelocity = numpy.einsum("nij,nj->ni", subspace, qd[:, dofs])
+            # the joint translation is along joint axes, which rotate with the child while the joint rotates
+            jointBias = numpy.zeros((count, 6))
+            jointBias[:, 3:] = -numpy.cross(jointVelocity[:, :3], jointVelocity[:, 3:])
+            velocity = velocity + jointVelocity
+            acceleration = (acceleration + numpy.einsum("nij,nj->ni", subspace, qdd[:, dofs]) + jointBias
+                            + _motionCross(velocity, jointVelocity))
+            jointSubspaces[jointIndex] = subspace
+        velocities[:, childIndex] = velocity
+        accelerations[:, childIndex] = acceleration
+        childRotations[jointIndex] = rotation
+        childOrigins[jointIndex] = origin
+
+    forces = (_inertiaTimes(masses, centers, inertias, accelerations)
+              + _forceCross(velocities, _inertiaTimes(masses, centers, inertias, velocities)))
+    torques = numpy.zeros((count, model.dofCount))
+    for jointIndex in model.jointOrder[::-1]:
+        childForce = forces[:, model.jointChildren[jointIndex]]
+        dofs = model.jointDofs(jointIndex)
+        if len(dofs):
+            torques[:, dofs] = numpy.einsum("nij,ni->nj", jointSubspaces[jointIndex], childForce)
+        forces[:, model.jointParents[jointIndex]] += _transformForceToParent(childRotations[jointIndex], childOrigins[jointIndex], childForce)
+    # mimic joints are driven through their drivers
+    for level in model.mimicLevels[::-1]:
+        numpy.add.at(torques, (slice(None), model.dofIndex[model.mimicDrivers[level]]),
+                     model.mimicMultipliers[level] * torques[:, model.dofIndex[level]])
+    return torques
+
+
+#Motions (N, 6) of parent links in the coordinates of their children, for parent to child rotations (N, 3, 3) and child
+#origins (N, 3) in parent coordinates
+def _transformMotion(rotation, origin, motion):
+    angular = numpy.einsum("nij,nj->ni", rotation, motion[:, :3])
+    linear = numpy.einsum("nij,nj->ni", rotation, motion[:, 3:] - numpy.cross(origin, motion[:, :3]))
+    return numpy.concatenate([angular, linear], axis=-1)
+
+
+#Forces (N, 6) on child links in the coordinates of their parents
+def _transformForceToParent(rotation, origin, force):
+    linear = numpy.einsum("nji,nj->ni", rotation, force[:, 3:])
+    torque = numpy.einsum("nji,nj->ni", rotation, force[:, :3]) + numpy.cross(origin, linear)
+    return numpy.concatenate([torque, linear], axis=-1)
+
+
+def _batch(model, values):
+    values = numpy.asarray(values, dtype=numpy.float64)
+    return values.reshape(-1, model.dofCount), values.ndim == 1
+
+
+#Joint torques (..., dofCount) that produce joint accelerations qdd at joint values q and velocities qd (..., dofCount)
+#under gravity (robot coordinates). The torques of mimic joints are added to the torques of their drivers.
+def inverseDynamics(model, q, qd=None, qdd=None, gravity=STANDARD_GRAVITY):
+    q, single = _batch(model, q)
+    qd = numpy.zeros_like(q) if qd is None else _batch(model, qd)[0]
+    qdd = numpy.zeros_like(q) if qdd is None else _batch(model, qdd)[0]
+    torques = _newtonEuler(model, q, qd, qdd, gravity, model.linkMasses, model.linkCentersOfMass, model.linkInertias)
+    return torques[0] if single else torques
+
+
+#Joint torques (..., dofCount) that hold the robot still at joint values q (..., dofCount) against gravity
+def gravityTorques(model, q, gravity=STANDARD_GRAVITY):
+    return inverseDynamics(model, q, gravity=gravity)
+
+
+#Center of mass (..., 3) of the robot in robot coordinates and its total mass at joint values q (..., dofCount)
+def centerOfMass(model, q):
+    q, single = _batch(model, q)
+    totalMass = model.linkMasses.sum()
+    if totalMass <= 0:
+        raise ValueError("Robot has no mass")
+    linkTransforms = model.linkTransforms(q)
+    centers = numpy.einsum("nlij,lj->nli", linkTransforms[..., :3, :3], model.linkCentersOfMass) + linkTransforms[..., :3, 3]
+    center = numpy.einsum("l,nli->ni", model.linkMasses, centers) / totalMass
+    return (center[0] if single else center), float(totalMass)
+
+
+#Estimates the mass and center of mass (3,) in link coordinates of a payload attached to a link from joint torques (N, dofCount)
+#measured while the robot holds still at joint values q (N, dofCount). The torques that the model links need are subtracted
+#and the rest is fitted by least squares, so the poses should turn the link in different directions. The mass is only
+#separated from the center if some joint carries the payload weight at a lever arm that does not depend on the center,
+#e.g., a vertical prismatic joint; center components that no torque depends on are zero.
+def estimatePayload(model, q, torques, linkIndex, gravity=STANDARD_GRAVITY):
+    q, _ = _batch(model, q)
+    residuals = _batch(model, torques)[0] - gravityTorques(model, q, gravity)
+    # holding torques are linear in the payload mass m and its first moment m * center: basis torques of a unit mass at the
+    # link origin and the changes when it is moved to unit offsets along x, y and z
+    linkCount = len(model.linkNames)
+    masses = numpy.zeros(linkCount)
+    masses[linkIndex] = 1.0
+    inertias = numpy.zeros((linkCount, 3, 3))
+    basis = []
+    for offset in numpy.vstack([numpy.zeros(3), numpy.eye(3)]):
+        centers = numpy.zeros((linkCount, 3))
+        centers[linkIndex] = offset
+        basis.append(_newtonEuler(model, q, numpy.zeros_like(q), numpy.zeros_like(q), gravity, masses, centers, inertias))
+    basis[1:] = [offsetTorques - basis[0] for offsetTorques in basis[1:]]
+    basis = numpy.stack(basis, axis=-1).reshape(-1, 4)
+    (mass, *moment), *_ = numpy.linalg.lstsq(basis, residuals.reshape(-1), rcond=None)
+    return float(mass), numpy.array(moment) / mass if mass != 0 else numpy.zeros(3)
@@ -0,0 +1,130 @@
+"""Instanced drawing of a mesh that is shared by several links.
+
+All instances of a mesh are drawn by one actor. With a hardware OpenGL renderer the actor uses a
+vtkGlyph3DMapper that places the mesh at per-instance positions and orientations on the GPU. With a
+software renderer (e.g., Mesa llvmpipe on machines without a GPU) the instances are copied into one
+polydata instead, which is transformed with numpy whenever the instances move. While the GPU draws the
+instances, that copy is only brought up to date when it is needed (see lazyMergedPolyData).
+"""
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from URDF_ImportLib.bundle import triangleArrays
+from URDF_ImportLib.meshloading import LINK_INDEX_ARRAY_NAME
+from URDF_ImportLib.rotations import matrixToQuaternion
+
+
+INSTANCE_ORIENTATION_ARRAY_NAME = "InstanceOrientation"
+# OpenGL renderer names of software rasterizers, instanced drawing is not faster than plain polydata with these
+SOFTWARE_RENDERERS = ("llvmpipe", "softpipe", "swrast", "software rasterizer")
+
+
+#Returns True if the render window draws with a hardware OpenGL renderer that supports instancing
+def instancedRenderingSupported(renderWindow):
+    if renderWindow is None or not hasattr(renderWindow, "SupportsOpenGL") or not renderWindow.SupportsOpenGL():
+        return False
+    capabilities = (renderWindow.ReportCapabilities() or "").lower()
+    return not any(renderer in capabilities for renderer in SOFTWARE_RENDERERS)
+
+
+class MeshInstances:
+    """One mesh placed at several poses.
+
+    instancePoints holds one point and orientation quaternion per instance for a vtkGlyph3DMapper
+    (see glyphMapper), mergedPolyData holds a transformed copy of the mesh per instance with a
+    LinkIndex cell array that tells which instance each cell belongs to. Both are updated in place
+    by setMatrices, unless lazyMergedPolyData is set: then mergedPolyData is only updated by
+    updateMergedPolyData.
+    """
+
+    #Instances of the mesh of the mergedPolyData of MeshInstances (e.g., read back from a saved scene), whose instances
+    #were placed at mesh to world transforms matrices (instanceCount, 4, 4)
+    @classmethod
+    def fromMergedPolyData(cls, mergedPolyData, matrices):
+        matrices = numpy.asarray(matrices, dtype=numpy.float64)
+        points, offsets, connectivity = triangleArrays(mergedPolyData)
+        pointCount = len(points) // len(matrices)
+        triangleCount = (len(offsets) - 1) // len(matrices)
+        # the first instance holds the mesh moved by the first matrix
+        inverse = numpy.linalg.inv(matrices[0])
+        meshPoints = vtk.vtkPoints()
+        meshPoints.SetData(numpy_support.numpy_to_vtk(points[:pointCount].astype(numpy.float64) @ inverse[:3, :3].T + inverse[:3, 3], deep=True))
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_support.numpy_to_vtk(offsets[:triangleCount + 1].astype(numpy.int64), deep=True),
+                      numpy_support.numpy_to_vtk(connectivity[:3 * triangleCount].astype(numpy.int64), deep=True))
+        mesh = vtk.vtkPolyData()
+        mesh.SetPoints(meshPoints)
+        mesh.SetPolys(polys)
+        return cls(mesh, len(matrices))
+
+    def __init__(self, mesh, instanceCount):
+        self.mesh = mesh
+        self.instanceCount = instanceCount
+        self.lazyMergedPolyData = False
+        self._matrices = None
+        self._mergedPolyDataOutdated = False
+        points, offsets, connectivity = triangleArrays(mesh)
+        self._meshPoints = points.astype(numpy.float64)
+        triangleCount = len(offsets) - 1
+
+        self._centers = numpy.zeros((instanceCount, 3))
+        self._orientations = numpy.tile([1.0, 0.0, 0.0, 0.0], (instanceCount, 1))
+        self.instancePoints = vtk.vtkPolyData()
+        centerPoints = vtk.vtkPoints()
+        centerPoints.SetData(numpy_support.numpy_to_vtk(self._centers, deep=False))
+        self.instancePoints.SetPoints(centerPoints)
+        orientationArray = numpy_support.numpy_to_vtk(self._orientations, deep=False)
+        orientationArray.SetName(INSTANCE_ORIENTATION_ARRAY_NAME)
+        self.instancePoints.GetPointData().AddArray(orientationArray)
+
+        self._mergedPoints = numpy.tile(points, (instanceCount, 1)).astype(numpy.float32)
+        pointOffsets = numpy.repeat(numpy.arange(instanceCount, dtype=numpy.int64) * len(points), len(connectivity))
+        mergedConnectivity = numpy.tile(connectivity.astype(numpy.int64), instanceCount) + pointOffsets
+        mergedOffsets = numpy.arange(0, 3 * triangleCount * instanceCount + 1, 3, dtype=numpy.int64)
+        self.mergedPolyData = vtk.vtkPolyData()
+        mergedPointsData = vtk.vtkPoints()
+        mergedPointsData.SetData(numpy_support.numpy_to_vtk(self._mergedPoints, deep=False))
+        self.mergedPolyData.SetPoints(mergedPointsData)
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_support.numpy_to_vtk(mergedOffsets, deep=True), numpy_support.numpy_to_vtk(mergedConnectivity, deep=True))
+        self.mergedPolyData.SetPolys(polys)
+        linkIndices = numpy_support.numpy_to_vtk(numpy.repeat(numpy.arange(instanceCount, dtype=numpy.int32), triangleCount), deep=True)
+        linkIndices.SetName(LINK_INDEX_ARRAY_NAME)
+        self.mergedPolyData.GetCellData().AddArray(linkIndices)
+
+    #Sets the mesh to world transforms (instanceCount, 4, 4) of the instances
+    def setMatrices(self, matrices):
+        matrices = numpy.asarray(matrices, dtype=numpy.float64)
+        self._centers[:] = matrices[:, :3, 3]
+        self._orientations[:] = matrixToQuaternion(matrices[:, :3, :3])
+        self.instancePoints.GetPoints().GetData().Modified()
+        self.instancePoints.GetPointData().GetArray(INSTANCE_ORIENTATION_ARRAY_NAME).Modified()
+        self.instancePoints.Modified()
+        self._matrices = matrices
+        self._mergedPolyDataOutdated = True
+        if not self.lazyMergedPolyData:
+            self.updateMergedPolyData()
+
+    #Moves the instances of mergedPolyData to the matrices of the last setMatrices call if they are not there yet
+    def updateMergedPolyData(self):
+        if not self._mergedPolyDataOutdated:
+            return
+        self._mergedPolyDataOutdated = False
+        matrices = self._matrices
+        mergedPoints = self._mergedPoints.reshape(self.instanceCount, -1, 3)
+        mergedPoints[:] = numpy.einsum("ijk,nk->inj", matrices[:, :3, :3], self._meshPoints) + matrices[:, None, :3, 3]
+        self.mergedPolyData.GetPoints().GetData().Modified()
+        self.mergedPolyData.GetPoints().Modified()
+        self.mergedPolyData.Modified()
+
+    #Mapper that draws all instances of the mesh with GPU instancing
+    def glyphMapper(self):
+        mapper = vtk.vtkGlyph3DMapper()
+        mapper.SetSourceData(self.mesh)
+        mapper.SetInputData(self.instancePoints)
+        mapper.SetOrientationModeToQuaternion()
+        mapper.SetOrientationArray(INSTANCE_ORIENTATION_ARRAY_NAME)
+        mapper.ScalingOff()
+        return mapper
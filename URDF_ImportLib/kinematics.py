@@ -0,0 +1,367 @@
+import numpy
+
+from URDF_ImportLib.rotations import axisAngleToMatrix, matrixToAxisAngle, normalize
+from URDF_ImportLib.urdfparser import describeElement, parseURDF
+
+
+# Joint types in the order used by RobotModel.jointTypes
+JOINT_TYPES = ("fixed", "revolute", "continuous", "prismatic", "floating", "planar")
+FIXED, REVOLUTE, CONTINUOUS, PRISMATIC, FLOATING, PLANAR = range(len(JOINT_TYPES))
+
+# Number of joint values (degrees of freedom) per joint type
+# Planar joints have translations along the two planeBasis directions and a rotation about the axis, floating
+# joints a translation (x, y, z) and a rotation vector (axis * angle).
+JOINT_DOF = {FIXED: 0, REVOLUTE: 1, CONTINUOUS: 1, PRISMATIC: 1, FLOATING: 6, PLANAR: 3}
+
+
+#Two unit vectors (..., 2, 3) spanning the plane perpendicular to unit axes (..., 3), for the Z axis these are X and Y
+def planeBasis(axes):
+    axes = numpy.asarray(axes, dtype=numpy.float64)
+    # project the X axis into the plane, or the Y axis if the plane is (close to) perpendicular to X
+    closeToX = numpy.abs(axes[..., 0]) >= numpy.abs(axes).max(axis=-1)
+    helpers = numpy.zeros(axes.shape)
+    helpers[..., 0] = ~closeToX
+    helpers[..., 1] = closeToX
+    first = normalize(helpers - numpy.sum(helpers * axes, axis=-1, keepdims=True) * axes)
+    return numpy.stack([first, numpy.cross(axes, first)], axis=-2)
+
+
+#Rotation angles (...) about unit axes (..., 3) of rotation matrices (..., 3, 3), rotation about other axes is ignored
+def _twistAngles(rotation, axes):
+    # R - R^T = 2 sin(angle) [axis]x and trace(R) = 1 + 2 cos(angle) for rotation about the axis
+    skew = numpy.stack([rotation[..., 2, 1] - rotation[..., 1, 2],
+                        rotation[..., 0, 2] - rotation[..., 2, 0],
+                        rotation[..., 1, 0] - rotation[..., 0, 1]], axis=-1)
+    sine = 0.5 * numpy.sum(skew * axes, axis=-1)
+    cosine = 0.5 * (numpy.trace(rotation, axis1=-2, axis2=-1) - 1.0)
+    return numpy.arctan2(sine, cosine)
+
+
+class RobotModel:
+    """Kinematic tree of a URDF robot stored in flat numpy arrays.
+
+    Links and joints are indexed in document order. Joint values are stored in one vector with an
+    entry per degree of freedom (see dofIndex), and all kinematic functions accept either one
+    vector of shape (dofCount,) or a batch of shape (N, dofCount).
+    """
+
+    def __init__(self):
+        self.name = ""
+        self.linkNames = []
+        self.linkIndex = {}
+        self.jointNames = []
+        self.jointIndex = {}
+        self.jointTypes = numpy.zeros(0, dtype=numpy.int32)
+        self.jointParents = numpy.zeros(0, dtype=numpy.int32)
+        self.jointChildren = numpy.zeros(0, dtype=numpy.int32)
+        self.jointOrigins = numpy.zeros((0, 4, 4))
+        self.jointAxes = numpy.zeros((0, 3))
+        self.dofIndex = numpy.zeros(0, dtype=numpy.int32)
+        self.dofCount = 0
+        self.lowerLimits = numpy.zeros(0)
+        self.upperLimits = numpy.zeros(0)
+        self.linkParentJoints = numpy.zeros(0, dtype=numpy.int32)
+        self.jointOrder = numpy.zeros(0, dtype=numpy.int32)
+        self.visualOrigins = numpy.zeros((0, 4, 4))
+        # Mimic joints (URDF <mimic>): index of the driving joint (-1 for independent joints), multiplier and offset
+        self.mimicDrivers = numpy.zeros(0, dtype=numpy.int32)
+        self.mimicMultipliers = numpy.zeros(0)
+        self.mimicOffsets = numpy.zeros(0)
+        self.mimicLevels = []
+        # Mass, center of mass (linkCount, 3) and inertia about the center of mass (linkCount, 3, 3) of each link in link coordinates
+        self.linkMasses = numpy.zeros(0)
+        self.linkCentersOfMass = numpy.zeros((0, 3))
+        self.linkInertias = numpy.zeros((0, 3, 3))
+        self.visualMeshes = []
+        self.collisionMeshes = []
+
+    @classmethod
+    def fromFile(cls, path):
+        return cls.fromDescription(parseURDF(path))
+
+    @classmethod
+    def fromElement(cls, robot):
+        if robot.tag != "robot":
+            raise ValueError("Invalid URDF file")
+        return cls.fromDescription(describeElement(robot))
+
+    #Creates the model of a robot read by urdfparser
+    @classmethod
+    def fromDescription(cls, description):
+        model = cls()
+        model.name = description.name
+        model.linkNames = list(description.linkNames)
+        model.linkIndex = {name: index for index, name in enumerate(model.linkNames)}
+        model.jointNames = list(description.jointNames)
+        model.jointIndex = {name: index for index, name in enumerate(model.jointNames)}
+        model.visualOrigins = description.visualOrigins()
+        model.visualMeshes = list(description.visualMeshes)
+        model.collisionMeshes = list(description.collisionMeshes)
+        inertialOrigins = description.inertialOrigins()
+        rotations = inertialOrigins[:, :3, :3]
+        model.linkMasses = description.masses.copy()
+        model.linkCentersOfMass = inertialOrigins[:, :3, 3].copy()
+        model.linkInertias = rotations @ description.inertiaMatrices() @ numpy.swapaxes(rotations, 1, 2)
+
+        for jointType in description.jointTypeNames:
+            if jointType not in JOINT_TYPES:
+                raise ValueError(f"Unsupported joint type {jointType}")
+        model.jointTypes = numpy.array([JOINT_TYPES.index(jointType) for jointType in description.jointTypeNames], dtype=numpy.int32)
+        unconnected = numpy.nonzero((description.jointParents < 0) | (description.jointChildren < 0))[0]
+        if len(unconnected):
+            raise ValueError(f"Joint {model.jointNames[unconnected[0]]} does not connect two links of the robot")
+        model.jointParents = description.jointParents.copy()
+        model.jointChildren = description.jointChildren.copy()
+        model.jointOrigins = description.jointOrigins()
+        norms = numpy.linalg.norm(description.jointAxes, axis=1)
+        if numpy.any(norms == 0):
+            raise ValueError(f"Joint {model.jointNames[numpy.nonzero(norms == 0)[0][0]]} has a zero axis")
+        model.jointAxes = description.jointAxes / norms[:, None]
+
+        model.mimicDrivers = description.mimicJoints.copy()
+        model.mimicMultipliers = description.mimicMultipliers.copy()
+        model.mimicOffsets = description.mimicOffsets.copy()
+        for jointIndex, driverName in enumerate(description.mimicJointNames):
+            if driverName is not None and model.mimicDrivers[jointIndex] < 0:
+                raise ValueError(f"Joint {model.jointNames[jointIndex]} mimics unknown joint {driverName}")
+
+        # URDF limits apply to the joint value of revolute and prismatic joints only
+        dofs = numpy.array([JOINT_DOF[jointType] for jointType in model.jointTypes], dtype=numpy.int32).reshape(-1)
+        limited = numpy.isin(model.jointTypes, (REVOLUTE, PRISMATIC))
+        lower = numpy.where(limited & ~numpy.isnan(description.lowerLimits), description.lowerLimits, -numpy.inf)
+        upper = numpy.where(limited & ~numpy.isnan(description.upperLimits), description.upperLimits, numpy.inf)
+        model.dofIndex = numpy.where(dofs > 0, numpy.cumsum(dofs) - dofs, -1).astype(numpy.int32)
+        model.lowerLimits = numpy.repeat(lower, dofs).astype(numpy.float64)
+        model.upperLimits = numpy.repeat(upper, dofs).astype(numpy.float64)
+        model.dofCount = len(model.lowerLimits)
+
+        model.linkParentJoints = numpy.full(len(model.linkNames), -1, dtype=numpy.int32)
+        for jointIndex, childIndex in enumerate(model.jointChildren):
+            if model.linkParentJoints[childIndex] != -1:
+                raise ValueError(f"Link {model.linkNames[childIndex]} is the child of more than one joint")
+            model.linkParentJoints[childIndex] = jointIndex
+        model.jointOrder = model._topologicalJointOrder()
+        model.mimicLevels = model._mimicLevels()
+        return model
+
+    # Array attributes that fully describe the kinematic tree (see toArrays/fromArrays)
+    arrayNames = ("jointTypes", "jointParents", "jointChildren", "jointOrigins", "jointAxes", "dofIndex",
+                  "lowerLimits", "upperLimits", "linkParentJoints", "jointOrder", "visualOrigins",
+                  "mimicDrivers", "mimicMultipliers", "mimicOffsets", "linkMasses", "linkCentersOfMass", "linkInertias")
+    # List attributes stored next to the arrays, None entries are stored as empty strings
+    stringListNames = ("linkNames", "jointNames", "visualMeshes", "collisionMeshes")
+
+    #Returns the model as a dictionary of numpy arrays and a dictionary of string lists
+    def toArrays(self):
+        arrays = {name: getattr(self, name) for name in self.arrayNames}
+        strings = {name: [value or "" for value in getattr(self, name)] for name in self.stringListNames}
+        strings["name"] = [self.name]
+        return arrays, strings
+
+    #Creates a model from the output of toArrays, arrays are used without copying
+    @classmethod
+    def fromArrays(cls, arrays, strings):
+        model = cls()
+        for name in cls.arrayNames:
+            if name in arrays:
+                setattr(model, name, arrays[name])
+        if "mimicDrivers" not in arrays:
+            # stored before mimic joints were supported
+            model.mimicDrivers = numpy.full(len(model.jointTypes), -1, dtype=numpy.int32)
+            model.mimicMultipliers = numpy.ones(len(model.jointTypes))
+            model.mimicOffsets = numpy.zeros(len(model.jointTypes))
+        model.jointOrigins = model.jointOrigins.reshape(-1, 4, 4)
+        model.jointAxes = model.jointAxes.reshape(-1, 3)
+        model.visualOrigins = model.visualOrigins.reshape(-1, 4, 4)
+        model.linkNames = list(strings["linkNames"])
+        if "linkMasses" not in arrays:
+            # stored before link inertials were read
+            model.linkMasses = numpy.zeros(len(model.linkNames))
+            model.linkCentersOfMass = numpy.zeros((len(model.linkNames), 3))
+            model.linkInertias = numpy.zeros((len(model.linkNames), 3, 3))
+        model.linkCentersOfMass = model.linkCentersOfMass.reshape(-1, 3)
+        model.linkInertias = model.linkInertias.reshape(-1, 3, 3)
+        model.jointNames = list(strings["jointNames"])
+        model.visualMeshes = [value or None for value in strings["visualMeshes"]]
+        model.collisionMeshes = [value or None for value in strings["collisionMeshes"]]
+        model.name = strings["name"][0] if strings.get("name") else ""
+        model.linkIndex = {name: index for index, name in enumerate(model.linkNames)}
+        model.jointIndex = {name: index for index, name in enumerate(model.jointNames)}
+        model.dofCount = len(model.lowerLimits)
+        model.mimicLevels = model._mimicLevels()
+        return model
+
+    #Orders joints so that every joint comes after the joint that moves its parent link
+    def _topologicalJointOrder(self):
+        childJoints = [[] for _ in self.linkNames]
+        for jointIndex, parentIndex in enumerate(self.jointParents):
+            childJoints[parentIndex].append(jointIndex)
+        order = []
+        stack = [linkIndex for linkIndex, parentJoint in enumerate(self.linkParentJoints) if parentJoint == -1]
+        if self.linkNames and not stack:
+            raise ValueError("Robot has no root link")
+        while stack:
+            linkIndex = stack.pop()
+            for jointIndex in reversed(childJoints[linkIndex]):
+                order.append(jointIndex)
+                stack.append(self.jointChildren[jointIndex])
+        if len(order) != len(self.jointNames):
+            raise ValueError("Robot joints contain a cycle")
+        return numpy.array(order, dtype=numpy.int32)
+
+    #Groups mimic joints so that the drivers of each group are independent joints or in an earlier group
+    def _mimicLevels(self):
+        levels = []
+        resolved = self.mimicDrivers < 0
+        for jointIndex in numpy.nonzero(~resolved)[0]:
+            if JOINT_DOF[self.jointTypes[jointIndex]] != 1 or JOINT_DOF[self.jointTypes[self.mimicDrivers[jointIndex]]] != 1:
+                raise ValueError(f"Mimic joint {self.jointNames[jointIndex]} and the joint it mimics must have one degree of freedom")
+        while not numpy.all(resolved):
+            level = numpy.nonzero(~resolved & resolved[numpy.maximum(self.mimicDrivers, 0)])[0]
+            if len(level) == 0:
+                raise ValueError("Mimic joints contain a cycle")
+            levels.append(level)
+            resolved[level] = True
+        return levels
+
+    #Joints that follow a joint, directly or through other mimic joints
+    def mimicFollowers(self, jointIndex):
+        followers = []
+        drivers = {jointIndex}
+        for level in self.mimicLevels:
+            followingJoints = [follower for follower in level if self.mimicDrivers[follower] in drivers]
+            followers.extend(followingJoints)
+            drivers.update(followingJoints)
+        return numpy.array(followers, dtype=numpy.int64)
+
+    #Joint values (..., dofCount) with the values of mimic joints set from their drivers: multiplier * driver value + offset
+    def applyMimicJoints(self, q):
+        q = numpy.array(q, dtype=numpy.float64)
+        for level in self.mimicLevels:
+            q[..., self.dofIndex[level]] = self.mimicMultipliers[level] * q[..., self.dofIndex[self.mimicDrivers[level]]] + self.mimicOffsets[level]
+        return q
+
+    #Links connected by fixed joints move as one rigid body. Returns, for every link, the index of the first link
+    #of its rigid body and the link to first link transforms (linkCount, 4, 4).
+    def rigidBodies(self):
+        bodyLinks = numpy.arange(len(self.linkNames), dtype=numpy.int32)
+        linkToBody = numpy.tile(numpy.eye(4), (len(self.linkNames), 1, 1))
+        for jointIndex in self.jointOrder:
+            if self.jointTypes[jointIndex] != FIXED:
+                continue
+            parentIndex = self.jointParents[jointIndex]
+            childIndex = self.jointChildren[jointIndex]
+            bodyLinks[childIndex] = bodyLinks[parentIndex]
+            linkToBody[childIndex] = linkToBody[parentIndex] @ self.jointOrigins[jointIndex]
+        return bodyLinks, linkToBody
+
+    def zeroConfiguration(self):
+        return numpy.zeros(self.dofCount)
+
+    #Names of the joint values: the joint name, followed by the index of the value for joints with several degrees of freedom
+    def dofNames(self):
+        names = [""] * self.dofCount
+        for jointIndex, jointName in enumerate(self.jointNames):
+            dofs = self.jointDofs(jointIndex)
+            for position, dof in enumerate(dofs):
+                names[dof] = jointName if len(dofs) == 1 else f"{jointName} ({position})"
+        return names
+
+    #Indices of the joint values of a joint in the joint value vector
+    def jointDofs(self, jointIndex):
+        return numpy.arange(JOINT_DOF[self.jointTypes[jointIndex]]) + self.dofIndex[jointIndex]
+
+    #Joint motion transforms (..., jointCount, 4, 4) for joint values (..., dofCount)
+    #If joints (joint indices) is given, only the motions (..., len(joints), 4, 4) of those joints are computed.
+    def jointMotions(self, q, joints=None):
+        q = numpy.asarray(q, dtype=numpy.float64)
+        joints = numpy.arange(len(self.jointNames)) if joints is None else numpy.asarray(joints, dtype=numpy.int64)
+        jointTypes = self.jointTypes[joints]
+        axes = self.jointAxes[joints]
+        firstDofs = self.dofIndex[joints]
+        motions = numpy.empty(q.shape[:-1] + (len(joints), 4, 4))
+        motions[...] = numpy.eye(4)
+        translations = motions[..., :3, 3]
+
+        rotating = numpy.nonzero((jointTypes == REVOLUTE) | (jointTypes == CONTINUOUS))[0]
+        if len(rotating):
+            angles = q[..., firstDofs[rotating]]
+            motions[..., rotating, :3, :3] = axisAngleToMatrix(axes[rotating], angles)
+        sliding = numpy.nonzero(jointTypes == PRISMATIC)[0]
+        if len(sliding):
+            distances = q[..., firstDofs[sliding]]
+            translations[..., sliding, :] = distances[..., None] * axes[sliding]
+        planar = numpy.nonzero(jointTypes == PLANAR)[0]
+        if len(planar):
+            values = q[..., firstDofs[planar][:, None] + numpy.arange(3)]
+            translations[..., planar, :] = numpy.einsum("...jk,jkd->...jd", values[..., :2], planeBasis(axes[planar]))
+            motions[..., planar, :3, :3] = axisAngleToMatrix(axes[planar], values[..., 2])
+        floating = numpy.nonzero(jointTypes == FLOATING)[0]
+        if len(floating):
+            values = q[..., firstDofs[floating][:, None] + numpy.arange(6)]
+            translations[..., floating, :] = values[..., :3]
+            motions[..., floating, :3, :3] = axisAngleToMatrix(values[..., 3:], numpy.linalg.norm(values[..., 3:], axis=-1))
+        return motions
+
+    #Joint values (..., dofCount) that produce the given joint motion transforms (..., jointCount, 4, 4)
+    #Motion components that the joint cannot perform (off-axis rotation or translation) are ignored.
+    #If joints (joint indices) is given, motions are (..., len(joints), 4, 4) and only the values of those joints are set.
+    def jointValuesFromMotions(self, motions, joints=None):
+        motions = numpy.asarray(motions, dtype=numpy.float64)
+        joints = numpy.arange(len(self.jointNames)) if joints is None else numpy.asarray(joints, dtype=numpy.int64)
+        jointTypes = self.jointTypes[joints]
+        axes = self.jointAxes[joints]
+        firstDofs = self.dofIndex[joints]
+        q = numpy.zeros(motions.shape[:-3] + (self.dofCount,))
+        translations = motions[..., :3, 3]
+
+        rotating = numpy.nonzero((jointTypes == REVOLUTE) | (jointTypes == CONTINUOUS))[0]
+        if len(rotating):
+            q[..., firstDofs[rotating]] = _twistAngles(motions[..., rotating, :3, :3], axes[rotating])
+        sliding = numpy.nonzero(jointTypes == PRISMATIC)[0]
+        if len(sliding):
+            q[..., firstDofs[sliding]] = numpy.sum(translations[..., sliding, :] * axes[sliding], axis=-1)
+        planar = numpy.nonzero(jointTypes == PLANAR)[0]
+        if len(planar):
+            planeTranslations = numpy.einsum("...jd,jkd->...jk", translations[..., planar, :], planeBasis(axes[planar]))
+            q[..., firstDofs[planar]] = planeTranslations[..., 0]
+            q[..., firstDofs[planar] + 1] = planeTranslations[..., 1]
+            q[..., firstDofs[planar] + 2] = _twistAngles(motions[..., planar, :3, :3], axes[planar])
+        floating = numpy.nonzero(jointTypes == FLOATING)[0]
+        if len(floating):
+            rotationAxes, angles = matrixToAxisAngle(motions[..., floating, :3, :3])
+            q[..., firstDofs[floating][:, None] + numpy.arange(3)] = translations[..., floating, :]
+            q[..., firstDofs[floating][:, None] + numpy.arange(3, 6)] = rotationAxes * angles[..., None]
+        return q
+
+    #Motion (4, 4) that a joint performs, within its limits, for a motion (4, 4) set by the user
+    #Returns the motion and True if a joint value was clamped to a limit.
+    def constrainJointMotion(self, jointIndex, motion):
+        joints = [jointIndex]
+        q = self.jointValuesFromMotions(numpy.asarray(motion, dtype=numpy.float64)[None], joints)
+        dofs = self.jointDofs(jointIndex)
+        values = q[dofs]
+        q[dofs] = numpy.clip(values, self.lowerLimits[dofs], self.upperLimits[dofs])
+        return self.jointMotions(q, joints)[0], bool(numpy.any(q[dofs] != values))
+
+    #Clamps joint values to the URDF limits, returns clamped values and a mask of clamped entries
+    def clampJointValues(self, q):
+        q = numpy.asarray(q, dtype=numpy.float64)
+        clamped = numpy.clip(q, self.lowerLimits, self.upperLimits)
+        return clamped, clamped != q
+
+    #Link to robot transforms (..., linkCount, 4, 4) for joint values (..., dofCount), mimic joints follow their drivers
+    #Motions can be given instead of joint values, e.g., matrices read from the joint transform nodes.
+    def linkTransforms(self, q=None, motions=None):
+        if motions is None:
+            if q is None:
+                q = self.zeroConfiguration()
+            motions = self.jointMotions(self.applyMimicJoints(q))
+        batchShape = motions.shape[:-3]
+        transforms = numpy.empty(batchShape + (len(self.linkNames), 4, 4))
+        transforms[...] = numpy.eye(4)
+        jointToChild = self.jointOrigins @ motions
+        for jointIndex in self.jointOrder:
+            transforms[..., self.jointChildren[jointIndex], :, :] = (
+                transforms[..., self.jointParents[jointIndex], :, :] @ jointToChild[..., jointIndex, :, :])
+        return transforms
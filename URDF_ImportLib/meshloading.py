@@ -0,0 +1,175 @@
+import concurrent.futures
+import os
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from URDF_ImportLib.meshreaders import STREAMING_READERS
+
+
+# Cell array of merged meshes that holds the position of the source mesh in the merged mesh list
+LINK_INDEX_ARRAY_NAME = "LinkIndex"
+
+# VTK readers by (lowercase) mesh file extension, used for formats and variants the streaming readers do not handle
+MESH_READERS = {
+    ".stl": vtk.vtkSTLReader,
+    ".obj": vtk.vtkOBJReader,
+    ".ply": vtk.vtkPLYReader,
+    ".vtp": vtk.vtkXMLPolyDataReader,
+    ".vtk": vtk.vtkPolyDataReader,
+}
+
+
+#Reads a mesh file into a new vtkPolyData. The mesh is scaled by scale (URDF <mesh scale="">) first,
+#then transformed by transform (vtkTransform), if given.
+def readMeshFile(path, transform=None, scale=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in STREAMING_READERS and extension not in MESH_READERS:
+        raise ValueError(f"Unsupported mesh file format {extension}")
+    output = None
+    if extension in STREAMING_READERS:
+        output = STREAMING_READERS[extension](path)
+    if output is None:
+        if extension not in MESH_READERS:
+            raise ValueError(f"No mesh could be read from {path}")
+        reader = MESH_READERS[extension]()
+        reader.SetFileName(path)
+        reader.Update()
+        output = reader.GetOutput()
+    if output.GetNumberOfPoints() == 0:
+        raise ValueError(f"No mesh could be read from {path}")
+
+    if transform is not None or scale is not None:
+        meshTransform = vtk.vtkTransform()
+        if transform is not None:
+            meshTransform.Concatenate(transform)
+        if scale is not None:
+            meshTransform.Scale(scale)
+        transformFilter = vtk.vtkTransformPolyDataFilter()
+        transformFilter.SetInputData(output)
+        transformFilter.SetTransform(meshTransform)
+        transformFilter.Update()
+        output = transformFilter.GetOutput()
+    polyData = vtk.vtkPolyData()
+    polyData.ShallowCopy(output)
+    return polyData
+
+
+#Key of a mesh file read with a URDF mesh scale in a mesh cache
+def meshCacheKey(path, scale=None):
+    return (path, None if scale is None else tuple(scale))
+
+
+#Reads a mesh file like readMeshFile unless meshCache (meshCacheKey -> vtkPolyData, or the error raised when reading
+#it) already holds it. Cached meshes are copied, because several links can use the same mesh and they are modified in place.
+def readCachedMeshFile(meshCache, path, transform=None, scale=None):
+    mesh = meshCache.get(meshCacheKey(path, scale)) if meshCache else None
+    if mesh is None:
+        return readMeshFile(path, transform, scale)
+    if isinstance(mesh, Exception):
+        raise mesh
+    if transform is not None:
+        transformFilter = vtk.vtkTransformPolyDataFilter()
+        transformFilter.SetInputData(mesh)
+        transformFilter.SetTransform(transform)
+        transformFilter.Update()
+        return transformFilter.GetOutput()
+    polyData = vtk.vtkPolyData()
+    polyData.DeepCopy(mesh)
+    return polyData
+
+
+#Appends meshes into one vtkPolyData. The LinkIndex cell array of the result holds the position
+#of the mesh each cell comes from in the meshes list.
+def mergeMeshes(meshes):
+    appendFilter = vtk.vtkAppendPolyData()
+    for meshIndex, mesh in enumerate(meshes):
+        taggedMesh = vtk.vtkPolyData()
+        taggedMesh.ShallowCopy(mesh)
+        linkIndices = numpy_support.numpy_to_vtk(numpy.full(mesh.GetNumberOfCells(), meshIndex, dtype=numpy.int32), deep=True)
+        linkIndices.SetName(LINK_INDEX_ARRAY_NAME)
+        taggedMesh.GetCellData().AddArray(linkIndices)
+        appendFilter.AddInputData(taggedMesh)
+    appendFilter.Update()
+    return appendFilter.GetOutput()
+
+
+#Bounds (xmin, xmax, ymin, ymax, zmin, zmax) of a binary STL file read without building a mesh,
+#None if the file is not a binary STL
+def meshFileBounds(path):
+    if os.path.splitext(path)[1].lower() != ".stl":
+        return None
+    size = os.path.getsize(path)
+    if size < 84:
+        return None
+    with open(path, "rb") as stlFile:
+        stlFile.seek(80)
+        triangleCount = int(numpy.frombuffer(stlFile.read(4), dtype="<u4")[0])
+    if triangleCount == 0 or size != 84 + 50 * triangleCount:
+        # ASCII STL
+        return None
+    records = numpy.memmap(path, dtype=[("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")],
+                           mode="r", offset=84, shape=(triangleCount,))
+    vertices = records["vertices"].reshape(-1, 3)
+    lower = vertices.min(axis=0)
+    upper = vertices.max(axis=0)
+    return (float(lower[0]), float(upper[0]), float(lower[1]), float(upper[1]), float(lower[2]), float(upper[2]))
+
+
+#Box shown in place of a link mesh while the mesh is loading, bounds are scaled by the URDF mesh scale, if given
+def placeholderPolyData(bounds=None, size=0.02, scale=None):
+    if bounds is None:
+        bounds = (-size / 2, size / 2, -size / 2, size / 2, -size / 2, size / 2)
+    elif scale is not None:
+        bounds = [value for axis in range(3) for value in sorted([bounds[2 * axis] * scale[axis], bounds[2 * axis + 1] * scale[axis]])]
+    cube = vtk.vtkCubeSource()
+    cube.SetBounds(bounds)
+    cube.Update()
+    return cube.GetOutput()
+
+
+class BackgroundMeshLoader:
+    """Reads mesh files on worker threads.
+
+    Only file reading and polydata processing happen on the workers; the caller collects finished
+    meshes with takeCompleted() on the main thread and is responsible for putting them in the scene.
+    """
+
+    def __init__(self, maxWorkers=None):
+        self.maxWorkers = maxWorkers or min(8, (os.cpu_count() or 2))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="URDFMeshLoader")
+        self._futures = {}
+
+    @property
+    def inFlight(self):
+        return len(self._futures)
+
+    def submit(self, key, path, transform=None, scale=None):
+        self._futures[key] = self._executor.submit(readMeshFile, path, transform, scale)
+
+    #Returns list of (key, polyData, error) for meshes that finished since the last call
+    def takeCompleted(self):
+        completed = []
+        for key, future in list(self._futures.items()):
+            if not future.done():
+                continue
+            del self._futures[key]
+            try:
+                completed.append((key, future.result(), None))
+            except Exception as error:
+                completed.append((key, None, error))
+        return completed
+
+    #Blocks until all submitted meshes are read
+    def wait(self):
+        concurrent.futures.wait(list(self._futures.values()))
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,294 @@
+"""Mesh file readers that fill numpy arrays in chunks and hand them to VTK without per-point Python work.
+
+Each reader returns a triangle vtkPolyData, or None if the file uses a variant that the reader does not
+handle (ASCII STL/PLY, non-triangle PLY faces, relative OBJ indices); callers then fall back to the
+generic VTK readers. Points are not merged, which keeps reading linear in the file size.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+
+# Number of records (triangles, vertices or faces) read per chunk
+CHUNK_RECORDS = 1 << 18
+# Number of bytes of text read per chunk
+CHUNK_BYTES = 1 << 24
+
+
+#Wraps points (n, 3) and triangle indices (m, 3) into a vtkPolyData, the arrays are referenced, not copied
+def polyDataFromArrays(points, triangles):
+    points = numpy.ascontiguousarray(points, dtype=numpy.float32).reshape(-1, 3)
+    indexType = numpy.int32 if len(points) < 2**31 and triangles.size < 2**31 else numpy.int64
+    connectivity = numpy.ascontiguousarray(triangles, dtype=indexType).reshape(-1)
+    offsets = numpy.arange(0, connectivity.size + 1, 3, dtype=indexType)
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_support.numpy_to_vtk(points, deep=False))
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtk(offsets, deep=False), numpy_support.numpy_to_vtk(connectivity, deep=False))
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vtkPoints)
+    polyData.SetPolys(cells)
+    return polyData
+
+
+_STL_RECORD = numpy.dtype([("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+
+
+def readBinarySTL(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as stlFile:
+        stlFile.seek(80)
+        header = stlFile.read(4)
+        if len(header) < 4:
+            return None
+        triangleCount = int(numpy.frombuffer(header, dtype="<u4")[0])
+        if size != 84 + _STL_RECORD.itemsize * triangleCount:
+            # ASCII STL
+            return None
+        points = numpy.empty((triangleCount * 3, 3), dtype=numpy.float32)
+        for start in range(0, triangleCount, CHUNK_RECORDS):
+            records = numpy.fromfile(stlFile, dtype=_STL_RECORD, count=min(CHUNK_RECORDS, triangleCount - start))
+            points[start * 3:(start + len(records)) * 3] = records["vertices"].reshape(-1, 3)
+    return polyDataFromArrays(points, numpy.arange(triangleCount * 3).reshape(-1, 3))
+
+
+_PLY_TYPES = {"char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1", "short": "i2", "int16": "i2",
+              "ushort": "u2", "uint16": "u2", "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+              "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"}
+
+
+def readBinaryPLY(path):
+    with open(path, "rb") as plyFile:
+        if plyFile.readline().strip() != b"ply":
+            return None
+        byteOrder = None
+        elements = []
+        while True:
+            line = plyFile.readline()
+            if not line:
+                return None
+            words = line.decode("ascii", "replace").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                byteOrder = {"binary_little_endian": "<", "binary_big_endian": ">"}.get(words[1])
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                elements[-1][2].append(words[1:])
+        if byteOrder is None:
+            # ASCII PLY
+            return None
+
+        points = None
+        triangles = None
+        for name, count, properties in elements:
+            if name == "face":
+                if len(properties) != 1 or properties[0][0] != "list":
+                    return None
+                countType, indexType = _PLY_TYPES[properties[0][1]], _PLY_TYPES[properties[0][2]]
+                faceRecord = numpy.dtype([("count", byteOrder + countType), ("indices", byteOrder + indexType, 3)])
+                triangles = numpy.empty((count, 3), dtype=numpy.int64)
+                for start in range(0, count, CHUNK_RECORDS):
+                    records = numpy.fromfile(plyFile, dtype=faceRecord, count=min(CHUNK_RECORDS, count - start))
+                    if len(records) == 0 or numpy.any(records["count"] != 3):
+                        # polygons or truncated file, fixed-size records cannot be used
+                        return None
+                    triangles[start:start + len(records)] = records["indices"]
+            else:
+                if any(prop[0] == "list" for prop in properties):
+                    return None
+                record = numpy.dtype([(prop[1], byteOrder + _PLY_TYPES[prop[0]]) for prop in properties])
+                if name != "vertex":
+                    plyFile.seek(record.itemsize * count, os.SEEK_CUR)
+                    continue
+                points = numpy.empty((count, 3), dtype=numpy.float32)
+                for start in range(0, count, CHUNK_RECORDS):
+                    records = numpy.fromfile(plyFile, dtype=record, count=min(CHUNK_RECORDS, count - start))
+                    for axis, coordinate in enumerate("xyz"):
+                        points[start:start + len(records), axis] = records[coordinate]
+    if points is None or triangles is None:
+        return None
+    return polyDataFromArrays(points, triangles)
+
+
+_OBJ_VERTEX = re.compile(rb"^v[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)", re.M)
+_OBJ_FACE = re.compile(rb"^f[ \t]+([^\r\n]*)", re.M)
+_OBJ_INDEX_SUFFIX = re.compile(rb"/\S*")
+
+
+def readOBJ(path):
+    vertexChunks = []
+    triangleChunks = []
+    with open(path, "rb") as objFile:
+        remainder = b""
+        while True:
+            data = objFile.read(CHUNK_BYTES)
+            block = remainder + data
+            if data:
+                # only parse complete lines, the rest is kept for the next chunk
+                cut = block.rfind(b"\n") + 1
+                block, remainder = block[:cut], block[cut:]
+            vertices = _OBJ_VERTEX.findall(block)
+            if vertices:
+                vertexChunks.append(numpy.array(vertices, dtype=numpy.float32))
+            faces = _OBJ_FACE.findall(block)
+            if faces:
+                lines = _OBJ_INDEX_SUFFIX.sub(b"", b"\n".join(faces)).split(b"\n")
+                indices = numpy.array(b" ".join(lines).split(), dtype=numpy.int64)
+                if numpy.any(indices < 0):
+                    # relative indices depend on the position of the face in the file
+                    return None
+                if len(indices) == 3 * len(lines):
+                    triangleChunks.append(indices.reshape(-1, 3) - 1)
+                else:
+                    # polygons, triangulated as fans
+                    fans = []
+                    for line in lines:
+                        polygon = [int(index) - 1 for index in line.split()]
+                        fans.extend([polygon[0], polygon[i], polygon[i + 1]] for i in range(1, len(polygon) - 1))
+                    triangleChunks.append(numpy.array(fans, dtype=numpy.int64).reshape(-1, 3))
+            if not data:
+                break
+    if not vertexChunks or not triangleChunks:
+        return None
+    return polyDataFromArrays(numpy.concatenate(vertexChunks), numpy.concatenate(triangleChunks))
+
+
+#4x4 matrix of the transform elements (matrix, translate, rotate, scale) of a COLLADA <node>
+def _colladaNodeMatrix(node, namespace):
+    matrix = numpy.eye(4)
+    for element in node:
+        tag = element.tag[len(namespace):]
+        values = [float(x) for x in (element.text or "").split()]
+        step = numpy.eye(4)
+        if tag == "matrix":
+            step = numpy.array(values).reshape(4, 4)
+        elif tag == "translate":
+            step[:3, 3] = values
+        elif tag == "scale":
+            step[:3, :3] = numpy.diag(values)
+        elif tag == "rotate":
+            axis = numpy.array(values[:3]) / numpy.linalg.norm(values[:3])
+            angle = numpy.radians(values[3])
+            skew = numpy.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+            step[:3, :3] = numpy.eye(3) + numpy.sin(angle) * skew + (1 - numpy.cos(angle)) * skew @ skew
+        else:
+            continue
+        matrix = matrix @ step
+    return matrix
+
+
+#Points and triangles of each primitive of a COLLADA <geometry>
+def _colladaGeometry(geometry, namespace):
+    mesh = geometry.find(namespace + "mesh")
+    if mesh is None:
+        return []
+    sources = {}
+    for source in mesh.findall(namespace + "source"):
+        floatArray = source.find(namespace + "float_array")
+        accessor = source.find(namespace + "technique_common/" + namespace + "accessor")
+        stride = int(accessor.get("stride", "3")) if accessor is not None else 3
+        values = numpy.array((floatArray.text or "").split(), dtype=numpy.float64)
+        sources[source.get("id")] = values.reshape(-1, stride)[:, :3]
+    vertices = mesh.find(namespace + "vertices")
+    for vertexInput in vertices.findall(namespace + "input"):
+        if vertexInput.get("semantic") == "POSITION":
+            sources[vertices.get("id")] = sources[vertexInput.get("source").lstrip("#")]
+
+    parts = []
+    for primitive in mesh:
+        tag = primitive.tag[len(namespace):]
+        if tag not in ("triangles", "polylist", "polygons"):
+            continue
+        inputs = primitive.findall(namespace + "input")
+        stride = max(int(primitiveInput.get("offset", "0")) for primitiveInput in inputs) + 1
+        vertexInput = [primitiveInput for primitiveInput in inputs if primitiveInput.get("semantic") == "VERTEX"][0]
+        points = sources[vertexInput.get("source").lstrip("#")]
+        vertexOffset = int(vertexInput.get("offset", "0"))
+        polygons = primitive.findall(namespace + "p")
+        indices = numpy.array(" ".join(p.text or "" for p in polygons).split(), dtype=numpy.int64)
+        indices = indices.reshape(-1, stride)[:, vertexOffset]
+        if tag == "triangles":
+            triangles = indices.reshape(-1, 3)
+        else:
+            if tag == "polylist":
+                counts = numpy.array(primitive.findtext(namespace + "vcount").split(), dtype=numpy.int64)
+            else:
+                counts = numpy.array([len((p.text or "").split()) // stride for p in polygons], dtype=numpy.int64)
+            starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+            # fan triangulation: (start, start + i, start + i + 1) for i in 1 .. count - 2
+            fanCounts = numpy.maximum(counts - 2, 0)
+            fanStarts = numpy.repeat(starts, fanCounts)
+            fanSteps = numpy.arange(fanCounts.sum()) - numpy.repeat(numpy.cumsum(fanCounts) - fanCounts, fanCounts) + 1
+            triangles = numpy.stack([indices[fanStarts], indices[fanStarts + fanSteps], indices[fanStarts + fanSteps + 1]], axis=1)
+        parts.append((points, triangles))
+    return parts
+
+
+def readCOLLADA(path):
+    root = ET.parse(path).getroot()
+    namespace = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+    geometries = {geometry.get("id"): geometry for geometry in root.iter(namespace + "geometry")}
+    libraryNodes = {node.get("id"): node for node in root.iterfind(f"{namespace}library_nodes/{namespace}node")}
+
+    # Geometry instances with their world matrix from the visual scene, or all geometries if there is no scene
+    instances = []
+    def collect(node, parentMatrix):
+        matrix = parentMatrix @ _colladaNodeMatrix(node, namespace)
+        for instance in node.findall(namespace + "instance_geometry"):
+            instances.append((instance.get("url").lstrip("#"), matrix))
+        for instance in node.findall(namespace + "instance_node"):
+            referenced = libraryNodes.get(instance.get("url").lstrip("#"))
+            if referenced is not None:
+                collect(referenced, matrix)
+        for child in node.findall(namespace + "node"):
+            collect(child, matrix)
+    scene = root.find(f"{namespace}library_visual_scenes/{namespace}visual_scene")
+    if scene is not None:
+        for node in scene.findall(namespace + "node"):
+            collect(node, numpy.eye(4))
+    else:
+        instances = [(geometryId, numpy.eye(4)) for geometryId in geometries]
+
+    # Unit and up axis conversion into a Z-up, unscaled frame
+    rootMatrix = numpy.eye(4)
+    unit = root.find(f"{namespace}asset/{namespace}unit")
+    if unit is not None:
+        rootMatrix[:3, :3] *= float(unit.get("meter", "1"))
+    upAxis = (root.findtext(f"{namespace}asset/{namespace}up_axis") or "Y_UP").strip()
+    if upAxis == "Y_UP":
+        rootMatrix = rootMatrix @ numpy.array([[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, 0], [0, 0, 0, 1]])
+    elif upAxis == "X_UP":
+        rootMatrix = rootMatrix @ numpy.array([[0, -1, 0, 0], [0, 0, -1, 0], [1, 0, 0, 0], [0, 0, 0, 1]])
+
+    allPoints = []
+    allTriangles = []
+    pointCount = 0
+    for geometryId, matrix in instances:
+        if geometryId not in geometries:
+            continue
+        matrix = rootMatrix @ matrix
+        for points, triangles in _colladaGeometry(geometries[geometryId], namespace):
+            allPoints.append(points @ matrix[:3, :3].T + matrix[:3, 3])
+            allTriangles.append(triangles + pointCount)
+            pointCount += len(points)
+    if not allPoints:
+        return None
+    return polyDataFromArrays(numpy.concatenate(allPoints), numpy.concatenate(allTriangles))
+
+
+# Streaming readers by (lowercase) mesh file extension
+STREAMING_READERS = {
+    ".stl": readBinarySTL,
+    ".ply": readBinaryPLY,
+    ".obj": readOBJ,
+    ".dae": readCOLLADA,
+}
@@ -0,0 +1,87 @@
+import os
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+
+# Directories that are never searched for packages
+_SKIPPED_DIRECTORIES = {".git", "__pycache__", "build", "devel", "install", "log"}
+
+
+class PackageIndex:
+    """Maps ROS package names to directories.
+
+    Packages are directories that contain a package.xml file. They are searched below the given
+    root directories and the directories listed in the ROS_PACKAGE_PATH environment variable, down
+    to maxDepth levels. The search only runs the first time a package is looked up.
+    """
+
+    def __init__(self, roots=(), maxDepth=4, useEnvironment=True):
+        self.roots = [root for root in roots if root]
+        if useEnvironment:
+            self.roots += [path for path in os.environ.get("ROS_PACKAGE_PATH", "").split(os.pathsep) if path]
+        self.maxDepth = maxDepth
+        self._packages = None
+
+    @property
+    def packages(self):
+        if self._packages is None:
+            self._packages = {}
+            for root in self.roots:
+                self._scan(os.path.abspath(root), 0)
+        return self._packages
+
+    def _scan(self, directory, depth):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        if any(entry.name == "package.xml" and entry.is_file() for entry in entries):
+            self._packages.setdefault(self._packageName(directory), directory)
+            # packages are not nested
+            return
+        if depth >= self.maxDepth:
+            return
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name not in _SKIPPED_DIRECTORIES:
+                self._scan(entry.path, depth + 1)
+
+    @staticmethod
+    def _packageName(directory):
+        try:
+            name = ET.parse(os.path.join(directory, "package.xml")).getroot().findtext("name")
+            if name:
+                return name.strip()
+        except ET.ParseError:
+            pass
+        return os.path.basename(directory)
+
+    def find(self, packageName):
+        return self.packages.get(packageName)
+
+
+#Returns the local file path of a URDF mesh filename, which can be a package:// or file:// URI or
+#a path relative to meshFolder. Raises FileNotFoundError if the file does not exist.
+def resolveMeshPath(filename, meshFolder, packageIndex=None):
+    uri = urllib.parse.urlparse(filename)
+    candidates = []
+    if uri.scheme == "package":
+        packageName = uri.netloc
+        relativePath = urllib.parse.unquote(uri.path).lstrip("/")
+        if packageIndex is not None and packageIndex.find(packageName):
+            candidates.append(os.path.join(packageIndex.find(packageName), relativePath))
+        # The meshes folder is often the package directory itself, its parent, or the folder of the meshes
+        candidates.append(os.path.join(meshFolder, packageName, relativePath))
+        candidates.append(os.path.join(meshFolder, relativePath))
+        candidates.append(os.path.join(meshFolder, os.path.basename(relativePath)))
+    elif uri.scheme == "file":
+        candidates.append(urllib.request.url2pathname(uri.netloc + uri.path))
+    elif os.path.isabs(filename):
+        candidates.append(filename)
+    else:
+        candidates.append(meshFolder + '/' + filename)
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    raise FileNotFoundError(f"Mesh {filename} not found (looked for {', '.join(candidates)})")
@@ -0,0 +1,392 @@
+"""Sampling-based motion planning for a RobotModel.
+
+Links are approximated by spheres fitted to their meshes. A configuration is in collision if spheres
+of two links that may not touch overlap, or if a sphere is closer to the anatomy (a DistanceField)
+than its radius plus a margin. Configurations are checked in batches with numpy; CheckerPool splits
+large batches among worker processes. rrtConnect grows two trees towards each other for a single
+query, a Roadmap (PRM) of collision-free configurations and edges is built once per robot and
+environment and answers many queries.
+"""
+
+import concurrent.futures
+import heapq
+import multiprocessing
+
+import numpy
+
+from URDF_ImportLib.kinematics import CONTINUOUS, FLOATING, PLANAR, REVOLUTE
+from URDF_ImportLib.sweptvolume import surfaceSamples
+
+
+# Configurations checked at once, bounds the memory used for sphere pair distances
+CHECK_CHUNK_SIZE = 256
+
+
+#Spheres (centers (k, 3), radii (k,)) covering a mesh with points (n, 3) and triangles (m, 3)
+#Surface samples are grouped in cubic cells of size cellSize and each group is covered by a sphere around its centroid.
+def sphereApproximation(points, triangles, cellSize):
+    samples = surfaceSamples(points, triangles, cellSize / 4)
+    _, groups = numpy.unique(numpy.floor(samples / cellSize).astype(numpy.int64), axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    counts = numpy.bincount(groups)
+    centers = numpy.zeros((len(counts), 3))
+    numpy.add.at(centers, groups, samples)
+    centers /= counts[:, None]
+    radii = numpy.zeros(len(counts))
+    numpy.maximum.at(radii, groups, numpy.linalg.norm(samples - centers[groups], axis=1))
+    return centers, radii
+
+
+#Lower and upper joint values (dofCount,) to sample configurations from: the joint limits, with unlimited rotations
+#limited to [-pi, pi] and unlimited translations to [-translationRange, translationRange]
+def samplingBounds(model, translationRange=1.0):
+    rotations = numpy.zeros(model.dofCount, dtype=bool)
+    for jointIndex, jointType in enumerate(model.jointTypes):
+        dofs = model.jointDofs(jointIndex)
+        if jointType in (REVOLUTE, CONTINUOUS):
+            rotations[dofs] = True
+        elif jointType == FLOATING:
+            rotations[dofs[3:]] = True
+        elif jointType == PLANAR:
+            rotations[dofs[2]] = True
+    unlimited = numpy.where(rotations, numpy.pi, translationRange)
+    lower = numpy.where(numpy.isfinite(model.lowerLimits), model.lowerLimits, -unlimited)
+    upper = numpy.where(numpy.isfinite(model.upperLimits), model.upperLimits, unlimited)
+    return lower, upper
+
+
+class CollisionChecker:
+    """Self-collision and anatomy collision test of batches of configurations.
+
+    linkSpheres maps link indices to (centers (k, 3), radii (k,)) in link coordinates. Links of one
+    rigid body, links of rigid bodies connected by a joint and links that already touch at the zero configuration
+    are not checked against each other. distanceField is in world coordinates, robotToWorld (4, 4)
+    maps robot to world coordinates and margin is the clearance (in world units) that is required
+    between links and from the anatomy.
+    """
+
+    def __init__(self, model, linkSpheres, distanceField=None, robotToWorld=None, margin=0.0):
+        self.model = model
+        self.distanceField = distanceField
+        self.robotToWorld = numpy.eye(4) if robotToWorld is None else numpy.asarray(robotToWorld, dtype=numpy.float64)
+        self.margin = margin
+        self.scale = float(numpy.cbrt(abs(numpy.linalg.det(self.robotToWorld[:3, :3]))))
+        linkIndices = sorted(linkSpheres)
+        if not linkIndices:
+            raise ValueError("No link spheres to check for collisions")
+        self.sphereLinks = numpy.concatenate([numpy.full(len(linkSpheres[linkIndex][1]), linkIndex) for linkIndex in linkIndices])
+        self.centers = numpy.concatenate([linkSpheres[linkIndex][0] for linkIndex in linkIndices]).astype(numpy.float64)
+        self.radii = numpy.concatenate([linkSpheres[linkIndex][1] for linkIndex in linkIndices]).astype(numpy.float64)
+
+        # a bounding sphere per link: the spheres of two links are only compared if the bounding spheres of the links overlap
+        self.linkIndices = numpy.array(linkIndices)
+        self.boundCenters = numpy.array([linkSpheres[linkIndex][0].mean(axis=0) for linkIndex in linkIndices]).reshape(-1, 3)
+        self.boundRadii = numpy.array([numpy.max(numpy.linalg.norm(linkSpheres[linkIndex][0] - center, axis=1) + linkSpheres[linkIndex][1])
+                                       for linkIndex, center in zip(linkIndices, self.boundCenters)])
+
+        bodyLinks, _ = model.rigidBodies()
+        connectedBodies = {frozenset((bodyLinks[parent], bodyLinks[child])) for parent, child in zip(model.jointParents, model.jointChildren)}
+        linkPairs = [(first, second) for position, first in enumerate(linkIndices) for second in linkIndices[position + 1:]
+                     if bodyLinks[first] != bodyLinks[second] and frozenset((bodyLinks[first], bodyLinks[second])) not in connectedBodies]
+        self._setLinkPairs(linkPairs)
+        # links that touch in the zero configuration are assumed to be designed to touch
+        touching, _ = self._touchingPairs(model.applyMimicJoints(model.zeroConfiguration())[None])
+        self._setLinkPairs([pair for pair, touches in zip(linkPairs, touching[0]) if not touches])
+
+    def _setLinkPairs(self, linkPairs):
+        self.linkPairs = linkPairs
+        positions = {linkIndex: position for position, linkIndex in enumerate(self.linkIndices)}
+        self._pairLinks = numpy.array([(positions[first], positions[second]) for first, second in linkPairs], dtype=numpy.int64).reshape(-1, 2)
+        # the margin is in world units, distances are compared squared in robot units
+        margin = self.margin / self.scale
+        self._pairBoundDistances = (self.boundRadii[self._pairLinks[:, 0]] + self.boundRadii[self._pairLinks[:, 1]] + margin) ** 2
+        # sphere indices of the first and second link of each sphere pair and the squared distance of their centers below which they touch
+        self._pairSpheres = []
+        for first, second in linkPairs:
+            firstSpheres = numpy.nonzero(self.sphereLinks == first)[0]
+            secondSpheres = numpy.nonzero(self.sphereLinks == second)[0]
+            sphereA = numpy.repeat(firstSpheres, len(secondSpheres))
+            sphereB = numpy.tile(secondSpheres, len(firstSpheres))
+            self._pairSpheres.append((sphereA, sphereB, (self.radii[sphereA] + self.radii[sphereB] + margin) ** 2))
+
+    #Whether each checked link pair touches (N, pairCount) in configurations (N, dofCount), and the sphere centers (N, S, 3)
+    #in robot coordinates
+    def _touchingPairs(self, q):
+        linkTransforms = self.model.linkTransforms(q)
+        sphereTransforms = linkTransforms[:, self.sphereLinks]
+        centers = numpy.einsum("nsij,sj->nsi", sphereTransforms[..., :3, :3], self.centers) + sphereTransforms[..., :3, 3]
+        touching = numpy.zeros((len(q), len(self.linkPairs)), dtype=bool)
+        if not self.linkPairs:
+            return touching, centers
+        boundTransforms = linkTransforms[:, self.linkIndices]
+        boundCenters = numpy.einsum("nlij,lj->nli", boundTransforms[..., :3, :3], self.boundCenters) + boundTransforms[..., :3, 3]
+        offsets = boundCenters[:, self._pairLinks[:, 0]] - boundCenters[:, self._pairLinks[:, 1]]
+        candidates = numpy.einsum("npk,npk->np", offsets, offsets) < self._pairBoundDistances
+        for pairIndex in numpy.nonzero(candidates.any(axis=0))[0]:
+            configurations = numpy.nonzero(candidates[:, pairIndex])[0]
+            sphereA, sphereB, contactDistances = self._pairSpheres[pairIndex]
+            offsets = centers[configurations[:, None], sphereA] - centers[configurations[:, None], sphereB]
+            touching[configurations, pairIndex] = numpy.any(numpy.einsum("nsk,nsk->ns", offsets, offsets) < contactDistances, axis=1)
+        return touching, centers
+
+    #Collision flags (N,) of configurations (N, dofCount), mimic joint values are set from their drivers
+    def inCollision(self, q):
+        q = self.model.applyMimicJoints(numpy.atleast_2d(numpy.asarray(q, dtype=numpy.float64)))
+        colliding = numpy.zeros(len(q), dtype=bool)
+        for chunkStart in range(0, len(q), CHECK_CHUNK_SIZE):
+            chunk = q[chunkStart:chunkStart + CHECK_CHUNK_SIZE]
+            touching, centers = self._touchingPairs(chunk)
+            chunkColliding = touching.any(axis=1)
+            if self.distanceField is not None:
+                worldCenters = centers @ self.robotToWorld[:3, :3].T + self.robotToWorld[:3, 3]
+                clearances = self.distanceField.distances(worldCenters.reshape(-1, 3)).reshape(len(chunk), -1)
+                chunkColliding |= numpy.any(clearances < self.radii * self.scale + self.margin, axis=1)
+            colliding[chunkStart:chunkStart + CHECK_CHUNK_SIZE] = chunkColliding
+        return colliding
+
+
+# Set by _initializeWorker in worker processes
+_workerChecker = None
+
+
+def _initializeWorker(checker):
+    global _workerChecker
+    _workerChecker = checker
+
+
+def _checkChunk(q):
+    return _workerChecker.inCollision(q)
+
+
+class CheckerPool:
+    """Runs the inCollision checks of a CollisionChecker on worker processes.
+
+    Batches smaller than minBatch, and all batches if there is only one worker, are checked in this
+    process. Use as a context manager or call close() to stop the workers.
+    """
+
+    def __init__(self, checker, workers=None, minBatch=4 * CHECK_CHUNK_SIZE):
+        self.checker = checker
+        self.model = checker.model
+        self.workers = workers or multiprocessing.cpu_count() or 1
+        self.minBatch = minBatch
+        self._executor = None
+        if self.workers > 1:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                                    initializer=_initializeWorker, initargs=(checker,))
+
+    def inCollision(self, q):
+        q = numpy.atleast_2d(numpy.asarray(q, dtype=numpy.float64))
+        if self._executor is None or len(q) < self.minBatch:
+            return self.checker.inCollision(q)
+        chunkSize = -(-len(q) // self.workers)
+        chunks = [q[chunkStart:chunkStart + chunkSize] for chunkStart in range(0, len(q), chunkSize)]
+        return numpy.concatenate(list(self._executor.map(_checkChunk, chunks)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+
+#Collision flags (E,) of the straight edges between configurations starts (E, dofCount) and ends (E, dofCount)
+#The edges are sampled so that no joint value changes by more than checkStep between samples, all samples of all
+#edges are checked in one batch. The end configurations are not checked.
+def edgesInCollision(checker, starts, ends, checkStep):
+    starts = numpy.atleast_2d(starts)
+    ends = numpy.atleast_2d(ends)
+    if len(starts) == 0:
+        return numpy.zeros(0, dtype=bool)
+    sampleCounts = numpy.maximum(numpy.ceil(numpy.abs(ends - starts).max(axis=1) / checkStep).astype(numpy.int64), 1)
+    edges = numpy.repeat(numpy.arange(len(starts)), sampleCounts)
+    fractions = numpy.concatenate([numpy.arange(count) / count for count in sampleCounts])
+    samples = starts[edges] + fractions[:, None] * (ends[edges] - starts[edges])
+    colliding = numpy.zeros(len(starts), dtype=bool)
+    colliding[edges[checker.inCollision(samples)]] = True
+    return colliding
+
+
+#Configurations reached from start moving towards target in steps of at most stepSize (largest joint change) until
+#the target or a collision is reached, (K, dofCount) with K = 0 if the first step collides
+def _steer(checker, start, target, stepSize, checkStep, maxSteps=None):
+    stepCount = max(1, int(numpy.ceil(numpy.abs(target - start).max() / stepSize)))
+    if maxSteps is not None:
+        stepCount = min(stepCount, maxSteps)
+        target = start + (target - start) * min(1.0, stepCount * stepSize / max(numpy.abs(target - start).max(), 1e-12))
+    waypoints = start + numpy.linspace(0, 1, stepCount + 1)[1:, None] * (target - start)
+    blocked = edgesInCollision(checker, numpy.vstack([start, waypoints[:-1]]), waypoints, checkStep) | checker.inCollision(waypoints)
+    firstBlocked = numpy.argmax(blocked) if numpy.any(blocked) else len(waypoints)
+    return waypoints[:firstBlocked]
+
+
+#Plans a path from start to goal (dofCount,) with RRT-Connect: two trees grow from the start and the goal towards random
+#configurations within bounds (lower, upper) and towards each other. Returns configurations (K, dofCount) from start to
+#goal, None if no path is found within maxIterations.
+def rrtConnect(checker, start, goal, bounds, stepSize=0.2, checkStep=0.02, maxIterations=2000, rng=None):
+    rng = numpy.random.default_rng(rng)
+    start = numpy.asarray(start, dtype=numpy.float64)
+    goal = numpy.asarray(goal, dtype=numpy.float64)
+    if checker.inCollision(numpy.vstack([start, goal])).any():
+        return None
+    if not edgesInCollision(checker, start, goal, checkStep)[0]:
+        return numpy.vstack([start, goal])
+    lower, upper = bounds
+    # configurations and parent indices of the start and goal trees
+    trees = [([start], [-1]), ([goal], [-1])]
+    for iteration in range(maxIterations):
+        growing, other = trees[iteration % 2], trees[(iteration + 1) % 2]
+        sample = rng.uniform(lower, upper)
+        nearest = int(numpy.argmin(numpy.abs(numpy.asarray(growing[0]) - sample).max(axis=1)))
+        reached = _steer(checker, growing[0][nearest], sample, stepSize, checkStep, maxSteps=1)
+        if len(reached) == 0:
+            continue
+        growing[0].append(reached[-1])
+        growing[1].append(nearest)
+        newNode = reached[-1]
+        # connect the other tree to the new configuration as far as possible
+        otherNearest = int(numpy.argmin(numpy.abs(numpy.asarray(other[0]) - newNode).max(axis=1)))
+        reached = _steer(checker, other[0][otherNearest], newNode, stepSize, checkStep)
+        parent = otherNearest
+        for configuration in reached:
+            other[0].append(configuration)
+            other[1].append(parent)
+            parent = len(other[0]) - 1
+        if len(reached) and numpy.allclose(reached[-1], newNode):
+            startTree, goalTree = trees
+            startEnd, goalEnd = (len(growing[0]) - 1, parent) if growing is startTree else (parent, len(growing[0]) - 1)
+            return numpy.vstack(_treePath(startTree, startEnd)[::-1] + _treePath(goalTree, goalEnd)[1:])
+    return None
+
+
+#Configurations from a tree node to the root of the tree
+def _treePath(tree, nodeIndex):
+    configurations, parents = tree
+    path = []
+    while nodeIndex >= 0:
+        path.append(configurations[nodeIndex])
+        nodeIndex = parents[nodeIndex]
+    return path
+
+
+#Shortens a path (K, dofCount) by replacing parts of it with straight collision-free edges
+def shortcutPath(checker, path, checkStep=0.02, iterations=50, rng=None):
+    rng = numpy.random.default_rng(rng)
+    path = numpy.array(path, dtype=numpy.float64)
+    for _ in range(iterations):
+        if len(path) < 3:
+            break
+        first, second = sorted(rng.choice(len(path), 2, replace=False))
+        if second - first < 2:
+            continue
+        if not edgesInCollision(checker, path[first], path[second], checkStep)[0]:
+            path = numpy.vstack([path[:first + 1], path[second:]])
+    return path
+
+
+class Roadmap:
+    """Probabilistic roadmap: collision-free configurations (nodes) and the collision-free straight edges between them.
+
+    A roadmap only holds for the robot and environment it was built for. Start and goal configurations
+    of queries are added to it, so that it grows with use.
+    """
+
+    def __init__(self, nodes, edges, checkStep=0.02):
+        self.nodes = numpy.asarray(nodes, dtype=numpy.float64)
+        # neighbors of each node as {neighbor index: edge length}
+        self.neighbors = [{} for _ in range(len(self.nodes))]
+        for first, second in edges:
+            self._addEdge(first, second)
+        self.checkStep = checkStep
+
+    def _addEdge(self, first, second):
+        length = float(numpy.linalg.norm(self.nodes[first] - self.nodes[second]))
+        self.neighbors[first][second] = length
+        self.neighbors[second][first] = length
+
+    @property
+    def edges(self):
+        return numpy.array([(first, second) for first, neighbors in enumerate(self.neighbors) for second in neighbors if first < second],
+                           dtype=numpy.int64).reshape(-1, 2)
+
+    #Samples nodeCount collision-free configurations within bounds and connects each to up to neighborCount of its
+    #nearest neighbors. All configurations and all candidate edges are checked in one batch each.
+    @classmethod
+    def build(cls, checker, bounds, nodeCount=500, neighborCount=10, checkStep=0.02, rng=None):
+        rng = numpy.random.default_rng(rng)
+        lower, upper = bounds
+        samples = rng.uniform(lower, upper, (nodeCount, len(lower)))
+        roadmap = cls(samples[~checker.inCollision(samples)], [], checkStep)
+        roadmap._connect(checker, numpy.arange(len(roadmap.nodes)), neighborCount)
+        return roadmap
+
+    #Checks and adds the edges from nodes (indices) to their nearest neighbors
+    def _connect(self, checker, nodeIndices, neighborCount):
+        if len(self.nodes) < 2 or len(nodeIndices) == 0:
+            return
+        candidates = set()
+        for chunkStart in range(0, len(nodeIndices), 256):
+            chunk = nodeIndices[chunkStart:chunkStart + 256]
+            distances = numpy.linalg.norm(self.nodes[chunk, None] - self.nodes[None], axis=-1)
+            distances[numpy.arange(len(chunk)), chunk] = numpy.inf
+            nearest = numpy.argsort(distances, axis=1)[:, :neighborCount]
+            for nodeIndex, neighbors in zip(chunk, nearest):
+                candidates.update((min(nodeIndex, neighbor), max(nodeIndex, neighbor)) for neighbor in neighbors
+                                  if neighbor not in self.neighbors[nodeIndex])
+        candidates = numpy.array(sorted(candidates), dtype=numpy.int64).reshape(-1, 2)
+        free = ~edgesInCollision(checker, self.nodes[candidates[:, 0]], self.nodes[candidates[:, 1]], self.checkStep)
+        for first, second in candidates[free]:
+            self._addEdge(first, second)
+
+    #Adds configurations (K, dofCount) that are not in collision as nodes, returns their indices (-1 if in collision)
+    def addNodes(self, checker, configurations, neighborCount=10):
+        configurations = numpy.atleast_2d(configurations)
+        free = ~checker.inCollision(configurations)
+        indices = numpy.full(len(configurations), -1, dtype=numpy.int64)
+        indices[free] = numpy.arange(free.sum()) + len(self.nodes)
+        self.nodes = numpy.vstack([self.nodes, configurations[free]])
+        self.neighbors.extend({} for _ in range(free.sum()))
+        self._connect(checker, indices[free], neighborCount)
+        return indices
+
+    #Node indices of the shortest path between two nodes (Dijkstra), None if they are not connected
+    def shortestPath(self, startIndex, goalIndex):
+        distances = {startIndex: 0.0}
+        previous = {}
+        queue = [(0.0, startIndex)]
+        while queue:
+            distance, nodeIndex = heapq.heappop(queue)
+            if nodeIndex == goalIndex:
+                path = [goalIndex]
+                while path[-1] != startIndex:
+                    path.append(previous[path[-1]])
+                return path[::-1]
+            if distance > distances[nodeIndex]:
+                continue
+            for neighbor, length in self.neighbors[nodeIndex].items():
+                if distance + length < distances.get(neighbor, numpy.inf):
+                    distances[neighbor] = distance + length
+                    previous[neighbor] = nodeIndex
+                    heapq.heappush(queue, (distance + length, neighbor))
+        return None
+
+    #Path (K, dofCount) from start to goal through the roadmap, None if start or goal is in collision or they are not connected
+    def query(self, checker, start, goal, neighborCount=10):
+        startIndex, goalIndex = self.addNodes(checker, numpy.vstack([start, goal]), neighborCount)
+        if startIndex < 0 or goalIndex < 0:
+            return None
+        path = self.shortestPath(startIndex, goalIndex)
+        return None if path is None else self.nodes[path]
+
+    def save(self, path):
+        numpy.savez(path, nodes=self.nodes, edges=self.edges, checkStep=self.checkStep)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as arrays:
+            return cls(arrays["nodes"], arrays["edges"], float(arrays["checkStep"]))
@@ -0,0 +1,95 @@
+import csv
+import math
+
+import numpy
+
+
+#Fixed-capacity ring buffer of the most recent latency samples (in seconds)
+class LatencyRingBuffer:
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.samples = numpy.zeros(capacity, dtype=numpy.float64)
+        self.count = 0
+
+    def append(self, value):
+        self.samples[self.count % self.capacity] = value
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, self.capacity)]
+
+    def percentiles(self, q=(50, 95, 99)):
+        values = self.values()
+        if len(values) == 0:
+            return [math.nan for _ in q]
+        return [float(value) for value in numpy.percentile(values, q)]
+
+    def clear(self):
+        self.count = 0
+
+
+#Call count, clamp count and latency history of one joint observer
+class JointInteractionStatistics:
+    def __init__(self, capacity):
+        self.calls = 0
+        self.clamps = 0
+        self.latency = LatencyRingBuffer(capacity)
+
+
+class JointInteractionProfiler:
+    """Collects per-joint observer latencies and clamp counts.
+
+    Recording a sample is a dictionary lookup and one array store, so the profiler can stay
+    enabled while the user drags joints. Percentiles are only computed when a summary is requested.
+    """
+
+    columns = ["name", "calls", "clamps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.enabled = True
+        self.joints = {}
+        self.render = JointInteractionStatistics(capacity)
+
+    def record(self, jointName, elapsed, clamped=False):
+        if not self.enabled:
+            return
+        statistics = self.joints.get(jointName)
+        if statistics is None:
+            statistics = self.joints[jointName] = JointInteractionStatistics(self.capacity)
+        statistics.calls += 1
+        if clamped:
+            statistics.clamps += 1
+        statistics.latency.append(elapsed)
+
+    # Render time of the 3D view, recorded separately to tell observer cost from rendering cost
+    def recordRender(self, elapsed):
+        if not self.enabled:
+            return
+        self.render.calls += 1
+        self.render.latency.append(elapsed)
+
+    def reset(self):
+        self.joints = {}
+        self.render = JointInteractionStatistics(self.capacity)
+
+    def _row(self, name, statistics):
+        p50, p95, p99 = statistics.latency.percentiles((50, 95, 99))
+        values = statistics.latency.values()
+        maximum = float(values.max()) if len(values) else math.nan
+        return {"name": name, "calls": statistics.calls, "clamps": statistics.clamps,
+                "p50_ms": p50 * 1000.0, "p95_ms": p95 * 1000.0, "p99_ms": p99 * 1000.0, "max_ms": maximum * 1000.0}
+
+    #Returns one row per joint (sorted by name) followed by the render row, if any frames were rendered
+    def summary(self):
+        rows = [self._row(name, self.joints[name]) for name in sorted(self.joints)]
+        if self.render.calls:
+            rows.append(self._row("(3D view render)", self.render))
+        return rows
+
+    def writeCSV(self, path):
+        with open(path, "w", newline="") as csvFile:
+            writer = csv.DictWriter(csvFile, fieldnames=self.columns)
+            writer.writeheader()
+            for row in self.summary():
+                writer.writerow({key: (f"{value:.4f}" if isinstance(value, float) else value) for key, value in row.items()})
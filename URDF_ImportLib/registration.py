@@ -0,0 +1,301 @@
+"""Registration of a robot to a surface scan with iterative closest points (ICP).
+
+The robot surface is represented by points sampled from each link mesh in link coordinates, with a
+nearest neighbor index built once per link. In every ICP iteration the scan points are moved into
+the coordinates of each link and their closest link points are looked up in all indices at once.
+Several starting poses are registered with a few scan points in parallel threads, with closed form
+point to point steps (Kabsch) that are robust far from the solution. The best one is refined with
+damped Gauss-Newton steps that minimize the distances of the scan points to the tangent planes of
+their closest robot points, which converge in a few iterations, optionally together with the joint
+values. Scans are subsampled to a fixed number of points, so the time does not grow with the scan
+size, and the pairs that are farthest apart are ignored so that scan points of other objects do not
+pull on the robot.
+
+The nearest neighbor indices are scipy KD-trees if scipy is installed, otherwise grids that store the
+closest surface point of each grid point (see PointIndex), so that lookups take constant time.
+"""
+
+import concurrent.futures
+
+import numpy
+
+from URDF_ImportLib.rotations import axisAngleToMatrix
+from URDF_ImportLib.sweptvolume import orientedSurfaceSamples
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+# Upper bound of the number of grid points of a closest point grid
+MAX_GRID_POINTS = 2000000
+
+
+#Indices (z, y, x) of the closest points (n, 3) to the points of a grid with the given origin, spacing and dimensions (x, y, z),
+#by jump flooding: every grid point starts with the points that fall into it and repeatedly takes over the closest point of
+#its neighbors at halving distances, which finds the closest point of almost all grid points in log(size) passes
+def _closestPointGrid(points, origin, spacing, dimensions):
+    shape = tuple(dimensions[::-1])
+    gridPoints = numpy.stack(numpy.meshgrid(*[origin[axis] + spacing * numpy.arange(dimensions[axis]) for axis in (2, 1, 0)],
+                                            indexing="ij")[::-1], axis=-1)
+    closest = numpy.full(shape, -1, dtype=numpy.int64)
+    squared = numpy.full(shape, numpy.inf)
+    seeds = numpy.clip(numpy.rint((points - origin) / spacing).astype(numpy.int64), 0, dimensions - 1)[:, ::-1]
+    seedOffsets = points - gridPoints[tuple(seeds.T)]
+    seedSquared = numpy.einsum("ij,ij->i", seedOffsets, seedOffsets)
+    # the closest of the points that fall into the same grid point is written last
+    order = numpy.argsort(-seedSquared)
+    closest[tuple(seeds[order].T)] = order
+    squared[tuple(seeds[order].T)] = seedSquared[order]
+    step = int(max(dimensions)) // 2
+    steps = []
+    while step >= 1:
+        steps.append(step)
+        step //= 2
+    for step in steps + [1]:
+        padded = numpy.pad(closest, step, constant_values=-1)
+        for dz in (-step, 0, step):
+            for dy in (-step, 0, step):
+                for dx in (-step, 0, step):
+                    if dx == dy == dz == 0:
+                        continue
+                    candidates = padded[step + dz:step + dz + shape[0], step + dy:step + dy + shape[1], step + dx:step + dx + shape[2]]
+                    offsets = points[numpy.maximum(candidates, 0)] - gridPoints
+                    candidateSquared = numpy.where(candidates >= 0, numpy.einsum("zyxj,zyxj->zyx", offsets, offsets), numpy.inf)
+                    closer = candidateSquared < squared
+                    closest[closer] = candidates[closer]
+                    squared[closer] = candidateSquared[closer]
+    return closest
+
+
+class PointIndex:
+    """Nearest neighbor lookup in a fixed set of points (n, 3) that are about spacing apart.
+
+    Without scipy the closest point of every point of a grid around the points (grid spacing at least
+    spacing) is found once, and a query returns the closest of the points of the 8 grid points around it.
+    Near the indexed points that is at most about one grid spacing farther than the closest point, about
+    as far as the samples are from the surface anyway. Query points outside of the grid get points of the
+    closest grid points, they are ICP pairs that are discarded or only need to pull in the right direction.
+    """
+
+    def __init__(self, points, spacing):
+        self.points = numpy.ascontiguousarray(points, dtype=numpy.float64)
+        self._tree = cKDTree(self.points) if cKDTree is not None else None
+        if self._tree is None:
+            lower, upper = self.points.min(axis=0), self.points.max(axis=0)
+            margin = 0.25 * (upper - lower).max() + 2 * spacing
+            lower, upper = lower - margin, upper + margin
+            # coarser grids for large point sets
+            spacing = max(spacing, (numpy.prod(upper - lower) / MAX_GRID_POINTS) ** (1 / 3))
+            self.dimensions = numpy.maximum(numpy.ceil((upper - lower) / spacing).astype(numpy.int64) + 1, 2)
+            self.origin = lower
+            self.spacing = spacing
+            self._gridClosest = _closestPointGrid(self.points, lower, spacing, self.dimensions).reshape(-1)
+
+    #Distances (m,) from query points (m, 3) to their closest points and the indices (m,) of those points
+    def query(self, queryPoints):
+        queryPoints = numpy.asarray(queryPoints, dtype=numpy.float64)
+        if self._tree is not None:
+            return self._tree.query(queryPoints)
+        coordinates = numpy.clip((queryPoints - self.origin) / self.spacing, 0, self.dimensions - 1)
+        base = numpy.minimum(coordinates.astype(numpy.int64), self.dimensions - 2)
+        index = base @ numpy.array([1, self.dimensions[0], self.dimensions[0] * self.dimensions[1]])
+        corners = numpy.array([dx + self.dimensions[0] * (dy + self.dimensions[1] * dz)
+                               for dz in (0, 1) for dy in (0, 1) for dx in (0, 1)])
+        candidates = self._gridClosest.take(index[:, None] + corners)
+        offsets = self.points[candidates] - queryPoints[:, None]
+        squared = numpy.einsum("mcj,mcj->mc", offsets, offsets)
+        best = numpy.argmin(squared, axis=1)
+        rows = numpy.arange(len(queryPoints))
+        return numpy.sqrt(squared[rows, best]), candidates[rows, best]
+
+
+class RegistrationResult:
+    """Robot to world transform (4, 4) and joint values (dofCount,) found by registration, with the root mean square
+    distance of the scan points used for the fit (the inliers) to the robot surface and the fraction of scan points
+    that are inliers."""
+
+    def __init__(self, robotToWorld, q, rms, inlierFraction):
+        self.robotToWorld = robotToWorld
+        self.q = q
+        self.rms = rms
+        self.inlierFraction = inlierFraction
+
+
+#Rotation (3, 3) and translation (3,) that move points (n, 3) closest to targets (n, 3) in the least squares sense
+def rigidAlignment(points, targets):
+    pointsCenter = points.mean(axis=0)
+    targetsCenter = targets.mean(axis=0)
+    u, _, vt = numpy.linalg.svd((points - pointsCenter).T @ (targets - targetsCenter))
+    # reflections are turned into the closest rotation
+    d = numpy.sign(numpy.linalg.det(vt.T @ u.T)) or 1.0
+    rotation = vt.T @ numpy.diag([1.0, 1.0, d]) @ u.T
+    return rotation, targetsCenter - rotation @ pointsCenter
+
+
+class RobotSurfaceRegistration:
+    """Registers a robot to scan points in world coordinates.
+
+    linkMeshes maps link indices to (points (n, 3), triangles (m, 3)) in link coordinates, as returned by
+    URDF_ImportLogic.linkMeshArrays. Surfaces are sampled every sampleSpacing (link coordinate units) and
+    the samples of each link are indexed once.
+    """
+
+    def __init__(self, model, linkMeshes, sampleSpacing):
+        self.model = model
+        self.linkIndices = numpy.array(sorted(linkMeshes), dtype=numpy.int64)
+        if len(self.linkIndices) == 0:
+            raise ValueError("No link meshes to register")
+        self.linkSamples = []
+        self.linkNormals = []
+        for linkIndex in self.linkIndices:
+            points, triangles = linkMeshes[linkIndex]
+            samples, normals = orientedSurfaceSamples(points, triangles, sampleSpacing)
+            self.linkSamples.append(samples)
+            self.linkNormals.append(normals)
+        self.pointIndices = [PointIndex(samples, sampleSpacing) for samples in self.linkSamples]
+
+    #Closest robot surface points (m, 3) in world coordinates of scan points (m, 3) and their unit surface normals (m, 3), with
+    #their link positions (m,) in linkIndices, their points in link coordinates (m, 3) and their distances (m,)
+    def closestPoints(self, scanPoints, robotToWorld, q):
+        linkToWorld = robotToWorld @ self.model.linkTransforms(q)[self.linkIndices]
+        worldToLink = numpy.linalg.inv(linkToWorld)
+        distances = numpy.full(len(scanPoints), numpy.inf)
+        linkPositions = numpy.zeros(len(scanPoints), dtype=numpy.int64)
+        closestIndices = numpy.zeros(len(scanPoints), dtype=numpy.int64)
+        for position, pointIndex in enumerate(self.pointIndices):
+            # distances are measured in world units, link coordinates may be scaled
+            localPoints = scanPoints @ worldToLink[position, :3, :3].T + worldToLink[position, :3, 3]
+            _, closest = pointIndex.query(localPoints)
+            worldCandidates = self.linkSamples[position][closest] @ linkToWorld[position, :3, :3].T + linkToWorld[position, :3, 3]
+            candidateDistances = numpy.linalg.norm(worldCandidates - scanPoints, axis=1)
+            closer = candidateDistances < distances
+            distances[closer] = candidateDistances[closer]
+            linkPositions[closer] = position
+            closestIndices[closer] = closest[closer]
+        linkPoints = numpy.zeros((len(scanPoints), 3))
+        linkNormals = numpy.zeros((len(scanPoints), 3))
+        for position in range(len(self.linkIndices)):
+            matches = linkPositions == position
+            linkPoints[matches] = self.linkSamples[position][closestIndices[matches]]
+            linkNormals[matches] = self.linkNormals[position][closestIndices[matches]]
+        rotations = linkToWorld[linkPositions, :3, :3]
+        worldPoints = numpy.einsum("nij,nj->ni", rotations, linkPoints) + linkToWorld[linkPositions, :3, 3]
+        worldNormals = numpy.einsum("nij,nj->ni", rotations, linkNormals)
+        worldNormals /= numpy.maximum(numpy.linalg.norm(worldNormals, axis=1), 1e-300)[:, None]
+        return worldPoints, worldNormals, linkPositions, linkPoints, distances
+
+    #Robot points (k, 3) in world coordinates, a sample of all link surfaces
+    def robotPoints(self, robotToWorld, q, maxPoints=5000, rng=None):
+        rng = numpy.random.default_rng(rng)
+        linkToWorld = robotToWorld @ self.model.linkTransforms(q)[self.linkIndices]
+        points = numpy.concatenate([samples @ transform[:3, :3].T + transform[:3, 3] for samples, transform in zip(self.linkSamples, linkToWorld)])
+        return points[rng.choice(len(points), min(maxPoints, len(points)), replace=False)]
+
+    #Starting robot to world transforms: the current one and the ones that align the principal axes of the robot points
+    #with those of the scan points in the four ways that keep the axes right-handed
+    def startingTransforms(self, scanPoints, robotToWorld, q):
+        robotPoints = self.robotPoints(robotToWorld, q, rng=0)
+        robotCenter = robotPoints.mean(axis=0)
+        scanCenter = scanPoints.mean(axis=0)
+        robotAxes = numpy.linalg.svd(robotPoints - robotCenter, full_matrices=False)[2].T
+        scanAxes = numpy.linalg.svd(scanPoints - scanCenter, full_matrices=False)[2].T
+        robotAxes[:, 2] *= numpy.sign(numpy.linalg.det(robotAxes))
+        scanAxes[:, 2] *= numpy.sign(numpy.linalg.det(scanAxes))
+        transforms = [robotToWorld]
+        for flips in ([1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]):
+            correction = numpy.eye(4)
+            correction[:3, :3] = scanAxes @ numpy.diag(flips) @ robotAxes.T
+            correction[:3, 3] = scanCenter - correction[:3, :3] @ robotCenter
+            transforms.append(correction @ robotToWorld)
+        return transforms
+
+    #Registers the robot to scan points (n, 3) in world coordinates starting from robotToWorld (4, 4) and joint values q.
+    #Joint values are fitted too if estimateJoints is set, within the joint limits. maxPoints scan points are used, of which
+    #the inlierFraction closest to the robot pull on it. If multiStart is set, the starting poses of startingTransforms are
+    #first registered rigidly with startPoints of the scan points on workers threads, and only the best one is refined.
+    #Returns the RegistrationResult.
+    def register(self, scanPoints, robotToWorld, q=None, estimateJoints=False, maxPoints=3000, iterations=30, inlierFraction=0.9,
+                 multiStart=True, startPoints=500, workers=None, tolerance=1e-4, rng=None):
+        rng = numpy.random.default_rng(rng)
+        scanPoints = numpy.asarray(scanPoints, dtype=numpy.float64)
+        if len(scanPoints) > maxPoints:
+            scanPoints = scanPoints[rng.choice(len(scanPoints), maxPoints, replace=False)]
+        robotToWorld = numpy.asarray(robotToWorld, dtype=numpy.float64)
+        q = self.model.zeroConfiguration() if q is None else self.model.applyMimicJoints(numpy.asarray(q, dtype=numpy.float64))
+        if multiStart:
+            starts = self.startingTransforms(scanPoints, robotToWorld, q)
+            startScan = scanPoints[rng.choice(len(scanPoints), min(startPoints, len(scanPoints)), replace=False)]
+            arguments = (startScan, q, iterations, inlierFraction, tolerance, False, False)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers or len(starts)) as executor:
+                results = list(executor.map(lambda start: self._registerFrom(start, *arguments), starts))
+            robotToWorld = min(results, key=lambda result: result.rms).robotToWorld
+        return self._registerFrom(robotToWorld, scanPoints, q, iterations, inlierFraction, tolerance, True, estimateJoints)
+
+    #ICP from one starting pose: point to point steps (closed form, robust far from the solution) or point to plane
+    #Gauss-Newton steps (converge in few iterations near the solution, optionally with the joint values)
+    def _registerFrom(self, robotToWorld, scanPoints, q, iterations, inlierFraction, tolerance, pointToPlane, estimateJoints):
+        inlierCount = max(3, int(round(inlierFraction * len(scanPoints))))
+        previousRms = numpy.inf
+        best = None
+        for iteration in range(iterations + 1):
+            worldPoints, worldNormals, linkPositions, linkPoints, distances = self.closestPoints(scanPoints, robotToWorld, q)
+            inliers = numpy.argsort(distances)[:inlierCount]
+            rms = float(numpy.sqrt(numpy.mean(distances[inliers] ** 2)))
+            # a step can make the fit worse, the best pose is kept
+            if best is None or rms < best[0]:
+                best = (rms, robotToWorld, q)
+            if iteration == iterations or (numpy.isfinite(previousRms) and previousRms - rms <= tolerance * previousRms):
+                break
+            previousRms = rms
+            if pointToPlane:
+                robotToWorld, q = self._gaussNewtonStep(scanPoints[inliers], worldPoints[inliers], worldNormals[inliers], linkPositions[inliers],
+                                                        linkPoints[inliers], robotToWorld, q, estimateJoints)
+            else:
+                rotation, translation = rigidAlignment(worldPoints[inliers], scanPoints[inliers])
+                correction = numpy.eye(4)
+                correction[:3, :3] = rotation
+                correction[:3, 3] = translation
+                robotToWorld = correction @ robotToWorld
+        rms, robotToWorld, q = best
+        return RegistrationResult(robotToWorld, q, rms, inlierCount / len(scanPoints))
+
+    #One damped Gauss-Newton step on the robot to world transform, and the joint values if estimateJoints is set, that
+    #minimizes the distances of scan points to the tangent planes of their closest robot points (world coordinates, with
+    #unit normals, link positions and link coordinates of the robot points)
+    def _gaussNewtonStep(self, scanPoints, worldPoints, worldNormals, linkPositions, linkPoints, robotToWorld, q, estimateJoints,
+                         damping=1e-3, jointStep=1e-6):
+        model = self.model
+        # a small rotation about the center of the robot points and a translation move a point along the normal by
+        # rotation . (offset x normal) + translation . normal
+        center = worldPoints.mean(axis=0)
+        columns = [numpy.cross(worldPoints - center, worldNormals), worldNormals]
+        dofs = numpy.zeros(0, dtype=numpy.int64)
+        if estimateJoints:
+            independent = numpy.ones(model.dofCount, dtype=bool)
+            independent[model.dofIndex[model.mimicDrivers >= 0]] = False
+            dofs = numpy.nonzero(independent)[0]
+            # derivatives of the link to world transforms by each joint value, mimic joints follow their drivers
+            steps = numpy.zeros((2 * len(dofs), model.dofCount))
+            steps[numpy.arange(len(dofs)), dofs] = jointStep
+            steps[len(dofs) + numpy.arange(len(dofs)), dofs] = -jointStep
+            linkTransforms = robotToWorld @ model.linkTransforms(q + steps)[:, self.linkIndices]
+            derivatives = ((linkTransforms[:len(dofs)] - linkTransforms[len(dofs):]) / (2 * jointStep))[:, linkPositions]
+            pointDerivatives = numpy.einsum("dnij,nj->dni", derivatives[..., :3, :3], linkPoints) + derivatives[..., :3, 3]
+            columns.append(numpy.einsum("dni,ni->nd", pointDerivatives, worldNormals))
+        jacobian = numpy.hstack(columns)
+        residuals = numpy.einsum("ij,ij->i", scanPoints - worldPoints, worldNormals)
+        normal = jacobian.T @ jacobian
+        # directions that no tangent plane constrains (e.g. sliding along a flat link) are kept by the damping
+        normal += damping * numpy.diag(numpy.diag(normal)) + 1e-9 * numpy.trace(normal) * numpy.eye(len(normal))
+        update = numpy.linalg.solve(normal, jacobian.T @ residuals)
+
+        correction = numpy.eye(4)
+        correction[:3, :3] = axisAngleToMatrix(update[:3], numpy.linalg.norm(update[:3]))
+        correction[:3, 3] = center + update[3:6] - correction[:3, :3] @ center
+        if len(dofs):
+            q = q.copy()
+            q[dofs] += update[6:]
+            q = model.applyMimicJoints(model.clampJointValues(q)[0])
+        return correction @ robotToWorld, q
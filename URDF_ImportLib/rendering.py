@@ -0,0 +1,218 @@
+"""Offscreen rendering of robot poses into RGB, depth and link label images.
+
+A RobotRenderer holds one actor per link mesh in an offscreen render window, built once. For every
+image the link actors are moved with forward kinematics and the scene is drawn twice: shaded for the
+RGB image and with lighting off and the link index encoded in the actor color for the label image.
+Depth (distance along the camera axis, in world units) is read from the z-buffer. renderDataset
+shards the images of a dataset over worker processes that each build their own renderer.
+
+No display is needed. The render window class is chosen by VTK (EGL or OSMesa builds render without
+an X server), the VTK_DEFAULT_OPENGL_WINDOW environment variable selects another one.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+from URDF_ImportLib.rotations import toVTKMatrices
+
+
+# Color of links that are not given one, light gray
+DEFAULT_LINK_COLOR = (0.8, 0.8, 0.8)
+
+
+#Intrinsic camera matrix (3, 3) of images of width x height pixels with a vertical field of view of viewAngle degrees
+def cameraIntrinsics(width, height, viewAngle):
+    focalLength = 0.5 * height / numpy.tan(numpy.radians(viewAngle) / 2)
+    return numpy.array([[focalLength, 0.0, 0.5 * width], [0.0, focalLength, 0.5 * height], [0.0, 0.0, 1.0]])
+
+
+class RobotRenderer:
+    """Renders images of a robot in an offscreen window.
+
+    linkMeshes maps link indices to (points (n, 3), triangles (m, 3)) in link coordinates, as returned by
+    URDF_ImportLogic.linkMeshArrays, and linkColors maps link indices to RGB colors (0..1). Camera poses
+    are camera to world transforms (4, 4) in the computer vision convention: the camera looks along its
+    z axis, x points right and y down in the image.
+    """
+
+    def __init__(self, model, linkMeshes, width=640, height=480, viewAngle=30.0, robotToWorld=None, linkColors=None, background=(0.0, 0.0, 0.0)):
+        self.model = model
+        self.width = width
+        self.height = height
+        self.robotToWorld = numpy.eye(4) if robotToWorld is None else numpy.asarray(robotToWorld, dtype=numpy.float64)
+        self.background = background
+        self.linkIndices = sorted(linkMeshes)
+        if len(self.linkIndices) >= 2 ** 16:
+            raise ValueError("Too many links to label")
+        self.renderer = vtk.vtkRenderer()
+        self.renderer.SetBackground(*background)
+        self.renderer.UseFXAAOff()
+        self.renderWindow = vtk.vtkRenderWindow()
+        self.renderWindow.SetOffScreenRendering(1)
+        # label colors must not be blended with the background at link edges
+        self.renderWindow.SetMultiSamples(0)
+        self.renderWindow.SetSize(width, height)
+        self.renderWindow.AddRenderer(self.renderer)
+        self.camera = self.renderer.GetActiveCamera()
+        self.camera.SetViewAngle(viewAngle)
+        self.actors = []
+        self.shadedProperties = []
+        self.labelProperties = []
+        for linkIndex in self.linkIndices:
+            points, triangles = linkMeshes[linkIndex]
+            self.actors.append(self._linkActor(points, triangles))
+            shaded = vtk.vtkProperty()
+            shaded.SetColor(*(linkColors or {}).get(linkIndex, DEFAULT_LINK_COLOR))
+            self.shadedProperties.append(shaded)
+            label = vtk.vtkProperty()
+            # label = link index + 1 in the red (low byte) and green (high byte) channels, exactly as set without lighting
+            labelValue = linkIndex + 1
+            label.SetColor((labelValue & 255) / 255.0, (labelValue >> 8) / 255.0, 0.0)
+            label.LightingOff()
+            self.labelProperties.append(label)
+            self.renderer.AddActor(self.actors[-1])
+        self._windowToImage = vtk.vtkWindowToImageFilter()
+        self._windowToImage.SetInput(self.renderWindow)
+        self._windowToImage.SetInputBufferTypeToRGB()
+        self._windowToImage.ReadFrontBufferOff()
+        self._depthBuffer = vtk.vtkFloatArray()
+
+    def _linkActor(self, points, triangles):
+        vtkPoints = vtk.vtkPoints()
+        vtkPoints.SetData(numpy_support.numpy_to_vtk(numpy.ascontiguousarray(points, dtype=numpy.float32), deep=True))
+        triangles = numpy.asarray(triangles, dtype=numpy.int64)
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_support.numpy_to_vtk(numpy.arange(0, 3 * len(triangles) + 1, 3, dtype=numpy.int64), deep=True),
+                      numpy_support.numpy_to_vtk(triangles.reshape(-1), deep=True))
+        polyData = vtk.vtkPolyData()
+        polyData.SetPoints(vtkPoints)
+        polyData.SetPolys(polys)
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputData(polyData)
+        normals.Update()
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(normals.GetOutput())
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        return actor
+
+    #Renders the robot at joint values q (dofCount,) seen from a camera pose (4, 4)
+    #Returns RGB (height, width, 3) uint8, depth (height, width) float32 in world units (0 where no link is seen) and labels
+    #(height, width) uint16 (link index + 1, 0 for the background) with row 0 at the top of the image.
+    def render(self, q, cameraPose):
+        linkToWorld = self.robotToWorld @ self.model.linkTransforms(q)[self.linkIndices]
+        for actor, matrix in zip(self.actors, toVTKMatrices(linkToWorld)):
+            actor.SetUserMatrix(matrix)
+        cameraPose = numpy.asarray(cameraPose, dtype=numpy.float64)
+        position = cameraPose[:3, 3]
+        self.camera.SetPosition(*position)
+        self.camera.SetFocalPoint(*(position + cameraPose[:3, 2]))
+        self.camera.SetViewUp(*(-cameraPose[:3, 1]))
+        self.renderer.ResetCameraClippingRange()
+
+        for actor, shaded in zip(self.actors, self.shadedProperties):
+            actor.SetProperty(shaded)
+        self.renderer.SetBackground(*self.background)
+        rgb = self._readPixels()
+        for actor, label in zip(self.actors, self.labelProperties):
+            actor.SetProperty(label)
+        self.renderer.SetBackground(0.0, 0.0, 0.0)
+        labelColors = self._readPixels().astype(numpy.uint16)
+        labels = labelColors[..., 0] + (labelColors[..., 1] << 8)
+
+        self.renderWindow.GetZbufferData(0, 0, self.width - 1, self.height - 1, self._depthBuffer)
+        zBuffer = numpy_support.vtk_to_numpy(self._depthBuffer).reshape(self.height, self.width)[::-1]
+        near, far = self.camera.GetClippingRange()
+        # perspective depth from normalized device coordinates
+        ndc = 2.0 * zBuffer.astype(numpy.float64) - 1.0
+        depth = numpy.where(zBuffer < 1.0, 2.0 * near * far / (far + near - ndc * (far - near)), 0.0)
+        return rgb, depth.astype(numpy.float32), labels
+
+    def _readPixels(self):
+        self.renderWindow.Render()
+        self._windowToImage.Modified()
+        self._windowToImage.Update()
+        pixels = numpy_support.vtk_to_numpy(self._windowToImage.GetOutput().GetPointData().GetScalars())
+        # VTK images start at the bottom row
+        return pixels.reshape(self.height, self.width, -1)[::-1].copy()
+
+
+#Writes an image (height, width) or (height, width, channels) of uint8 or uint16 values as PNG, row 0 at the top
+def writePNG(path, image):
+    image = numpy.asarray(image)
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(image.shape[1], image.shape[0], 1)
+    scalars = numpy_support.numpy_to_vtk(numpy.ascontiguousarray(image[::-1]).reshape(image.shape[0] * image.shape[1], -1), deep=True)
+    imageData.GetPointData().SetScalars(scalars)
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(path)
+    writer.SetInputData(imageData)
+    writer.Write()
+
+
+#File names of the RGB (PNG), depth (float32 .npy) and label (uint16 PNG) images of a dataset sample
+def sampleFileNames(index):
+    return f"{index:06d}_rgb.png", f"{index:06d}_depth.npy", f"{index:06d}_label.png"
+
+
+# Set by _initializeWorker in worker processes (and directly when rendering without workers)
+_workerState = None
+
+
+def _initializeWorker(arguments):
+    global _workerState
+    outputFolder, rendererArguments = arguments
+    _workerState = (outputFolder, RobotRenderer(*rendererArguments))
+
+
+#Renders and writes the samples (indices, joint values, camera poses) of a chunk, returns the number of samples
+def _renderChunk(chunk):
+    outputFolder, renderer = _workerState
+    for index, q, cameraPose in zip(*chunk):
+        rgb, depth, labels = renderer.render(q, cameraPose)
+        rgbName, depthName, labelName = sampleFileNames(index)
+        writePNG(os.path.join(outputFolder, rgbName), rgb)
+        numpy.save(os.path.join(outputFolder, depthName), depth)
+        writePNG(os.path.join(outputFolder, labelName), labels)
+    return len(chunk[0])
+
+
+#Renders the robot at joint values q (N, dofCount) from camera poses (N, 4, 4) into outputFolder (see sampleFileNames),
+#see RobotRenderer for the other arguments. The samples are rendered in chunks of chunkSize on workers processes (all CPUs
+#by default), each with its own renderer, and progressCallback is called with (samples done, sample count) after each chunk.
+def renderDataset(model, linkMeshes, q, cameraPoses, outputFolder, width=640, height=480, viewAngle=30.0, robotToWorld=None,
+                  linkColors=None, workers=None, chunkSize=64, progressCallback=None):
+    q = numpy.atleast_2d(numpy.asarray(q, dtype=numpy.float64))
+    cameraPoses = numpy.asarray(cameraPoses, dtype=numpy.float64).reshape(-1, 4, 4)
+    if len(cameraPoses) != len(q):
+        raise ValueError(f"Expected {len(q)} camera poses, got {len(cameraPoses)}")
+    if not linkMeshes:
+        raise ValueError("No link meshes to render")
+    os.makedirs(outputFolder, exist_ok=True)
+    arguments = (outputFolder, (model, linkMeshes, width, height, viewAngle, robotToWorld, linkColors))
+    if workers is None:
+        workers = multiprocessing.cpu_count() or 1
+    # at least one chunk per worker
+    chunkSize = max(1, min(chunkSize, -(-len(q) // workers)))
+    chunks = [(range(chunkStart, min(chunkStart + chunkSize, len(q))), q[chunkStart:chunkStart + chunkSize], cameraPoses[chunkStart:chunkStart + chunkSize])
+              for chunkStart in range(0, len(q), chunkSize)]
+    done = 0
+    if workers > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=_initializeWorker, initargs=(arguments,)) as executor:
+            for count in executor.map(_renderChunk, chunks):
+                done += count
+                if progressCallback:
+                    progressCallback(done, len(q))
+    else:
+        _initializeWorker(arguments)
+        for chunk in chunks:
+            done += _renderChunk(chunk)
+            if progressCallback:
+                progressCallback(done, len(q))
+    return done
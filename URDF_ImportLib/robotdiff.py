@@ -0,0 +1,114 @@
+"""Differences between two versions of a robot description, for reloading an edited robot file.
+
+Links and joints are matched by name. A joint whose origin changed only needs its origin transform
+updated and a link whose mesh changed (file name, scale, visual origin or the contents of the mesh
+file) only needs that mesh read again. Limits, axes and mimic coefficients are part of the kinematic
+model, which is replaced as a whole. Added and removed links and joints, and joints that connect other
+links or change between fixed and moving, change the structure of the scene.
+"""
+
+import os
+
+import numpy
+
+from URDF_ImportLib.packagepaths import resolveMeshPath
+
+
+#Identifies the mesh file of each link of a URDFDescription: link name -> (resolved path, modification time, size), None for
+#links without a mesh file
+def meshStamps(urdf, meshFolder, useCollisionMesh=False, packageIndex=None):
+    stamps = {}
+    for linkIndex, linkName in enumerate(urdf.linkNames):
+        meshFilename = urdf.meshFilename(linkIndex, useCollisionMesh)
+        stamps[linkName] = None
+        if meshFilename is None:
+            continue
+        try:
+            meshFilePath = resolveMeshPath(meshFilename, meshFolder, packageIndex)
+            status = os.stat(meshFilePath)
+        except OSError:
+            continue
+        stamps[linkName] = (meshFilePath, status.st_mtime_ns, status.st_size)
+    return stamps
+
+
+class RobotDiff:
+    """Names of the links and joints that differ between two robot descriptions."""
+
+    def __init__(self):
+        self.addedLinks = []
+        self.removedLinks = []
+        self.addedJoints = []
+        self.removedJoints = []
+        # joints with another parent or child link, or changed between fixed and moving
+        self.reattachedJoints = []
+        # joints with another origin
+        self.movedJoints = []
+        # joints with another type, axis, limits or mimic coefficients
+        self.changedJoints = []
+        # links with another mesh file, mesh scale, visual origin or mesh file contents
+        self.changedMeshes = []
+        # whether the links and joints are the same and in the same order, so that their indices are still valid
+        self.sameOrder = True
+
+    @property
+    def structureChanged(self):
+        return bool(self.addedLinks or self.removedLinks or self.addedJoints or self.removedJoints or self.reattachedJoints)
+
+    @property
+    def empty(self):
+        return not (self.structureChanged or self.movedJoints or self.changedJoints or self.changedMeshes)
+
+    def __str__(self):
+        counts = [(self.addedLinks, "added links"), (self.removedLinks, "removed links"), (self.addedJoints, "added joints"),
+                  (self.removedJoints, "removed joints"), (self.reattachedJoints, "reattached joints"), (self.movedJoints, "moved joints"),
+                  (self.changedJoints, "changed joints"), (self.changedMeshes, "changed meshes")]
+        return ", ".join(f"{len(names)} {label}" for names, label in counts if names) or "no changes"
+
+
+def _fixed(urdf, jointIndex):
+    return urdf.jointTypeNames[jointIndex] == "fixed"
+
+
+#Changes from the URDFDescription oldUrdf to newUrdf, oldStamps and newStamps are their meshStamps
+def diffRobotDescriptions(oldUrdf, newUrdf, oldStamps, newStamps, useCollisionMesh=False):
+    diff = RobotDiff()
+    diff.sameOrder = oldUrdf.linkNames == newUrdf.linkNames and oldUrdf.jointNames == newUrdf.jointNames
+    diff.addedLinks = [name for name in newUrdf.linkNames if name not in oldUrdf.linkIndex]
+    diff.removedLinks = [name for name in oldUrdf.linkNames if name not in newUrdf.linkIndex]
+    diff.addedJoints = [name for name in newUrdf.jointNames if name not in oldUrdf.jointIndex]
+    diff.removedJoints = [name for name in oldUrdf.jointNames if name not in newUrdf.jointIndex]
+
+    oldJointOrigins, newJointOrigins = oldUrdf.jointOrigins(), newUrdf.jointOrigins()
+    for newIndex, name in enumerate(newUrdf.jointNames):
+        oldIndex = oldUrdf.jointIndex.get(name)
+        if oldIndex is None:
+            continue
+        if (oldUrdf.linkNames[oldUrdf.jointParents[oldIndex]] != newUrdf.linkNames[newUrdf.jointParents[newIndex]]
+                or oldUrdf.linkNames[oldUrdf.jointChildren[oldIndex]] != newUrdf.linkNames[newUrdf.jointChildren[newIndex]]
+                or _fixed(oldUrdf, oldIndex) != _fixed(newUrdf, newIndex)):
+            diff.reattachedJoints.append(name)
+            continue
+        if not numpy.allclose(oldJointOrigins[oldIndex], newJointOrigins[newIndex], rtol=0.0, atol=1e-12):
+            diff.movedJoints.append(name)
+        if (oldUrdf.jointTypeNames[oldIndex] != newUrdf.jointTypeNames[newIndex]
+                or not numpy.array_equal(oldUrdf.jointAxes[oldIndex], newUrdf.jointAxes[newIndex])
+                or oldUrdf.lowerLimits[oldIndex] != newUrdf.lowerLimits[newIndex]
+                or oldUrdf.upperLimits[oldIndex] != newUrdf.upperLimits[newIndex]
+                or oldUrdf.mimicJointNames[oldIndex] != newUrdf.mimicJointNames[newIndex]
+                or oldUrdf.mimicMultipliers[oldIndex] != newUrdf.mimicMultipliers[newIndex]
+                or oldUrdf.mimicOffsets[oldIndex] != newUrdf.mimicOffsets[newIndex]):
+            diff.changedJoints.append(name)
+
+    oldVisualOrigins, newVisualOrigins = oldUrdf.visualOrigins(), newUrdf.visualOrigins()
+    for newIndex, name in enumerate(newUrdf.linkNames):
+        oldIndex = oldUrdf.linkIndex.get(name)
+        if oldIndex is None:
+            continue
+        if (oldUrdf.meshFilename(oldIndex, useCollisionMesh) != newUrdf.meshFilename(newIndex, useCollisionMesh)
+                or oldUrdf.meshScale(oldIndex, useCollisionMesh) != newUrdf.meshScale(newIndex, useCollisionMesh)
+                or oldUrdf.hasVisualOrigin[oldIndex] != newUrdf.hasVisualOrigin[newIndex]
+                or not numpy.allclose(oldVisualOrigins[oldIndex], newVisualOrigins[newIndex], rtol=0.0, atol=1e-12)
+                or oldStamps.get(name) != newStamps.get(name)):
+            diff.changedMeshes.append(name)
+    return diff
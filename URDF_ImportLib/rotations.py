@@ -0,0 +1,194 @@
+"""Vectorized conversions between rotation representations.
+
+All functions take float64 arrays with any number of leading batch dimensions: axis-angle as unit
+axes (..., 3) and angles (...), quaternions as (..., 4) in (w, x, y, z) order, roll-pitch-yaw as
+(..., 3) fixed-axis X, Y, Z angles (URDF <origin rpy="">) and rotation matrices as (..., 3, 3).
+The 0 and 180 degree singularities of the axis-angle and quaternion conversions are handled
+analytically instead of with tolerances.
+"""
+
+import numpy
+import vtk
+
+
+#Scales vectors (..., 3) to unit length, zero vectors are returned unchanged
+def normalize(vectors):
+    vectors = numpy.asarray(vectors, dtype=numpy.float64)
+    lengths = numpy.linalg.norm(vectors, axis=-1, keepdims=True)
+    return numpy.divide(vectors, lengths, out=vectors.copy(), where=lengths > 0)
+
+
+#Rotation matrices (..., 3, 3) for angles (...) about axes (..., 3) using Rodrigues' formula
+def axisAngleToMatrix(axes, angles):
+    angles = numpy.asarray(angles, dtype=numpy.float64)
+    axes = numpy.broadcast_to(normalize(axes), angles.shape + (3,))
+    x, y, z = axes[..., 0], axes[..., 1], axes[..., 2]
+    c = numpy.cos(angles)
+    s = numpy.sin(angles)
+    t = 1.0 - c
+    rotation = numpy.empty(angles.shape + (3, 3))
+    rotation[..., 0, 0] = t*x*x + c
+    rotation[..., 0, 1] = t*x*y - s*z
+    rotation[..., 0, 2] = t*x*z + s*y
+    rotation[..., 1, 0] = t*x*y + s*z
+    rotation[..., 1, 1] = t*y*y + c
+    rotation[..., 1, 2] = t*y*z - s*x
+    rotation[..., 2, 0] = t*x*z - s*y
+    rotation[..., 2, 1] = t*y*z + s*x
+    rotation[..., 2, 2] = t*z*z + c
+    return rotation
+
+
+#Unit quaternions (..., 4) for angles (...) about axes (..., 3)
+def axisAngleToQuaternion(axes, angles):
+    angles = numpy.asarray(angles, dtype=numpy.float64)
+    axes = numpy.broadcast_to(normalize(axes), angles.shape + (3,))
+    quaternions = numpy.empty(angles.shape + (4,))
+    quaternions[..., 0] = numpy.cos(angles / 2)
+    quaternions[..., 1:] = axes * numpy.sin(angles / 2)[..., None]
+    return quaternions
+
+
+#Rotation matrices (..., 3, 3) of quaternions (..., 4), the quaternions do not have to be normalized
+def quaternionToMatrix(quaternions):
+    quaternions = numpy.asarray(quaternions, dtype=numpy.float64)
+    w, x, y, z = numpy.moveaxis(quaternions / numpy.linalg.norm(quaternions, axis=-1, keepdims=True), -1, 0)
+    rotation = numpy.empty(quaternions.shape[:-1] + (3, 3))
+    rotation[..., 0, 0] = 1 - 2*(y*y + z*z)
+    rotation[..., 0, 1] = 2*(x*y - w*z)
+    rotation[..., 0, 2] = 2*(x*z + w*y)
+    rotation[..., 1, 0] = 2*(x*y + w*z)
+    rotation[..., 1, 1] = 1 - 2*(x*x + z*z)
+    rotation[..., 1, 2] = 2*(y*z - w*x)
+    rotation[..., 2, 0] = 2*(x*z - w*y)
+    rotation[..., 2, 1] = 2*(y*z + w*x)
+    rotation[..., 2, 2] = 1 - 2*(x*x + y*y)
+    return rotation
+
+
+#Unit quaternions (..., 4) with w >= 0 of rotation matrices (..., 3, 3)
+def matrixToQuaternion(rotations):
+    r = numpy.asarray(rotations, dtype=numpy.float64)
+    trace = numpy.trace(r, axis1=-2, axis2=-1)
+    # The component with the largest magnitude is computed from the diagonal, the others from off-diagonal sums,
+    # which is accurate for all rotations including 180 degrees
+    candidates = numpy.stack([trace, r[..., 0, 0], r[..., 1, 1], r[..., 2, 2]], axis=-1)
+    largest = numpy.argmax(candidates, axis=-1)
+    quaternions = numpy.empty(r.shape[:-2] + (4,))
+    for index in range(4):
+        selected = largest == index
+        if not numpy.any(selected):
+            continue
+        m = r[selected]
+        if index == 0:
+            s = 2.0 * numpy.sqrt(1.0 + trace[selected])
+            q = [0.25 * s, (m[:, 2, 1] - m[:, 1, 2]) / s, (m[:, 0, 2] - m[:, 2, 0]) / s, (m[:, 1, 0] - m[:, 0, 1]) / s]
+        elif index == 1:
+            s = 2.0 * numpy.sqrt(1.0 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2])
+            q = [(m[:, 2, 1] - m[:, 1, 2]) / s, 0.25 * s, (m[:, 0, 1] + m[:, 1, 0]) / s, (m[:, 0, 2] + m[:, 2, 0]) / s]
+        elif index == 2:
+            s = 2.0 * numpy.sqrt(1.0 + m[:, 1, 1] - m[:, 0, 0] - m[:, 2, 2])
+            q = [(m[:, 0, 2] - m[:, 2, 0]) / s, (m[:, 0, 1] + m[:, 1, 0]) / s, 0.25 * s, (m[:, 1, 2] + m[:, 2, 1]) / s]
+        else:
+            s = 2.0 * numpy.sqrt(1.0 + m[:, 2, 2] - m[:, 0, 0] - m[:, 1, 1])
+            q = [(m[:, 1, 0] - m[:, 0, 1]) / s, (m[:, 0, 2] + m[:, 2, 0]) / s, (m[:, 1, 2] + m[:, 2, 1]) / s, 0.25 * s]
+        quaternions[selected] = numpy.stack(q, axis=-1)
+    quaternions *= numpy.where(quaternions[..., :1] < 0, -1.0, 1.0)
+    return quaternions
+
+
+#Unit axes (..., 3) and angles (...) in [0, pi] of quaternions (..., 4). The axis of a zero rotation is +X.
+def quaternionToAxisAngle(quaternions):
+    quaternions = numpy.asarray(quaternions, dtype=numpy.float64)
+    # q and -q are the same rotation, the one with w >= 0 has an angle of at most pi
+    quaternions = quaternions * numpy.where(quaternions[..., :1] < 0, -1.0, 1.0)
+    sinHalfAngles = numpy.linalg.norm(quaternions[..., 1:], axis=-1)
+    angles = 2 * numpy.arctan2(sinHalfAngles, quaternions[..., 0])
+    axes = numpy.zeros(quaternions.shape[:-1] + (3,))
+    axes[..., 0] = 1.0
+    rotating = sinHalfAngles > 0
+    axes[rotating] = quaternions[rotating][:, 1:] / sinHalfAngles[rotating][:, None]
+    return axes, angles
+
+
+#Unit axes (..., 3) and angles (...) in [0, pi] of rotation matrices (..., 3, 3)
+def matrixToAxisAngle(rotations):
+    return quaternionToAxisAngle(matrixToQuaternion(rotations))
+
+
+#Rotation matrices (..., 3, 3) of fixed-axis roll, pitch, yaw angles (..., 3): R = Rz(yaw) Ry(pitch) Rx(roll)
+def rpyToMatrix(rpy):
+    rpy = numpy.asarray(rpy, dtype=numpy.float64)
+    cr, cp, cy = numpy.moveaxis(numpy.cos(rpy), -1, 0)
+    sr, sp, sy = numpy.moveaxis(numpy.sin(rpy), -1, 0)
+    rotation = numpy.empty(rpy.shape[:-1] + (3, 3))
+    rotation[..., 0, 0] = cy*cp
+    rotation[..., 0, 1] = cy*sp*sr - sy*cr
+    rotation[..., 0, 2] = cy*sp*cr + sy*sr
+    rotation[..., 1, 0] = sy*cp
+    rotation[..., 1, 1] = sy*sp*sr + cy*cr
+    rotation[..., 1, 2] = sy*sp*cr - cy*sr
+    rotation[..., 2, 0] = -sp
+    rotation[..., 2, 1] = cp*sr
+    rotation[..., 2, 2] = cp*cr
+    return rotation
+
+
+#Roll, pitch, yaw angles (..., 3) of rotation matrices (..., 3, 3), pitch is in [-pi/2, pi/2]
+#Yaw is read from the first column and roll and pitch from the matrix with the yaw removed. This stays exact near
+#pitch = +-pi/2, where yaw is poorly defined but the roll computed from it makes up for any error in it.
+def matrixToRpy(rotations):
+    r = numpy.asarray(rotations, dtype=numpy.float64)
+    yaw = numpy.arctan2(r[..., 1, 0], r[..., 0, 0])
+    cy = numpy.cos(yaw)[..., None]
+    sy = numpy.sin(yaw)[..., None]
+    # rows 0 and 1 of Rz(-yaw) R = Ry(pitch) Rx(roll)
+    row0 = cy * r[..., 0, :] + sy * r[..., 1, :]
+    row1 = cy * r[..., 1, :] - sy * r[..., 0, :]
+    rpy = numpy.empty(r.shape[:-2] + (3,))
+    rpy[..., 0] = numpy.arctan2(-row1[..., 2], row1[..., 1])
+    rpy[..., 1] = numpy.arctan2(-r[..., 2, 0], row0[..., 0])
+    rpy[..., 2] = yaw
+    return rpy
+
+
+#Homogeneous transforms (..., 4, 4) from translations (..., 3) and roll, pitch, yaw angles (..., 3)
+def originMatrix(xyz, rpy):
+    xyz = numpy.asarray(xyz, dtype=numpy.float64)
+    rotation = rpyToMatrix(rpy)
+    matrix = numpy.zeros(numpy.broadcast_shapes(xyz.shape[:-1], rotation.shape[:-2]) + (4, 4))
+    matrix[..., :3, :3] = rotation
+    matrix[..., :3, 3] = xyz
+    matrix[..., 3, 3] = 1.0
+    return matrix
+
+
+#Converts matrices (..., 4, 4) or rotations (..., 3, 3) to a vtkMatrix4x4, or a list of them if there are batch dimensions
+def toVTKMatrices(matrices):
+    matrices = numpy.asarray(matrices, dtype=numpy.float64)
+    if matrices.shape[-2:] == (3, 3):
+        homogeneous = numpy.zeros(matrices.shape[:-2] + (4, 4))
+        homogeneous[..., :3, :3] = matrices
+        homogeneous[..., 3, 3] = 1.0
+        matrices = homogeneous
+    buffers = numpy.ascontiguousarray(matrices).reshape(-1, 16)
+    vtkMatrices = []
+    for buffer in buffers:
+        vtkMatrix = vtk.vtkMatrix4x4()
+        vtkMatrix.DeepCopy(buffer)
+        vtkMatrices.append(vtkMatrix)
+    return vtkMatrices if matrices.ndim > 2 else vtkMatrices[0]
+
+
+#Converts a vtkMatrix4x4 to a (4, 4) array, or a list of them to an (N, 4, 4) array
+def fromVTKMatrices(vtkMatrices):
+    single = isinstance(vtkMatrices, vtk.vtkMatrix4x4)
+    if single:
+        vtkMatrices = [vtkMatrices]
+    buffer = [0.0] * 16
+    matrices = numpy.empty((len(vtkMatrices), 16))
+    for index, vtkMatrix in enumerate(vtkMatrices):
+        vtkMatrix.DeepCopy(buffer, vtkMatrix)
+        matrices[index] = buffer
+    matrices = matrices.reshape(-1, 4, 4)
+    return matrices[0] if single else matrices
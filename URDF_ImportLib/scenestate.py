@@ -0,0 +1,42 @@
+"""Compact text encodings of robot metadata, for storing it in node attributes of a saved scene.
+
+The kinematic model is stored as its arrays (see RobotModel.toArrays) in a compressed numpy archive
+and the robot description as compressed text, both base64 encoded, so that a robot in a saved scene
+can be set up again without its robot file or mesh files.
+"""
+
+import base64
+import io
+import json
+import zlib
+
+import numpy
+
+from URDF_ImportLib.kinematics import RobotModel
+
+
+#Encodes a RobotModel as ASCII text
+def encodeRobotModel(model):
+    arrays, strings = model.toArrays()
+    sections = {"arr:" + name: numpy.ascontiguousarray(array) for name, array in arrays.items()}
+    sections["strings"] = numpy.frombuffer(json.dumps(strings).encode("utf-8"), dtype=numpy.uint8)
+    archive = io.BytesIO()
+    numpy.savez_compressed(archive, **sections)
+    return base64.b64encode(archive.getvalue()).decode("ascii")
+
+
+#Decodes a RobotModel encoded by encodeRobotModel
+def decodeRobotModel(text):
+    with numpy.load(io.BytesIO(base64.b64decode(text)), allow_pickle=False) as archive:
+        arrays = {name[len("arr:"):]: archive[name] for name in archive.files if name.startswith("arr:")}
+        strings = json.loads(archive["strings"].tobytes().decode("utf-8"))
+    return RobotModel.fromArrays(arrays, strings)
+
+
+#Compresses text (str or UTF-8 bytes) into ASCII text
+def compressText(text):
+    return base64.b64encode(zlib.compress(text.encode("utf-8") if isinstance(text, str) else text, 9)).decode("ascii")
+
+
+def decompressText(text):
+    return zlib.decompress(base64.b64decode(text)).decode("utf-8")
@@ -0,0 +1,185 @@
+"""Volume swept by robot links along a joint trajectory.
+
+The surface of each link mesh is sampled once in the link frame, densely enough that neighboring samples
+are at most half a voxel apart. For every configuration of the trajectory the samples are moved with
+forward kinematics and the voxels they fall in are marked. Configurations are processed in chunks on
+worker processes and the interior of the marked surfaces is filled at the end.
+"""
+
+import concurrent.futures
+import multiprocessing
+
+import numpy
+import vtk
+from vtk.util import numpy_support
+
+
+# Number of transformed surface samples processed at once, bounds the memory used by a chunk
+CHUNK_SAMPLES = 2000000
+
+
+#Points on the triangles (m, 3) of a mesh with points (n, 3), at most maxDistance apart along the triangle edges
+def surfaceSamples(points, triangles, maxDistance):
+    points = numpy.asarray(points, dtype=numpy.float64)
+    return numpy.concatenate([points] + [samples.reshape(-1, 3) for _, samples in _triangleLattices(points, triangles, maxDistance)])
+
+
+#Points (k, 3) sampled on triangles (m, 3) like surfaceSamples, without the points that are not corners of triangles, and the
+#unit normals (k, 3) of the triangles they are sampled from
+def orientedSurfaceSamples(points, triangles, maxDistance):
+    points = numpy.asarray(points, dtype=numpy.float64)
+    corners = points[numpy.asarray(triangles)]
+    normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1), 1e-300)[:, None]
+    samples, sampleNormals = [numpy.zeros((0, 3))], [numpy.zeros((0, 3))]
+    for triangleIndices, triangleSamples in _triangleLattices(points, triangles, maxDistance):
+        samples.append(triangleSamples.reshape(-1, 3))
+        sampleNormals.append(numpy.repeat(normals[triangleIndices], triangleSamples.shape[1], axis=0))
+    return numpy.concatenate(samples), numpy.concatenate(sampleNormals)
+
+
+#Samples (t, k, 3) of groups of triangles with the same number of edge subdivisions, with the triangle indices (t,) of each group
+def _triangleLattices(points, triangles, maxDistance):
+    corners = points[numpy.asarray(triangles)]
+    edgeLengths = numpy.linalg.norm(corners - numpy.roll(corners, 1, axis=1), axis=2).max(axis=1)
+    subdivisions = numpy.maximum(numpy.ceil(edgeLengths / maxDistance).astype(numpy.int64), 1)
+    # triangles with the same number of subdivisions are sampled with the same barycentric lattice
+    for subdivision in numpy.unique(subdivisions):
+        i, j = numpy.meshgrid(numpy.arange(subdivision + 1), numpy.arange(subdivision + 1), indexing="ij")
+        inside = i + j <= subdivision
+        weights = numpy.column_stack([i[inside], j[inside], subdivision - i[inside] - j[inside]]) / subdivision
+        triangleIndices = numpy.nonzero(subdivisions == subdivision)[0]
+        yield triangleIndices, numpy.einsum("kc,tcd->tkd", weights, corners[triangleIndices])
+
+
+#Inserts linearly interpolated configurations so that no joint value changes by more than maxStep between samples
+def interpolateTrajectory(trajectory, maxStep):
+    trajectory = numpy.asarray(trajectory, dtype=numpy.float64)
+    if len(trajectory) < 2:
+        return trajectory
+    steps = numpy.maximum(numpy.ceil(numpy.abs(numpy.diff(trajectory, axis=0)).max(axis=1) / maxStep).astype(numpy.int64), 1)
+    segments = numpy.repeat(numpy.arange(len(steps)), steps)
+    fractions = numpy.concatenate([numpy.arange(count) / count for count in steps])
+    interpolated = trajectory[segments] + fractions[:, None] * (trajectory[segments + 1] - trajectory[segments])
+    return numpy.concatenate([interpolated, trajectory[-1:]])
+
+
+def _boxCorners(points):
+    lower = points.min(axis=0)
+    upper = points.max(axis=0)
+    return numpy.array([[x, y, z] for x in (lower[0], upper[0]) for y in (lower[1], upper[1]) for z in (lower[2], upper[2])])
+
+
+# Set by _initializeWorker in worker processes (and directly when running without workers)
+_workerState = None
+
+
+def _initializeWorker(state):
+    global _workerState
+    _workerState = state
+
+
+#Marks the voxels hit by the link samples for a chunk of configurations, returns the occupancy as packed bits
+def _sweepChunk(configurations):
+    model, linkSamples, robotToWorld, origin, spacing, dimensions = _workerState
+    occupied = numpy.zeros(int(numpy.prod(dimensions)), dtype=bool)
+    linkTransforms = model.linkTransforms(configurations)
+    for linkIndex, samples in linkSamples.items():
+        linkToWorld = robotToWorld @ linkTransforms[:, linkIndex]
+        # batched matrix product, much faster than einsum for many samples
+        worldPoints = numpy.matmul(samples, linkToWorld[:, :3, :3].transpose(0, 2, 1)) + linkToWorld[:, None, :3, 3]
+        ijk = numpy.rint((worldPoints.reshape(-1, 3) - origin) / spacing).astype(numpy.int64)
+        inside = numpy.all((ijk >= 0) & (ijk < dimensions), axis=1)
+        ijk = ijk[inside]
+        occupied[(ijk[:, 2] * dimensions[1] + ijk[:, 1]) * dimensions[0] + ijk[:, 0]] = True
+    return numpy.packbits(occupied)
+
+
+#Marks the voxels that are enclosed by occupied voxels (array indexed [k, j, i])
+def fillInterior(occupancy):
+    padded = numpy.pad(occupancy == 0, 1, constant_values=True).astype(numpy.uint8)
+    image = vtk.vtkImageData()
+    image.SetDimensions(padded.shape[::-1])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(padded.reshape(-1), deep=True))
+    seedPoints = vtk.vtkPoints()
+    seedPoints.InsertNextPoint(0, 0, 0)
+    seeds = vtk.vtkPolyData()
+    seeds.SetPoints(seedPoints)
+    # the empty region connected to the padding is outside, everything else is swept
+    connectivity = vtk.vtkImageConnectivityFilter()
+    connectivity.SetInputData(image)
+    connectivity.SetSeedData(seeds)
+    connectivity.SetScalarRange(1, 1)
+    connectivity.SetExtractionModeToSeededRegions()
+    connectivity.Update()
+    labels = numpy_support.vtk_to_numpy(connectivity.GetOutput().GetPointData().GetScalars()).reshape(padded.shape)
+    return (labels[1:-1, 1:-1, 1:-1] == 0).astype(numpy.uint8)
+
+
+#Voxel occupancy of the volume swept by link meshes along a trajectory
+#linkMeshes maps link indices to (points (n, 3), triangles (m, 3)) in the link frame, trajectory holds joint values
+#(T, dofCount) of the model and robotToWorld (4, 4) maps robot to output coordinates (spacing is in output units).
+#Returns occupancy (uint8, indexed [k, j, i]), the position of voxel (0, 0, 0) and the spacing.
+def sweptVolume(model, linkMeshes, trajectory, spacing=2.0, robotToWorld=None, maxJointStep=None, workers=None, fillHoles=True):
+    robotToWorld = numpy.eye(4) if robotToWorld is None else numpy.asarray(robotToWorld, dtype=numpy.float64)
+    trajectory = numpy.atleast_2d(numpy.asarray(trajectory, dtype=numpy.float64))
+    if maxJointStep:
+        trajectory = interpolateTrajectory(trajectory, maxJointStep)
+    # samples are defined in link coordinates, spacing is in output coordinates
+    scale = numpy.cbrt(abs(numpy.linalg.det(robotToWorld[:3, :3])))
+    linkSamples = {linkIndex: surfaceSamples(points, triangles, 0.5 * spacing / scale)
+                   for linkIndex, (points, triangles) in linkMeshes.items()}
+    if not linkSamples or not len(trajectory):
+        raise ValueError("Nothing to sweep")
+
+    # Grid bounds from the bounding boxes of the link meshes at all configurations
+    samplesPerConfiguration = sum(len(samples) for samples in linkSamples.values())
+    chunkSize = max(1, CHUNK_SAMPLES // samplesPerConfiguration)
+    lower = numpy.full(3, numpy.inf)
+    upper = numpy.full(3, -numpy.inf)
+    for chunkStart in range(0, len(trajectory), chunkSize):
+        linkTransforms = model.linkTransforms(trajectory[chunkStart:chunkStart + chunkSize])
+        for linkIndex, samples in linkSamples.items():
+            boxCorners = _boxCorners(samples)
+            linkToWorld = robotToWorld @ linkTransforms[:, linkIndex]
+            worldCorners = numpy.einsum("tij,pj->tpi", linkToWorld[:, :3, :3], boxCorners) + linkToWorld[:, None, :3, 3]
+            lower = numpy.minimum(lower, worldCorners.reshape(-1, 3).min(axis=0))
+            upper = numpy.maximum(upper, worldCorners.reshape(-1, 3).max(axis=0))
+    origin = lower - spacing
+    dimensions = numpy.ceil((upper - origin) / spacing).astype(numpy.int64) + 2
+
+    state = (model, linkSamples, robotToWorld, origin, float(spacing), dimensions)
+    if workers is None:
+        workers = multiprocessing.cpu_count() or 1
+    # at least one chunk per worker
+    chunkSize = max(1, min(chunkSize, -(-len(trajectory) // workers)))
+    chunks = [trajectory[chunkStart:chunkStart + chunkSize] for chunkStart in range(0, len(trajectory), chunkSize)]
+    voxelCount = int(numpy.prod(dimensions))
+    occupied = numpy.zeros(voxelCount, dtype=bool)
+    if workers > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=_initializeWorker, initargs=(state,)) as executor:
+            for packed in executor.map(_sweepChunk, chunks):
+                occupied |= numpy.unpackbits(packed, count=voxelCount).astype(bool)
+    else:
+        _initializeWorker(state)
+        for chunk in chunks:
+            occupied |= numpy.unpackbits(_sweepChunk(chunk), count=voxelCount).astype(bool)
+    occupancy = occupied.reshape(dimensions[::-1]).astype(numpy.uint8)
+    if fillHoles:
+        occupancy = fillInterior(occupancy)
+    return occupancy, origin, spacing
+
+
+#Surface of the occupied voxels as vtkPolyData in output coordinates
+def occupancySurface(occupancy, origin, spacing):
+    image = vtk.vtkImageData()
+    image.SetDimensions(occupancy.shape[::-1])
+    image.SetOrigin(origin)
+    image.SetSpacing(spacing, spacing, spacing)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(numpy.ascontiguousarray(occupancy).reshape(-1), deep=True))
+    contour = vtk.vtkDiscreteFlyingEdges3D()
+    contour.SetInputData(image)
+    contour.SetValue(0, 1)
+    contour.Update()
+    return contour.GetOutput()
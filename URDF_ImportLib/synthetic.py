@@ -0,0 +1,135 @@
+import os
+
+import numpy
+
+
+# Generators of synthetic robot descriptions for tests and benchmarks.
+# Joint types cycle through revolute, prismatic, continuous and fixed so that every code path is used.
+SYNTHETIC_JOINT_TYPES = ("revolute", "prismatic", "continuous", "fixed")
+SYNTHETIC_AXES = ("0 0 1", "1 0 0", "0 1 0", "0 0 -1")
+
+
+#Parent link index of each link for the given topology ("chain" or "tree"), -1 for the root
+def syntheticParents(linkCount, topology="chain", branching=4):
+    if topology == "chain":
+        return [index - 1 for index in range(linkCount)]
+    elif topology == "tree":
+        return [-1] + [(index - 1) // branching for index in range(1, linkCount)]
+    raise ValueError(f"Unknown topology {topology}")
+
+
+def _meshFilename(linkIndex, meshes):
+    if meshes == "shared":
+        return "link.stl"
+    elif meshes == "unique":
+        return f"link_{linkIndex}.stl"
+    elif meshes == "none":
+        return None
+    raise ValueError(f"Unknown mesh mode {meshes}")
+
+
+def _linkXML(linkIndex, meshes):
+    filename = _meshFilename(linkIndex, meshes)
+    if filename is None:
+        return f'  <link name="link_{linkIndex}"/>\n'
+    return (f'  <link name="link_{linkIndex}">\n'
+            f'    <visual>\n'
+            f'      <origin xyz="0 0 0.025" rpy="0 0 0"/>\n'
+            f'      <geometry><mesh filename="{filename}"/></geometry>\n'
+            f'    </visual>\n'
+            f'    <collision>\n'
+            f'      <geometry><mesh filename="{filename}"/></geometry>\n'
+            f'    </collision>\n'
+            f'  </link>\n')
+
+
+def _jointXML(jointIndex, parentIndex, childIndex):
+    jointType = SYNTHETIC_JOINT_TYPES[jointIndex % len(SYNTHETIC_JOINT_TYPES)]
+    axis = SYNTHETIC_AXES[jointIndex % len(SYNTHETIC_AXES)]
+    if jointType == "prismatic":
+        limit = '<limit lower="-0.02" upper="0.02" effort="10" velocity="1"/>'
+    else:
+        limit = '<limit lower="-1.5" upper="1.5" effort="10" velocity="1"/>'
+    return (f'  <joint name="joint_{jointIndex}" type="{jointType}">\n'
+            f'    <parent link="link_{parentIndex}"/>\n'
+            f'    <child link="link_{childIndex}"/>\n'
+            f'    <origin xyz="0 0 0.05" rpy="0 0 0.1"/>\n'
+            f'    <axis xyz="{axis}"/>\n'
+            f'    {limit}\n'
+            f'  </joint>\n')
+
+
+#URDF text of a synthetic robot with linkCount links
+def syntheticURDF(linkCount, topology="chain", meshes="shared", branching=4):
+    parents = syntheticParents(linkCount, topology, branching)
+    parts = [f'<?xml version="1.0"?>\n<robot name="synthetic_{topology}_{linkCount}">\n']
+    for linkIndex in range(linkCount):
+        parts.append(_linkXML(linkIndex, meshes))
+    for childIndex in range(1, linkCount):
+        parts.append(_jointXML(childIndex - 1, parents[childIndex], childIndex))
+    parts.append('</robot>\n')
+    return "".join(parts)
+
+
+#Xacro text that expands to the same kinematic tree as syntheticURDF using a property and a macro
+def syntheticXacro(linkCount, topology="chain", meshes="shared", branching=4):
+    parents = syntheticParents(linkCount, topology, branching)
+    parts = [f'<?xml version="1.0"?>\n<robot name="synthetic_{topology}_{linkCount}" xmlns:xacro="http://www.ros.org/wiki/xacro">\n',
+             '  <xacro:property name="segment_length" value="0.05"/>\n',
+             '  <xacro:macro name="segment" params="index parent mesh">\n',
+             '    <link name="link_${index}">\n',
+             '      <visual>\n',
+             '        <origin xyz="0 0 ${segment_length / 2}" rpy="0 0 0"/>\n',
+             '        <geometry><mesh filename="${mesh}"/></geometry>\n',
+             '      </visual>\n',
+             '    </link>\n',
+             '    <joint name="joint_${index}" type="revolute">\n',
+             '      <parent link="link_${parent}"/>\n',
+             '      <child link="link_${index}"/>\n',
+             '      <origin xyz="0 0 ${segment_length}" rpy="0 0 0.1"/>\n',
+             '      <axis xyz="0 0 1"/>\n',
+             '      <limit lower="-1.5" upper="1.5" effort="10" velocity="1"/>\n',
+             '    </joint>\n',
+             '  </xacro:macro>\n',
+             _linkXML(0, meshes)]
+    for linkIndex in range(1, linkCount):
+        mesh = _meshFilename(linkIndex, meshes) or "link.stl"
+        parts.append(f'  <xacro:segment index="{linkIndex}" parent="{parents[linkIndex]}" mesh="{mesh}"/>\n')
+    parts.append('</robot>\n')
+    return "".join(parts)
+
+
+#Writes a binary STL box of the given size centered at the origin
+def writeBoxSTL(path, size=(0.02, 0.02, 0.05)):
+    half = numpy.array(size) / 2.0
+    corners = numpy.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=numpy.float32) * half
+    faces = numpy.array([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+                         [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    triangles = corners[faces]
+    normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    normals /= numpy.linalg.norm(normals, axis=1)[:, None]
+    records = numpy.zeros(len(faces), dtype=[("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+    records["normal"] = normals
+    records["vertices"] = triangles
+    with open(path, "wb") as stlFile:
+        stlFile.write(b"synthetic box".ljust(80, b"\0"))
+        stlFile.write(numpy.uint32(len(faces)).tobytes())
+        stlFile.write(records.tobytes())
+
+
+#Writes a synthetic robot (URDF and meshes) into directory, returns the path of the URDF file
+def writeSyntheticRobot(directory, linkCount, topology="chain", meshes="shared", branching=4, xacro=False):
+    os.makedirs(directory, exist_ok=True)
+    filenames = {_meshFilename(linkIndex, meshes) for linkIndex in range(linkCount)} - {None}
+    for filename in sorted(filenames):
+        linkIndex = int(filename[5:-4]) if filename != "link.stl" else 0
+        writeBoxSTL(os.path.join(directory, filename), (0.02, 0.02, 0.05 + 0.001 * (linkIndex % 10)))
+    if xacro:
+        path = os.path.join(directory, f"synthetic_{topology}_{linkCount}.xacro")
+        text = syntheticXacro(linkCount, topology, meshes, branching)
+    else:
+        path = os.path.join(directory, f"synthetic_{topology}_{linkCount}.urdf")
+        text = syntheticURDF(linkCount, topology, meshes, branching)
+    with open(path, "w") as robotFile:
+        robotFile.write(text)
+    return path
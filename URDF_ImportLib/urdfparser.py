@@ -0,0 +1,314 @@
+"""Single-pass URDF parser.
+
+parseURDF reads a URDF document once, with iterparse for files so that large generated robots are
+never held in memory as a complete element tree, and stores everything the importer needs in a
+URDFDescription: name to index maps of links, joints and materials and typed numpy arrays of all
+numeric attributes. References that cannot be resolved (joint parent and child links, mimicked
+joints, link materials) are listed in danglingReferences as soon as the document is read.
+"""
+
+import io
+import xml.etree.ElementTree as ET
+
+import numpy
+
+from URDF_ImportLib.rotations import originMatrix
+
+
+class URDFDescription:
+    """Links, joints and materials of a URDF robot in document order.
+
+    Only the first <visual> and <collision> of a link are read. Missing origins are zero, missing
+    axes are (1, 0, 0), missing limits, efforts and velocities are NaN, missing mesh scales are
+    (1, 1, 1), links without <inertial> have zero mass and inertia and materials without a color
+    have a NaN color. Inertias are (ixx, ixy, ixz, iyy, iyz, izz) about the inertial origin. References that cannot be resolved
+    are -1 in jointParents, jointChildren, mimicJoints and linkMaterials.
+    """
+
+    def __init__(self):
+        self.name = ""
+        # ("link" or "joint", index) of the links and joints in document order
+        self.elementOrder = []
+        self.linkNames = []
+        self.linkIndex = {}
+        self.jointNames = []
+        self.jointIndex = {}
+        self.materialNames = []
+        self.materialIndex = {}
+        # Descriptions of the references that could not be resolved
+        self.danglingReferences = []
+
+        self.visualMeshes = []
+        self.collisionMeshes = []
+        self.visualXyz = numpy.zeros((0, 3))
+        self.visualRpy = numpy.zeros((0, 3))
+        self.hasVisualOrigin = numpy.zeros(0, dtype=bool)
+        self.visualMeshScales = numpy.ones((0, 3))
+        self.collisionMeshScales = numpy.ones((0, 3))
+        self.linkMaterials = numpy.zeros(0, dtype=numpy.int32)
+        self.materialColors = numpy.zeros((0, 4))
+        self.masses = numpy.zeros(0)
+        self.inertialXyz = numpy.zeros((0, 3))
+        self.inertialRpy = numpy.zeros((0, 3))
+        self.inertias = numpy.zeros((0, 6))
+
+        self.jointTypeNames = []
+        self.mimicJointNames = []
+        self.jointParents = numpy.zeros(0, dtype=numpy.int32)
+        self.jointChildren = numpy.zeros(0, dtype=numpy.int32)
+        self.jointXyz = numpy.zeros((0, 3))
+        self.jointRpy = numpy.zeros((0, 3))
+        self.jointAxes = numpy.zeros((0, 3))
+        self.lowerLimits = numpy.zeros(0)
+        self.upperLimits = numpy.zeros(0)
+        self.efforts = numpy.zeros(0)
+        self.velocities = numpy.zeros(0)
+        self.mimicJoints = numpy.zeros(0, dtype=numpy.int32)
+        self.mimicMultipliers = numpy.zeros(0)
+        self.mimicOffsets = numpy.zeros(0)
+
+    @property
+    def linkCount(self):
+        return len(self.linkNames)
+
+    @property
+    def jointCount(self):
+        return len(self.jointNames)
+
+    #Link visual origins (linkCount, 4, 4)
+    def visualOrigins(self):
+        return originMatrix(self.visualXyz, self.visualRpy)
+
+    #Link inertial origins (linkCount, 4, 4): center of mass and principal axes of the inertia in link coordinates
+    def inertialOrigins(self):
+        return originMatrix(self.inertialXyz, self.inertialRpy)
+
+    #Inertia matrices (linkCount, 3, 3) about the center of mass in the axes of the inertial origin
+    def inertiaMatrices(self):
+        ixx, ixy, ixz, iyy, iyz, izz = self.inertias.T
+        return numpy.stack([ixx, ixy, ixz, ixy, iyy, iyz, ixz, iyz, izz], axis=-1).reshape(-1, 3, 3)
+
+    #Joint origins (jointCount, 4, 4)
+    def jointOrigins(self):
+        return originMatrix(self.jointXyz, self.jointRpy)
+
+    #Mesh file name of the visual (or collision) of a link, None if it has none
+    def meshFilename(self, linkIndex, collision=False):
+        return (self.collisionMeshes if collision else self.visualMeshes)[linkIndex]
+
+    #Scale of the visual (or collision) mesh of a link: None if it is not scaled, else [x, y, z]
+    def meshScale(self, linkIndex, collision=False):
+        scale = (self.collisionMeshScales if collision else self.visualMeshScales)[linkIndex]
+        if numpy.all(scale == 1.0):
+            return None
+        return scale.tolist()
+
+
+#Parses a URDF file (path or binary file object) in one pass without keeping the element tree
+def parseURDF(source):
+    events = ET.iterparse(source, events=("start", "end"))
+    return _describeEvents(events, clearElements=True)
+
+
+#Parses URDF text (str or bytes)
+def parseURDFString(text):
+    return parseURDF(io.BytesIO(text.encode("utf-8") if isinstance(text, str) else text))
+
+
+#Describes a robot element that has already been parsed
+def describeElement(robot):
+    return _describeEvents(_elementEvents(robot), clearElements=False)
+
+
+#(event, element) pairs of an element tree in the order ET.iterparse produces them
+def _elementEvents(element):
+    yield "start", element
+    for child in element:
+        yield from _elementEvents(child)
+    yield "end", element
+
+
+#Numbers of a space separated XML attribute stored in row index of rows, rows[index] is left unchanged if there is no attribute
+def _readFloats(rows, index, element, attribute):
+    value = element.get(attribute)
+    if value is not None:
+        rows[index] = [float(x) for x in value.split()]
+
+
+def _readScale(rows, index, meshElement):
+    value = meshElement.get("scale")
+    if value is not None:
+        scale = [float(x) for x in value.split()]
+        rows[index] = scale * 3 if len(scale) == 1 else scale
+
+
+#Builds a URDFDescription from (event, element) pairs as produced by ET.iterparse(source, events=("start", "end")).
+#Elements are read at their "start" event, when their attributes but not necessarily their children are parsed.
+#Link and joint elements are cleared at their "end" event if clearElements is set.
+def _describeEvents(events, clearElements):
+    description = URDFDescription()
+    linkRows = {"visualXyz": [], "visualRpy": [], "visualMeshScales": [], "collisionMeshScales": [], "inertialXyz": [], "inertialRpy": []}
+    masses = []
+    inertias = []
+    jointRows = {"jointXyz": [], "jointRpy": [], "jointAxes": [], "lowerLimits": [], "upperLimits": [], "efforts": [],
+                 "velocities": [], "mimicMultipliers": [], "mimicOffsets": []}
+    jointDefaults = {"jointXyz": [0.0, 0.0, 0.0], "jointRpy": [0.0, 0.0, 0.0], "jointAxes": [1.0, 0.0, 0.0], "lowerLimits": numpy.nan,
+                     "upperLimits": numpy.nan, "efforts": numpy.nan, "velocities": numpy.nan, "mimicMultipliers": 1.0, "mimicOffsets": 0.0}
+    linkMaterialNames = []
+    hasVisualOrigin = []
+    jointParentNames = []
+    jointChildNames = []
+    mimicJointNames = description.mimicJointNames
+    # rgba of the materials, None for materials without a color, and the materials that are defined (not just referenced)
+    materialColors = {}
+    definedMaterials = set()
+    # tags of the open elements, the first visual and collision of the current link and the material being defined
+    path = []
+    visualCount = collisionCount = 0
+    materialName = None
+
+    for event, element in events:
+        if event == "end":
+            path.pop()
+            if len(path) == 2 and path[1] == "link":
+                visualCount += element.tag == "visual"
+                collisionCount += element.tag == "collision"
+            if clearElements and len(path) == 1:
+                element.clear()
+            continue
+        path.append(element.tag)
+        depth = len(path)
+        tag = element.tag
+        if depth == 1:
+            if tag != "robot":
+                raise ValueError("Invalid URDF file")
+            description.name = element.get("name", "")
+        elif depth == 2:
+            if tag == "link":
+                name = element.get("name")
+                description.linkIndex[name] = len(description.linkNames)
+                description.elementOrder.append(("link", len(description.linkNames)))
+                description.linkNames.append(name)
+                description.visualMeshes.append(None)
+                description.collisionMeshes.append(None)
+                linkMaterialNames.append(None)
+                hasVisualOrigin.append(False)
+                linkRows["visualXyz"].append([0.0, 0.0, 0.0])
+                linkRows["visualRpy"].append([0.0, 0.0, 0.0])
+                linkRows["visualMeshScales"].append([1.0, 1.0, 1.0])
+                linkRows["collisionMeshScales"].append([1.0, 1.0, 1.0])
+                linkRows["inertialXyz"].append([0.0, 0.0, 0.0])
+                linkRows["inertialRpy"].append([0.0, 0.0, 0.0])
+                masses.append(0.0)
+                inertias.append([0.0] * 6)
+                visualCount = collisionCount = 0
+            elif tag == "joint":
+                name = element.get("name")
+                description.jointIndex[name] = len(description.jointNames)
+                description.elementOrder.append(("joint", len(description.jointNames)))
+                description.jointNames.append(name)
+                description.jointTypeNames.append(element.get("type"))
+                jointParentNames.append(None)
+                jointChildNames.append(None)
+                mimicJointNames.append(None)
+                for name, default in jointDefaults.items():
+                    jointRows[name].append(default)
+            elif tag == "material":
+                materialName = element.get("name")
+                materialColors.setdefault(materialName, None)
+                definedMaterials.add(materialName)
+        elif path[1] == "link":
+            linkIndex = len(description.linkNames) - 1
+            if path[2] == "visual" and visualCount == 0:
+                if depth == 4 and tag == "origin":
+                    hasVisualOrigin[linkIndex] = True
+                    _readFloats(linkRows["visualXyz"], linkIndex, element, "xyz")
+                    _readFloats(linkRows["visualRpy"], linkIndex, element, "rpy")
+                elif depth == 5 and tag == "mesh" and path[3] == "geometry" and description.visualMeshes[linkIndex] is None:
+                    description.visualMeshes[linkIndex] = element.get("filename")
+                    _readScale(linkRows["visualMeshScales"], linkIndex, element)
+                elif depth == 4 and tag == "material":
+                    materialName = linkMaterialNames[linkIndex] = element.get("name")
+                    materialColors.setdefault(materialName, None)
+                elif depth == 5 and path[3] == "material":
+                    # a material with a color or texture is defined where it is used
+                    definedMaterials.add(materialName)
+                    if tag == "color":
+                        materialColors[materialName] = element.get("rgba")
+            elif path[2] == "inertial" and depth == 4:
+                if tag == "origin":
+                    _readFloats(linkRows["inertialXyz"], linkIndex, element, "xyz")
+                    _readFloats(linkRows["inertialRpy"], linkIndex, element, "rpy")
+                elif tag == "mass":
+                    masses[linkIndex] = float(element.get("value", 0.0))
+                elif tag == "inertia":
+                    inertias[linkIndex] = [float(element.get(name, 0.0)) for name in ("ixx", "ixy", "ixz", "iyy", "iyz", "izz")]
+            elif path[2] == "collision" and collisionCount == 0:
+                if depth == 5 and tag == "mesh" and path[3] == "geometry" and description.collisionMeshes[linkIndex] is None:
+                    description.collisionMeshes[linkIndex] = element.get("filename")
+                    _readScale(linkRows["collisionMeshScales"], linkIndex, element)
+        elif path[1] == "joint" and depth == 3:
+            jointIndex = len(description.jointNames) - 1
+            if tag == "parent":
+                jointParentNames[jointIndex] = element.get("link")
+            elif tag == "child":
+                jointChildNames[jointIndex] = element.get("link")
+            elif tag == "origin":
+                _readFloats(jointRows["jointXyz"], jointIndex, element, "xyz")
+                _readFloats(jointRows["jointRpy"], jointIndex, element, "rpy")
+            elif tag == "axis":
+                _readFloats(jointRows["jointAxes"], jointIndex, element, "xyz")
+            elif tag == "limit":
+                for name, attribute in (("lowerLimits", "lower"), ("upperLimits", "upper"), ("efforts", "effort"), ("velocities", "velocity")):
+                    if element.get(attribute) is not None:
+                        jointRows[name][jointIndex] = float(element.get(attribute))
+            elif tag == "mimic":
+                mimicJointNames[jointIndex] = element.get("joint")
+                jointRows["mimicMultipliers"][jointIndex] = float(element.get("multiplier", 1.0))
+                jointRows["mimicOffsets"][jointIndex] = float(element.get("offset", 0.0))
+        elif path[1] == "material" and depth == 3 and tag == "color":
+            materialColors[materialName] = element.get("rgba")
+
+    for name, rows in linkRows.items():
+        setattr(description, name, numpy.array(rows, dtype=numpy.float64).reshape(-1, 3))
+    for name, rows in jointRows.items():
+        setattr(description, name, numpy.array(rows, dtype=numpy.float64).reshape((-1, 3) if name in ("jointXyz", "jointRpy", "jointAxes") else -1))
+
+    description.hasVisualOrigin = numpy.array(hasVisualOrigin, dtype=bool)
+    description.masses = numpy.array(masses, dtype=numpy.float64)
+    description.inertias = numpy.array(inertias, dtype=numpy.float64).reshape(-1, 6)
+    description.materialNames = list(materialColors)
+    description.materialIndex = {name: index for index, name in enumerate(description.materialNames)}
+    description.materialColors = numpy.full((len(materialColors), 4), numpy.nan)
+    for index, rgba in enumerate(materialColors.values()):
+        if rgba is not None:
+            description.materialColors[index] = [float(x) for x in rgba.split()]
+
+    # References are resolved once everything is read, links and joints can be referenced before they are defined
+    def resolve(names, index, kind, referrer):
+        resolved = numpy.full(len(names), -1, dtype=numpy.int32)
+        for position, name in enumerate(names):
+            if name is None:
+                continue
+            if name in index:
+                resolved[position] = index[name]
+            else:
+                description.danglingReferences.append(f"{referrer(position)} refers to unknown {kind} {name}")
+        return resolved
+
+    def jointName(jointIndex):
+        return f"Joint {description.jointNames[jointIndex]}"
+
+    description.jointParents = resolve(jointParentNames, description.linkIndex, "link", jointName)
+    description.jointChildren = resolve(jointChildNames, description.linkIndex, "link", jointName)
+    description.mimicJoints = resolve(mimicJointNames, description.jointIndex, "joint", jointName)
+    description.linkMaterials = numpy.array([-1 if name is None else description.materialIndex[name] for name in linkMaterialNames],
+                                            dtype=numpy.int32)
+    for linkIndex, name in enumerate(linkMaterialNames):
+        if name is not None and name not in definedMaterials:
+            description.danglingReferences.append(f"Link {description.linkNames[linkIndex]} refers to unknown material {name}")
+            description.linkMaterials[linkIndex] = -1
+    for jointIndex in range(description.jointCount):
+        if jointParentNames[jointIndex] is None or jointChildNames[jointIndex] is None:
+            description.danglingReferences.append(f"{jointName(jointIndex)} does not have a parent and a child link")
+    return description
@@ -30,6 +30,7 @@
 # Modified by Saul Reynolds-Haertle Oct 14 2012 to remove ROS dependencies.
 
 
+import io
 import os.path, sys, os, getopt
 import subprocess
 from xml.dom.minidom import parse, parseString
@@ -69,13 +70,28 @@ def fixed_writexml(self, writer, indent="", addindent="", newl=""):
         writer.write(">%s"%(newl))
         for node in self.childNodes:
             if node.nodeType is not xml.dom.minidom.Node.TEXT_NODE: # 3:
-                node.writexml(writer,indent+addindent,addindent,newl) 
-                #node.writexml(writer,indent+addindent,addindent,newl)
+                _write_node(node, writer,indent+addindent,addindent,newl)
         writer.write("%s</%s>%s" % (indent,self.tagName,newl))
     else:
         writer.write("/>%s"%(newl))
-# replace minidom's function with ours
-xml.dom.minidom.Element.writexml = fixed_writexml
+
+# Elements of xacro output are written with fixed_writexml, other nodes with minidom's writexml.
+# minidom itself is not patched, so other users of xml.dom.minidom in the process are not affected.
+def _write_node(node, writer, indent="", addindent="", newl=""):
+    if node.nodeType == xml.dom.minidom.Node.ELEMENT_NODE:
+        fixed_writexml(node, writer, indent, addindent, newl)
+    else:
+        node.writexml(writer, indent, addindent, newl)
+
+def writexml(doc, writer, indent="", addindent="", newl=""):
+    writer.write('<?xml version="1.0" ?>' + newl)
+    for node in doc.childNodes:
+        _write_node(node, writer, indent, addindent, newl)
+
+def toprettyxml(doc, indent="\t", newl="\n"):
+    writer = io.StringIO()
+    writexml(doc, writer, "", indent, newl)
+    return writer.getvalue()
 
 
 class Table:
@@ -581,7 +597,7 @@ def runProgram(f, toWrite):
             sys.stdout.write(inc + " ")
         sys.stdout.write("\n")
     elif just_includes:
-        doc.writexml(output)
+        writexml(doc, output)
         print()
     else:
         eval_self_contained(doc)
@@ -594,8 +610,7 @@ def runProgram(f, toWrite):
         for comment in banner:
             doc.insertBefore(comment, first)
 
-        output.write(doc.toprettyxml(indent = '  '))
-        #doc.writexml(output, newl = "\n")
+        output.write(toprettyxml(doc, indent = '  '))
         print()
 
 